@@ -41,7 +41,7 @@ import pandas as pd
 import fitz
 from dotenv import load_dotenv
 from flask import Flask, request, jsonify, g, send_file
-from flask import Response
+from flask import Response, stream_with_context
 import torch
 from flask_cors import CORS
 from supabase import create_client, Client
@@ -67,18 +67,31 @@ from services import asistente_de_limpieza_orquestador as orquestador
 from services.load_data import robust_read_csv, apply_cleaning_action, drop_rows
 from utils.supabase_handler import supabase_handler
 from services.backend_nlp import TextAnalysisService
-from services.visualize import generate_plot 
+from services.visualize import generate_plot, columnas_necesarias
 from services.backend_predictivo import PredictionService
 from services.model_manager import ModelManager
 from services.prompt_lab_service import PromptLabService
 from services.history_service import HistoryService
 from services.faq_service import FAQService
 from services.TabularClusteringService import TabularClusteringService
+from services.dataset_session import DatasetSessionManager, DatasetSessionConflict
+from services.dataset_versioning import DatasetVersionStore
+from services.chunked_upload import ChunkedUploadManager, UploadNotFound
+from services.dataset_profile import profile_cache, PROFILE_MODES
+from services.model_artifact_cache import model_artifact_cache
+from services.prediction_batcher import PredictionBatcher
+from services import batch_prediction_stream as bps
+from services.model_leaderboard import build_leaderboard, split_cache_key, feature_matrix_cache
+from services.job_queue import job_queue, JOBS_ASYNC_ENDPOINTS
+from utils.dataframe_cache import normalize_filters, apply_filters_in_memory
+from utils.storage_transport import StorageError, get_storage_transport
+from utils.bulk_fetcher import BulkFetcher, fetch_visuals
 from vision_processor import analisis_completo_de_imagen
 from vision_processor import orquestar_edicion_avanzada, extraer_datos_estructurados_con_gemini, procesar_imagen_completa ,generar_imagen_desde_texto, crear_meme,  extraer_color_dominante, analizar_contenido_imagen_google,download_image_from_url
 import json 
 from utils.security import encrypt_text, decrypt_text 
 from services.vision_backend import VisionPredictionService
+import tasks
 
 
 # --- 1. CONFIGURACIÓN INICIAL ---
@@ -181,15 +194,29 @@ model_manager = get_llm_manager()
 
 cliente_public: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 supabase_admin: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+# Todo acceso a Storage pasa por el transporte compartido (pool, reintentos, streaming).
+storage_transport = get_storage_transport()
 project_service = ProjectService(db_client=supabase_admin, storage_handler=supabase_handler)
 dataset_service = DataService(db_client=supabase_admin, storage_handler=supabase_handler)
 text_analysis_service = TextAnalysisService()
 prediction_service = PredictionService()
+# Las predicciones de una fila concurrentes contra el mismo modelo se agrupan en lotes.
+prediction_batcher = PredictionBatcher(
+    predict_many=prediction_service.predict_rows,
+    predict_one=lambda artifacts, row: prediction_service.make_prediction(artifacts, row),
+)
 executor = ThreadPoolExecutor(max_workers=5)
 history_service = HistoryService() 
 prompt_lab_service = PromptLabService(model_manager=model_manager, history_service=history_service)
 vision_prediction_service = VisionPredictionService()
 tabular_clustering_service = TabularClusteringService()
+# Historial de versiones por columnas (deshacer/rehacer); DATASET_VERSIONING=false lo desactiva.
+dataset_version_store = (
+    DatasetVersionStore(supabase_handler) if os.getenv("DATASET_VERSIONING", "true").lower() == "true" else None
+)
+dataset_session_manager = DatasetSessionManager(storage_handler=supabase_handler, version_store=dataset_version_store)
+# Subidas por partes reanudables para archivos que superan MAX_CONTENT_LENGTH.
+chunked_upload_manager = ChunkedUploadManager()
 
 # 2. Inmediatamente después, configuramos las dependencias.
 tabular_clustering_service.configure(
@@ -197,6 +224,17 @@ tabular_clustering_service.configure(
     supabase_handler=supabase_handler
 )
 
+# Los trabajos que corren en hilos de la API reutilizan estas instancias (en el worker RQ
+# tasks.py crea las suyas).
+tasks.configure(
+    supabase_admin=supabase_admin,
+    storage_transport=storage_transport,
+    dataset_service=dataset_service,
+    prediction_service=prediction_service,
+    tabular_clustering_service=tabular_clustering_service,
+    model_manager=model_manager,
+)
+
 VALID_PROVIDERS = {"google", "openai", "aws", "azure"}
 
 logger.info("Conectando FAQService con PromptLabService...")
@@ -251,6 +289,67 @@ def token_required(f):
     return decorated_function
 
 
+# --- TRABAJOS EN SEGUNDO PLANO ---
+# Los endpoints pesados validan la petición y encolan una función de tasks.py con
+# argumentos simples (ver services/job_queue.py); responden 202 con un job_id. Con
+# `?sync=1` (o JOBS_ASYNC_ENDPOINTS=false) la tarea corre dentro de la petición.
+
+# Tareas cuyo resultado no es (cuerpo, código HTTP): la API lo convierte al entregarlo.
+_JOB_RESULT_HANDLERS = {}
+
+
+def _wants_sync():
+    return not JOBS_ASYNC_ENDPOINTS or request.args.get("sync", "").lower() in ("1", "true")
+
+
+def _job_accepted(job_id):
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/jobs/{job_id}",
+        "result_url": f"/api/jobs/{job_id}/result",
+    }), 202
+
+
+def _run_or_enqueue(func, args, kind, owner):
+    """Encola `func(*args)` (una tarea de tasks.py), o la ejecuta ya si la petición es sincrónica."""
+    if _wants_sync():
+        body, status = func(*args)
+        return jsonify(body), status
+    return _job_accepted(job_queue.enqueue(func, args=args, kind=kind, owner=owner))
+
+
+def _job_response(job):
+    """(cuerpo, código HTTP) de un trabajo terminado: lo que habría respondido el endpoint."""
+    handler = _JOB_RESULT_HANDLERS.get(job["kind"])
+    if handler is not None:
+        return handler(job)
+    body, status = job["result"]
+    return body, status
+
+
+def _public_job(job):
+    """Estado del trabajo para el cliente. Una tarea que respondió con error cuenta como fallida."""
+    status, error = job["status"], job["error"]
+    outcome = job.get("result") if status == "finished" else None
+    if isinstance(outcome, (list, tuple)) and len(outcome) == 2 and outcome[1] >= 400:
+        status = "failed"
+        error = (outcome[0].get("error") if isinstance(outcome[0], dict) else None) or f"HTTP {outcome[1]}"
+    elif isinstance(outcome, dict) and not outcome.get("success", True):
+        status, error = "failed", outcome.get("error")
+    return {
+        "job_id": job["job_id"],
+        "kind": job["kind"],
+        "status": status,
+        "progress": job["progress"],
+        "error": error,
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "ended_at": job["ended_at"],
+    }
+
+
 
 
 
@@ -260,6 +359,65 @@ def token_required(f):
 def health_check():
     return jsonify({"status": "ok", "message": "Backend PromptLab funcionando."})
 
+
+@app.route("/api/cache/stats", methods=["GET"])
+@token_required
+def get_cache_stats(current_user):
+    """Expone los contadores de las cachés de DataFrames, perfiles y modelos (aciertos, fallos, ocupación)."""
+    return jsonify({"success": True, "data": {
+        "dataframes": supabase_handler.get_dataframe_cache_stats(),
+        "profiles": profile_cache.stats(),
+        "models": model_artifact_cache.stats(),
+        "predict_batching": prediction_batcher.stats(),
+        "leaderboard_features": feature_matrix_cache.stats(),
+    }}), 200
+
+
+# === RUTAS DE TRABAJOS EN SEGUNDO PLANO ===
+
+@app.route("/api/jobs/<string:job_id>", methods=["GET"])
+@token_required
+def get_job_status(current_user, job_id):
+    """Estado y progreso de un trabajo encolado por el usuario."""
+    job = job_queue.get(job_id, owner=current_user.id)
+    if job is None:
+        return jsonify({"success": False, "error": "Trabajo no encontrado o ya vencido."}), 404
+    return jsonify({"success": True, "data": _public_job(job)}), 200
+
+
+@app.route("/api/jobs/<string:job_id>/result", methods=["GET"])
+@token_required
+def get_job_result(current_user, job_id):
+    """
+    Resultado de un trabajo terminado: la misma respuesta (cuerpo y código HTTP) que
+    habría dado el endpoint sincrónico. 202 si todavía está en curso.
+    """
+    job = job_queue.get(job_id, owner=current_user.id)
+    if job is None:
+        return jsonify({"success": False, "error": "Trabajo no encontrado o ya vencido."}), 404
+
+    status = job["status"]
+    if status in ("queued", "started"):
+        return jsonify({"success": True, "data": _public_job(job)}), 202
+    if status == "canceled":
+        return jsonify({"success": False, "error": "El trabajo fue cancelado.", "data": _public_job(job)}), 409
+    if status == "finished":
+        body, code = _job_response(job)
+        return jsonify(body), code
+    return jsonify({"success": False, "error": job.get("error") or "El trabajo falló.", "data": _public_job(job)}), 500
+
+
+@app.route("/api/jobs/<string:job_id>/cancel", methods=["POST"])
+@token_required
+def cancel_job(current_user, job_id):
+    """Cancela un trabajo en cola o en curso."""
+    canceled, job = job_queue.cancel(job_id, owner=current_user.id)
+    if job is None:
+        return jsonify({"success": False, "error": "Trabajo no encontrado o ya vencido."}), 404
+    if not canceled:
+        return jsonify({"success": False, "error": "El trabajo ya terminó.", "data": _public_job(job)}), 409
+    return jsonify({"success": True, "data": _public_job(job)}), 200
+
 # === RUTAS DE GESTIÓN DE PROYECTOS (CRUD) ===
 
 @app.route("/api/projects", methods=["GET"])
@@ -398,6 +556,93 @@ def upload_dataset(current_user, project_id):
         return jsonify({"success": False, "error": "Error interno del servidor."}), 500
     
     
+# === SUBIDAS POR PARTES (REANUDABLES) ===
+# Flujo: POST .../uploads (iniciar) -> PUT .../parts/<n> (cuerpo binario, una por parte)
+# -> POST .../complete. Si se corta, GET .../uploads/<id> dice qué partes faltan.
+
+@app.route("/api/projects/<string:project_id>/datasets/uploads", methods=["POST"])
+@token_required
+def initiate_chunked_upload(current_user, project_id):
+    try:
+        payload = request.get_json(silent=True) or {}
+        data = chunked_upload_manager.initiate(
+            current_user.id, project_id, payload.get("filename"), payload.get("size"), sha256=payload.get("sha256")
+        )
+        return jsonify({"success": True, "data": data}), 201
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error iniciando subida por partes: {e}", exc_info=True)
+        return jsonify({"success": False, "error": "Error interno del servidor."}), 500
+
+
+@app.route("/api/datasets/uploads/<string:upload_id>/parts/<int:part_number>", methods=["PUT"])
+@token_required
+def upload_chunked_part(current_user, upload_id, part_number):
+    try:
+        # El cuerpo se copia al spool en bloques: nunca se carga la parte entera en memoria.
+        data = chunked_upload_manager.upload_part(
+            current_user.id, upload_id, part_number, request.stream,
+            checksum=request.headers.get("X-Content-SHA256"),
+        )
+        return jsonify({"success": True, "data": data}), 200
+    except UploadNotFound as e:
+        return jsonify({"success": False, "error": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error recibiendo la parte {part_number} de la subida {upload_id}: {e}", exc_info=True)
+        return jsonify({"success": False, "error": "Error interno del servidor."}), 500
+
+
+@app.route("/api/datasets/uploads/<string:upload_id>", methods=["GET"])
+@token_required
+def get_chunked_upload_status(current_user, upload_id):
+    try:
+        return jsonify({"success": True, "data": chunked_upload_manager.status(current_user.id, upload_id)}), 200
+    except UploadNotFound as e:
+        return jsonify({"success": False, "error": str(e)}), 404
+
+
+@app.route("/api/datasets/uploads/<string:upload_id>/complete", methods=["POST"])
+@token_required
+def complete_chunked_upload(current_user, upload_id):
+    try:
+        spooled = chunked_upload_manager.complete(current_user.id, upload_id)
+
+        # El spool entra por la misma ingesta en streaming que una subida normal.
+        with open(spooled["path"], "rb") as fh:
+            result = dataset_service.create_dataset_from_file(
+                user_id=current_user.id,
+                project_id=spooled["project_id"],
+                file=FileStorage(stream=fh, filename=spooled["filename"]),
+            )
+
+        if result.get("success"):
+            chunked_upload_manager.discard(current_user.id, upload_id)
+            return jsonify(result), 201
+        # Si la ingesta falla el spool se conserva (hasta UPLOAD_TTL_SEC) para reintentar.
+        return jsonify(result), 400
+
+    except UploadNotFound as e:
+        return jsonify({"success": False, "error": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error completando la subida {upload_id}: {e}", exc_info=True)
+        return jsonify({"success": False, "error": "Error interno del servidor."}), 500
+
+
+@app.route("/api/datasets/uploads/<string:upload_id>", methods=["DELETE"])
+@token_required
+def abort_chunked_upload(current_user, upload_id):
+    try:
+        chunked_upload_manager.discard(current_user.id, upload_id)
+        return jsonify({"success": True, "message": "Subida cancelada."}), 200
+    except UploadNotFound as e:
+        return jsonify({"success": False, "error": str(e)}), 404
+
+
 @app.route("/api/datasets/<string:dataset_id>/details", methods=["GET"])
 @token_required
 def get_dataset_details(current_user, dataset_id):
@@ -529,13 +774,12 @@ def edit_columns(current_user, dataset_id):
         if not storage_path:
             return jsonify({"success": False, "error": "Falta la ruta de almacenamiento del dataset"}), 500
 
-        # --- PASO 1b: LEER ARCHIVO DIRECTAMENTE CON HANDLER ---
-        df = supabase_handler.load_file_as_dataframe(user_id=current_user.id, path=storage_path)
+        # --- PASO 1b: LEER ARCHIVO (o el DataFrame de la sesión abierta) ---
+        df, session = _load_working_dataframe(current_user.id, dataset_id, storage_path)
         if df is None or df.empty:
             return jsonify({"success": False, "error": "Error al leer el archivo o archivo vacío."}), 400
         print("\n--- DEBUG: ENDPOINT /edit-columns ---")
         print(f"[ENTRADA] Shape del DataFrame: {df.shape}")
-        print(f"[ENTRADA] Duplicados: {df.duplicated().sum()}")
         print(f"[ENTRADA] Columnas: {df.columns.tolist()}")
         
 
@@ -557,21 +801,23 @@ def edit_columns(current_user, dataset_id):
         print("Columnas del DF LIMPIO (después de la acción):", df_limpio.columns.tolist())
         print(f"\n--- DEBUG: ENDPOINT /edit-columns (DESPUÉS) ---")
         print(f"[SALIDA] Shape del DataFrame: {df_limpio.shape}")
-        print(f"[SALIDA] Duplicados: {df_limpio.duplicated().sum()}")
         print(f"[SALIDA] Columnas: {df_limpio.columns.tolist()}")
         print(f"--- FIN DEBUG ---\n")
 
         # --- PASO 3b: GENERAR ANÁLISIS ---
         analysis_result = get_preliminary_analysis(df_limpio)
 
-        # --- PASO 4: GUARDAR RESULTADO EN STORAGE ---
+        # --- PASO 4: GUARDAR RESULTADO EN STORAGE (o dejarlo en la sesión abierta) ---
         try:
-            supabase_handler.save_dataframe_to_storage(
-                user_id=current_user.id,
-                path=storage_path,
-                df=df_limpio
-            )
-            print(f"--- DEBUG STORAGE: Dataset actualizado en {storage_path}")
+            if not _store_working_dataframe(session, df, df_limpio, action):
+                supabase_handler.save_dataframe_to_storage(
+                    user_id=current_user.id,
+                    path=storage_path,
+                    df=df_limpio
+                )
+                print(f"--- DEBUG STORAGE: Dataset actualizado en {storage_path}")
+        except DatasetSessionConflict:
+            raise
         except Exception as storage_error:
             logger.error(f"Error al guardar dataset actualizado: {storage_error}", exc_info=True)
             return jsonify({"success": False, "error": "Error al guardar dataset actualizado."}), 500
@@ -599,7 +845,7 @@ def edit_columns(current_user, dataset_id):
             # Construcción de respuesta final bien estructurada
             final_response_data = {
                 "diagnostics": formatted_diagnostics,
-                "previewData": df_limpio.head(50).fillna("N/A").to_dict(orient="records"),
+                "previewData": df_limpio.head(50).astype(object).fillna("N/A").to_dict(orient="records"),
                 "cleaning_message": cleaning_result.get("message", "Transformación aplicada con éxito.")
             }
 
@@ -614,6 +860,8 @@ def edit_columns(current_user, dataset_id):
                 "error": "Error al generar análisis del dataset modificado."
             }), 500
 
+    except DatasetSessionConflict as e:
+        return jsonify({"success": False, "error": str(e)}), 409
     except Exception as e:
         logger.error(f"[edit_columns] Error en el endpoint edit-columns: {e}", exc_info=True)
         return jsonify({"success": False, "error": "Error interno del servidor"}), 500
@@ -727,7 +975,6 @@ def save_dataset_text_content(current_user, dataset_id):
             return jsonify({"success": False, "error": "Dataset no encontrado o acceso denegado."}), 404
         
         storage_path = dataset_info["data"].get("storage_path")
-        file_ext = os.path.splitext(storage_path)[-1].lower().replace('.', '')
 
         # --- 2. Convertir el texto editado en un DataFrame ---
         # El frontend nos envía un string en formato CSV, así que lo leemos.
@@ -738,30 +985,18 @@ def save_dataset_text_content(current_user, dataset_id):
             logger.error(f"Error al parsear el CSV del editor: {e}")
             return jsonify({"success": False, "error": "El formato del texto editado no es un CSV válido."}), 400
 
-        # --- 3. Convertir el DataFrame al formato de archivo original y guardarlo en Supabase ---
-        # Esto SOBRESCRIBE el archivo viejo con los nuevos datos.
+        # --- 3. Guardarlo en Supabase con el formato del archivo original ---
+        # Esto SOBRESCRIBE el archivo viejo con los nuevos datos (con una sesión de
+        # edición abierta, el cambio queda en la sesión y lo persiste su guardado).
         try:
-            buffer_out = BytesIO()
-            if file_ext == 'parquet':
-                df_modificado.to_parquet(buffer_out, index=False)
-            elif file_ext == 'xlsx':
-                df_modificado.to_excel(buffer_out, index=False)
-            else: # Asumimos CSV como default
-                df_modificado.to_csv(buffer_out, index=False)
-            
-            buffer_out.seek(0)
-            
-            # Subimos el buffer para sobrescribir el archivo en el Storage
-            supabase_admin.storage.from_("proyectos-usuarios").update(
-                path=storage_path,
-                file=buffer_out.getvalue(),
-                file_options={
-                    "content-type": "application/octet-stream",
-                    "cache-control": "0",
-                    "upsert": "true"
-                }
+            session = dataset_session_manager.get(current_user.id, dataset_id)
+            if not _store_working_dataframe(session, None, df_modificado, "edit_text_content"):
+                supabase_handler.save_dataframe_to_storage(
+                    user_id=current_user.id,
+                    path=storage_path,
+                    df=df_modificado
                 )
-            logger.info(f"Archivo '{storage_path}' sobrescrito con éxito en Supabase Storage.")
+                logger.info(f"Archivo '{storage_path}' sobrescrito con éxito en Supabase Storage.")
 
         except Exception as e:
             logger.error(f"Error al guardar el archivo modificado en Supabase: {e}")
@@ -861,7 +1096,7 @@ def get_dataset_promptlab_content(current_user, dataset_id):
 
         # 3. Descargar archivo del storage
         try:
-            file_bytes = supabase_admin.storage.from_(BUCKET_NAME).download(storage_path)
+            file_bytes = storage_transport.from_(BUCKET_NAME).download(storage_path)
         except Exception as storage_err:
             logger.error(
                 f"Error al descargar archivo desde storage para dataset {dataset_id}: {storage_err}",
@@ -973,7 +1208,7 @@ def get_document_text_content(current_user, dataset_id):
             return jsonify({"success": False, "error": "Ruta de archivo no disponible"}), 500
 
         try:
-            file_bytes = supabase_admin.storage.from_(BUCKET_NAME).download(storage_path)
+            file_bytes = storage_transport.from_(BUCKET_NAME).download(storage_path)
         except Exception as storage_err:
             logger.error(f"Error al descargar archivo desde storage para dataset {dataset_id}: {storage_err}", exc_info=True)
             return jsonify({"success": False, "error": "No se pudo acceder al archivo"}), 500
@@ -1272,6 +1507,264 @@ def analyze_profile_writing(current_user):
     
 
 
+# ================================================================
+#    SESIONES DE EDICIÓN (cargar una vez, aplicar muchas, guardar una vez)
+# ================================================================
+
+def _load_working_dataframe(user_id, dataset_id, storage_path):
+    """
+    Devuelve (df, session). Si el usuario tiene una sesión de edición abierta para el
+    dataset se usa el DataFrame en memoria; si no, se carga desde Storage como siempre.
+    """
+    session = dataset_session_manager.get(user_id, dataset_id)
+    if session is not None:
+        return session.df, session
+    return supabase_handler.load_file_as_dataframe(user_id=user_id, path=storage_path), None
+
+
+def _load_working_columns(user_id, dataset_id, storage_path, columns=None, filters=None):
+    """
+    Como _load_working_dataframe, pero leyendo solo `columns` y las filas que cumplen
+    `filters`: desde Storage se empujan a la lectura Parquet (proyección + row groups).
+    Con columns=None y sin filtros se carga el DataFrame completo.
+    """
+    session = dataset_session_manager.get(user_id, dataset_id)
+    if session is not None:
+        return apply_filters_in_memory(session.df, columns, filters), session
+    df = supabase_handler.load_file_as_dataframe(
+        user_id=user_id, path=storage_path, columns=columns, filters=filters
+    )
+    return df, None
+
+
+def _store_working_dataframe(session, base_df, df_clean, action):
+    """
+    Con sesión abierta el cambio queda en memoria (lo persiste el commit o el write-behind).
+    Devuelve False si no hay sesión y el endpoint debe guardar en Storage por su cuenta.
+    """
+    if session is None:
+        return False
+    session.update(df_clean, action=action, base=base_df)
+    return True
+
+
+def _profile_cache_key(dataset_id, storage_path, session, version=None, mode="auto"):
+    """Clave del perfil: la revisión de la sesión abierta o la versión del objeto en Storage, más el modo."""
+    if session is not None:
+        return f"session:{dataset_id}:{session.revision}|{mode}"
+    version = version or supabase_handler.get_object_version(storage_path)
+    return f"{storage_path}|{version}|{mode}" if version else None
+
+
+def _profile_mode_from_request():
+    """Modo de perfilado pedido por query string (?mode=exact|approx|auto)."""
+    mode = request.args.get("mode", "auto").lower()
+    return mode if mode in PROFILE_MODES else "auto"
+
+
+def _load_dataset_profile(user_id, dataset_id, storage_path, need_dataframe=False, mode="auto"):
+    """
+    Devuelve (profile, df) con el perfil de una sola pasada de services/dataset_profile.py.
+    Si el perfil de esta versión ya está cacheado y no se pide el DataFrame, no se descarga
+    nada: diagnose, check-quality, columns-summary y column-details comparten el mismo perfil.
+    """
+    session = dataset_session_manager.get(user_id, dataset_id)
+    if session is not None:
+        key = _profile_cache_key(dataset_id, storage_path, session, mode=mode)
+        return profile_cache.get_or_build(key, session.df, mode=mode, row_hashes=session.row_hashes), session.df
+
+    version = supabase_handler.get_object_version(storage_path)
+    key = _profile_cache_key(dataset_id, storage_path, None, version=version, mode=mode)
+    profile = profile_cache.get(key)
+    if profile is not None and not need_dataframe:
+        return profile, None
+
+    df = supabase_handler.load_file_as_dataframe(user_id=user_id, path=storage_path, version=version)
+    if df is None:
+        return None, None
+    if profile is None:
+        # El índice de hashes guardado junto al archivo evita rehashear todas las filas.
+        row_hashes = supabase_handler.load_row_hashes(storage_path, version, n_rows=len(df))
+        profile = profile_cache.get_or_build(key, df, mode=mode, row_hashes=row_hashes)
+    return profile, df
+
+
+def _cached_profile(dataset_id, storage_path, session):
+    """Perfil cacheado del estado actual (o None): habilita el re-diagnóstico incremental."""
+    return profile_cache.get(_profile_cache_key(dataset_id, storage_path, session))
+
+
+def _remember_profile(dataset_id, storage_path, session, profile):
+    """
+    Guarda el perfil que devolvió cleaning_action para la nueva versión del dataset y
+    mantiene el índice de hashes de fila: en la sesión (se persiste con el guardado) o,
+    si el endpoint ya escribió en Storage, directamente junto al archivo.
+    """
+    if profile is None:
+        return
+    if profile.row_hashes is not None:
+        if session is not None:
+            session.row_hashes = profile.row_hashes
+        else:
+            supabase_handler.save_row_hashes(storage_path, profile.row_hashes)
+    key = _profile_cache_key(dataset_id, storage_path, session)
+    if key is not None:
+        profile_cache.put(key, profile)
+        # El mismo perfil responde también a quien pida explícitamente su modo.
+        resolved = "approx" if profile.approximate else "exact"
+        profile_cache.put(key.rsplit("|", 1)[0] + f"|{resolved}", profile)
+
+
+@app.route('/api/datasets/<string:dataset_id>/session', methods=['POST'])
+@token_required
+def open_dataset_session(current_user, dataset_id):
+    try:
+        dataset_info = dataset_service.get_dataset_info_by_id(dataset_id, current_user.id)
+        if not dataset_info or not dataset_info.get("success"):
+            return jsonify({"success": False, "error": "Dataset no encontrado."}), 404
+
+        storage_path = dataset_info["data"].get("storage_path")
+        if not storage_path:
+            return jsonify({"success": False, "error": "Ruta del archivo no disponible."}), 500
+
+        session = dataset_session_manager.open(current_user.id, dataset_id, storage_path)
+        return jsonify({"success": True, "data": session.summary()}), 200
+
+    except PermissionError as e:
+        return jsonify({"success": False, "error": str(e)}), 409
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error abriendo sesión para dataset {dataset_id}: {e}", exc_info=True)
+        return jsonify({"success": False, "error": "Error interno en el servidor."}), 500
+
+
+@app.route('/api/datasets/<string:dataset_id>/session', methods=['GET'])
+@token_required
+def get_dataset_session(current_user, dataset_id):
+    session = dataset_session_manager.get(current_user.id, dataset_id)
+    if session is None:
+        return jsonify({"success": True, "data": {"dataset_id": dataset_id, "open": False}}), 200
+    return jsonify({"success": True, "data": {**session.summary(), "open": True}}), 200
+
+
+@app.route('/api/datasets/<string:dataset_id>/session/commit', methods=['POST'])
+@token_required
+def commit_dataset_session(current_user, dataset_id):
+    try:
+        result = dataset_session_manager.commit(current_user.id, dataset_id)
+        return jsonify(result), 200 if result.get("success") else 404
+    except Exception as e:
+        logger.error(f"Error guardando sesión del dataset {dataset_id}: {e}", exc_info=True)
+        return jsonify({"success": False, "error": "No se pudo guardar el dataset."}), 500
+
+
+@app.route('/api/datasets/<string:dataset_id>/session', methods=['DELETE'])
+@token_required
+def close_dataset_session(current_user, dataset_id):
+    """Cierra la sesión. Por defecto guarda los cambios; `?discard=true` los descarta."""
+    try:
+        discard = request.args.get("discard", "false").lower() == "true"
+        result = dataset_session_manager.close(current_user.id, dataset_id, commit=not discard)
+        return jsonify(result), 200 if result.get("success") else 404
+    except Exception as e:
+        logger.error(f"Error cerrando sesión del dataset {dataset_id}: {e}", exc_info=True)
+        return jsonify({"success": False, "error": "No se pudo guardar el dataset."}), 500
+
+
+# ================================================================
+#    HISTORIAL DE VERSIONES (deshacer / rehacer / lectura puntual)
+# ================================================================
+
+def _dataset_manifest(user_id, dataset_id, storage_path):
+    """Manifiesto vigente: el de la sesión abierta o el guardado junto al archivo."""
+    session = dataset_session_manager.get(user_id, dataset_id)
+    if session is not None:
+        return session.manifest, session
+    if dataset_version_store is None:
+        return None, None
+    version = supabase_handler.get_object_version(storage_path)
+    return dataset_version_store.load_manifest(storage_path, version), None
+
+
+@app.route('/api/datasets/<string:dataset_id>/versions', methods=['GET'])
+@token_required
+def list_dataset_versions(current_user, dataset_id):
+    try:
+        dataset_info = dataset_service.get_dataset_info_by_id(dataset_id, current_user.id)
+        if not dataset_info or not dataset_info.get("success"):
+            return jsonify({"success": False, "error": "Dataset no encontrado."}), 404
+        storage_path = dataset_info["data"].get("storage_path")
+
+        manifest, session = _dataset_manifest(current_user.id, dataset_id, storage_path)
+        data = DatasetVersionStore.summary(manifest)
+        if session is not None:
+            data["session"] = session.summary()
+        return jsonify({"success": True, "data": data}), 200
+    except Exception as e:
+        logger.error(f"Error listando versiones del dataset {dataset_id}: {e}", exc_info=True)
+        return jsonify({"success": False, "error": "No se pudo leer el historial de versiones."}), 500
+
+
+@app.route('/api/datasets/<string:dataset_id>/versions/undo', methods=['POST'])
+@token_required
+def undo_dataset_version(current_user, dataset_id):
+    """Vuelve a la versión anterior. Requiere una sesión de edición abierta."""
+    try:
+        result = dataset_session_manager.undo(current_user.id, dataset_id)
+        return jsonify(result), 200 if result.get("success") else 409
+    except Exception as e:
+        logger.error(f"Error deshaciendo en el dataset {dataset_id}: {e}", exc_info=True)
+        return jsonify({"success": False, "error": "No se pudo deshacer el cambio."}), 500
+
+
+@app.route('/api/datasets/<string:dataset_id>/versions/redo', methods=['POST'])
+@token_required
+def redo_dataset_version(current_user, dataset_id):
+    """Reaplica la versión siguiente (si no hubo cambios nuevos después de deshacer)."""
+    try:
+        result = dataset_session_manager.redo(current_user.id, dataset_id)
+        return jsonify(result), 200 if result.get("success") else 409
+    except Exception as e:
+        logger.error(f"Error rehaciendo en el dataset {dataset_id}: {e}", exc_info=True)
+        return jsonify({"success": False, "error": "No se pudo rehacer el cambio."}), 500
+
+
+@app.route('/api/datasets/<string:dataset_id>/versions/<int:version>', methods=['GET'])
+@token_required
+def get_dataset_version(current_user, dataset_id, version):
+    """Lectura puntual: vista previa de una versión reconstruida desde el manifiesto."""
+    try:
+        dataset_info = dataset_service.get_dataset_info_by_id(dataset_id, current_user.id)
+        if not dataset_info or not dataset_info.get("success"):
+            return jsonify({"success": False, "error": "Dataset no encontrado."}), 404
+        storage_path = dataset_info["data"].get("storage_path")
+
+        manifest, session = _dataset_manifest(current_user.id, dataset_id, storage_path)
+        if manifest is None:
+            return jsonify({"success": False, "error": "El dataset no tiene historial de versiones."}), 404
+
+        base_df, base_at = None, None
+        if session is not None and not session.pending_deltas:
+            base_df, base_at = session.df, manifest["head"]
+        df = dataset_version_store.checkout(current_user.id, manifest, version, base_df=base_df, base_at=base_at)
+
+        return jsonify({
+            "success": True,
+            "data": {
+                "version": version,
+                "rows": int(df.shape[0]),
+                "columns": int(df.shape[1]),
+                "previewData": df.head(100).astype(object).fillna("N/A").to_dict(orient="records"),
+            }
+        }), 200
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 404
+    except Exception as e:
+        logger.error(f"Error leyendo la versión {version} del dataset {dataset_id}: {e}", exc_info=True)
+        return jsonify({"success": False, "error": "No se pudo reconstruir la versión."}), 500
+
+
     # ================================================================
 #    ENDPOINT: CLEAN ACTION SOBRE UNA COLUMNA DEL DATASET
 # ================================================================
@@ -1296,13 +1789,13 @@ def clean_column_action_transformer(current_user, dataset_id):
         if not storage_path:
             return jsonify({"success": False, "error": "Ruta del archivo no disponible."}), 500
 
-        # --- 2. Cargar DataFrame ---
-        df = supabase_handler.load_file_as_dataframe(user_id=current_user.id, path=storage_path)
+        # --- 2. Cargar DataFrame (de la sesión abierta, si la hay) ---
+        df, session = _load_working_dataframe(current_user.id, dataset_id, storage_path)
         if df is None or df.empty:
             return jsonify({"success": False, "error": "No se pudo procesar el archivo."}), 400
 
         # --- 3. Ejecutar acción ---
-        result = cleaning_action(df, action, params)
+        result = cleaning_action(df, action, params, base_profile=_cached_profile(dataset_id, storage_path, session))
         if not result.get("success"):
             return jsonify(result), 400
 
@@ -1316,16 +1809,17 @@ def clean_column_action_transformer(current_user, dataset_id):
                 return jsonify({"success": False, "error": "Respuesta inesperada del servicio de limpieza."}), 500
 
         # --- 4. Guardar DataFrame ---
-        supabase_handler.save_dataframe_to_storage(user_id=current_user.id, path=storage_path, df=df_clean)
+        if not _store_working_dataframe(session, df, df_clean, action):
+            supabase_handler.save_dataframe_to_storage(user_id=current_user.id, path=storage_path, df=df_clean)
+        _remember_profile(dataset_id, storage_path, session, result.get("profile"))
 
-        # --- 5. Re-análisis ---
-        df_clean_safe = df_clean.fillna(np.nan).replace([np.nan], [None])
-        analysis_result = get_preliminary_analysis(df_clean_safe)
-        if not analysis_result.get("success"):
+        # --- 5. Diagnóstico (ya calculado por cleaning_action, incremental si se pudo) ---
+        analysis_data = result.get("new_diagnostics")
+        if analysis_data is None:
             return jsonify({"success": False, "error": "No se pudo re-analizar el dataset."}), 500
+        df_clean_safe = df_clean.head(100).fillna(np.nan).replace([np.nan], [None])
 
         # --- 6. Formatear respuesta ---
-        analysis_data = analysis_result["data"]
         formatted_diagnostics = {
             "summary": {
                 "totalRows": analysis_data["project_summary"]["rows"],
@@ -1342,12 +1836,14 @@ def clean_column_action_transformer(current_user, dataset_id):
 
         final_response_data = {
             "diagnostics": formatted_diagnostics,
-            "previewData": df_clean_safe.head(100).to_dict(orient="records"),
+            "previewData": df_clean_safe.to_dict(orient="records"),
             "cleaning_message": result.get("message", "Acción de limpieza aplicada correctamente.")
         }
 
         return jsonify({"success": True, "data": final_response_data}), 200
 
+    except DatasetSessionConflict as e:
+        return jsonify({"success": False, "error": str(e)}), 409
     except Exception as e:
         logger.error(f"Error en endpoint /columns/clean_action: {e}", exc_info=True)
         return jsonify({"success": False, "error": "Error interno en el servidor."}), 500
@@ -1382,7 +1878,7 @@ def clean_dataset(current_user, dataset_id):
         if not storage_path:
             return jsonify({"success": False, "error": "Ruta del archivo no disponible."}), 500
 
-        df = supabase_handler.load_file_as_dataframe(user_id=current_user.id, path=storage_path)
+        df, session = _load_working_dataframe(current_user.id, dataset_id, storage_path)
         if df is None or df.empty:
             return jsonify({"success": False, "error": "No se pudo cargar el dataset."}), 400
         
@@ -1390,10 +1886,9 @@ def clean_dataset(current_user, dataset_id):
         print(f"\n--- DEBUG: CLEAN DATASET - ANTES DE LIMPIAR ---")
         print(f"Acción a ejecutar: {backend_action}")
         print(f"Shape del DataFrame original: {df.shape}")
-        print(f"Duplicados en DataFrame original: {df.duplicated().sum()}")
         # --- FIN DE DEPURACIÓN ---
         
-        result = orquestador.cleaning_action(df, backend_action, params)
+        result = orquestador.cleaning_action(df, backend_action, params, base_profile=_cached_profile(dataset_id, storage_path, session))
         
         # --- INICIO DE DEPURACIÓN (PASO 2) ---
         print(f"\n--- DEBUG: CLEAN DATASET - DESPUÉS DEL ORQUESTADOR ---")
@@ -1401,7 +1896,6 @@ def clean_dataset(current_user, dataset_id):
         if 'cleaned_dataframe' in result:
             df_clean_temp = result["cleaned_dataframe"]
             print(f"Shape del DataFrame limpio: {df_clean_temp.shape}")
-            print(f"Duplicados en DataFrame limpio: {df_clean_temp.duplicated().sum()}")
         else:
             print("¡ALERTA! El resultado del orquestador NO contiene la clave 'cleaned_dataframe'.")
             print(f"Resultado completo: {result}")
@@ -1415,8 +1909,10 @@ def clean_dataset(current_user, dataset_id):
         message = result.get("message", "Acción completada exitosamente.")
 
         # Aquí vamos a asumir que el guardado funciona, pero la depuración nos lo confirmará.
-        supabase_handler.save_dataframe_to_storage(user_id=current_user.id, path=storage_path, df=df_clean)
-        print("--- DEBUG: DataFrame limpio enviado a Supabase Handler para guardado. ---\n")
+        if not _store_working_dataframe(session, df, df_clean, backend_action):
+            supabase_handler.save_dataframe_to_storage(user_id=current_user.id, path=storage_path, df=df_clean)
+            print("--- DEBUG: DataFrame limpio enviado a Supabase Handler para guardado. ---\n")
+        _remember_profile(dataset_id, storage_path, session, result.get("profile"))
 
         response_data = {
             "diagnostics": {
@@ -1432,14 +1928,84 @@ def clean_dataset(current_user, dataset_id):
                 "columnDetails": new_diagnostics["nulls_summary"]["by_column"],
                 "columns_info": new_diagnostics.get("columns_info", {})
             },
-            "previewData": df_clean.head(100).fillna("N/A").to_dict(orient="records")
+            "previewData": df_clean.head(100).astype(object).fillna("N/A").to_dict(orient="records")
         }
 
         return jsonify({"success": True, "message": message, "data": response_data}), 200
 
+    except DatasetSessionConflict as e:
+        return jsonify({"success": False, "error": str(e)}), 409
     except Exception as e:
         logger.error(f"Error general en clean_dataset: {e}", exc_info=True)
-     
+
+        return jsonify({"success": False, "error": "Ocurrió un error interno durante la limpieza."}), 500
+
+
+# ================================================================
+#    ENDPOINT: PIPELINE DE LIMPIEZA (receta de varias acciones)
+# ================================================================
+
+@app.route('/api/datasets/<string:dataset_id>/clean/pipeline', methods=['POST'])
+@token_required
+def clean_dataset_pipeline(current_user, dataset_id):
+    """
+    Aplica una lista ordenada de acciones (mismos nombres que ACTION_MAP) en una sola
+    ejecución: una carga, una normalización, un guardado y un diagnóstico.
+    Body: {"steps": [{"action": "...", "params": {...}}, ...]}
+    """
+    try:
+        payload = request.get_json() or {}
+        steps = payload.get("steps")
+        if not isinstance(steps, list) or not steps:
+            return jsonify({"success": False, "error": "Se esperaba 'steps' con al menos una acción."}), 400
+
+        dataset_info = dataset_service.get_dataset_info_by_id(dataset_id, current_user.id)
+        if not dataset_info or not dataset_info.get("success"):
+            return jsonify({"success": False, "error": "Dataset no encontrado."}), 404
+
+        storage_path = dataset_info["data"].get("storage_path")
+        if not storage_path:
+            return jsonify({"success": False, "error": "Ruta del archivo no disponible."}), 500
+
+        df, session = _load_working_dataframe(current_user.id, dataset_id, storage_path)
+        if df is None or df.empty:
+            return jsonify({"success": False, "error": "No se pudo cargar el dataset."}), 400
+
+        result = orquestador.cleaning_pipeline(df, steps, base_profile=_cached_profile(dataset_id, storage_path, session))
+        if not result.get("success"):
+            return jsonify({"success": False, "error": result.get("error", "Error en el pipeline de limpieza.")}), 400
+
+        df_clean = result["cleaned_dataframe"]
+        if not _store_working_dataframe(session, df, df_clean, f"pipeline ({len(steps)} pasos)"):
+            supabase_handler.save_dataframe_to_storage(user_id=current_user.id, path=storage_path, df=df_clean)
+        _remember_profile(dataset_id, storage_path, session, result.get("profile"))
+
+        new_diagnostics = result["new_diagnostics"]
+        response_data = {
+            "diagnostics": {
+                "summary": {
+                    "totalRows": new_diagnostics["project_summary"]["rows"],
+                    "totalColumns": new_diagnostics["project_summary"]["columns"],
+                    "duplicates": new_diagnostics["duplicates_summary"],
+                    "nanValues": {
+                        "totalCount": new_diagnostics["nulls_summary"]["total_count"],
+                        "percentage": new_diagnostics["nulls_summary"]["total_percentage"]
+                    }
+                },
+                "columnDetails": new_diagnostics["nulls_summary"]["by_column"],
+                "columns_info": new_diagnostics.get("columns_info", {})
+            },
+            "steps": result["steps"],
+            "plan": result["plan"],
+            "previewData": df_clean.head(100).astype(object).fillna("N/A").to_dict(orient="records")
+        }
+
+        return jsonify({"success": True, "message": result.get("message", ""), "data": response_data}), 200
+
+    except DatasetSessionConflict as e:
+        return jsonify({"success": False, "error": str(e)}), 409
+    except Exception as e:
+        logger.error(f"Error general en clean_dataset_pipeline: {e}", exc_info=True)
         return jsonify({"success": False, "error": "Ocurrió un error interno durante la limpieza."}), 500
 
 
@@ -1455,13 +2021,13 @@ def clean_column_from_inspector(current_user, dataset_id):
 
         dataset_info = dataset_service.get_dataset_info_by_id(dataset_id, current_user.id)
         storage_path = dataset_info["data"].get("storage_path")
-        df = supabase_handler.load_file_as_dataframe(user_id=current_user.id, path=storage_path)
+        df, session = _load_working_dataframe(current_user.id, dataset_id, storage_path)
         
 
         if df is None:
             raise ValueError("No se pudo leer el archivo tabular.")
 
-        result = orquestador.cleaning_action(df, action, params)
+        result = orquestador.cleaning_action(df, action, params, base_profile=_cached_profile(dataset_id, storage_path, session))
         if not result.get("success"):
             return jsonify(result), 400
 
@@ -1477,34 +2043,18 @@ def clean_column_from_inspector(current_user, dataset_id):
 
         message = result.get("message", "Acción completada.")
 
-        # Guardar en Supabase
-        file_ext = os.path.splitext(storage_path)[-1].lower().replace('.', '')
-        buffer_out = BytesIO()
-        if file_ext == 'xlsx':
-            df_clean.to_excel(buffer_out, index=False)
-        elif file_ext == 'parquet':
-            df_clean.to_parquet(buffer_out, index=False)
-        else:
-            df_clean.to_csv(buffer_out, index=False)
-        buffer_out.seek(0)
-
-        supabase_admin.storage.from_("proyectos-usuarios").update(
-            path=storage_path,
-            file=buffer_out.getvalue(),
-            file_options={
-                "content-type": "application/octet-stream",
-                "cache-control": "0",
-                "upsert": "true"
-            }
-        )
+        # Guardar en Supabase (o dejarlo en la sesión abierta)
+        if not _store_working_dataframe(session, df, df_clean, action):
+            supabase_handler.save_dataframe_to_storage(user_id=current_user.id, path=storage_path, df=df_clean)
+        _remember_profile(dataset_id, storage_path, session, result.get("profile"))
 
         updated_column_details = None
         if columna_afectada:
-            details_result = orquestador.get_column_details(df_clean, columna_afectada)
+            details_result = orquestador.get_column_details(df_clean, columna_afectada, profile=result.get("profile"))
             if details_result.get("success"):
                 updated_column_details = details_result["data"]
 
-        analysis_result = orquestador.get_preliminary_analysis(df_clean)
+        analysis_result = orquestador.get_preliminary_analysis(df_clean, profile=result.get("profile"))
         analysis_data = analysis_result["data"] if analysis_result.get("success") else {}
 
         formatted_diagnostics = {
@@ -1523,12 +2073,14 @@ def clean_column_from_inspector(current_user, dataset_id):
 
         final_response_data = {
             "diagnostics": formatted_diagnostics,
-            "previewData": df_clean.head(100).fillna("N/A").to_dict(orient="records"),
+            "previewData": df_clean.head(100).astype(object).fillna("N/A").to_dict(orient="records"),
             "updatedColumnDetails": updated_column_details
         }
 
         return jsonify({"success": True, "message": message, "data": final_response_data}), 200
 
+    except DatasetSessionConflict as e:
+        return jsonify({"success": False, "error": str(e)}), 409
     except Exception as e:
         logger.error(f"Error en endpoint /columns/clean: {e}", exc_info=True)
         return jsonify({"success": False, "error": "Ocurrió un error interno."}), 500
@@ -1556,7 +2108,10 @@ def diagnose_dataset(current_user, dataset_id):
         )
 
         BUCKET_NAME = 'proyectos-usuarios'
-        file_content_bytes = supabase_admin.storage.from_(BUCKET_NAME).download(storage_path)
+        # Los tabulares se leen con load_file_as_dataframe (caché / sesión); no hace falta el binario.
+        file_content_bytes = None
+        if dataset_type_from_db != 'tabular':
+            file_content_bytes = storage_transport.from_(BUCKET_NAME).download(storage_path)
 
         previewData = {}
         diagnostics = {}
@@ -1564,14 +2119,16 @@ def diagnose_dataset(current_user, dataset_id):
 
         if dataset_type_from_db == 'tabular':
             try:
-                df = supabase_handler.load_file_as_dataframe(user_id=current_user.id, path=storage_path)
+                profile, df = _load_dataset_profile(
+                    current_user.id, dataset_id, storage_path, need_dataframe=True, mode=_profile_mode_from_request()
+                )
                 if df is None:
                    return jsonify({"success": False, "error": "No se pudo leer el archivo. Formato no soportado o archivo corrupto."}), 400
                 print(f"\n--- DEBUG: DIAGNOSE DATASET ID {dataset_id} ---")
-                print(f"[1] DataFrame COMPLETO: {df.shape[0]} filas, {df.shape[1]} columnas")
-                print(f"[2] Duplicados encontrados: {df.duplicated().sum()}")
+                print(f"[1] DataFrame COMPLETO: {profile.n_rows} filas, {profile.n_cols} columnas")
+                print(f"[2] Duplicados encontrados: {profile.duplicate_count}")
 
-                analysis_result = get_preliminary_analysis(df)
+                analysis_result = get_preliminary_analysis(df, profile=profile)
                 print(f"[3] Resultado análisis preliminar: {json.dumps(analysis_result, indent=2)[:1000]}")
                 print("--- FIN DEBUG ---\n")
 
@@ -1590,7 +2147,9 @@ def diagnose_dataset(current_user, dataset_id):
                         }
                     },
                     "columnDetails": analysis_data["nulls_summary"]["by_column"],
-                    "columns_info": analysis_data["columns_info"] 
+                    "columns_info": analysis_data["columns_info"],
+                    "approximate": analysis_data.get("approximate", False),
+                    "errorBounds": analysis_data.get("error_bounds")
                 }
                 
                 
@@ -1705,11 +2264,11 @@ def get_columns_summary(current_user, dataset_id):
         dataset_info = dataset_service.get_dataset_info_by_id(dataset_id, current_user.id)
         storage_path = dataset_info["data"].get("storage_path")
 
-        df = supabase_handler.load_file_as_dataframe(user_id=current_user.id, path=storage_path)
-        if df is None:
+        profile, _ = _load_dataset_profile(current_user.id, dataset_id, storage_path, mode=_profile_mode_from_request())
+        if profile is None:
             return jsonify({"success": False, "error": "No se pudo cargar el archivo (formato no soportado o corrupto)."}), 400
 
-        result = orquestador.get_analysis_for_visualization(df)
+        result = orquestador.get_analysis_for_visualization(None, profile=profile)
         if result.get("success"):
             return jsonify(result)
         else:
@@ -1732,10 +2291,22 @@ def get_visualization(current_user, dataset_id):
         if not plot_type:
             return jsonify({"success": False, "error": "Falta 'plot_type'."}), 400
 
+        try:
+            filters = normalize_filters(payload.get('filters'))
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+
         dataset_info = dataset_service.get_dataset_info_by_id(dataset_id, current_user.id)
         storage_path = dataset_info["data"].get("storage_path")
 
-        df = supabase_handler.load_file_as_dataframe(user_id=current_user.id, path=storage_path)
+        # Solo se leen las columnas que usa el gráfico (y las filas que pasan los filtros).
+        try:
+            df, _ = _load_working_columns(
+                current_user.id, dataset_id, storage_path,
+                columns=columnas_necesarias(plot_type, params), filters=filters,
+            )
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
         if df is None:
             return jsonify({"success": False, "error": "No se pudo cargar el archivo (formato no soportado o corrupto)."}), 400
 
@@ -1762,12 +2333,25 @@ def get_column_details_endpoint(current_user, dataset_id):
         dataset_info = dataset_service.get_dataset_info_by_id(dataset_id, current_user.id)
         storage_path = dataset_info["data"].get("storage_path")
 
-        df = supabase_handler.load_file_as_dataframe(user_id=current_user.id, path=storage_path)
-        if df is None:
-            return jsonify({"success": False, "error": "No se pudo cargar el archivo (formato no soportado o corrupto)."}), 400
+        mode = _profile_mode_from_request()
+        session = dataset_session_manager.get(current_user.id, dataset_id)
+        profile = profile_cache.get(_profile_cache_key(dataset_id, storage_path, session, mode=mode))
 
-        # Solo delega el análisis
-        result = get_column_details(df, column_name)
+        if profile is not None or session is not None:
+            if profile is None:
+                profile, _ = _load_dataset_profile(current_user.id, dataset_id, storage_path, mode=mode)
+            # Solo delega el análisis (sale del perfil cacheado de esta versión)
+            result = get_column_details(None, column_name, profile=profile)
+        else:
+            # Sin perfil cacheado basta con leer esa columna del Parquet, no el dataset entero.
+            df_col = supabase_handler.load_file_as_dataframe(
+                user_id=current_user.id, path=storage_path, columns=[column_name]
+            )
+            if df_col is None:
+                return jsonify({"success": False, "error": "No se pudo cargar el archivo (formato no soportado o corrupto)."}), 400
+            if column_name not in df_col.columns:
+                return jsonify({"success": False, "error": f"La columna '{column_name}' no existe.", "error_code": "COLUMN_NOT_FOUND"}), 400
+            result = get_column_details(df_col, column_name, mode=mode)
         status_code = 200 if result.get("success") else 400
         return jsonify(result), status_code
 
@@ -1805,50 +2389,29 @@ def create_column_from_production(current_user, dataset_id):
         storage_path = dataset_info["data"].get("storage_path")
         
 
-        df = supabase_handler.load_file_as_dataframe(
-            user_id=current_user.id,
-            path=storage_path
-        )
+        df, session = _load_working_dataframe(current_user.id, dataset_id, storage_path)
 
         print(f"\n--- DEBUG: ENDPOINT /columns/create ---")
         print(f"[ENTRADA] Shape del DataFrame: {df.shape}")
-        print(f"[ENTRADA] Duplicados: {df.duplicated().sum()}")
 
         if df is None:
             raise ValueError("No se pudo leer el archivo tabular. Podría estar corrupto o en un formato no soportado.")
 
         # --- 2. Ejecutar la acción de creación de columna ---
-        result = orquestador.cleaning_action(df, action, params)
+        result = orquestador.cleaning_action(df, action, params, base_profile=_cached_profile(dataset_id, storage_path, session))
         if not result.get("success"):
             return jsonify(result), 400
 
         df_clean = result["cleaned_dataframe"]
         message = result.get("message", "Columna creada correctamente.")
 
-        # --- 3. Guardar archivo actualizado ---
-        file_ext = os.path.splitext(storage_path)[-1].lower().replace('.', '')
-        buffer_out = BytesIO()
-
-        if file_ext == 'xlsx':
-            df_clean.to_excel(buffer_out, index=False)
-        elif file_ext == 'parquet':
-            df_clean.to_parquet(buffer_out, index=False)
-        else:
-            df_clean.to_csv(buffer_out, index=False)
-        buffer_out.seek(0)
-
-        supabase_admin.storage.from_("proyectos-usuarios").update(
-            path=storage_path,
-            file=buffer_out.getvalue(),
-            file_options={
-               "content-type": "application/octet-stream",
-               "cache-control": "0",
-               "upsert": "true"
-            }
-        )
+        # --- 3. Guardar archivo actualizado (o dejarlo en la sesión abierta) ---
+        if not _store_working_dataframe(session, df, df_clean, action):
+            supabase_handler.save_dataframe_to_storage(user_id=current_user.id, path=storage_path, df=df_clean)
+        _remember_profile(dataset_id, storage_path, session, result.get("profile"))
 
         # --- 4. Diagnóstico general ---
-        analysis_result = orquestador.get_preliminary_analysis(df_clean)
+        analysis_result = orquestador.get_preliminary_analysis(df_clean, profile=result.get("profile"))
 
         if not analysis_result.get("success"):
             return jsonify({"success": False, "error": "Error generando diagnóstico."}), 500
@@ -1880,6 +2443,8 @@ def create_column_from_production(current_user, dataset_id):
             "data": response_data
         })
 
+    except DatasetSessionConflict as e:
+        return jsonify({"success": False, "error": str(e)}), 409
     except Exception as e:
         logger.error(f"Error en endpoint /columns/create: {e}", exc_info=True)
         return jsonify({"success": False, "error": "Ocurrió un error interno."}), 500
@@ -1908,7 +2473,7 @@ def duplicar_columna_endpoint(current_user, dataset_id):
             return jsonify(dataset_info), 404
         
         storage_path = dataset_info["data"].get("storage_path")
-        df = supabase_handler.load_file_as_dataframe(user_id=current_user.id, path=storage_path)
+        df, session = _load_working_dataframe(current_user.id, dataset_id, storage_path)
 
         if df is None:
             return jsonify({"success": False, "error": "No se pudo cargar el dataset."}), 400
@@ -1916,11 +2481,10 @@ def duplicar_columna_endpoint(current_user, dataset_id):
         # --- Depuración de ENTRADA ---
         print("\n--- DEBUG: ENDPOINT /columns/duplicate ---")
         print(f"[ENTRADA] Shape del DataFrame: {df.shape}")
-        print(f"[ENTRADA] Duplicados: {df.duplicated().sum()}")
 
         # --- 3. Ejecutar la acción usando el orquestador ---
         action = "general_duplicate_column"
-        result = orquestador.cleaning_action(df, action, params)
+        result = orquestador.cleaning_action(df, action, params, base_profile=_cached_profile(dataset_id, storage_path, session))
         
         if not result.get("success"):
             return jsonify(result), 400
@@ -1930,32 +2494,14 @@ def duplicar_columna_endpoint(current_user, dataset_id):
 
         # --- Depuración de SALIDA ---
         print(f"[SALIDA] Shape del DataFrame modificado: {df_modificado.shape}")
-        print(f"[SALIDA] Duplicados: {df_modificado.duplicated().sum()}")
         print(f"--- FIN DEBUG ---\n")
 
         mensaje = result.get("message", "Columna duplicada correctamente.")
 
-        # --- 4. Guardar archivo actualizado ---
-        file_ext = os.path.splitext(storage_path)[-1].lower().replace('.', '')
-        buffer_out = BytesIO()
-
-        if file_ext == 'xlsx':
-            df_modificado.to_excel(buffer_out, index=False)
-        elif file_ext == 'parquet':
-            df_modificado.to_parquet(buffer_out, index=False)
-        else:  # csv por default
-            df_modificado.to_csv(buffer_out, index=False)
-        buffer_out.seek(0)
-        
-        supabase_admin.storage.from_("proyectos-usuarios").update(
-            path=storage_path,
-            file=buffer_out.getvalue(),
-            file_options={
-                "content-type": "application/octet-stream",
-                "cache-control": "0",
-                "upsert": "true"
-            }
-        )
+        # --- 4. Guardar archivo actualizado (o dejarlo en la sesión abierta) ---
+        if not _store_working_dataframe(session, df, df_modificado, action):
+            supabase_handler.save_dataframe_to_storage(user_id=current_user.id, path=storage_path, df=df_modificado)
+        _remember_profile(dataset_id, storage_path, session, result.get("profile"))
 
         # --- 5. Generar diagnóstico y preview ---
         new_diagnostics = result["new_diagnostics"]
@@ -1986,6 +2532,8 @@ def duplicar_columna_endpoint(current_user, dataset_id):
             "data": response_data
         }), 200
 
+    except DatasetSessionConflict as e:
+        return jsonify({"success": False, "error": str(e)}), 409
     except Exception as e:
         logger.error(f"Error fatal en endpoint /duplicate: {e}", exc_info=True)
         return jsonify({"success": False, "error": "Ocurrió un error interno en el servidor."}), 500
@@ -2029,10 +2577,10 @@ def get_dataset_quality_check(current_user, dataset_id):
             }), 400
 
         # ---------------------------------------------------------------
-        # PASO 2: Cargar el dataset como DataFrame
+        # PASO 2: Obtener el perfil del dataset (cacheado por versión)
         # ---------------------------------------------------------------
-        df = supabase_handler.load_file_as_dataframe(user_id=current_user.id, path=storage_path)
-        if df is None:
+        profile, _ = _load_dataset_profile(current_user.id, dataset_id, storage_path, mode=_profile_mode_from_request())
+        if profile is None:
             logger.warning(f"[QUALITY CHECK] No se pudo cargar el DataFrame desde {storage_path}")
             return jsonify({
                 "success": False,
@@ -2040,7 +2588,7 @@ def get_dataset_quality_check(current_user, dataset_id):
                 "data": {"is_clean": None, "issues": {}}
             }), 400
 
-        if df.empty:
+        if profile.n_rows == 0 or profile.n_cols == 0:
             logger.info(f"[QUALITY CHECK] Dataset {dataset_id} vacío. No hay problemas de calidad que analizar.")
             return jsonify({
                 "success": True,
@@ -2049,9 +2597,9 @@ def get_dataset_quality_check(current_user, dataset_id):
             }), 200
 
         # ---------------------------------------------------------------
-        # PASO 3: Ejecutar función de chequeo de calidad (con copia)
+        # PASO 3: Ejecutar función de chequeo de calidad sobre el perfil
         # ---------------------------------------------------------------
-        quality_result = orquestador.check_dataset_quality(df.copy())
+        quality_result = orquestador.check_dataset_quality(None, profile=profile)
         # Aseguramos estructura de 'data' aunque algo falle internamente
         if "data" not in quality_result:
             quality_result["data"] = {"is_clean": None, "issues": {}}
@@ -2072,6 +2620,46 @@ def get_dataset_quality_check(current_user, dataset_id):
 
 
 
+def _resolve_tabular_model(user_id: str, model_id: str):
+    """
+    Artefactos deserializados de un modelo tabular del usuario, servidos desde
+    model_artifact_cache mientras el objeto en Storage no cambie de versión.
+    Devuelve (artefactos, clave_de_versión, None) o (None, None, (mensaje_de_error, status_http));
+    la clave es None si Storage no informa versión.
+    """
+    model_record = supabase_admin.table('trained_models') \
+        .select('model_storage_path') \
+        .eq('id', model_id) \
+        .eq('user_id', user_id) \
+        .single() \
+        .execute()
+
+    if not model_record.data:
+        return None, None, ("Modelo no encontrado o acceso denegado.", 404)
+
+    model_storage_path = model_record.data.get('model_storage_path')
+    if not model_storage_path:
+        return None, None, ("Ruta de modelo inválida en metadata.", 500)
+
+    # Solo metadatos (eTag + fecha): si el .joblib se reemplaza, cambia la clave de la caché.
+    version = supabase_handler.get_object_version(model_storage_path)
+    version_key = f"{model_storage_path}|{version}" if version else None
+    artifacts = model_artifact_cache.get_or_load(
+        model_id,
+        version_key,
+        lambda: supabase_handler.load_file(user_id=user_id, path=model_storage_path),
+    )
+    if artifacts is None:
+        return None, None, ("No se pudo descargar el modelo.", 500)
+    return artifacts, version_key, None
+
+
+def _load_tabular_model_artifacts(user_id: str, model_id: str):
+    """Como _resolve_tabular_model, sin la clave de versión: (artefactos, error)."""
+    artifacts, _, error = _resolve_tabular_model(user_id, model_id)
+    return artifacts, error
+
+
 @app.route('/api/models/<string:model_id>/predict', methods=['POST'])
 @token_required
 def predict_endpoint(current_user, model_id):
@@ -2085,34 +2673,26 @@ def predict_endpoint(current_user, model_id):
         if not input_data:
             return jsonify({"success": False, "error": "No se proporcionaron datos de entrada."}), 400
 
-        # 2. Buscar metadata del modelo
-        model_record = supabase_admin.table('trained_models') \
-            .select('model_storage_path') \
-            .eq('id', model_id) \
-            .eq('user_id', current_user.id) \
-            .single() \
-            .execute()
-
-        if not model_record.data:
-            return jsonify({"success": False, "error": "Modelo no encontrado o acceso denegado."}), 404
-
-        model_storage_path = model_record.data.get('model_storage_path')
-        if not model_storage_path:
-            return jsonify({"success": False, "error": "Ruta de modelo inválida en metadata."}), 500
-
-        # 3. Cargar modelo de forma segura
-        model_bytes = supabase_handler.load_file(
-            user_id=current_user.id,
-            path=model_storage_path
-        )
-        if model_bytes is None:
-            return jsonify({"success": False, "error": "No se pudo descargar el modelo."}), 500
-
-        # 4. Realizar predicción
-        prediction_result = prediction_service.make_prediction(
-            serialized_model_bytes=model_bytes,
-            input_data=input_data
-        )
+        # 2-3. Metadata y artefactos del modelo (desde la caché si no cambió en Storage)
+        artifacts, version_key, load_error = _resolve_tabular_model(current_user.id, model_id)
+        if load_error:
+            return jsonify({"success": False, "error": load_error[0]}), load_error[1]
+
+        # 3b. Una fila incompleta se rechaza antes de juntarla con otras
+        if not isinstance(input_data, dict):
+            return jsonify({"success": False, "error": "Los datos de entrada deben ser un objeto JSON."}), 400
+        missing = prediction_service.missing_features(artifacts, input_data)
+        if missing:
+            return jsonify({"success": False, "error": f"Faltan features requeridas: {missing}"}), 400
+
+        # 4. Realizar predicción (agrupada con otras peticiones concurrentes a la misma versión
+        #    del modelo en Storage; sin versión conocida no se agrupa)
+        if version_key:
+            prediction_result = prediction_batcher.predict(
+                (model_id, version_key), artifacts, input_data
+            )
+        else:
+            prediction_result = prediction_service.make_prediction(artifacts, input_data)
 
         if not prediction_result.get("success"):
             return jsonify(prediction_result), 400
@@ -2168,15 +2748,17 @@ def analyze_problem_endpoint(current_user, dataset_id):
             return jsonify({"success": False, "error": "Debe especificar 'target_column'."}), 400
         target_col = config["target_column"]
 
-        # --- 2. CARGAR EL DATAFRAME COMPLETO ---
+        # --- 2. CARGAR SOLO LA COLUMNA OBJETIVO ---
         dataset_info = dataset_service.get_dataset_info_by_id(dataset_id, current_user.id)
         storage_path = dataset_info["data"].get("storage_path")
-        df = supabase_handler.load_file_as_dataframe(user_id=current_user.id, path=storage_path)
+        df = supabase_handler.load_file_as_dataframe(user_id=current_user.id, path=storage_path, columns=[target_col])
 
-        if df is None or df.empty:
+        if df is None:
             return jsonify({"success": False, "error": "No se pudo cargar el dataset o está vacío."}), 400
         if target_col not in df.columns:
             return jsonify({"success": False, "error": f"La columna '{target_col}' no existe."}), 400
+        if df.empty:
+            return jsonify({"success": False, "error": "No se pudo cargar el dataset o está vacío."}), 400
 
         # --- 3. DETECTAR EL TIPO REAL DE LA COLUMNA ---
         target_series = df[target_col].dropna()
@@ -2353,9 +2935,9 @@ def prepare_features_endpoint(current_user, dataset_id):
 @app.route('/api/datasets/<string:dataset_id>/train-model', methods=['POST'])
 @token_required
 def train_model_endpoint(current_user, dataset_id):
+    """Valida la configuración y encola el entrenamiento (tasks.train_model_task)."""
     logger = app.logger
     logger.info(f"[TRAIN_MODEL] Usuario={current_user.id} Dataset={dataset_id}")
-    start_time = time.time()
 
     try:
         # --- PASO 1: OBTENER CONFIGURACIÓN (SIN LIMPIEZA) ---
@@ -2368,11 +2950,10 @@ def train_model_endpoint(current_user, dataset_id):
         model_name = config.get("model_name")
         project_name = config.get("project_name")
         model_display_name = config.get("model_display_name")
-        problem_type_from_request = config.get("problem_type")
         encoding_strategies = config.get("encoding_strategies", {})
-        use_smote = bool(config.get("use_smote", False))
-        use_cv = bool(config.get("use_cv", False))
         is_experiment_only = bool(config.get("is_experiment_only", False))
+        # Opcional: {"time_budget_sec", "cpu_budget", "n_candidates", "eta"} activa la búsqueda de hiperparámetros
+        tuning = config.get("tuning")
 
         # --- PASO 2: VALIDACIONES ---
         if not target_col:
@@ -2381,13 +2962,15 @@ def train_model_endpoint(current_user, dataset_id):
             return jsonify({"success": False, "error": "'model_name' es obligatorio."}), 400
         if not isinstance(encoding_strategies, dict):
             return jsonify({"success": False, "error": "'encoding_strategies' debe ser un objeto JSON."}), 400
+        if tuning is not None and not isinstance(tuning, dict):
+            return jsonify({"success": False, "error": "'tuning' debe ser un objeto JSON."}), 400
         if not is_experiment_only:
             if not project_name:
                 return jsonify({"success": False, "error": "'project_name' es obligatorio."}), 400
             if not model_display_name:
                 return jsonify({"success": False, "error": "'model_display_name' es obligatorio."}), 400
 
-        # --- PASO 3: CARGAR DATASET (SIN LIMPIEZA DE COLUMNAS) ---
+        # --- PASO 3: UBICAR EL DATASET ---
         dataset_info_result = dataset_service.get_dataset_info_by_id(dataset_id, current_user.id)
         if not dataset_info_result.get("success"):
             return jsonify(dataset_info_result), 404
@@ -2399,126 +2982,77 @@ def train_model_endpoint(current_user, dataset_id):
         if not project_id or not storage_path:
             return jsonify({"success": False, "error": "Metadata incompleta del dataset."}), 400
 
-        try:
-            df_fresh = supabase_handler.load_file_as_dataframe(user_id=current_user.id, path=storage_path)
-        except Exception as load_err:
-            logger.error(f"[TRAIN_MODEL] Error cargando dataset: {load_err}", exc_info=True)
-            return jsonify({"success": False, "error": "Error cargando dataset desde storage."}), 500
-
-        if df_fresh is None or df_fresh.empty:
+        # --- PASO 4: ENTRENAR (EN SEGUNDO PLANO) ---
+        return _run_or_enqueue(
+            tasks.train_model_task, (current_user.id, dataset_id, project_id, storage_path, config),
+            kind="train_model", owner=current_user.id,
+        )
+
+    except Exception as e:
+        logger.error(f"[TRAIN_MODEL] Error fatal: {e}", exc_info=True)
+        return jsonify({"success": False, "error": "Error interno durante el entrenamiento."}), 500
+
+
+# ================================================================
+#   ENDPOINT: LEADERBOARD DE MODELOS (ENTRENAMIENTO EN PARALELO)
+# ================================================================
+@app.route('/api/datasets/<string:dataset_id>/leaderboard', methods=['POST'])
+@token_required
+def model_leaderboard_endpoint(current_user, dataset_id):
+    """
+    Entrena varios modelos candidatos sobre el mismo split preprocesado (en paralelo)
+    y devuelve sus métricas ordenadas. No guarda modelos: el ganador se entrena y
+    guarda con /train-model.
+    Body: {"target_col", "models"?, "encoding_strategies"?, "problem_type"?,
+           "use_smote"?, "test_size"?, "rank_by"?}
+    """
+    try:
+        config = request.get_json(silent=True) or {}
+        target_col = config.get("target_col")
+        encoding_strategies = config.get("encoding_strategies", {})
+        model_names = config.get("models")
+        if not target_col:
+            return jsonify({"success": False, "error": "'target_col' es obligatorio."}), 400
+        if not isinstance(encoding_strategies, dict):
+            return jsonify({"success": False, "error": "'encoding_strategies' debe ser un objeto JSON."}), 400
+        if model_names is not None and not isinstance(model_names, list):
+            return jsonify({"success": False, "error": "'models' debe ser una lista de nombres."}), 400
+        test_size = float(config.get("test_size", 0.25))
+
+        dataset_info_result = dataset_service.get_dataset_info_by_id(dataset_id, current_user.id)
+        if not dataset_info_result.get("success"):
+            return jsonify(dataset_info_result), 404
+        storage_path = dataset_info_result["data"].get("storage_path")
+        if not storage_path:
+            return jsonify({"success": False, "error": "Metadata incompleta del dataset."}), 400
+
+        version = supabase_handler.get_object_version(storage_path)
+        df = supabase_handler.load_file_as_dataframe(user_id=current_user.id, path=storage_path, version=version)
+        if df is None or df.empty:
             return jsonify({"success": False, "error": "Dataset vacío o no cargado."}), 400
 
-        MAX_ROWS = 1_000_000
-        if len(df_fresh) > MAX_ROWS:
-            return jsonify({"success": False, "error": f"Dataset demasiado grande (máx {MAX_ROWS} filas)."}), 400
-
-        # --- PASO 4: ENTRENAR MODELO ---
-        training_response = prediction_service.train_model(
-            df=df_fresh.copy(deep=True),
+        result = build_leaderboard(
+            prediction_service,
+            df,
             target_col=target_col,
-            model_name=model_name,
+            model_names=model_names,
             encoding_strategies=encoding_strategies,
-            use_smote=use_smote,
-            use_cv=use_cv,
-            problem_type=problem_type_from_request
+            problem_type=config.get("problem_type"),
+            use_smote=bool(config.get("use_smote", False)),
+            test_size=test_size,
+            rank_by=config.get("rank_by"),
+            cache_key=split_cache_key(
+                f"{storage_path}|{version}" if version else None, target_col, encoding_strategies,
+                config.get("problem_type"), test_size, 42,
+            ),
         )
+        return jsonify(result), (200 if result.get("success") else 400)
 
-        if not training_response.get("success"):
-            return jsonify(training_response), 400
-
-        training_data = training_response["data"]
-
-        # --- CASO EXPERIMENTO ---
-        if is_experiment_only:
-            if 'artifacts' in training_data:
-                del training_data['artifacts']
-            elapsed = round(time.time() - start_time, 2)
-            logger.info(f"[TRAIN_MODEL] Experimento completado en {elapsed}s (sin guardar)")
-            return jsonify({
-                "success": True,
-                "message": "Experimento completado con éxito.",
-                "results": training_data,
-                "elapsed_time_sec": elapsed,
-                "is_experiment": True
-            }), 200
-
-        # --- PASO 5: GUARDAR MODELO EN STORAGE ---
-        artifacts_to_save = training_data.pop('artifacts', None)
-        if not artifacts_to_save:
-            return jsonify({"success": False, "error": "No se generaron artefactos del modelo."}), 500
-
-        buffer = BytesIO()
-        joblib.dump(artifacts_to_save, buffer)
-        model_bytes = buffer.getvalue()
-
-        model_id = str(uuid.uuid4())
-        model_storage_path = f"{current_user.id}/{project_id}/models/{model_id}.joblib"
-
-        try:
-            supabase_admin.storage.from_("proyectos-usuarios").upload(
-                path=model_storage_path,
-                file=model_bytes,
-                file_options={"content-type": "application/octet-stream"}
-            )
-            logger.info(f"[TRAIN_MODEL] Modelo guardado en Storage: {model_storage_path}")
-        except Exception as storage_error:
-            logger.error(f"[TRAIN_MODEL] Error guardando modelo en storage: {storage_error}", exc_info=True)
-            return jsonify({"success": False, "error": "Error al guardar el modelo."}), 500
-
-        # --- PASO 6: GUARDAR METADATA EN BD ---
-        feature_cols = [col for col in df_fresh.columns if col != target_col]
-
-        new_model_record = {
-            "id": model_id,
-            "project_id": project_id,
-            "user_id": current_user.id,
-            "model_name": model_name,
-            "source_dataset_id": dataset_id,
-            "target_col": target_col,
-            "feature_cols": feature_cols,
-            "model_storage_path": model_storage_path,
-            "evaluation_results": training_data,
-            "project_name": project_name,
-            "model_display_name": model_display_name
-        }
-
-        try:
-            supabase_admin.table("trained_models").insert(new_model_record).execute()
-            logger.info(f"[TRAIN_MODEL] Metadata del modelo {model_id} guardada en BD.")
-
-        # --- MANEJO DE DUPLICADOS ---
-        except Exception as db_error:
-            # Comprobamos si es error de duplicado
-            if hasattr(db_error, 'code') and db_error.code == '23505':
-                logger.warning(f"[TRAIN_MODEL] Intento de guardar modelo con nombre duplicado: {model_display_name}")
-                supabase_admin.storage.from_("proyectos-usuarios").remove([model_storage_path])
-                return jsonify({
-                    "success": False, 
-                    "error": f"El nombre del modelo '{model_display_name}' ya existe en el proyecto '{project_name}'. Por favor, elige un nombre único."
-                }), 409
-            # Otros errores
-            logger.error(f"[TRAIN_MODEL] Fallo guardando metadata BD: {db_error}", exc_info=True)
-            supabase_admin.storage.from_("proyectos-usuarios").remove([model_storage_path])
-            return jsonify({"success": False, "error": "Error guardando metadata en BD."}), 500
-
-        # --- PASO 7: RESPUESTA EXITOSA ---
-        elapsed = round(time.time() - start_time, 2)
-        logger.info(f"[TRAIN_MODEL] Entrenamiento completado en {elapsed}s")
-        return jsonify({
-            "success": True,
-            "message": "Modelo entrenado y guardado con éxito.",
-            "model_id": model_id,
-            "project_id": project_id,
-            "model_display_name": model_display_name,
-            "storage_path": model_storage_path,
-            "results": training_data,
-            "elapsed_time_sec": elapsed,
-            "is_experiment": False
-        }), 201
-
+    except (TypeError, ValueError) as e:
+        return jsonify({"success": False, "error": f"Parámetros inválidos: {e}"}), 400
     except Exception as e:
-        logger.error(f"[TRAIN_MODEL] Error fatal: {e}", exc_info=True)
-        return jsonify({"success": False, "error": "Error interno durante el entrenamiento."}), 500
+        logger.error(f"[LEADERBOARD] Error inesperado: {e}", exc_info=True)
+        return jsonify({"success": False, "error": "Error interno durante la comparación de modelos."}), 500
 
 # ================================================================
 #   ENDPOINT: LISTAR MODELOS ENTRENADOS DEL USUARIO ACTUAL
@@ -2619,30 +3153,14 @@ def sensitivity_analysis_endpoint(current_user, model_id):
         variation_range = config['variation_range']
         base_data_point = config['base_data_point']
 
-        # --- 2. Obtener metadata del modelo ---
-        model_record = supabase_admin.table('trained_models') \
-            .select('model_storage_path') \
-            .eq('id', model_id) \
-            .eq('user_id', current_user.id) \
-            .single() \
-            .execute()
-
-        if not model_record.data or 'model_storage_path' not in model_record.data:
-            return jsonify({"success": False, "error": "Modelo no encontrado o sin ruta de almacenamiento."}), 404
-
-        model_storage_path = model_record.data['model_storage_path']
-
-        # --- 3. Cargar modelo con handler seguro ---
-        model_bytes = supabase_handler.load_file(
-            user_id=current_user.id,
-            path=model_storage_path
-        )
-        if model_bytes is None:
-            return jsonify({"success": False, "error": "No se pudo descargar el modelo."}), 500
+        # --- 2-3. Metadata y artefactos del modelo (caché por versión) ---
+        artifacts, load_error = _load_tabular_model_artifacts(current_user.id, model_id)
+        if load_error:
+            return jsonify({"success": False, "error": load_error[0]}), load_error[1]
 
         # --- 4. Ejecutar análisis de sensibilidad ---
         analysis_result = prediction_service.analyze_sensitivity(
-            serialized_model_bytes=model_bytes,
+            serialized_model_bytes=artifacts,
             feature_to_vary=feature_to_vary,
             variation_range=variation_range,
             base_data_point=base_data_point
@@ -2660,6 +3178,160 @@ def sensitivity_analysis_endpoint(current_user, model_id):
         return jsonify({"success": False, "error": "Error interno del servidor."}), 500
 
 
+@app.route('/api/models/<string:model_id>/partial-dependence', methods=['POST'])
+@token_required
+def partial_dependence_endpoint(current_user, model_id):
+    """
+    Dependencia parcial (1 o 2 features) y curvas ICE sobre una muestra de filas reales.
+    Body: {"features": [...], "grid": {feature: {"start", "end", "steps"} | {"values": [...]}},
+           "dataset_id" (o "base_data_point"), "sample_size", "ice", "target_class"}
+    """
+    try:
+        config = request.get_json(silent=True) or {}
+        features = config.get("features")
+        if not isinstance(features, list) or not features:
+            return jsonify({"success": False, "error": "Falta 'features' (lista de 1 o 2 columnas)."}), 400
+        if not config.get("dataset_id") and not config.get("base_data_point"):
+            return jsonify({"success": False, "error": "Indicá 'dataset_id' o 'base_data_point'."}), 400
+        sample_size = max(1, min(int(config.get("sample_size", 200)), 2000))
+
+        artifacts, load_error = _load_tabular_model_artifacts(current_user.id, model_id)
+        if load_error:
+            return jsonify({"success": False, "error": load_error[0]}), load_error[1]
+
+        # --- Filas de referencia: muestra del dataset (solo las columnas del modelo) ---
+        if config.get("dataset_id"):
+            dataset_record = supabase_admin.table('datasets') \
+                .select('storage_path') \
+                .eq('dataset_id', config['dataset_id']) \
+                .eq('user_id', current_user.id) \
+                .single().execute()
+            if not dataset_record.data:
+                return jsonify({"success": False, "error": "Dataset no encontrado."}), 404
+            background_df = supabase_handler.load_file_as_dataframe(
+                user_id=current_user.id,
+                path=dataset_record.data['storage_path'],
+                columns=artifacts.get("training_features"),
+            )
+            if background_df is None or background_df.empty:
+                return jsonify({"success": False, "error": "Archivo corrupto, inválido o vacío."}), 400
+            if len(background_df) > sample_size:
+                background_df = background_df.sample(n=sample_size, random_state=42)
+        else:
+            background_df = pd.DataFrame([config['base_data_point']])
+
+        result = prediction_service.analyze_partial_dependence(
+            artifacts,
+            features=features,
+            grids=config.get("grid") or {},
+            background_df=background_df,
+            ice=bool(config.get("ice", True)),
+            target_class=config.get("target_class"),
+        )
+        if not result.get("success"):
+            return jsonify(result), 400
+        return jsonify(result), 200
+
+    except (TypeError, ValueError) as e:
+        return jsonify({"success": False, "error": f"Parámetros inválidos: {e}"}), 400
+    except Exception as e:
+        logging.error(f"[PartialDependence] Error inesperado: {e}", exc_info=True)
+        return jsonify({"success": False, "error": "Error interno del servidor."}), 500
+
+
+
+
+def _stream_batch_prediction(user_id: str, model_id: str, dataset_row: dict, output: str):
+    """
+    Predicción por lotes leyendo el dataset por partes (ver services/batch_prediction_stream).
+    "ndjson"/"csv" devuelven una respuesta en streaming; "dataset" escribe un Parquet
+    nuevo, lo sube y lo registra con DataService.create_dataset_record.
+    """
+    storage_path = dataset_row.get('storage_path')
+    if not storage_path or not supabase_handler.is_owner_of_path(user_id, storage_path):
+        return jsonify({"success": False, "error": "Acceso denegado al dataset."}), 403
+
+    artifacts, load_error = _load_tabular_model_artifacts(user_id, model_id)
+    if load_error:
+        return jsonify({"success": False, "error": load_error[0]}), load_error[1]
+
+    try:
+        source = storage_transport.from_(supabase_handler._bucket_name).download_to_file(storage_path)
+    except StorageError as e:
+        status = 404 if e.status_code == 404 else 500
+        return jsonify({"success": False, "error": "No se pudo descargar el dataset."}), status
+
+    extension = os.path.splitext(storage_path)[1]
+    tables = bps.iter_predicted_tables(prediction_service, artifacts, bps.iter_input_tables(source, extension))
+
+    if output == "dataset":
+        fd, local_path = tempfile.mkstemp(suffix=".parquet", prefix="predict_")
+        os.close(fd)
+        try:
+            rows, columns = bps.write_parquet(tables, local_path)
+            source.close()
+            base_name = os.path.splitext(os.path.basename(storage_path))[0]
+            # Un archivo por ejecución: repetir la predicción no pisa el dataset de la anterior.
+            new_dataset_id = str(uuid.uuid4())
+            new_path, msg = supabase_handler.save_parquet_file(
+                local_path, user_id, dataset_row.get('project_id'),
+                f"{base_name}_predicciones_{model_id[:8]}_{new_dataset_id[:8]}.parquet"
+            )
+            if not new_path:
+                raise IOError(msg)
+            new_dataset = dataset_service.create_dataset_record(
+                dataset_id=new_dataset_id,
+                user_id=user_id,
+                project_id=dataset_row.get('project_id'),
+                dataset_name=f"{dataset_row.get('dataset_name') or base_name} (Predicciones)",
+                dataset_type="tabular",
+                storage_path=new_path,
+                file_size=os.path.getsize(local_path),
+            )
+            if not new_dataset:
+                raise RuntimeError("No se pudo registrar el dataset de predicciones.")
+            return jsonify({
+                "success": True,
+                "message": f"Predicciones guardadas como nuevo dataset ({rows} filas).",
+                "new_dataset": new_dataset,
+                "rows": rows,
+                "columns": columns,
+            }), 201
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        finally:
+            source.close()
+            Path(local_path).unlink(missing_ok=True)
+
+    # Streaming: la primera parte se calcula antes de responder para poder devolver un
+    # error con su código HTTP; el resto se predice a medida que el cliente consume.
+    try:
+        first = next(tables, None)
+    except Exception as e:
+        source.close()
+        if isinstance(e, ValueError):
+            return jsonify({"success": False, "error": str(e)}), 400
+        raise
+    if first is None:
+        source.close()
+        return jsonify({"success": False, "error": "Archivo corrupto, inválido o vacío."}), 400
+
+    def _all_tables():
+        yield first
+        yield from tables
+
+    def generate():
+        try:
+            yield from (bps.iter_ndjson(_all_tables()) if output == "ndjson" else bps.iter_csv(_all_tables()))
+        finally:
+            source.close()
+
+    if output == "ndjson":
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson",
+                        headers={"X-Accel-Buffering": "no"})
+    return Response(stream_with_context(generate()), mimetype="text/csv",
+                    headers={"Content-Disposition": f'attachment; filename="predicciones_{model_id[:8]}.csv"',
+                             "X-Accel-Buffering": "no"})
 
 
 @app.route('/api/models/<string:model_id>/batch-predict', methods=['POST'])
@@ -2668,6 +3340,9 @@ def batch_predict_endpoint(current_user, model_id):
     """
     Endpoint robusto para predicción batch con modelo guardado.
     Lee datasets soportados (CSV, XLSX, Parquet) de forma segura usando supabase_handler.
+
+    `output` elige la salida: "json" (por defecto, todo en una respuesta), "ndjson" o
+    "csv" (streaming por partes) o "dataset" (un Parquet nuevo registrado como dataset).
     """
     try:
         # 1. Validar payload JSON
@@ -2675,11 +3350,14 @@ def batch_predict_endpoint(current_user, model_id):
         if not payload or 'dataset_id' not in payload:
             return jsonify({"success": False, "error": "Falta 'dataset_id' en la solicitud."}), 400
         dataset_id = payload['dataset_id']
+        output = str(payload.get('output', 'json')).lower()
+        if output != 'json' and output not in bps.STREAM_FORMATS:
+            return jsonify({"success": False, "error": f"'output' debe ser json o uno de {list(bps.STREAM_FORMATS)}."}), 400
 
         # 2. Descargar dataset (solo metadatos, no el archivo en bruto)
         try:
             dataset_record = supabase_admin.table('datasets') \
-                .select('storage_path, dataset_type') \
+                .select('storage_path, dataset_type, project_id, dataset_name') \
                 .eq('dataset_id', dataset_id) \
                 .eq('user_id', current_user.id) \
                 .single().execute()
@@ -2690,6 +3368,9 @@ def batch_predict_endpoint(current_user, model_id):
         if not dataset_record.data:
             return jsonify({"success": False, "error": "Dataset no encontrado."}), 404
 
+        if output in bps.STREAM_FORMATS:
+            return _stream_batch_prediction(current_user.id, model_id, dataset_record.data, output)
+
         file_storage_path = dataset_record.data['storage_path']
 
         # 3. Leer dataset con handler seguro
@@ -2704,32 +3385,18 @@ def batch_predict_endpoint(current_user, model_id):
             logging.error(f"[Dataset Read] Error leyendo dataset: {read_err}", exc_info=True)
             return jsonify({"success": False, "error": "No se pudo procesar el dataset."}), 400
 
-        # 4. Descargar modelo (con handler seguro)
+        # 4. Artefactos del modelo (caché por versión)
         try:
-            model_record = supabase_admin.table('trained_models') \
-                .select('model_storage_path') \
-                .eq('id', model_id) \
-                .eq('user_id', current_user.id) \
-                .single().execute()
+            artifacts, load_error = _load_tabular_model_artifacts(current_user.id, model_id)
         except Exception as db_err:
             logging.error(f"[Model DB] Error consultando modelo: {db_err}", exc_info=True)
             return jsonify({"success": False, "error": "Error al buscar el modelo."}), 500
-
-        if not model_record.data:
-            return jsonify({"success": False, "error": "Modelo no encontrado."}), 404
-
-        model_storage_path = model_record.data['model_storage_path']
-
-        model_bytes = supabase_handler.load_file(
-            user_id=current_user.id,
-            path=model_storage_path
-        )
-        if model_bytes is None:
-            return jsonify({"success": False, "error": "No se pudo descargar el modelo."}), 500
+        if load_error:
+            return jsonify({"success": False, "error": load_error[0]}), load_error[1]
 
         # 5. Ejecutar predicción
         try:
-            result = prediction_service.make_batch_prediction(model_bytes, df_to_predict)
+            result = prediction_service.make_batch_prediction(artifacts, df_to_predict)
             if not result.get("success"):
                 return jsonify(result), 500
             df_with_predictions = result['data']
@@ -2937,11 +3604,12 @@ def delete_model_endpoint(current_user, model_id):
             .execute()
         )
         logger.info(f"Registro del modelo {model_id} eliminado de la base de datos.")
+        model_artifact_cache.invalidate(model_id)
 
         # --- 3. Eliminar el archivo del almacenamiento ---
         if model_storage_path:
             try:
-                supabase_admin.storage.from_("proyectos-usuarios").remove([model_storage_path])
+                storage_transport.from_("proyectos-usuarios").remove([model_storage_path])
                 logger.info(f"Archivo {model_storage_path} eliminado del almacenamiento.")
             except Exception as storage_error:
                 # Si la eliminación del archivo falla, solo lo registramos. La base de datos
@@ -3001,26 +3669,11 @@ def evaluate_model_endpoint(current_user, model_id):
             logging.error(f"[Dataset] Error procesando dataset: {db_err}", exc_info=True)
             return jsonify({"success": False, "error": "Error al buscar o procesar el dataset."}), 500
 
-        # 3. Consultar y descargar modelo (con handler seguro)
+        # 3. Artefactos del modelo (caché por versión)
         try:
-            model_record = supabase_admin.table('trained_models') \
-                .select('model_storage_path') \
-                .eq('id', model_id) \
-                .eq('user_id', current_user.id) \
-                .single().execute()
-
-            if not model_record.data:
-                return jsonify({"success": False, "error": "Modelo no encontrado o no autorizado."}), 404
-
-            model_storage_path = model_record.data.get("model_storage_path")
-
-            # --- CORRECCIÓN: lectura segura ---
-            model_bytes = supabase_handler.load_file(
-                user_id=current_user.id,
-                path=model_storage_path
-            )
-            if model_bytes is None:
-                return jsonify({"success": False, "error": "No se pudo descargar el modelo."}), 500
+            artifacts, load_error = _load_tabular_model_artifacts(current_user.id, model_id)
+            if load_error:
+                return jsonify({"success": False, "error": load_error[0]}), load_error[1]
 
         except Exception as db_err:
             logging.error(f"[Model] Error procesando modelo: {db_err}", exc_info=True)
@@ -3028,7 +3681,7 @@ def evaluate_model_endpoint(current_user, model_id):
 
         # 4. Ejecutar evaluación
         try:
-            result = prediction_service.evaluate_model(model_bytes, df_to_evaluate)
+            result = prediction_service.evaluate_model(artifacts, df_to_evaluate)
             if not result.get("success"):
                 return jsonify(result), 400
         except Exception as eval_err:
@@ -4162,6 +4815,7 @@ def generate_unique_filename(filename):
 def enrich_dataset_from_image_urls(current_user, dataset_id):
     """
     Lee un dataset tabular, toma URLs de una columna, analiza las imágenes y crea un nuevo dataset enriquecido.
+    El análisis corre en segundo plano (tasks.enrich_with_image_urls_task).
     """
     data = request.get_json(silent=True) or {}
     column_name = data.get('column_name')
@@ -4169,90 +4823,18 @@ def enrich_dataset_from_image_urls(current_user, dataset_id):
         return jsonify({"success": False, "error": "Falta el nombre de la columna ('column_name')."}), 400
 
     try:
-        # --- PASO 0: OBTENER EL MODEL MANAGER ---
-        model_manager = get_llm_manager()
-        if not model_manager:
-            logger.error("❌ No se pudo inicializar el model_manager.")
-            return jsonify({"success": False, "error": "No se pudo inicializar el motor de análisis de imágenes."}), 500
-
-        # --- PASO 1: Cargar el dataset original ---
         dataset_info = dataset_service.get_dataset_info_by_id(dataset_id, current_user.id)
         if not dataset_info or not dataset_info.get("success") or not dataset_info.get("data"):
             return jsonify({"success": False, "error": "Dataset no encontrado o sin permisos."}), 404
 
-        storage_path_original = dataset_info["data"].get("storage_path")
-        if not storage_path_original:
+        if not dataset_info["data"].get("storage_path"):
             return jsonify({"success": False, "error": "Dataset inválido, sin ruta de almacenamiento."}), 400
 
-        original_df = supabase_handler.load_file_as_dataframe(user_id=current_user.id, path=storage_path_original)
-        if original_df is None:
-            return jsonify({"success": False, "error": "No se pudo cargar el dataset original."}), 500
-        if column_name not in original_df.columns:
-            return jsonify({"success": False, "error": f"La columna '{column_name}' no existe en el dataset."}), 400
-
-        # --- PASO 2: Procesar cada URL ---
-        results = []
-        for index, row in original_df.iterrows():
-            image_url = row[column_name]
-            if pd.isna(image_url) or not isinstance(image_url, str) or not image_url.startswith("http"):
-                results.append({})
-                continue
-
-            try:
-                image_bytes = download_image_from_url(image_url)
-                if image_bytes:
-                    result = procesar_imagen_completa(
-                        image_bytes,
-                        image_url,
-                        model_manager_instance=model_manager
-                    )
-                    results.append(result)
-                else:
-                    results.append({"error": "Fallo en la descarga"})
-            except Exception as img_err:
-                logger.warning(f"⚠️ Error procesando imagen {image_url}: {img_err}", exc_info=True)
-                results.append({"error": f"Error procesando imagen: {str(img_err)}"})
-
-        # --- PASO 3: Crear el nuevo DataFrame enriquecido ---
-        results_df = pd.DataFrame(results).add_prefix("img_")
-        original_df.reset_index(drop=True, inplace=True)
-        results_df.reset_index(drop=True, inplace=True)
-        enriched_df = pd.concat([original_df, results_df], axis=1)
-
-        # --- PASO 4: Generar bytes CSV y nombre del archivo ---
-        csv_bytes = enriched_df.to_csv(index=False).encode("utf-8")
-        new_dataset_id = str(uuid.uuid4())
-        original_name = dataset_info["data"].get("dataset_name", "dataset")
-        file_name = f"enriched_{original_name.replace('.csv', '')}_{new_dataset_id[:8]}.csv"
-
-        # --- PASO 5: Guardar en Supabase ---
-        storage_path, _ = supabase_handler.save_file(
-            file_bytes=csv_bytes,
-            user_id=current_user.id,
-            project_id=dataset_info["data"].get("project_id"),
-            folder="datasets",
-            filename=file_name
-        )
-        if not storage_path:
-            raise Exception("No se pudo guardar el archivo enriquecido en Supabase Storage.")
-
-        # --- PASO 6: Registrar el nuevo dataset ---
-        new_dataset = dataset_service.create_dataset_record(
-            dataset_id=new_dataset_id,
-            user_id=current_user.id,
-            project_id=dataset_info["data"].get("project_id"),
-            dataset_name=f"{original_name} (Enriquecido)",
-            dataset_type="tabular",
-            storage_path=storage_path,
-            file_size=len(csv_bytes)
+        return _run_or_enqueue(
+            tasks.enrich_with_image_urls_task, (current_user.id, dataset_id, dataset_info["data"], column_name),
+            kind="enrich_with_image_urls", owner=current_user.id,
         )
 
-        return jsonify({
-            "success": True,
-            "message": "Dataset enriquecido creado exitosamente.",
-            "new_dataset": new_dataset
-        }), 201
-
     except Exception as e:
         logger.critical(f"❌ Error enriqueciendo dataset {dataset_id}: {e}", exc_info=True)
         return jsonify({"success": False, "error": "Error interno del servidor."}), 500
@@ -5001,26 +5583,16 @@ def get_visuals_endpoint(current_user):
             color_filter=color_filter,
         )
 
-        # --- Generación de URLs firmadas seguras ---
+        # --- Generación de URLs firmadas seguras (una petición por página, con caché) ---
+        try:
+            signed_urls = storage_transport.from_(supabase_handler._visuals_bucket_name).signed_urls(
+                [visual.get("storage_path") for visual in visuals], 3600  # Expira en 1h
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudieron generar URLs firmadas para la galería: {e}", exc_info=True)
+            signed_urls = {}
         for visual in visuals:
-            storage_path = visual.get("storage_path")
-            if not storage_path:
-                visual["public_url"] = None
-                continue
-
-            try:
-                signed_url_response = (
-                    supabase_handler.get_db_client()
-                    .storage.from_(supabase_handler._visuals_bucket_name)
-                    .create_signed_url(storage_path, 3600)  # Expira en 1h
-                )
-                visual["public_url"] = signed_url_response.get("signedURL")
-            except Exception as e:
-                logger.warning(
-                    f"⚠️ No se pudo generar URL firmada para visual_id={visual.get('id')}: {e}",
-                    exc_info=True,
-                )
-                visual["public_url"] = None
+            visual["public_url"] = signed_urls.get(visual.get("storage_path"))
 
         # --- Respuesta exitosa ---
         return jsonify({
@@ -5381,6 +5953,10 @@ def update_visualmodel_details_endpoint(current_user, model_id):
         if not update_query.data:
             return jsonify({"success": False, "error": "Modelo no encontrado o acceso denegado."}), 404
 
+        # Los artefactos cacheados no dependen del nombre, pero tras editar un modelo
+        # la siguiente predicción vuelve a leerlo de Storage.
+        model_artifact_cache.invalidate(model_id)
+
         return jsonify({
             "success": True,
             "message": "Modelo renombrado con éxito.",
@@ -5412,7 +5988,7 @@ def _get_clustering_data(user_id: str, model_id: str) -> Optional[dict]:
             return None
 
         storage_path = model_query.data['model_storage_path']
-        file_bytes = supabase_admin.storage.from_("proyectos-usuarios").download(storage_path)
+        file_bytes = storage_transport.from_("proyectos-usuarios").download(storage_path)
 
         if not file_bytes:
             logger.error(f"[ClusteringData] No se pudo descargar el archivo en {storage_path}")
@@ -5442,6 +6018,8 @@ def get_available_vision_models():
 # Estructura: { temp_id: { "path": str, "created_at": timestamp } }
 TEMP_TRAINING_CACHE = {}
 TEMP_TRAINING_TTL = 60 * 30  # 30 minutos
+# job_id de un entrenamiento encolado -> temp_id ya creado al entregar su resultado.
+VISION_JOB_TEMP_IDS = {}
 
 def cleanup_temp_models():
     while True:
@@ -5457,6 +6035,9 @@ def cleanup_temp_models():
                 to_delete.append(temp_id)
         for temp_id in to_delete:
             TEMP_TRAINING_CACHE.pop(temp_id, None)
+        for job_id, temp_id in list(VISION_JOB_TEMP_IDS.items()):
+            if temp_id not in TEMP_TRAINING_CACHE:
+                VISION_JOB_TEMP_IDS.pop(job_id, None)
         time.sleep(300)
 
 cleanup_thread = threading.Thread(target=cleanup_temp_models, daemon=True)
@@ -5514,7 +6095,7 @@ def handle_vision_save_model(current_user, project_id):
 
         logger.info(f"[VisionSave] Intentando subir {len(model_bytes)} bytes a {model_storage_path}")
 
-        supabase_admin.storage.from_("proyectos-usuarios").upload(
+        storage_transport.from_("proyectos-usuarios").upload(
             path=model_storage_path,
             file=model_bytes,
             file_options={"content-type": "application/octet-stream"}
@@ -5567,23 +6148,56 @@ def handle_vision_save_model(current_user, project_id):
 # Lock global para controlar entrenamientos concurrentes
 TRAINING_LOCK = Lock()
 
+def _vision_training_response(result, job_id=None):
+    """
+    Respuesta del entrenamiento de visión a partir del resultado de
+    tasks.train_vision_model_task. Los bytes del modelo quedan en un archivo temporal de
+    este proceso (TEMP_TRAINING_CACHE) hasta que se guarde; con `job_id`, pedir el
+    resultado otra vez devuelve el mismo temp_training_id.
+    """
+    if not result.get("success"):
+        logger.error(f"[VisionTrain] Error durante entrenamiento: {result.get('error')}")
+        return {"success": False, "error": result.get('error')}, 500
+
+    training_data = dict(result.get("data", {}))
+    model_bytes = training_data.pop('artifacts_bytes', None)
+    if model_bytes is not None:
+        temp_id = VISION_JOB_TEMP_IDS.get(job_id)
+        if temp_id not in TEMP_TRAINING_CACHE:
+            temp_id = f"temp_{uuid.uuid4()}"
+            temp_file_path = Path(tempfile.gettempdir()) / f"{temp_id}_vision_model.joblib"
+
+            with open(temp_file_path, "wb") as f:
+                f.write(model_bytes)
+
+            TEMP_TRAINING_CACHE[temp_id] = {
+                "path": str(temp_file_path),
+                "created_at": time.time()
+            }
+            if job_id is not None:
+                VISION_JOB_TEMP_IDS[job_id] = temp_id
+            logger.info(f"[VisionTrain] Modelo temporal guardado en {temp_file_path} con ID {temp_id}")
+        training_data['temp_training_id'] = temp_id
+
+    return {
+        "success": True,
+        "message": "Entrenamiento completado exitosamente.",
+        "training_results": training_data
+    }, 200
+
+
+_JOB_RESULT_HANDLERS["vision_train"] = lambda job: _vision_training_response(job["result"], job_id=job["job_id"])
+
+
 @app.route('/api/project/<string:project_id>/vision/train', methods=['POST'])
 @token_required
 def handle_vision_train(current_user, project_id):
     """
-    Entrena un modelo de visión. Usa un Lock para prevenir entrenamientos concurrentes.
+    Entrena un modelo de visión con tasks.train_vision_model_task, en segundo plano.
+    En modo sincrónico usa un Lock para rechazar entrenamientos concurrentes.
     """
-
-    # --- 1. Intentar adquirir lock ---
-    if not TRAINING_LOCK.acquire(blocking=False):
-        logger.warning("[VisionTrain] Se rechazó un nuevo entrenamiento porque ya hay uno en curso.")
-        return jsonify({
-            "success": False,
-            "error": "Ya hay un proceso de entrenamiento en ejecución. Por favor, espera a que termine antes de iniciar uno nuevo."
-        }), 429
-
     try:
-        # --- 2. Validar usuario ---
+        # --- 1. Validar usuario ---
         if not current_user or not hasattr(current_user, "id"):
             return jsonify({"success": False, "error": "Usuario inválido."}), 401
 
@@ -5597,7 +6211,7 @@ def handle_vision_train(current_user, project_id):
 
         image_records = []
 
-        # --- 3. Selección de datos de entrenamiento ---
+        # --- 2. Selección de datos de entrenamiento ---
         if cluster_id and group_labels:
             logger.info(f"[VisionTrain] Modo clustering con cluster_id={cluster_id}")
             cluster_data = _get_clustering_data(current_user.id, cluster_id)
@@ -5619,7 +6233,7 @@ def handle_vision_train(current_user, project_id):
                 project_id=project_id
             )
 
-        # --- 4. Validación de datos ---
+        # --- 3. Validación de datos ---
         if not image_records or len(image_records) < 2:
             logger.warning(f"[VisionTrain] No hay suficientes imágenes para entrenar. Total: {len(image_records)}")
             return jsonify({
@@ -5627,52 +6241,35 @@ def handle_vision_train(current_user, project_id):
                 "error": "No hay suficientes imágenes seleccionadas para el entrenamiento (mínimo 2)."
             }), 400
 
-        # --- 5. Entrenamiento ---
+        # --- 4. Entrenamiento en segundo plano ---
         logger.info(f"[VisionTrain] Entrenando modelo {model_arch} con {len(image_records)} imágenes")
-        result = vision_prediction_service.train_model(
-            image_records=image_records,
-            model_arch=model_arch,
-            epochs=epochs
-        )
-
-        if not result.get("success"):
-            logger.error(f"[VisionTrain] Error durante entrenamiento: {result.get('error')}")
-            return jsonify({"success": False, "error": result.get('error')}), 500
-
-        # --- 6. Manejo de artefactos temporales ---
-        training_data = result.get("data", {})
-        if 'artifacts_bytes' in training_data:
-            model_bytes = training_data.pop('artifacts_bytes')
-            temp_id = f"temp_{uuid.uuid4()}"
-            temp_file_path = Path(tempfile.gettempdir()) / f"{temp_id}_vision_model.joblib"
-
-            with open(temp_file_path, "wb") as f:
-                f.write(model_bytes)
-
-            TEMP_TRAINING_CACHE[temp_id] = {
-                "path": str(temp_file_path),
-                "created_at": time.time()
-            }
+        if not _wants_sync():
+            # El resultado trae los bytes del modelo: se conserva lo mismo que el modelo temporal.
+            job_id = job_queue.enqueue(
+                tasks.train_vision_model_task, args=(image_records, model_arch, epochs),
+                kind="vision_train", owner=current_user.id, result_ttl_sec=TEMP_TRAINING_TTL,
+            )
+            return _job_accepted(job_id)
 
-            logger.info(f"[VisionTrain] Modelo temporal guardado en {temp_file_path} con ID {temp_id}")
-            training_data['temp_training_id'] = temp_id
+        # --- 5. Entrenamiento sincrónico (?sync=1) ---
+        if not TRAINING_LOCK.acquire(blocking=False):
+            logger.warning("[VisionTrain] Se rechazó un nuevo entrenamiento porque ya hay uno en curso.")
+            return jsonify({
+                "success": False,
+                "error": "Ya hay un proceso de entrenamiento en ejecución. Por favor, espera a que termine antes de iniciar uno nuevo."
+            }), 429
+        try:
+            result = tasks.train_vision_model_task(image_records, model_arch, epochs)
+        finally:
+            TRAINING_LOCK.release()
 
-        # --- 7. Respuesta final ---
-        return jsonify({
-            "success": True,
-            "message": "Entrenamiento completado exitosamente.",
-            "training_results": training_data
-        }), 200
+        body, status = _vision_training_response(result)
+        return jsonify(body), status
 
     except Exception as e:
         logger.error(f"[VisionTrain] Error inesperado: {e}", exc_info=True)
         return jsonify({"success": False, "error": "Error interno del servidor."}), 500
 
-    finally:
-        # --- 8. Liberar lock SIEMPRE ---
-        TRAINING_LOCK.release()
-
-
 
 # 1️⃣ Endpoint para AÑADIR una etiqueta a una imagen
 @app.route('/api/images/<string:image_id>/tags', methods=['POST'])
@@ -5791,7 +6388,7 @@ def handle_bulk_tagging_by_cluster(current_user, dataset_id):
             return jsonify({"success": False, "error": "Resultado de clustering no encontrado."}), 404
         
         storage_path = model_meta_query.data['model_storage_path']
-        cluster_file_bytes = supabase_admin.storage.from_("proyectos-usuarios").download(storage_path)
+        cluster_file_bytes = storage_transport.from_("proyectos-usuarios").download(storage_path)
         clustering_details = json.loads(cluster_file_bytes)
         
         # Creamos un mapa de storage_path -> cluster_id para búsqueda rápida
@@ -5856,20 +6453,17 @@ def run_kmeans_clustering(current_user):
 
         clustering_service = tool_response["tool_object"]
 
-        # --- 3. Descargar imágenes desde Supabase ---
+        # --- 3. Descargar imágenes desde Supabase (concurrente, en el orden recibido) ---
         image_bytes_list = []
         valid_storage_paths = []  # <-- Mantener solo las rutas válidas
-        for path in image_storage_paths:
-            try:
-                image_bytes = supabase_handler.download_visual_file(path)
-                if image_bytes:
-                    image_bytes_list.append(image_bytes)
-                    valid_storage_paths.append(path)
-                else:
-                    logger.warning(f"⚠️ No se pudo descargar la imagen en {path}")
-            except Exception:
-                logger.exception(f"❌ Error al descargar {path}")
-                continue
+        failed_downloads = []
+        for fetched in BulkFetcher(bucket="visuales").fetch_all(image_storage_paths):
+            if fetched.ok:
+                image_bytes_list.append(fetched.data)
+                valid_storage_paths.append(fetched.path)
+            else:
+                logger.warning(f"⚠️ No se pudo descargar la imagen en {fetched.path}: {fetched.error}")
+                failed_downloads.append(fetched.as_failure())
 
         if not image_bytes_list:
             return jsonify({"success": False, "error": "No se pudo descargar ninguna de las imágenes."}), 400
@@ -5891,7 +6485,8 @@ def run_kmeans_clustering(current_user):
                 for path, cluster, coords in zip(valid_storage_paths, result["cluster_labels"], result["plot_coords"])
             ],
             "n_clusters": result["n_clusters"],
-            "metrics": result.get("metrics", {})
+            "metrics": result.get("metrics", {}),
+            "failed_downloads": failed_downloads
         }
 
         logger.info("✅ Clustering completado correctamente.")
@@ -5926,7 +6521,7 @@ def approve_and_save_cluster(current_user):
         model_id = str(uuid.uuid4())
         storage_path = f"{current_user.id}/clustering/{project_name.replace(' ', '_')}_{model_id}.json"
         
-        supabase_admin.storage.from_("proyectos-usuarios").upload(
+        storage_transport.from_("proyectos-usuarios").upload(
             file=json.dumps(clustering_details, indent=2).encode('utf-8'),
             path=storage_path,
             file_options={"content-type": "application/json"}
@@ -5971,7 +6566,7 @@ def approve_and_save_cluster(current_user):
         # Intentamos borrar el archivo que ya se subió para no dejar basura
         if 'storage_path' in locals():
             try:
-                supabase_admin.storage.from_("proyectos-usuarios").remove([storage_path])
+                storage_transport.from_("proyectos-usuarios").remove([storage_path])
             except Exception as cleanup_error:
                 logger.error(f"Error en la limpieza de storage: {cleanup_error}")
         return jsonify({"success": False, "error": f"Error de base de datos: {e.message}"}), 500
@@ -6015,7 +6610,7 @@ def get_clustering_result_details(current_user, model_id):
 
         # 2. Descargar y leer el archivo JSON desde Supabase Storage
         try:
-            file_bytes = supabase_admin.storage.from_("proyectos-usuarios").download(storage_path)
+            file_bytes = storage_transport.from_("proyectos-usuarios").download(storage_path)
             if not file_bytes:
                 logger.error(f"[get_clustering_result_details] Archivo no encontrado en storage: {storage_path}")
                 return jsonify({
@@ -6074,7 +6669,7 @@ def _load_model_from_db(user_id: str, model_id: str):
         raise ValueError("La metadata del modelo no tiene una ruta de almacenamiento válida.")
 
     try:
-        artifacts_bytes = supabase_admin.storage.from_("proyectos-usuarios").download(path=model_storage_path)
+        artifacts_bytes = storage_transport.from_("proyectos-usuarios").download(path=model_storage_path)
     except Exception as e:
         logger.error(f"No se pudo descargar el artefacto desde {model_storage_path}: {e}")
         raise FileNotFoundError(f"El archivo del modelo en la ruta '{model_storage_path}' no se pudo encontrar.")
@@ -6089,6 +6684,7 @@ def _prepare_dataset_in_tempdir(image_records: list) -> Path:
     temp_dir = Path(tempfile.mkdtemp(prefix="vision_eval_"))
     logger.info(f"📁 Creando dataset de evaluación temporal en: {temp_dir}")
 
+    validos = []
     for record in image_records:
         # Asumimos que la primera etiqueta es la clase correcta
         tags = record.get("tags")
@@ -6101,24 +6697,24 @@ def _prepare_dataset_in_tempdir(image_records: list) -> Path:
         label = tags[0].get('name') if isinstance(tags[0], dict) else tags[0]
         if not label:
             continue
-            
-        label_dir = temp_dir / str(label)
-        label_dir.mkdir(exist_ok=True)
+        validos.append((storage_path, str(label)))
 
+    # Descarga concurrente desde el bucket 'visuales'; cada imagen se guarda apenas llega.
+    for fetched in fetch_visuals([path for path, _ in validos]):
+        storage_path, label = validos[fetched.index]
+        if not fetched.ok:
+            logger.error(f"❌ No se pudo descargar {storage_path} desde el bucket 'visuales': {fetched.error}")
+            continue
+
+        label_dir = temp_dir / label
+        label_dir.mkdir(exist_ok=True)
         try:
-            # --- ✅ LA CORRECCIÓN ESTÁ AQUÍ ---
-            # Le decimos explícitamente que descargue desde el bucket 'visuales'
-            image_bytes = supabase_admin.storage.from_("visuales").download(path=storage_path)
-            # --- FIN DE LA CORRECCIÓN ---
-
-            if image_bytes:
-                img = Image.open(BytesIO(image_bytes)).convert("RGB")
-                # Usamos el nombre del archivo original para evitar colisiones
-                file_name = Path(storage_path).name
-                img.save(label_dir / file_name, "PNG") # Guardamos como PNG para consistencia
+            img = Image.open(BytesIO(fetched.data)).convert("RGB")
+            # Usamos el nombre del archivo original para evitar colisiones
+            file_name = Path(storage_path).name
+            img.save(label_dir / file_name, "PNG") # Guardamos como PNG para consistencia
         except Exception as e:
-            # Añadimos más detalles al log de error
-            logger.error(f"❌ No se pudo descargar o procesar {storage_path} desde el bucket 'visuales': {e}")
+            logger.error(f"❌ No se pudo procesar {storage_path} desde el bucket 'visuales': {e}")
 
     return temp_dir
 
@@ -6191,7 +6787,7 @@ def _load_model_from_db_or_cache(user_id: str, model_id_or_temp_id: str):
         raise ValueError("La metadata del modelo no contiene una ruta de almacenamiento válida.")
 
     try:
-        artifacts_bytes = supabase_admin.storage.from_("proyectos-usuarios").download(path=model_storage_path)
+        artifacts_bytes = storage_transport.from_("proyectos-usuarios").download(path=model_storage_path)
         if not artifacts_bytes:
             raise FileNotFoundError(f"No se pudo descargar artefacto en {model_storage_path}")
         logger.info(f"[ModelLoad] Modelo descargado exitosamente desde {model_storage_path}")
@@ -6313,11 +6909,14 @@ def evaluate_vision_model_endpoint(current_user, model_id):
                 "error": f"El dataset excede el máximo permitido de {MAX_IMAGES} imágenes."
             }), 400
 
+        preview_urls = storage_transport.from_("visuales").signed_urls(
+            [rec.get("storage_path") for rec in image_records], 600
+        )
         for rec in image_records:
             storage_path = rec.get("storage_path")
             try:
                 # Descargar imagen desde bucket "visuales"
-                image_bytes = supabase_admin.storage.from_("visuales").download(path=storage_path)
+                image_bytes = storage_transport.from_("visuales").download(path=storage_path)
                 if not image_bytes:
                     continue
 
@@ -6329,11 +6928,10 @@ def evaluate_vision_model_endpoint(current_user, model_id):
                         "error": f"La imagen en {storage_path} supera el límite de {MAX_FILE_SIZE_MB} MB."
                     }), 400
 
-                # Generar URL firmada (preview)
-                signed_url_response = supabase_admin.storage.from_("visuales").create_signed_url(storage_path, 600)
+                # URL firmada (preview), ya generada en lote
                 preview_list.append({
                     "storage_path": storage_path,
-                    "image_url": signed_url_response.get("signedURL")
+                    "image_url": preview_urls.get(storage_path)
                 })
 
             except Exception as e:
@@ -6406,23 +7004,33 @@ def batch_predict_vision_model_endpoint(current_user, model_id):
         if not image_records:
             return jsonify({"success": False, "error": "El dataset no contiene imágenes."}), 404
 
-        predictions_list = []
+        # Se responde en el orden de los registros aunque las descargas lleguen desordenadas.
+        predictions_list = [None] * len(image_records)
+        paths_to_fetch, positions = [], []
+        for position, record in enumerate(image_records):
+            if record.get("storage_path"):
+                paths_to_fetch.append(record["storage_path"])
+                positions.append(position)
+            else:
+                predictions_list[position] = {"error": "Imagen sin ruta válida."}
 
-        # 3. Iterar imágenes y predecir
-        for record in image_records:
-            storage_path = record.get("storage_path")
-            if not storage_path:
-                predictions_list.append({"error": "Imagen sin ruta válida."})
-                continue
+        # URLs firmadas de todas las imágenes en una sola petición (o desde la caché)
+        try:
+            image_urls = storage_transport.from_("visuales").signed_urls(paths_to_fetch, 600)
+        except Exception as e:
+            logger.warning(f"[BatchPredict] No se pudieron firmar las URLs de las imágenes: {e}")
+            image_urls = {}
 
+        # 3. Descargar en paralelo y predecir cada imagen apenas llega
+        for fetched in fetch_visuals(paths_to_fetch):
+            storage_path = fetched.path
+            position = positions[fetched.index]
             try:
-                # Descargar imagen desde el bucket correcto
-                image_bytes = supabase_admin.storage.from_("visuales").download(path=storage_path)
-                if not image_bytes:
-                    raise ValueError("No se pudo descargar la imagen.")
+                if not fetched.ok:
+                    raise ValueError(f"No se pudo descargar la imagen: {fetched.error}")
 
                 # Preprocesar imagen
-                img = Image.open(BytesIO(image_bytes)).convert("RGB")
+                img = Image.open(BytesIO(fetched.data)).convert("RGB")
                 input_tensor = transforms(img).unsqueeze(0).to(device)
 
                 # Predicción
@@ -6432,23 +7040,21 @@ def batch_predict_vision_model_endpoint(current_user, model_id):
                     confidence, pred_idx = torch.max(probs, 1)
                     predicted_class = class_names[pred_idx.item()]
 
-                # Generar URL firmada (del bucket 'visuales')
-                signed_url_response = supabase_admin.storage.from_("visuales").create_signed_url(storage_path, 600)
-                image_url = signed_url_response.get("signedURL")
+                image_url = image_urls.get(storage_path)
 
-                predictions_list.append({
+                predictions_list[position] = {
                     "image_url": image_url,
                     "original_path": storage_path,
                     "predicted_class": predicted_class,
                     "confidence": round(float(confidence.item()), 4)
-                })
+                }
 
             except Exception as e:
                 logger.error(f"[BatchPredict] Error procesando imagen {storage_path}: {e}", exc_info=True)
-                predictions_list.append({
+                predictions_list[position] = {
                     "original_path": storage_path,
                     "error": "No se pudo procesar la imagen."
-                })
+                }
 
         return jsonify({"success": True, "data": predictions_list}), 200
 
@@ -6520,7 +7126,10 @@ def handle_analyze_image_deep(current_user):
 @app.route("/api/analyze-pdf", methods=["POST"])
 @token_required
 def handle_analyze_pdf(current_user):
-    """Análisis profundo de un archivo PDF, página por página."""
+    """
+    Análisis profundo de un archivo PDF, página por página. El PDF se deja en Storage y
+    lo analiza tasks.analyze_pdf_task en segundo plano.
+    """
     request_id = str(uuid.uuid4())
     try:
         if "pdf_file" not in request.files:
@@ -6535,38 +7144,21 @@ def handle_analyze_pdf(current_user):
         pdf_bytes = file.read()
         logger.info(f"[{request_id}] 📄 Iniciando análisis del PDF '{filename}' (usuario={current_user.id})")
 
-        pdf_doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        pages_analysis = []
-
-        for page_num in range(len(pdf_doc)):
-            page = pdf_doc.load_page(page_num)
-            pix = page.get_pixmap()
-            image_bytes = pix.tobytes("png")
-
-            analysis_result = analisis_completo_de_imagen(
-                imagen_bytes=image_bytes,
-                filename=f"{filename}_page_{page_num + 1}",
-                model_manager_instance=model_manager
-            )
-
-            pages_analysis.append({
-                "page_number": page_num + 1,
-                "analysis": analysis_result
-            })
-
-        pdf_doc.close()
-
-        logger.info(f"[{request_id}] ✅ Análisis del PDF '{filename}' completado con {len(pages_analysis)} páginas.")
+        if _wants_sync():
+            body, status = tasks.analyze_pdf_bytes(pdf_bytes, filename, request_id)
+            return jsonify(body), status
 
-        return jsonify({
-            "success": True,
-            "pdf_analysis": {
-                "filename": filename,
-                "total_pages": len(pages_analysis),
-                "pages": pages_analysis
-            },
-            "request_id": request_id
-        })
+        pdf_storage_path = f"{current_user.id}/jobs/{request_id}.pdf"
+        storage_transport.from_("proyectos-usuarios").upload(
+            path=pdf_storage_path,
+            file=pdf_bytes,
+            file_options={"content-type": "application/pdf"}
+        )
+        job_id = job_queue.enqueue(
+            tasks.analyze_pdf_task, args=(filename, pdf_storage_path, request_id),
+            kind="analyze_pdf", owner=current_user.id,
+        )
+        return _job_accepted(job_id)
 
     except BadRequest as e:
         logger.warning(f"[{request_id}] ⚠️ Error de validación PDF: {e}")
@@ -6786,14 +7378,21 @@ def download_dataset_file(current_user, dataset_id):
 
         logger.info(f"[{request_id}] 📂 Intentando descargar archivo desde: {storage_path}")
 
-        # 3. Descargar el archivo desde Supabase Storage
+        # 3. Descargar el archivo desde Supabase Storage (en streaming a un archivo temporal)
         try:
-            file_bytes = supabase_admin.storage.from_(BUCKET_NAME).download(storage_path)
+            file_obj = storage_transport.from_(BUCKET_NAME).download_to_file(storage_path)
+        except StorageError as e:
+            if e.status_code == 404:
+                logger.warning(f"[{request_id}] ❌ Archivo inexistente en storage_path={storage_path}.")
+                return jsonify({"success": False, "error": "El archivo no existe o está vacío en el almacenamiento."}), 404
+            logger.error(f"[{request_id}] ⚠️ Error al descargar archivo desde Supabase Storage: {e}", exc_info=True)
+            return jsonify({"success": False, "error": "No se pudo descargar el archivo del almacenamiento."}), 502
         except Exception as e:
             logger.error(f"[{request_id}] ⚠️ Error al descargar archivo desde Supabase Storage: {e}", exc_info=True)
             return jsonify({"success": False, "error": "No se pudo descargar el archivo del almacenamiento."}), 502
 
-        if not file_bytes:
+        if not file_obj.read(1):
+            file_obj.close()
             logger.warning(f"[{request_id}] ❌ Archivo vacío o inexistente en storage_path={storage_path}.")
             return jsonify({"success": False, "error": "El archivo no existe o está vacío en el almacenamiento."}), 404
 
@@ -6801,8 +7400,10 @@ def download_dataset_file(current_user, dataset_id):
         filename = storage_path.split("/")[-1]
         logger.info(f"[{request_id}] ✅ Descarga lista para el archivo: {filename}")
 
+        file_obj.seek(0)
+        # send_file cierra el archivo al terminar de enviar la respuesta.
         return send_file(
-            BytesIO(file_bytes),
+            file_obj,
             mimetype="application/octet-stream",  # Tipo genérico
             as_attachment=True,
             download_name=filename,
@@ -7026,8 +7627,11 @@ def cleanup_temp_files():
 # Scheduler cada 6h
 scheduler = BackgroundScheduler()
 scheduler.add_job(func=cleanup_temp_files, trigger="interval", hours=6)
+# Write-behind de las sesiones de edición de datasets (ver /api/datasets/<id>/session)
+scheduler.add_job(func=dataset_session_manager.flush_due, trigger="interval", seconds=30)
 scheduler.start()
 atexit.register(lambda: scheduler.shutdown())
+atexit.register(dataset_session_manager.flush_all)
 
 
 
@@ -7289,7 +7893,8 @@ def suggest_dbscan_eps_endpoint(current_user, dataset_id):
 def train_clustering_model_endpoint(current_user, dataset_id):
     """
     Entrena y guarda un modelo de clustering (KMeans o DBSCAN) en la base de datos
-    y en el almacenamiento, asociándolo a un proyecto.
+    y en el almacenamiento, asociándolo a un proyecto. Corre en segundo plano
+    (tasks.train_clustering_model_task).
     """
     logger = app.logger
     logger.info(f"[CLUSTERING_TRAIN] Usuario={current_user.id} Dataset={dataset_id}")
@@ -7300,7 +7905,6 @@ def train_clustering_model_endpoint(current_user, dataset_id):
 
         # --- OBTENEMOS PARÁMETROS NECESARIOS ---
         algorithm = config.get("algorithm")
-        parameters = config.get("parameters", {})
         project_id = config.get("project_id")
         model_display_name = config.get("model_display_name")
         project_name = config.get("project_name")
@@ -7309,20 +7913,11 @@ def train_clustering_model_endpoint(current_user, dataset_id):
         if not all([algorithm, project_id, model_display_name, project_name]):
             return jsonify({"success": False, "error": "Faltan parámetros obligatorios: 'algorithm', 'project_id', 'model_display_name', 'project_name'."}), 400
 
-        # --- LLAMADA AL SERVICIO CON EL NOMBRE CORRECTO ---
-        result = tabular_clustering_service.train_and_save_model( # <-- NOMBRE CORREGIDO
-            user_id=current_user.id,
-            dataset_id=dataset_id,
-            algorithm=algorithm,
-            parameters=parameters,
-            project_id=project_id,
-            model_display_name=model_display_name,
-            project_name=project_name
+        return _run_or_enqueue(
+            tasks.train_clustering_model_task, (current_user.id, dataset_id, config),
+            kind="train_clustering_model", owner=current_user.id,
         )
 
-        status_code = 201 if result.get("success") else 400
-        return jsonify(result), status_code
-
     except Exception as e:
         logger.error(f"[CLUSTERING_TRAIN] Error fatal: {e}", exc_info=True)
         return jsonify({"success": False, "error": "Error interno al entrenar el modelo de clustering."}), 500
@@ -7588,7 +8183,7 @@ def save_enriched_dataset_endpoint(current_user):
         new_storage_path = f"{current_user.id}/{project_id}/datasets/{new_dataset_id}.csv"
 
         with open(temp_path, 'rb') as f:
-            supabase_handler._client.storage.from_("proyectos-usuarios").upload(
+            storage_transport.from_("proyectos-usuarios").upload(
                 path=new_storage_path,
                 file=f,
                 file_options={"content-type": "text/csv"}
@@ -7752,8 +8347,7 @@ def handle_generate_and_save_image(current_user):
         signed_url = None
         try:
             signed_url_response = (
-                supabase_handler.get_db_client()
-                .storage.from_("visuales")  # nombre de bucket
+                storage_transport.from_("visuales")  # nombre de bucket
                 .create_signed_url(storage_path, 3600)  # expira en 1 hora
             )
 
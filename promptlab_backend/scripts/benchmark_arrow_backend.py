@@ -0,0 +1,138 @@
+# ARCHIVO: benchmark_arrow_backend.py
+# PROPÓSITO: Comparar memoria (RSS) y latencia del backend numpy contra el backend Arrow
+#            (DATAFRAME_BACKEND=pyarrow) en las operaciones típicas del asistente.
+#
+# Uso (desde promptlab_backend/):
+#     python scripts/benchmark_arrow_backend.py --rows 1000000
+#
+# Cada backend corre en un proceso aparte: DATAFRAME_BACKEND se lee al importar
+# services.arrow_backend y así el pico de memoria de uno no contamina al otro.
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def _rss_mb() -> float:
+    """RSS actual en MB (psutil si está instalado; si no, el pico de getrusage)."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        import resource
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / 1024 if sys.platform != "darwin" else maxrss / (1024 * 1024)
+
+
+def _peak_rss_mb() -> float:
+    import resource
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1024 if sys.platform != "darwin" else maxrss / (1024 * 1024)
+
+
+def generar_dataset(n_filas: int, destino: str) -> None:
+    """Dataset sintético con la mezcla habitual: texto repetido, texto libre, números y nulos."""
+    rng = np.random.default_rng(42)
+    ciudades = np.array(["  Buenos Aires", "córdoba ", "ROSARIO", "Mendoza", "n/a", "La Plata", "null"])
+    estados = np.array(["activo", "Inactivo", "PENDIENTE", "--"])
+    df = pd.DataFrame({
+        "id": np.arange(n_filas, dtype=np.int64),
+        "ciudad": ciudades[rng.integers(0, len(ciudades), n_filas)],
+        "estado": estados[rng.integers(0, len(estados), n_filas)],
+        "comentario": [f"Cliente número {i % 50_000} — Observación" for i in range(n_filas)],
+        "monto": rng.normal(1000, 250, n_filas).round(2),
+        "edad": rng.integers(18, 90, n_filas).astype(float),
+    })
+    df.loc[rng.random(n_filas) < 0.05, "edad"] = np.nan
+    df.to_parquet(destino, index=False, engine="pyarrow")
+
+
+def _medir(funcion):
+    inicio = time.perf_counter()
+    resultado = funcion()
+    return resultado, round(time.perf_counter() - inicio, 3)
+
+
+def ejecutar_backend(ruta_parquet: str) -> dict:
+    """Corre dentro del proceso hijo, con DATAFRAME_BACKEND ya fijado en el entorno."""
+    import pyarrow.parquet as pq
+    from services import arrow_backend as ab
+    from services import clean_text as ct
+    from services.dataset_profile import build_profile
+
+    rss_inicial = _rss_mb()
+    df, t_carga = _medir(lambda: ab.table_to_pandas(pq.read_table(ruta_parquet)))
+    rss_cargado = _rss_mb()
+
+    _, t_perfil = _medir(lambda: build_profile(df, mode="exact"))
+    columnas_texto = ab.text_columns(df)
+    _, t_limpieza = _medir(lambda: ct.limpiar_columnas_categoricas(df, columnas_texto))
+
+    return {
+        "backend": "pyarrow" if ab.enabled() else "numpy",
+        "memoria_df_mb": round(df.memory_usage(deep=True).sum() / (1024 * 1024), 1),
+        "rss_df_mb": round(rss_cargado - rss_inicial, 1),
+        "rss_pico_mb": round(_peak_rss_mb(), 1),
+        "carga_s": t_carga,
+        "perfil_s": t_perfil,
+        "limpieza_texto_s": t_limpieza,
+    }
+
+
+def lanzar(backend: str, ruta_parquet: str) -> dict:
+    entorno = dict(os.environ, DATAFRAME_BACKEND=backend)
+    salida = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", ruta_parquet],
+        env=entorno, cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    )
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+
+def imprimir_tabla(resultados: list) -> None:
+    metricas = ["memoria_df_mb", "rss_df_mb", "rss_pico_mb", "carga_s", "perfil_s", "limpieza_texto_s"]
+    print(f"\n{'métrica':<20}" + "".join(f"{r['backend']:>12}" for r in resultados))
+    print("-" * (20 + 12 * len(resultados)))
+    for metrica in metricas:
+        print(f"{metrica:<20}" + "".join(f"{r[metrica]:>12}" for r in resultados))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark numpy vs. Arrow para los DataFrames del asistente.")
+    parser.add_argument("--rows", type=int, default=500_000, help="Filas del dataset sintético.")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(ejecutar_backend(args.worker)))
+        return
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        ruta = os.path.join(carpeta, "benchmark.parquet")
+        print(f"--- 1. Generando dataset sintético de {args.rows:,} filas... ---")
+        generar_dataset(args.rows, ruta)
+
+        resultados = []
+        for backend in ("numpy", "pyarrow"):
+            print(f"--- 2. Midiendo backend '{backend}'... ---")
+            try:
+                resultados.append(lanzar(backend, ruta))
+            except subprocess.CalledProcessError as e:
+                print(f"--- ❌ El backend '{backend}' falló: {e.stderr.strip()[-500:]} ---")
+
+    if resultados:
+        imprimir_tabla(resultados)
+
+
+if __name__ == "__main__":
+    main()
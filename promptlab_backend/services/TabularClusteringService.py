@@ -21,6 +21,8 @@ from sklearn.metrics import (
 from sklearn.neighbors import NearestNeighbors
 import joblib
 
+from . import arrow_backend as ab
+
 import logging
 logger = logging.getLogger(__name__)
 
@@ -313,6 +315,7 @@ class TabularClusteringService:
                 return {"success": False, "error": "No se pudo cargar el dataset o está vacío."}
 
             logger.info(f"✅ Dataset cargado con {len(df)} filas y {len(df.columns)} columnas.")
+            df = ab.to_numpy_backed(df)  # sklearn trabaja con columnas numpy
 
             # ----------------------------------------------------------------
             # 2. ENTRENAR Y SERIALIZAR EL MODELO
@@ -337,7 +340,7 @@ class TabularClusteringService:
 
             logger.info(f"⬆️ Subiendo modelo a storage: {model_storage_path}")
             # Accedemos a través del atributo _client
-            self.supabase_handler._client.storage.from_("proyectos-usuarios").upload(
+            self.supabase_handler._storage.from_("proyectos-usuarios").upload(
             path=model_storage_path,
             file=model_bytes,
             file_options={"content-type": "application/octet-stream"}
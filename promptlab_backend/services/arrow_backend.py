@@ -0,0 +1,123 @@
+# services/arrow_backend.py
+import os
+import re
+import logging
+from typing import List, Optional
+
+import pandas as pd
+import pyarrow as pa
+
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# BACKEND ARROW OPCIONAL PARA LOS DATAFRAMES
+# ==============================================================================
+# Con DATAFRAME_BACKEND=pyarrow los datasets se cargan con dtypes ArrowDtype: el texto
+# vive en buffers Arrow (sin un objeto Python por celda) y las operaciones `.str` usan
+# los kernels de pyarrow.compute. Las columnas dictionary se siguen cargando como
+# `category` de pandas. El modo por defecto ("numpy") no cambia nada.
+
+BACKENDS = ("numpy", "pyarrow")
+_backend = os.getenv("DATAFRAME_BACKEND", "numpy").lower()
+if _backend not in BACKENDS:
+    logger.warning(f"⚠️ DATAFRAME_BACKEND='{_backend}' no es válido; se usa 'numpy'.")
+    _backend = "numpy"
+ARROW_BACKEND = _backend == "pyarrow"
+
+
+def enabled() -> bool:
+    return ARROW_BACKEND
+
+
+def _types_mapper(arrow_type: pa.DataType):
+    # None = conversión por defecto: dictionary -> category (ya compacta y bien soportada).
+    if pa.types.is_dictionary(arrow_type):
+        return None
+    return pd.ArrowDtype(arrow_type)
+
+
+def table_to_pandas(table: pa.Table, arrow: Optional[bool] = None) -> pd.DataFrame:
+    """Convierte una tabla Arrow al backend configurado (o al pedido con `arrow`)."""
+    if ARROW_BACKEND if arrow is None else arrow:
+        return table.to_pandas(types_mapper=_types_mapper)
+    return table.to_pandas()
+
+
+def read_kwargs() -> dict:
+    """Argumentos extra para pd.read_csv / pd.read_excel según el backend."""
+    return {"dtype_backend": "pyarrow"} if ARROW_BACKEND else {}
+
+
+# ------------------------------------------------------------------------------
+# Detección de tipos compatible con ambos backends
+# ------------------------------------------------------------------------------
+
+def is_arrow_dtype(dtype) -> bool:
+    return isinstance(dtype, pd.ArrowDtype)
+
+
+def is_arrow_string(dtype) -> bool:
+    return is_arrow_dtype(dtype) and (
+        pa.types.is_string(dtype.pyarrow_dtype) or pa.types.is_large_string(dtype.pyarrow_dtype)
+    )
+
+
+def is_text_dtype(dtype) -> bool:
+    """Texto en cualquiera de sus formas: object, category o string de Arrow."""
+    return dtype == object or isinstance(dtype, pd.CategoricalDtype) or is_arrow_string(dtype)
+
+
+def text_columns(df: pd.DataFrame, include_bool: bool = False) -> List:
+    """Reemplazo de `select_dtypes(include=['object', 'category'])` que reconoce ArrowDtype."""
+    return [
+        col for col in df.columns
+        if is_text_dtype(df[col].dtype) or (include_bool and pd.api.types.is_bool_dtype(df[col].dtype))
+    ]
+
+
+# ------------------------------------------------------------------------------
+# Conversión entre backends
+# ------------------------------------------------------------------------------
+
+def series_to_numpy(series: pd.Series) -> pd.Series:
+    """
+    La misma columna con los dtypes que tendría en el backend numpy (entero con nulos ->
+    float64, texto -> object). Así los hashes de fila y sklearn ven lo mismo en ambos modos.
+    """
+    if not is_arrow_dtype(series.dtype):
+        return series
+    convertida = pa.array(series.array).to_pandas()
+    convertida.index = series.index
+    convertida.name = series.name
+    return convertida
+
+
+def to_numpy_backed(df: pd.DataFrame) -> pd.DataFrame:
+    """Copia superficial con las columnas Arrow convertidas a numpy (entrada de los modelos)."""
+    columnas = [col for col in df.columns if is_arrow_dtype(df[col].dtype)]
+    if not columnas:
+        return df
+    df_out = df.copy(deep=False)
+    for col in columnas:
+        df_out[col] = series_to_numpy(df[col])
+    return df_out
+
+
+def to_arrow_backed(df: pd.DataFrame) -> pd.DataFrame:
+    """El DataFrame con dtypes Arrow (las categorías se mantienen como category)."""
+    return table_to_pandas(pa.Table.from_pandas(df, preserve_index=False), arrow=True).set_axis(df.index)
+
+
+# ------------------------------------------------------------------------------
+# Kernels de texto
+# ------------------------------------------------------------------------------
+
+def normalize_text(series: pd.Series, null_regex: "re.Pattern", null_words=("none", "")) -> pd.Series:
+    """
+    Para una columna string de Arrow: regex de nulos -> NA, luego strip + lower y las
+    palabras de `null_words` -> NA. Todo con kernels de pyarrow, sin `.apply` por celda.
+    """
+    limpio = series.str.strip().str.lower()
+    nulos = series.str.fullmatch(null_regex.pattern).fillna(False) | limpio.isin(list(null_words)).fillna(False)
+    return limpio.mask(nulos)
@@ -3,16 +3,24 @@
 
 import pandas as pd
 import logging
-from typing import Tuple, List, Dict, Any, Callable
+from typing import Tuple, List, Dict, Any, Callable, Optional
 import numpy as np
 from typing import Dict, Any
 import math
+import re
 
 # En asistente_de_limpieza_orquestador.py
 
 from . import load_data as ld
 from . import clean_numericas as cn
 from . import clean_text as ct
+from .dataset_profile import (
+    APPROX_SAMPLE_SIZE, DatasetProfile, build_profile, update_profile, normalize_null_like, profile_column, resolve_mode
+)
+from . import sketches as sk
+from . import row_hash as rh
+from . import transform_engine as te
+from . import arrow_backend as ab
 
 logger = logging.getLogger(__name__)
 
@@ -41,37 +49,36 @@ def clean_nan_from_dict(data):
         return data
 
 
-def get_preliminary_analysis(df: pd.DataFrame) -> Dict[str, Any]:
+def get_preliminary_analysis(df: pd.DataFrame, profile: Optional[DatasetProfile] = None, mode: str = "auto") -> Dict[str, Any]:
     """
     Realiza un análisis inicial rápido del DataFrame.
     Llamado por el endpoint de carga de archivo.
-    Reemplaza valores nulo-like antes del análisis.
+    Si se pasa un `profile` ya calculado (p. ej. desde la caché) no se vuelve a
+    recorrer el DataFrame; si no, se construye uno (con los nulo-like ya normalizados).
+    `mode` ("auto", "exact", "approx") elige entre perfil exacto y por sketches.
     """
     try:
-        null_like_values = ['nan', 'na', 'n/a', 'null', '', '--', 'undefined']
-        null_regex = r'^\s*(' + '|'.join(null_like_values) + r')\s*$'
+        if profile is None:
+            profile = build_profile(df, mode=mode)
 
-        df_procesado = df.copy()
-        df_procesado.replace(to_replace=null_regex, value=np.nan, regex=True, inplace=True)
-
-        _, n_duplicados, pct_duplicados = ld.detectar_duplicados(df_procesado)
-
-        nan_summary = ld.nan_por_columna(df_procesado)
-        total_nulos = int(nan_summary['cantidad_nan'].sum())
-        total_elementos = df_procesado.size
+        total_nulos = profile.total_nulls
+        total_elementos = profile.total_cells
         porcentaje_total_nulos = round((total_nulos / total_elementos) * 100 if total_elementos > 0 else 0, 2)
 
-        by_column_list = nan_summary[nan_summary['cantidad_nan'] > 0].to_dict('records')
+        by_column_list = [
+            {"columna": col, "cantidad_nan": c["null_count"], "porcentaje_nan": c["null_percentage"]}
+            for col, c in profile.columns.items() if c["null_count"] > 0
+        ]
         cleaned_by_column_list = [clean_nan_from_dict(record) for record in by_column_list]
 
         analysis = {
             "project_summary": {
-                "rows": df_procesado.shape[0],
-                "columns": df_procesado.shape[1],
+                "rows": profile.n_rows,
+                "columns": profile.n_cols,
             },
             "duplicates_summary": {
-                "count": n_duplicados,
-                "percentage": round(pct_duplicados, 2)
+                "count": profile.duplicate_count,
+                "percentage": round(profile.duplicate_percentage, 2)
             },
             "nulls_summary": {
                 "total_count": total_nulos,
@@ -79,9 +86,16 @@ def get_preliminary_analysis(df: pd.DataFrame) -> Dict[str, Any]:
                 "by_column": cleaned_by_column_list
             },
             "columns_info": [
-                {"name": col, "type": str(df_procesado[col].dtype)} for col in df_procesado.columns
-            ]
+                {"name": col, "type": c["dtype"]} for col, c in profile.columns.items()
+            ],
+            "approximate": profile.approximate
         }
+        if profile.approximate:
+            analysis["duplicates_summary"]["error_bound"] = profile.error_bounds.get("duplicates", 0)
+            analysis["error_bounds"] = {
+                "confidence": sk.DEFAULT_CONFIDENCE,
+                "duplicates": profile.error_bounds.get("duplicates", 0),
+            }
 
         # Limpiar NaNs en todo el análisis antes de devolver
         analysis = clean_nan_from_dict(analysis)
@@ -93,71 +107,75 @@ def get_preliminary_analysis(df: pd.DataFrame) -> Dict[str, Any]:
         logger.error("Error crítico al generar análisis preliminar: %s", str(e))
         return {"success": False, "error": "Error al generar análisis preliminar."}
     
-def get_column_details(df: pd.DataFrame, column_name: str) -> Dict[str, Any]:
+def get_column_details(
+    df: Optional[pd.DataFrame],
+    column_name: str,
+    profile: Optional[DatasetProfile] = None,
+    mode: str = "auto",
+) -> Dict[str, Any]:
     """
     Analiza una columna del DataFrame, detectando el tipo real (numérico o categórico)
     y devolviendo estadísticas relevantes, incluyendo outliers y problemas comunes de calidad.
+    Con `profile` la respuesta sale del perfil cacheado y `df` puede ser None.
+    En modo aproximado `unique_values` trae solo los valores más frecuentes.
     """
-    if df.empty:
+    if profile is not None:
+        n_rows, columnas = profile.n_rows, profile.columns
+    else:
+        n_rows, columnas = len(df), df.columns
+
+    if n_rows == 0 or len(columnas) == 0:
         return {"success": False, "error": "El DataFrame está vacío.", "error_code": "DATAFRAME_EMPTY"}
 
     if not isinstance(column_name, str):
         return {"success": False, "error": "El nombre de la columna debe ser una cadena de texto.", "error_code": "INVALID_COLUMN_NAME"}
 
-    if column_name not in df.columns:
+    if column_name not in columnas:
         return {"success": False, "error": f"La columna '{column_name}' no existe.", "error_code": "COLUMN_NOT_FOUND"}
 
     try:
-        null_like_values = ['nan', 'na', 'n/a', 'null', '', '--', 'undefined']
-        null_regex = r'^\s*(' + '|'.join(null_like_values) + r')\s*$'
-
-        df_procesado = df.copy()
-        df_procesado.replace(to_replace=null_regex, value=np.nan, regex=True, inplace=True)
-
-        if df_procesado[column_name].isnull().all():
+        if profile is not None:
+            col_profile = profile.column(column_name)
+        else:
+            # Sin perfil del dataset basta con perfilar esta columna: no hace falta copiar el frame.
+            col_norm = normalize_null_like(df[[column_name]])[column_name]
+            approximate = resolve_mode(n_rows, mode)
+            col_profile = profile_column(
+                col_norm,
+                original_dtype=str(df[column_name].dtype),
+                approximate=approximate,
+                sample_pos=sk.sample_positions(n_rows, APPROX_SAMPLE_SIZE) if approximate else None,
+            )
+
+        null_count = col_profile["null_count"]
+        if null_count == n_rows:
             return {
                 "success": False,
                 "error": f"La columna '{column_name}' contiene solo valores nulos.",
                 "error_code": "COLUMN_EMPTY"
             }
 
-        col_data = df_procesado[column_name]
-        null_count = int(col_data.isnull().sum())
         logger.info(f"[DEBUG] Columna '{column_name}' tiene {null_count} valores nulos después de limpieza.")
 
         details = {
             "column_name": column_name,
-            "original_type": str(df[column_name].dtype),
+            "original_type": col_profile["original_dtype"],
             "null_count": null_count
         }
 
-        if pd.api.types.is_numeric_dtype(col_data):
-            es_numerica = True
+        if col_profile["kind"] == "numeric":
             details["detected_type"] = "numeric"
-        else:
-            es_numerica = False
-            details["detected_type"] = "categorical"
-
-        if es_numerica:
-            try:
-                stats_series, _ = cn.obtener_estadisticas_descriptivas(df_procesado, column_name)
-                outliers_df, _, _, _ = cn.detectar_outliers_iqr(df_procesado, column_name)
-
-                stats_dict = stats_series.round(2).to_dict() if stats_series is not None else {}
-                clean_stats_dict = {k: None if pd.isna(v) else v for k, v in stats_dict.items()}
-
+            if col_profile.get("statistics_available"):
+                stats_dict = {k: (round(v, 2) if not pd.isna(v) else None) for k, v in col_profile["statistics"].items()}
                 details.update({
                     "analysis_type": "numeric",
-                    "statistics": clean_stats_dict,
+                    "statistics": stats_dict,
                     "outliers": {
-                        "count": len(outliers_df),
-                        "percentage": round((len(outliers_df) / len(df_procesado)) * 100, 2)
-                        if len(df_procesado) > 0 else 0
+                        "count": col_profile["outlier_count"],
+                        "percentage": round((col_profile["outlier_count"] / n_rows) * 100, 2)
                     }
                 })
-
-            except Exception as e:
-                logger.warning(f"[{column_name}] Error en análisis numérico: {e}", exc_info=True)
+            else:
                 details.update({
                     "analysis_type": "numeric",
                     "statistics": {},
@@ -165,56 +183,42 @@ def get_column_details(df: pd.DataFrame, column_name: str) -> Dict[str, Any]:
                 })
 
         else:
-            try:
-                col_data = df_procesado[column_name]
-
-                stats_df = pd.DataFrame([{
-                    "count": int(col_data.count()),
-                    "unique": int(col_data.nunique()),
-                    "top": col_data.mode().iloc[0] if not col_data.mode().empty else None,
-                    "freq": int(col_data.value_counts().iloc[0]) if not col_data.value_counts().empty else None
-                }])
-
-                stats_dict_cat = stats_df.iloc[0].to_dict()
-                clean_stats_dict_cat = {k: None if pd.isna(v) else v for k, v in stats_dict_cat.items()}
-
-                value_counts_df, _ = ld.valores_unicos_y_conteo(df_procesado, column_name)
-
-                columna_limpia = df_procesado[column_name].apply(ct._limpiar_texto_individual)
-                unicos_original = df_procesado[column_name].nunique()
-                unicos_limpios = columna_limpia.nunique()
-                problemas_formato = unicos_original > unicos_limpios
-
-                df_valores_raros = ct.valores_poco_frecuentes(df_procesado, column_name, umbral=0.01)
-                conteo_valores_raros = len(df_valores_raros)
-
-                details.update({
-                    "analysis_type": "categorical",
-                    "statistics": clean_stats_dict_cat,
-                    "unique_values": value_counts_df.to_dict("records") if value_counts_df is not None else [],
-                    "total_unique_count": len(value_counts_df) if value_counts_df is not None else 0,
-                    "advanced_analysis": {
-                        "has_format_issues": problemas_formato,
-                        "format_issues_details": (
-                            f"Se reducirían de {unicos_original} a {unicos_limpios} valores únicos al limpiar formato."
-                            if problemas_formato else "No se detectaron problemas obvios de formato."
-                        ),
-                        "rare_values_count": conteo_valores_raros,
-                        "rare_values_percentage": round(
-                            (conteo_valores_raros / len(value_counts_df)) * 100, 2
-                        ) if len(value_counts_df) > 0 else 0
-                    }
-                })
+            details["detected_type"] = "categorical"
+            value_counts = col_profile["value_counts"]
+            value_counts_df = value_counts.reset_index()
+            value_counts_df.columns = ['valor', 'conteo']
+
+            unicos_original = col_profile["distinct"]
+            unicos_limpios = col_profile["distinct_after_format"]
+            problemas_formato = unicos_original > unicos_limpios
+            conteo_valores_raros = col_profile["rare_values_count"]
+            # En modo aproximado value_counts solo tiene los candidatos frecuentes.
+            total_unicos = (
+                unicos_original + (1 if null_count else 0)
+                if col_profile.get("approximate") else len(value_counts_df)
+            )
+
+            details.update({
+                "analysis_type": "categorical",
+                "statistics": {k: None if pd.isna(v) else v for k, v in col_profile["statistics"].items()},
+                "unique_values": value_counts_df.to_dict("records"),
+                "total_unique_count": total_unicos,
+                "advanced_analysis": {
+                    "has_format_issues": problemas_formato,
+                    "format_issues_details": (
+                        f"Se reducirían de {unicos_original} a {unicos_limpios} valores únicos al limpiar formato."
+                        if problemas_formato else "No se detectaron problemas obvios de formato."
+                    ),
+                    "rare_values_count": conteo_valores_raros,
+                    "rare_values_percentage": round(
+                        (conteo_valores_raros / total_unicos) * 100, 2
+                    ) if total_unicos > 0 else 0
+                }
+            })
 
-            except Exception as e:
-                logger.warning(f"[{column_name}] Error en análisis categórico: {e}", exc_info=True)
-                details.update({
-                    "analysis_type": "categorical",
-                    "statistics": {},
-                    "unique_values": [],
-                    "total_unique_count": 0,
-                    "advanced_analysis": {}
-                })
+        details["approximate"] = bool(col_profile.get("approximate"))
+        if details["approximate"]:
+            details["error_bounds"] = col_profile.get("error_bounds", {})
 
         details_cleaned = clean_nan_from_dict(details)
 
@@ -330,40 +334,24 @@ def _handle_replace_outliers(df: pd.DataFrame, **params) -> Tuple[pd.DataFrame,
 
 
 
-def get_analysis_for_visualization(df: pd.DataFrame) -> Dict[str, Any]:
+def get_analysis_for_visualization(df: Optional[pd.DataFrame], profile: Optional[DatasetProfile] = None, mode: str = "auto") -> Dict[str, Any]:
     """
     Genera un análisis optimizado para los componentes de visualización del frontend.
     Devuelve los detalles de las columnas como un diccionario por columna.
     """
     try:
-        null_like_values = ['nan', 'na', 'n/a', 'null', '', '--', 'undefined']
-        null_regex = r'^\s*(' + '|'.join(null_like_values) + r')\s*$'
-        df_procesado = df.copy()
-
-        for col in df_procesado.columns:
-            if df_procesado[col].dtype == 'object':
-                df_procesado[col] = df_procesado[col].astype(str).str.strip()
-
-        df_procesado.replace(to_replace=null_regex, value=np.nan, regex=True, inplace=True)
+        if profile is None:
+            profile = build_profile(df, mode=mode)
 
         column_details_object = {}
 
-        for col in df_procesado.columns:
-            col_data = df_procesado[col].dropna()
-
-            if pd.api.types.is_numeric_dtype(col_data):
-                col_type = "numeric"
-            elif pd.api.types.is_datetime64_any_dtype(col_data):
-                col_type = "datetime"
-            elif pd.api.types.is_string_dtype(col_data) or pd.api.types.is_categorical_dtype(col_data):
-                col_type = "categorical"
-            else:
-                col_type = "unknown"
-
+        for col, c in profile.columns.items():
+            col_type = c["kind"]
             details_for_col = {
                 "analysis_type": col_type,
-                "null_count": int(df_procesado[col].isnull().sum()),
-                "unique_count": int(col_data.nunique()) if col_type in ["categorical", "datetime"] else None
+                "null_count": c["null_count"],
+                # Los únicos se cuentan sin espacios al borde, como hacía el análisis original.
+                "unique_count": c.get("distinct_stripped", c["distinct"]) if col_type in ["categorical", "datetime"] else None
             }
 
             cleaned_details = clean_nan_from_dict(details_for_col)
@@ -373,7 +361,8 @@ def get_analysis_for_visualization(df: pd.DataFrame) -> Dict[str, Any]:
         return {
             "success": True,
             "data": {
-                "columnDetails": column_details_object
+                "columnDetails": column_details_object,
+                "approximate": profile.approximate
             }
         }
 
@@ -938,37 +927,253 @@ ACTION_MAP: Dict[str, Callable] = {
 }
 
 
+# --- ALCANCE DE CADA ACCIÓN (para el re-diagnóstico incremental) ---
+# Cada entrada recibe los params de la acción y devuelve (columnas_afectadas, cambia_filas).
+# columnas_afectadas = None significa "no se sabe / todas": se re-perfila el dataset completo.
+# Las acciones que no figuran aquí también se tratan como "todas".
+def _alcance_columna(*claves: str) -> Callable[[Dict[str, Any]], Tuple[Optional[List[str]], bool]]:
+    def _alcance(params: Dict[str, Any]) -> Tuple[Optional[List[str]], bool]:
+        columnas = []
+        for clave in claves:
+            valor = params.get(clave)
+            if isinstance(valor, (list, tuple)):
+                columnas.extend(valor)
+            elif valor is not None:
+                columnas.append(valor)
+        return (columnas or None), False
+    return _alcance
+
+
+def _alcance_filas(params: Dict[str, Any]) -> Tuple[Optional[List[str]], bool]:
+    return None, True
+
+
+ACTION_SCOPE: Dict[str, Callable[[Dict[str, Any]], Tuple[Optional[List[str]], bool]]] = {
+    "general_drop_duplicates": _alcance_filas,
+    "general_drop_na_rows": _alcance_filas,
+    "general_delete_rows_by_value": _alcance_filas,
+    "general_drop_columns": _alcance_columna("columnas"),
+    "general_replace_value": _alcance_columna("columna"),
+    "numeric_replace_outliers": lambda p: (None, True) if p.get("metodo") == "eliminar" else _alcance_columna("columna")(p),
+    "numeric_impute_by_method": _alcance_columna("columna"),
+    "numeric_impute_with_value": _alcance_columna("columna"),
+    "numeric_remap_values": _alcance_columna("columna"),
+    "numeric_validate_range": lambda p: (None, True) if p.get("mode", "filter") == "filter" else _alcance_columna("columna")(p),
+    "type_convert_to_categorical": lambda p: (None, False) if p.get("auto") else _alcance_columna("columnas")(p),
+    "categorical_impute_with_constant": _alcance_columna("columna"),
+    "categorical_remap_values": _alcance_columna("columna"),
+    "categorical_impute_with_mode": _alcance_columna("columna"),
+    "categorical_standardize_format": _alcance_columna("columna"),
+    "categorical_group_rare": _alcance_columna("columna"),
+    "text_clean_by_pattern": _alcance_columna("columna"),
+    "type_convert_to_integer": _alcance_columna("columna"),
+    "type_convert_to_float": _alcance_columna("columna"),
+    "type_convert_to_numeric_smart": _alcance_columna("columna"),
+    "type_convert_to_date": _alcance_columna("columna"),
+    "general_create_calculated_column": _alcance_columna("nuevo_nombre"),
+    "general_create_column_by_value": _alcance_columna("nuevo_nombre"),
+    "general_duplicate_column": _alcance_columna("nuevo_nombre_columna"),
+}
+
+
+# --- Normalización previa a cada acción ---
+NULL_LIKE_ACCION = ['nan', 'na', 'n/a', 'null', '', '--', 'undefined', 'N/A']
+NULL_REGEX_ACCION = re.compile(r'^\s*(' + '|'.join(re.escape(v) for v in NULL_LIKE_ACCION) + r')\s*$')
+
+
+def _normalizar_valor_texto(valor: Any) -> Any:
+    """Misma regla que regex de nulos + .str.strip().str.lower() + {'none', ''} -> NaN."""
+    if not isinstance(valor, str) or NULL_REGEX_ACCION.match(valor):
+        return np.nan
+    valor = valor.strip().lower()
+    return np.nan if valor in ('none', '') else valor
+
+
+def _preparar_dataframe(df: pd.DataFrame, columnas: Optional[List[Any]] = None) -> Tuple[pd.DataFrame, List[Any]]:
+    """
+    Copia el DataFrame aplicando la normalización de nulos y de texto que espera
+    ACTION_MAP. Trabaja sobre los valores únicos de cada columna de texto y devuelve
+    también qué columnas cambiaron de verdad: después de la primera acción el dataset
+    ya está normalizado y esta lista suele quedar vacía.
+    Con `columnas` solo se revisan esas y la copia es superficial (la usa el pipeline
+    para re-normalizar lo que tocó el paso anterior sobre un DataFrame que ya es suyo).
+    """
+    df_preparado = df.copy() if columnas is None else df.copy(deep=False)
+    columnas_modificadas = []
+
+    for col in (df_preparado.columns if columnas is None else columnas):
+        if col not in df_preparado.columns:
+            continue
+        serie = df_preparado[col]
+        if serie.dtype == object:
+            codigos, unicos = te.factorizar(serie)
+            nuevos = [_normalizar_valor_texto(v) for v in unicos]
+            if all(isinstance(n, str) and n == u for n, u in zip(nuevos, unicos)):
+                continue
+            df_preparado[col] = te.expandir(serie, codigos, nuevos, conservar_nulos=False)
+            columnas_modificadas.append(col)
+        elif isinstance(serie.dtype, pd.CategoricalDtype):
+            # Texto compactado como categoría: se normalizan las categorías y, si cambia
+            # algo, se vuelve a categorizar (dos categorías pueden quedar iguales).
+            categorias = list(serie.cat.categories)
+            if not categorias or not all(isinstance(v, str) for v in categorias):
+                continue
+            nuevos = [_normalizar_valor_texto(v) for v in categorias]
+            if all(isinstance(n, str) and n == u for n, u in zip(nuevos, categorias)):
+                continue
+            codigos, _ = te.factorizar(serie)
+            df_preparado[col] = te.expandir(serie, codigos, nuevos, conservar_nulos=False).astype("category")
+            columnas_modificadas.append(col)
+        elif ab.is_arrow_string(serie.dtype):
+            # Backend Arrow: la misma regla con kernels vectorizados, sin pasar por Python.
+            normalizada = ab.normalize_text(serie, NULL_REGEX_ACCION)
+            if normalizada.equals(serie):
+                continue
+            df_preparado[col] = normalizada
+            columnas_modificadas.append(col)
+        elif pd.api.types.is_string_dtype(serie.dtype):
+            tokens = [v for v in pd.unique(serie.dropna()) if NULL_REGEX_ACCION.match(v)]
+            if tokens:
+                df_preparado[col] = serie.where(~serie.isin(tokens))
+                columnas_modificadas.append(col)
+
+    return df_preparado, columnas_modificadas
+
+
+# Acciones que solo quitan filas (conservan el índice de las que quedan): los hashes
+# de fila sobrevivientes se toman del índice previo en vez de recalcularse.
+ACCIONES_FILTRO_FILAS = {"general_drop_duplicates", "general_drop_na_rows", "general_delete_rows_by_value"}
+
+
+def _hashes_preparados(
+    df: pd.DataFrame,
+    df_preparado: pd.DataFrame,
+    columnas_normalizadas: List[Any],
+    base_profile: Optional[DatasetProfile],
+) -> Optional[np.ndarray]:
+    """
+    Hashes de fila de `df_preparado` derivados del índice del perfil previo: solo se
+    rehashean las columnas que cambió la normalización. None si no hay índice válido.
+    """
+    if base_profile is None or base_profile.row_hashes is None or len(base_profile.row_hashes) != len(df):
+        return None
+    if not columnas_normalizadas:
+        return base_profile.row_hashes
+    return rh.update_row_hashes(
+        base_profile.row_hashes,
+        normalize_null_like(df[columnas_normalizadas]),
+        normalize_null_like(df_preparado[columnas_normalizadas]),
+        columnas_normalizadas,
+    )
+
+
+def _rediagnosticar(
+    df_original: pd.DataFrame,
+    df_cleaned: pd.DataFrame,
+    action: str,
+    params: Dict[str, Any],
+    columnas_normalizadas: List[Any],
+    base_profile: Optional[DatasetProfile],
+    df_preparado: Optional[pd.DataFrame] = None,
+    hashes_preparados: Optional[np.ndarray] = None,
+) -> DatasetProfile:
+    """
+    Perfil del DataFrame limpio. Si la acción declara sus columnas en ACTION_SCOPE,
+    no cambia filas y tenemos el perfil previo, solo se re-perfilan esas columnas
+    (más las que tocó la normalización) y los duplicados se recalculan con hashes de fila.
+    Si la acción solo filtra filas, los hashes de las sobrevivientes se reutilizan.
+    """
+    alcance = ACTION_SCOPE.get(action)
+    columnas, cambia_filas = alcance(params) if alcance else (None, True)
+
+    if (
+        action in ACCIONES_FILTRO_FILAS
+        and hashes_preparados is not None
+        and df_preparado is not None
+        and df_preparado.index.is_unique
+        and df_cleaned.columns.equals(df_preparado.columns)
+    ):
+        posiciones = df_preparado.index.get_indexer(df_cleaned.index)
+        if len(posiciones) == 0 or posiciones.min() >= 0:
+            return build_profile(df_cleaned, row_hashes=hashes_preparados[posiciones])
+
+    incremental = (
+        base_profile is not None
+        and columnas is not None
+        and not cambia_filas
+        and len(df_cleaned) == len(df_original)
+        and df_cleaned.index.equals(df_original.index)
+    )
+    if not incremental:
+        return build_profile(df_cleaned)
+
+    afectadas = set(columnas) | set(columnas_normalizadas)
+    logger.info(f"⚡ Re-diagnóstico incremental de '{action}': {len(afectadas)} columna(s) de {df_cleaned.shape[1]}.")
+    return update_profile(base_profile, df_original, df_cleaned, afectadas)
+
+
 # --- Función orquestadora ---
-def cleaning_action(df: pd.DataFrame, action: str, params: Dict[str, Any]) -> Dict[str, Any]:
+def _descategorizar(df: pd.DataFrame, action: str, params: Dict[str, Any]) -> pd.DataFrame:
+    """
+    Las columnas `category` (así se cargan los textos de baja cardinalidad) no aceptan
+    valores fuera de sus categorías: un fillna/replace/.loc con un literal nuevo lanza
+    TypeError. Antes de la acción, las columnas que toca pasan a object (copia
+    superficial); al guardar se vuelven a compactar. Las acciones que solo quitan filas
+    no escriben valores y se saltean; si la acción no declara sus columnas se
+    convierten todas las categóricas.
+    """
+    columnas, cambia_filas = ACTION_SCOPE[action](params) if action in ACTION_SCOPE else (None, False)
+    if columnas is None and cambia_filas:
+        return df
+    candidatas = df.columns if columnas is None else [c for c in columnas if c in df.columns]
+    categoricas = [c for c in candidatas if isinstance(df[c].dtype, pd.CategoricalDtype)]
+    if not categoricas:
+        return df
+    df = df.copy(deep=False)
+    for col in categoricas:
+        df[col] = df[col].astype(object)
+    return df
+
+
+def _ejecutar_accion(df: pd.DataFrame, action: str, params: Dict[str, Any], **extra) -> Tuple[pd.DataFrame, str]:
+    """Llama a la función de ACTION_MAP con las columnas afectadas ya editables."""
+    return ACTION_MAP[action](_descategorizar(df, action, params), **extra, **params)
+
+
+def cleaning_action(
+    df: pd.DataFrame,
+    action: str,
+    params: Dict[str, Any],
+    base_profile: Optional[DatasetProfile] = None,
+) -> Dict[str, Any]:
+    """
+    Ejecuta una acción de ACTION_MAP y devuelve el DataFrame limpio con su diagnóstico.
+    `base_profile` es el perfil (cacheado) de `df`; con él el re-diagnóstico solo
+    recalcula lo que la acción tocó.
+    """
     logger.info(f"🧹 Iniciando acción de limpieza: '{action}' con params: {params}")
-    print(f"\n--- !!! SE HA LLAMADO A cleaning_action CON LA ACCIÓN: {action} !!! ---\n")
 
-    filas_antes = len(df)
-    df_preparado = df.copy()
-
-    # --- Paso 1: Reemplazar valores null-like ---
-    null_like_values = ['nan', 'na', 'n/a', 'null', '', '--', 'undefined', 'N/A']
-    null_regex = r'^\s*(' + '|'.join(null_like_values) + r')\s*$'
-    df_preparado.replace(to_replace=null_regex, value=np.nan, regex=True, inplace=True)
-
-    # --- Paso 2: Normalizar texto ---
-    columnas_obj = df_preparado.select_dtypes(include='object').columns.tolist()
-    for col in columnas_obj:
-        df_preparado[col] = (
-            df_preparado[col]
-            .str.strip()
-            .str.lower()
-            .replace({'none': np.nan, '': np.nan})
-        )
+    # --- Pasos 1 y 2: Reemplazar valores null-like y normalizar texto ---
+    df_preparado, columnas_normalizadas = _preparar_dataframe(df)
+
+    # Índice de hashes de fila del DataFrame preparado (si hay perfil previo)
+    hashes_preparados = _hashes_preparados(df, df_preparado, columnas_normalizadas, base_profile)
 
     # --- Paso 3: Ejecutar acción ---
     if action in ACTION_MAP:
         try:
-            func_to_call = ACTION_MAP[action]
-            df_cleaned, message = func_to_call(df_preparado, **params)
-
-            # Diagnóstico post-limpieza
-            new_analysis_result = get_preliminary_analysis(df_cleaned)
+            if action == "general_drop_duplicates" and not params.get("subset") and hashes_preparados is not None:
+                # Deduplicación sobre el índice de hashes: no se comparan filas completas.
+                df_cleaned, message = _ejecutar_accion(df_preparado, action, params, row_hashes=hashes_preparados)
+            else:
+                df_cleaned, message = _ejecutar_accion(df_preparado, action, params)
+
+            # Diagnóstico post-limpieza (el perfil se devuelve para que el endpoint lo cachee)
+            new_profile = _rediagnosticar(
+                df, df_cleaned, action, params, columnas_normalizadas, base_profile,
+                df_preparado=df_preparado, hashes_preparados=hashes_preparados,
+            )
+            new_analysis_result = get_preliminary_analysis(df_cleaned, profile=new_profile)
             if not new_analysis_result.get("success"):
                 return {
                     "success": False,
@@ -980,6 +1185,7 @@ def cleaning_action(df: pd.DataFrame, action: str, params: Dict[str, Any]) -> Di
                 "message": message,
                 "cleaned_dataframe": df_cleaned,
                 "new_diagnostics": new_analysis_result["data"],
+                "profile": new_profile,
             }
 
         except TypeError:
@@ -999,40 +1205,208 @@ def cleaning_action(df: pd.DataFrame, action: str, params: Dict[str, Any]) -> Di
         }
 
 
+# ==============================================================================
+# 3. PIPELINE DE LIMPIEZA (varias acciones, una sola pasada)
+# ==============================================================================
+
+# Acciones que leen y escriben únicamente `params['columna']` sin cambiar filas.
+# Varias seguidas se fusionan: cada columna se procesa sobre un DataFrame de una sola
+# columna y el resultado se escribe de vuelta una vez, en lugar de copiar el dataset
+# completo en cada paso.
+ACCIONES_COLUMNA_LOCAL = {
+    "general_replace_value",
+    "numeric_replace_outliers",
+    "numeric_impute_by_method",
+    "numeric_impute_with_value",
+    "numeric_remap_values",
+    "numeric_validate_range",
+    "categorical_impute_with_constant",
+    "categorical_remap_values",
+    "categorical_impute_with_mode",
+    "categorical_standardize_format",
+    "categorical_group_rare",
+    "text_clean_by_pattern",
+    "type_convert_to_integer",
+    "type_convert_to_float",
+    "type_convert_to_numeric_smart",
+    "type_convert_to_date",
+}
+
+
+def _columna_local(action: str, params: Dict[str, Any]) -> Optional[Any]:
+    """Columna sobre la que trabaja un paso fusionable, o None si el paso es una barrera."""
+    if action not in ACCIONES_COLUMNA_LOCAL:
+        return None
+    columnas, cambia_filas = ACTION_SCOPE[action](params)
+    if cambia_filas or not columnas or len(columnas) != 1:
+        return None
+    return columnas[0]
+
+
+def plan_pipeline(steps: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Valida los pasos y arma el plan lógico: una lista de etapas en orden.
+      - {"type": "fused", "columns": {col: [i, ...]}}: pasos columna-local consecutivos,
+        agrupados por columna (entre columnas distintas el orden no importa).
+      - {"type": "barrier", "step": i}: paso que necesita el DataFrame completo.
+    """
+    if not isinstance(steps, list) or not steps:
+        return {"success": False, "error": "Se esperaba una lista no vacía de pasos."}
+
+    etapas: List[Dict[str, Any]] = []
+    for i, step in enumerate(steps):
+        action = step.get("action") if isinstance(step, dict) else None
+        params = step.get("params", {}) if isinstance(step, dict) else None
+        if action not in ACTION_MAP:
+            return {"success": False, "error": f"Paso {i + 1}: acción de limpieza desconocida: '{action}'"}
+        if not isinstance(params, dict):
+            return {"success": False, "error": f"Paso {i + 1}: 'params' debe ser un objeto."}
+
+        columna = _columna_local(action, params)
+        if columna is None:
+            etapas.append({"type": "barrier", "step": i})
+            continue
+        if not etapas or etapas[-1]["type"] != "fused":
+            etapas.append({"type": "fused", "columns": {}})
+        etapas[-1]["columns"].setdefault(columna, []).append(i)
+
+    return {"success": True, "data": etapas}
+
+
+def cleaning_pipeline(
+    df: pd.DataFrame,
+    steps: List[Dict[str, Any]],
+    base_profile: Optional[DatasetProfile] = None,
+) -> Dict[str, Any]:
+    """
+    Ejecuta una receta de acciones de ACTION_MAP con el mismo resultado que aplicarlas
+    una por una con cleaning_action, pero normalizando el dataset completo una sola vez
+    (después solo se re-normalizan las columnas que tocó cada paso), fusionando los pasos
+    columna-local y diagnosticando al final. Si un paso falla no se devuelve nada parcial.
+    """
+    plan = plan_pipeline(steps)
+    if not plan.get("success"):
+        return plan
+    etapas = plan["data"]
+    logger.info(f"🧪 Pipeline de limpieza: {len(steps)} pasos en {len(etapas)} etapas.")
+
+    df_trabajo, columnas_normalizadas = _preparar_dataframe(df)
+    mensajes: List[Optional[str]] = [None] * len(steps)
+    columnas_tocadas = set(columnas_normalizadas)
+    alcance_conocido, cambia_filas = True, False
+
+    paso_actual = 0
+    try:
+        for etapa in etapas:
+            if etapa["type"] == "barrier":
+                paso_actual = i = etapa["step"]
+                action, params = steps[i]["action"], steps[i].get("params", {})
+                columnas_antes = set(df_trabajo.columns)
+                df_trabajo, mensajes[i] = _ejecutar_accion(df_trabajo, action, params)
+
+                columnas, filas = ACTION_SCOPE[action](params) if action in ACTION_SCOPE else (None, True)
+                cambia_filas = cambia_filas or filas
+                if action in ACCIONES_FILTRO_FILAS:
+                    continue  # Solo quita filas: no hay valores nuevos que normalizar
+                if columnas is None:
+                    alcance_conocido = False
+                    df_trabajo, _ = _preparar_dataframe(df_trabajo, list(df_trabajo.columns))
+                else:
+                    nuevas = [c for c in df_trabajo.columns if c not in columnas_antes]
+                    columnas_tocadas.update(columnas, nuevas)
+                    df_trabajo, _ = _preparar_dataframe(df_trabajo, list(columnas) + nuevas)
+                continue
+
+            resultados = {}
+            for columna, indices_columna in etapa["columns"].items():
+                if columna not in df_trabajo.columns:
+                    # Sin la columna no hay nada que fusionar: cada paso responde su propio aviso.
+                    for i in indices_columna:
+                        paso_actual = i
+                        df_trabajo, mensajes[i] = _ejecutar_accion(df_trabajo, steps[i]["action"], steps[i].get("params", {}))
+                    continue
+                df_columna = df_trabajo[[columna]]
+                for i in indices_columna:
+                    paso_actual = i
+                    action, params = steps[i]["action"], steps[i].get("params", {})
+                    df_columna, mensajes[i] = _ejecutar_accion(df_columna, action, params)
+                    df_columna, _ = _preparar_dataframe(df_columna, [columna])
+                if columna not in df_columna.columns or len(df_columna) != len(df_trabajo):
+                    raise ValueError(f"el paso sobre '{columna}' cambió la forma del DataFrame")
+                resultados[columna] = df_columna[columna]
+                columnas_tocadas.add(columna)
+
+            df_trabajo = df_trabajo.copy(deep=False)
+            for columna, serie in resultados.items():
+                df_trabajo[columna] = serie
+
+    except TypeError:
+        return {
+            "success": False,
+            "error": f"Parámetros incorrectos en el paso {paso_actual + 1} ('{steps[paso_actual]['action']}')."
+        }
+    except Exception as e:
+        return {
+            "success": False,
+            "error": f"Error interno en el paso {paso_actual + 1} ('{steps[paso_actual]['action']}'): {str(e)}"
+        }
+
+    # --- Diagnóstico único al final ---
+    incremental = (
+        base_profile is not None
+        and alcance_conocido
+        and not cambia_filas
+        and len(df_trabajo) == len(df)
+        and df_trabajo.index.equals(df.index)
+    )
+    if incremental:
+        new_profile = update_profile(base_profile, df, df_trabajo, columnas_tocadas)
+    else:
+        new_profile = build_profile(df_trabajo)
+    new_analysis_result = get_preliminary_analysis(df_trabajo, profile=new_profile)
+    if not new_analysis_result.get("success"):
+        return {"success": False, "error": "La limpieza funcionó, pero el reanálisis falló."}
+
+    return {
+        "success": True,
+        "message": " ".join(m for m in mensajes if m),
+        "steps": [
+            {"action": step["action"], "message": mensajes[i]} for i, step in enumerate(steps)
+        ],
+        "plan": [
+            {"type": e["type"], "steps": [e["step"]]} if e["type"] == "barrier"
+            else {"type": e["type"], "columns": {str(c): idx for c, idx in e["columns"].items()}}
+            for e in etapas
+        ],
+        "cleaned_dataframe": df_trabajo,
+        "new_diagnostics": new_analysis_result["data"],
+        "profile": new_profile,
+    }
+
+
     
 
-def check_dataset_quality(df: pd.DataFrame) -> Dict[str, Any]:
+def check_dataset_quality(df: Optional[pd.DataFrame], profile: Optional[DatasetProfile] = None, mode: str = "auto") -> Dict[str, Any]:
     """
     Realiza un diagnóstico de calidad completo pero eficiente.
-    Optimizado para evitar iterar sobre columnas no numéricas al buscar outliers.
+    Duplicados, nulos y outliers (IQR) salen del perfil del dataset, que ya los
+    calcula en una sola pasada; con un `profile` cacheado no se toca el DataFrame.
     """
     try:
-        # --- 1. Preprocesamiento ---
-        null_like_values = ['nan', 'na', 'n/a', 'null', '', '--', 'undefined']
-        null_regex = r'^\s*(' + '|'.join(null_like_values) + r')\s*$'
-        df_procesado = df.copy()
-        df_procesado.replace(to_replace=null_regex, value=np.nan, regex=True, inplace=True)
-        
+        # --- 1. Perfil (normaliza nulo-like una sola vez) ---
+        if profile is None:
+            profile = build_profile(df, mode=mode)
+
         # --- 2. Chequeos Globales ---
-        # Asumiendo que ld.detectar_duplicados devuelve (dataframe, conteo, indices)
-        _, n_duplicados, _ = ld.detectar_duplicados(df_procesado)
-        total_nulos = int(df_procesado.isnull().sum().sum())
+        n_duplicados = profile.duplicate_count
+        total_nulos = profile.total_nulls
 
         has_duplicates = n_duplicados > 0
         has_nulls = total_nulos > 0
 
-        # --- 3. Chequeo de Outliers solo en columnas numéricas ---
-        has_outliers = False
-        outlier_columns = []
-
-        numeric_cols = df_procesado.select_dtypes(include=[np.number]).columns
-
-        for col_name in numeric_cols:
-            # Asumiendo que cn.detectar_outliers_iqr devuelve (outliers_df, conteo, ...)
-            outliers_df, _, _, _ = cn.detectar_outliers_iqr(df_procesado, col_name)
-            if not outliers_df.empty:
-                has_outliers = True
-                outlier_columns.append(col_name)
+        # --- 3. Outliers: columnas numéricas con valores fuera de [Q1 - 1.5·IQR, Q3 + 1.5·IQR] ---
+        outlier_columns = profile.outlier_columns()
+        has_outliers = len(outlier_columns) > 0
 
         # --- 4. Veredicto Final ---
         is_clean = not (has_duplicates or has_nulls or has_outliers)
@@ -1056,8 +1430,11 @@ def check_dataset_quality(df: pd.DataFrame) -> Dict[str, Any]:
                 "nulls_count": total_nulos,
                 "has_outliers": has_outliers,
                 "outlier_columns": outlier_columns
-            }
+            },
+            "approximate": profile.approximate
         }
+        if profile.approximate:
+            report["issues"]["duplicates_error_bound"] = profile.error_bounds.get("duplicates", 0)
         
         logger.info(f"Chequeo de calidad completado. Veredicto: {'Limpio' if is_clean else 'Con Problemas'}")
         
@@ -1070,4 +1447,4 @@ def check_dataset_quality(df: pd.DataFrame) -> Dict[str, Any]:
     except Exception as e:
         logger.error("Error crítico durante el chequeo de calidad del dataset: %s", str(e))
         # También es buena idea pasar un mensaje en el error
-        return {"success": False, "message": "Error interno al analizar el dataset.", "error": "Error al realizar el chequeo de calidad."}
\ No newline at end of file
+        return {"success": False, "message": "Error interno al analizar el dataset.", "error": "Error al realizar el chequeo de calidad."}
\ No newline at end of file
@@ -1,17 +1,19 @@
 # services/backend_predictivo.py
+import os
+import tempfile
 import logging
 import numpy as np  
 import pandas as pd 
-from typing import List, Dict, Any, Union
+from typing import List, Dict, Any, Union, Optional
 
-from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.base import BaseEstimator, TransformerMixin, clone
 from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder, LabelEncoder 
 from sklearn.feature_selection import mutual_info_classif 
 from sklearn.impute import SimpleImputer
 from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
 from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
-from sklearn.model_selection import train_test_split, cross_val_score, StratifiedKFold, KFold
+from sklearn.model_selection import train_test_split, cross_validate, StratifiedKFold, KFold
 from sklearn.metrics import classification_report, r2_score, mean_squared_error
 from imblearn.over_sampling import SMOTE
 from sklearn.compose import TransformedTargetRegressor
@@ -25,11 +27,28 @@ from sklearn import set_config
 import joblib
 from io import BytesIO
 
+from . import arrow_backend as ab
+from .model_artifact_cache import load_artifacts
+from . import hyperparameter_search as hs
+from .job_queue import report_progress
+
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 set_config(transform_output="pandas")
 
+# Sensibilidad / dependencia parcial: filas por llamada a predict y límites de la grilla.
+PDP_CHUNK_ROWS = int(os.getenv("PDP_CHUNK_ROWS", 50_000))
+
+# Validación cruzada: folds en paralelo (acotados para no competir con el n_jobs de los
+# modelos) y caché en disco de las salidas del preprocesador/SMOTE por fold.
+CV_FOLDS = 5
+CV_MAX_WORKERS = int(os.getenv("CV_MAX_WORKERS", 0)) or max(1, min(CV_FOLDS, (os.cpu_count() or 1) // 2))
+CV_CACHE_DIR = os.getenv("CV_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "promptlab_cv_cache")
+CV_CACHE_MAX_MB = int(os.getenv("CV_CACHE_MAX_MB", 1024))
+SENSITIVITY_MAX_STEPS = int(os.getenv("SENSITIVITY_MAX_STEPS", 1000))
+PDP_MAX_GRID_CELLS = int(os.getenv("PDP_MAX_GRID_CELLS", 2500))
+
 # ===================================================================
 # CLASE HELPER ROBUSTA (PRODUCCIÓN, "CLONE-SAFE")
 # ===================================================================
@@ -290,6 +309,16 @@ class PredictionService:
                  }
         self.logger = logging.getLogger(__name__)
 
+    @staticmethod
+    def _resolve_artifacts(serialized_model_bytes) -> Dict[str, Any]:
+        """
+        Acepta los bytes del .joblib o los artefactos ya deserializados (los que sirve
+        ModelArtifactCache); en el segundo caso no se vuelve a llamar a joblib.load.
+        """
+        if isinstance(serialized_model_bytes, dict):
+            return serialized_model_bytes
+        return load_artifacts(serialized_model_bytes)
+
     def evaluate_model(
         self,
         serialized_model_bytes: bytes,
@@ -304,8 +333,7 @@ class PredictionService:
 
             # --- 1. Cargar artefactos ---
             try:
-                buffer = BytesIO(serialized_model_bytes)
-                artifacts = joblib.load(buffer)
+                artifacts = self._resolve_artifacts(serialized_model_bytes)
             except Exception as load_err:
                 self.logger.error(f"❌ Error cargando artefactos del modelo: {load_err}", exc_info=True)
                 return {"success": False, "error": "El modelo no se pudo cargar correctamente."}
@@ -332,6 +360,7 @@ class PredictionService:
 
             if df_to_evaluate.empty:
                 return {"success": False, "error": "El dataset de evaluación está vacío."}
+            df_to_evaluate = ab.to_numpy_backed(df_to_evaluate)
 
             self.logger.info("✅ Validación de esquema exitosa.")
 
@@ -425,7 +454,14 @@ class PredictionService:
         use_cv: bool = False,
         test_size: float = 0.25,
         random_state: int = 42,
+        tuning: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Any]:
+        """
+        Entrena `model_name` con su configuración por defecto. Con `tuning`
+        ({"time_budget_sec", "cpu_budget", "n_candidates", "eta"}) busca antes los
+        hiperparámetros por successive halving (ver hyperparameter_search); los
+        artefactos devueltos tienen el mismo formato en ambos casos.
+        """
         # 1. Validaciones iniciales
         if not isinstance(df, pd.DataFrame):
             return {"success": False, "error": "El parámetro 'df' debe ser un DataFrame."}
@@ -433,6 +469,8 @@ class PredictionService:
             return {"success": False, "error": f"La columna objetivo '{target_col}' no está en el DataFrame."}
         if not (0 < test_size < 1):
             return {"success": False, "error": "'test_size' debe estar entre 0 y 1."}
+        # sklearn/xgboost esperan columnas numpy: el backend Arrow se convierte aquí.
+        df = ab.to_numpy_backed(df)
 
         results = {"model_name": model_name, "problem_type": problem_type}
 
@@ -482,98 +520,45 @@ class PredictionService:
             pipeline = ImbPipeline(steps=pipeline_steps)
 
             # 7. División de datos
-            stratify_param = (
-                y
-                if problem_type == 'clasificacion'
-                and y.nunique() > 1
-                and y.value_counts().min() >= 2
-                else None
-            )
+            stratify_param = self._stratify_target(y, problem_type)
             X_train, X_test, y_train, y_test = train_test_split(
                 X, y, test_size=test_size, random_state=random_state, stratify=stratify_param
             )
 
-            # 8. Validación cruzada opcional
+            # 8. Validación cruzada opcional (folds en paralelo, sobre el train)
+            cv_pipeline = None
             if use_cv:
-                scoring = 'accuracy' if problem_type == "clasificacion" else 'r2'
-                cv_strategy = (
-                    StratifiedKFold(5, shuffle=True, random_state=random_state)
-                    if problem_type == "clasificacion" and stratify_param is not None
-                    else KFold(5, shuffle=True, random_state=random_state)
-                )
+                report_progress(20, "Validación cruzada")
                 try:
-                    cv_scores = cross_val_score(pipeline, X, y, cv=cv_strategy, scoring=scoring)
-                    results['cv_mean_score'] = float(np.mean(cv_scores))
-                    results['cv_std_dev'] = float(np.std(cv_scores))
+                    cv_output = self._cross_validate(pipeline, X_train, y_train, problem_type, random_state)
+                    results.update(cv_output['summary'])
+                    cv_pipeline = cv_output['pipeline']
                 except Exception as e:
                     logger.error(f"Error en validación cruzada: {e}", exc_info=True)
                     results['cv_error'] = str(e)
 
-            # 9. Entrenamiento
-            try:
-                pipeline.fit(X_train, y_train)
-            except Exception as e:
-                return {"success": False, "error": f"Error en entrenamiento: {e}"}
-
-            # 10. Predicción y métricas
-            y_pred = pipeline.predict(X_test)
-            if problem_type == "clasificacion":
-                cm = confusion_matrix(y_test, y_pred)
-                results['confusion_matrix'] = cm.tolist()
-                results['accuracy'] = float(accuracy_score(y_test, y_pred))
-                labels = y_encoder.classes_.tolist() if y_encoder else None
-                if labels:
-                    results['confusion_matrix_labels'] = labels
-                    results['classification_report'] = classification_report(
-                        y_test, y_pred, target_names=labels, output_dict=True
+            # 9. Entrenamiento (con búsqueda de hiperparámetros si se pidió `tuning`)
+            if tuning:
+                try:
+                    results['tuning'] = self._tune_pipeline(
+                        pipeline, X_train, y_train, model_name, problem_type, use_smote, random_state, tuning
                     )
-            else:  # regresión
-                # Calcular métricas
-                results['r2_score'] = float(r2_score(y_test, y_pred))
-                results['rmse'] = float(np.sqrt(mean_squared_error(y_test, y_pred)))
-                results['mae'] = float(mean_absolute_error(y_test, y_pred))
-
-                # Calcular MAPE seguro
-                mape_val = mean_absolute_percentage_error(y_test, y_pred)
-                results['mape'] = None if np.isnan(mape_val) or np.isinf(mape_val) else float(mape_val)
-
-                # Errores para histograma
-                prediction_errors = (y_test - y_pred).tolist()
-                results['error_histogram_data'] = prediction_errors
-
-                # Submuestreo para scatter plot
-                sample_size = min(len(y_test), 200)
-                indices = np.random.choice(y_test.index, sample_size, replace=False)
-                y_test_sample = y_test.loc[indices]
-                y_pred_sample = pd.Series(y_pred, index=y_test.index).loc[indices]
-                results['scatter_plot_data'] = {
-                    'actual': y_test_sample.tolist(),
-                    'predicted': y_pred_sample.tolist()
-                }
+                except Exception as e:
+                    logger.error(f"Error en la búsqueda de hiperparámetros: {e}", exc_info=True)
+                    return {"success": False, "error": f"Error en la búsqueda de hiperparámetros: {e}"}
+            elif cv_pipeline is not None:
+                # La validación cruzada ya reajustó el pipeline sobre todo el train.
+                pipeline = cv_pipeline
+            else:
+                report_progress(40, "Ajustando el modelo")
+                try:
+                    pipeline.fit(X_train, y_train)
+                except Exception as e:
+                    return {"success": False, "error": f"Error en entrenamiento: {e}"}
 
-            # 11. Importancia de características
-            try:
-                final_model = pipeline.named_steps['model']
-                from sklearn.utils.validation import check_is_fitted
-                check_is_fitted(final_model)
-
-                if hasattr(final_model, 'feature_importances_'):
-                    feature_names = pipeline.named_steps['preprocessor'].get_feature_names_out()
-                    results['feature_importance_chart_data'] = {
-                        name: float(imp)
-                        for name, imp in zip(feature_names, final_model.feature_importances_)
-                    }
-                elif hasattr(final_model, 'coef_'):
-                    feature_names = pipeline.named_steps['preprocessor'].get_feature_names_out()
-                    coefs = np.abs(final_model.coef_).ravel()
-                    results['feature_importance_chart_data'] = {
-                        name: float(coef) for name, coef in zip(feature_names, coefs)
-                    }
-                else:
-                    results['feature_importance_chart_data'] = {}
-            except Exception as e:
-                logger.error(f"No se pudo extraer importancia de características: {e}", exc_info=True)
-                results['feature_importance_chart_data'] = {}
+            # 10-11. Predicción, métricas e importancia de características
+            report_progress(85, "Calculando métricas")
+            results.update(self._test_metrics(pipeline, X_test, y_test, problem_type, y_encoder))
 
             # 12. Artefactos
             training_features = X.columns.tolist()
@@ -616,10 +601,11 @@ class PredictionService:
             steps = int(variation_range.get("steps", 20))
             if steps <= 0:
                 raise ValueError("'steps' debe ser mayor que 0.")
+            if steps > SENSITIVITY_MAX_STEPS:
+                raise ValueError(f"'steps' no puede superar {SENSITIVITY_MAX_STEPS}.")
 
             # --- 1. Cargar artefactos ---
-            buffer = BytesIO(serialized_model_bytes)
-            artifacts = joblib.load(buffer)
+            artifacts = self._resolve_artifacts(serialized_model_bytes)
             pipeline = artifacts.get("pipeline")
             y_encoder = artifacts.get("y_encoder")
             training_features = artifacts.get("training_features")
@@ -638,33 +624,19 @@ class PredictionService:
             # --- 2. Generar rango de simulación ---
             sim_values = np.linspace(variation_range["start"], variation_range["end"], steps)
 
-            # --- 3. Construcción del DataFrame a prueba de errores ---
-            # Creamos DataFrame vacío con columnas EXACTAS como en el entrenamiento
-            sim_df = pd.DataFrame(columns=training_features)
-
-            # Rellenamos con las filas variando la feature
-            for val in sim_values:
-                new_row_dict = base_data_point.copy()
-                new_row_dict[feature_to_vary] = val
-                new_row_df = pd.DataFrame([new_row_dict])
-                sim_df = pd.concat([sim_df, new_row_df], ignore_index=True)
-
-            # Forzar a que las columnas queden en el mismo orden
-            sim_df = sim_df[training_features]
+            # --- 3. Grilla de simulación en un solo paso ---
+            # Una fila base repetida `steps` veces, con las columnas EXACTAS del entrenamiento
+            sim_df = pd.DataFrame([base_data_point] * steps).reindex(columns=training_features)
+            sim_df[feature_to_vary] = sim_values
 
-            # --- 4. Predicciones ---
-            if problem_type == "clasificacion":
-                if not hasattr(pipeline, "predict_proba"):
-                    raise ValueError("El pipeline no soporta predict_proba para clasificación.")
-                pred_array = pipeline.predict_proba(sim_df)
-                predictions = pred_array[:, 1] if pred_array.shape[1] == 2 else pred_array
-            else:  # regresion
-                predictions = pipeline.predict(sim_df)
-                
+            # --- 4. Predicciones (una sola llamada) ---
+            if problem_type == "clasificacion" and not hasattr(pipeline, "predict_proba"):
+                raise ValueError("El pipeline no soporta predict_proba para clasificación.")
+            predictions = self._predict_scores(pipeline, problem_type, sim_df)
 
             # --- 5. Resultados ---
             results_data = [
-                {"feature_value": float(val), "prediction": float(pred)}
+                {"feature_value": float(val), "prediction": self._score_to_json(pred)}
                 for val, pred in zip(sim_values, predictions)
             ]
 
@@ -681,6 +653,150 @@ class PredictionService:
             self.logger.error(f"Error en analyze_sensitivity: {e}", exc_info=True)
             return {"success": False, "error": str(e)}
 
+    # ------------------------------------------------------------------
+    # Dependencia parcial (PDP) y curvas ICE
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _predict_scores(pipeline, problem_type: str, df: pd.DataFrame, class_index: Optional[int] = None) -> np.ndarray:
+        """
+        Salida numérica del modelo por fila, en llamadas de hasta PDP_CHUNK_ROWS filas:
+        probabilidad de la clase `class_index` (por defecto la positiva si es binaria,
+        todas si es multiclase) en clasificación y el valor predicho en regresión.
+        """
+        outputs = []
+        for start in range(0, len(df), PDP_CHUNK_ROWS):
+            chunk = df.iloc[start:start + PDP_CHUNK_ROWS]
+            if problem_type == "clasificacion":
+                proba = np.asarray(pipeline.predict_proba(chunk), dtype=float)
+                if class_index is not None:
+                    outputs.append(proba[:, class_index])
+                else:
+                    outputs.append(proba[:, 1] if proba.shape[1] == 2 else proba)
+            else:
+                outputs.append(np.asarray(pipeline.predict(chunk), dtype=float))
+        return np.concatenate(outputs) if outputs else np.array([])
+
+    @staticmethod
+    def _score_to_json(score):
+        return float(score) if np.ndim(score) == 0 else [float(p) for p in score]
+
+    @staticmethod
+    def _grid_values(feature: str, spec: dict) -> np.ndarray:
+        """Valores de la grilla: `values` explícitos (sirve para categóricas) o `start`/`end`/`steps`."""
+        if not isinstance(spec, dict):
+            raise ValueError(f"La grilla de '{feature}' debe ser un objeto.")
+        if spec.get("values") is not None:
+            values = pd.Series(list(spec["values"])).drop_duplicates().to_numpy()
+        else:
+            if "start" not in spec or "end" not in spec:
+                raise ValueError(f"La grilla de '{feature}' necesita 'values' o 'start' y 'end'.")
+            values = np.linspace(float(spec["start"]), float(spec["end"]), int(spec.get("steps", 20)))
+        if len(values) == 0 or len(values) > SENSITIVITY_MAX_STEPS:
+            raise ValueError(f"La grilla de '{feature}' debe tener entre 1 y {SENSITIVITY_MAX_STEPS} valores.")
+        return values
+
+    @staticmethod
+    def _resolve_class_index(y_encoder, target_class) -> Optional[int]:
+        if y_encoder is None or not hasattr(y_encoder, "classes_"):
+            return None
+        classes = list(y_encoder.classes_)
+        if target_class is None:
+            if len(classes) > 2:
+                raise ValueError(f"Modelo multiclase: indicá 'target_class' (una de {classes}).")
+            return None
+        for idx, cls in enumerate(classes):
+            if cls == target_class or str(cls) == str(target_class):
+                return idx
+        raise ValueError(f"La clase '{target_class}' no existe en el modelo. Clases: {classes}")
+
+    def analyze_partial_dependence(
+        self,
+        serialized_model_bytes,
+        features: List[str],
+        grids: Dict[str, dict],
+        background_df: pd.DataFrame,
+        ice: bool = True,
+        max_ice_curves: int = 50,
+        target_class=None,
+    ) -> dict:
+        """
+        Dependencia parcial de 1 o 2 features sobre filas reales (`background_df`).
+
+        Cada fila de fondo se replica una vez por punto de la grilla (el producto
+        cartesiano si son 2 features) y todo se predice en lotes de PDP_CHUNK_ROWS.
+        El PDP es el promedio por punto; con 1 feature también se devuelven las curvas
+        ICE (una por fila, hasta `max_ice_curves`).
+        """
+        try:
+            artifacts = self._resolve_artifacts(serialized_model_bytes)
+            pipeline = artifacts.get("pipeline")
+            y_encoder = artifacts.get("y_encoder")
+            training_features = artifacts.get("training_features")
+            problem_type = artifacts.get("problem_type")
+
+            if pipeline is None or not training_features:
+                raise ValueError("Artefacto de modelo inválido: faltan 'pipeline' o 'training_features'.")
+            if problem_type not in ["clasificacion", "regresion"]:
+                raise ValueError("El artefacto no tiene un 'problem_type' válido.")
+            if not features or len(features) > 2:
+                raise ValueError("Indicá 1 o 2 features en 'features'.")
+            unknown = [f for f in features if f not in training_features]
+            if unknown:
+                raise ValueError(f"Features no usadas por el modelo: {unknown}")
+            if background_df is None or background_df.empty:
+                raise ValueError("No hay filas de referencia para calcular la dependencia parcial.")
+
+            class_index = self._resolve_class_index(y_encoder, target_class) if problem_type == "clasificacion" else None
+
+            # --- 1. Grilla (producto cartesiano si son 2 features) ---
+            axes = [self._grid_values(f, (grids or {}).get(f)) for f in features]
+            if len(axes) == 2:
+                if len(axes[0]) * len(axes[1]) > PDP_MAX_GRID_CELLS:
+                    raise ValueError(f"La grilla 2D no puede superar {PDP_MAX_GRID_CELLS} celdas.")
+                mesh = np.meshgrid(axes[0], axes[1], indexing="ij")
+                grid_columns = [m.ravel() for m in mesh]
+            else:
+                grid_columns = [axes[0]]
+            grid_size = len(grid_columns[0])
+
+            background = ab.to_numpy_backed(background_df).reindex(columns=training_features).reset_index(drop=True)
+            n_rows = len(background)
+
+            # --- 2. Predicción por bloques de filas de fondo × grilla completa ---
+            rows_per_block = max(1, PDP_CHUNK_ROWS // grid_size)
+            scores = np.empty((n_rows, grid_size), dtype=float)
+            for start in range(0, n_rows, rows_per_block):
+                block = background.iloc[start:start + rows_per_block]
+                expanded = block.iloc[np.repeat(np.arange(len(block)), grid_size)].reset_index(drop=True)
+                for feature, column in zip(features, grid_columns):
+                    expanded[feature] = np.tile(column, len(block))
+                block_scores = self._predict_scores(pipeline, problem_type, expanded, class_index)
+                scores[start:start + len(block)] = block_scores.reshape(len(block), grid_size)
+
+            # --- 3. Resultados ---
+            pdp = scores.mean(axis=0)
+            data = {
+                "features": features,
+                "problem_type": problem_type,
+                "target_class": target_class,
+                "grid": {f: axis.tolist() for f, axis in zip(features, axes)},
+                "n_background_rows": n_rows,
+                "predictions_evaluated": int(n_rows * grid_size),
+            }
+            if len(features) == 2:
+                data["partial_dependence"] = pdp.reshape(len(axes[0]), len(axes[1])).round(6).tolist()
+            else:
+                data["partial_dependence"] = pdp.round(6).tolist()
+                if ice:
+                    data["ice_curves"] = scores[:max_ice_curves].round(6).tolist()
+
+            return {"success": True, "data": data}
+
+        except Exception as e:
+            self.logger.error(f"Error en analyze_partial_dependence: {e}", exc_info=True)
+            return {"success": False, "error": str(e)}
+
 
     def make_batch_prediction(
         self,
@@ -692,7 +808,7 @@ class PredictionService:
         """
         try:
             # --- Validaciones ---
-            if not isinstance(serialized_model_bytes, (bytes, bytearray)):
+            if not isinstance(serialized_model_bytes, (bytes, bytearray, dict)):
                 return {"success": False, "error": "El modelo debe ser un objeto bytes."}
 
             if not isinstance(df_to_predict, pd.DataFrame):
@@ -700,11 +816,11 @@ class PredictionService:
 
             if df_to_predict.empty:
                 return {"success": False, "error": "El DataFrame a predecir está vacío."}
+            df_to_predict = ab.to_numpy_backed(df_to_predict)
 
             # --- 1. Cargar artefactos ---
-            buffer = BytesIO(serialized_model_bytes)
             try:
-                artifacts = joblib.load(buffer)
+                artifacts = self._resolve_artifacts(serialized_model_bytes)
             except Exception as load_err:
                 self.logger.error(f"Error al cargar el modelo serializado: {load_err}", exc_info=True)
                 return {"success": False, "error": "Error al cargar el modelo serializado."}
@@ -806,6 +922,175 @@ class PredictionService:
             return {col: 0.0 for col in X.columns}
 
 
+    def _test_metrics(self, pipeline, X_test, y_test, problem_type: str, y_encoder) -> Dict[str, Any]:
+        """Métricas sobre el conjunto de prueba e importancia de características del modelo ajustado."""
+        metrics: Dict[str, Any] = {}
+        y_pred = pipeline.predict(X_test)
+        if problem_type == "clasificacion":
+            cm = confusion_matrix(y_test, y_pred)
+            metrics['confusion_matrix'] = cm.tolist()
+            metrics['accuracy'] = float(accuracy_score(y_test, y_pred))
+            labels = y_encoder.classes_.tolist() if y_encoder else None
+            if labels:
+                metrics['confusion_matrix_labels'] = labels
+                metrics['classification_report'] = classification_report(
+                    y_test, y_pred, target_names=labels, output_dict=True
+                )
+        else:  # regresión
+            # Calcular métricas
+            metrics['r2_score'] = float(r2_score(y_test, y_pred))
+            metrics['rmse'] = float(np.sqrt(mean_squared_error(y_test, y_pred)))
+            metrics['mae'] = float(mean_absolute_error(y_test, y_pred))
+
+            # Calcular MAPE seguro
+            mape_val = mean_absolute_percentage_error(y_test, y_pred)
+            metrics['mape'] = None if np.isnan(mape_val) or np.isinf(mape_val) else float(mape_val)
+
+            # Errores para histograma
+            prediction_errors = (y_test - y_pred).tolist()
+            metrics['error_histogram_data'] = prediction_errors
+
+            # Submuestreo para scatter plot
+            sample_size = min(len(y_test), 200)
+            indices = np.random.choice(y_test.index, sample_size, replace=False)
+            y_test_sample = y_test.loc[indices]
+            y_pred_sample = pd.Series(y_pred, index=y_test.index).loc[indices]
+            metrics['scatter_plot_data'] = {
+                'actual': y_test_sample.tolist(),
+                'predicted': y_pred_sample.tolist()
+            }
+
+        # 11. Importancia de características
+        try:
+            final_model = pipeline.named_steps['model']
+            from sklearn.utils.validation import check_is_fitted
+            check_is_fitted(final_model)
+
+            if hasattr(final_model, 'feature_importances_'):
+                feature_names = pipeline.named_steps['preprocessor'].get_feature_names_out()
+                metrics['feature_importance_chart_data'] = {
+                    name: float(imp)
+                    for name, imp in zip(feature_names, final_model.feature_importances_)
+                }
+            elif hasattr(final_model, 'coef_'):
+                feature_names = pipeline.named_steps['preprocessor'].get_feature_names_out()
+                coefs = np.abs(final_model.coef_).ravel()
+                metrics['feature_importance_chart_data'] = {
+                    name: float(coef) for name, coef in zip(feature_names, coefs)
+                }
+            else:
+                metrics['feature_importance_chart_data'] = {}
+        except Exception as e:
+            logger.error(f"No se pudo extraer importancia de características: {e}", exc_info=True)
+            metrics['feature_importance_chart_data'] = {}
+        return metrics
+
+    def _cross_validate(self, pipeline, X, y, problem_type: str, random_state: int) -> Dict[str, Any]:
+        """
+        K-fold en paralelo con a lo sumo CV_MAX_WORKERS procesos; todo `*n_jobs` anidado del
+        pipeline se reparte entre ellos. Con `memory` el preprocesador (y SMOTE) ajustado en
+        cada fold queda cacheado en CV_CACHE_DIR y se reutiliza si se repite el mismo fold.
+        Devuelve el resumen (media y desvío de los folds) y el pipeline reajustado sobre todo X, y.
+        """
+        cv_strategy = (
+            StratifiedKFold(CV_FOLDS, shuffle=True, random_state=random_state)
+            if self._stratify_target(y, problem_type) is not None
+            else KFold(CV_FOLDS, shuffle=True, random_state=random_state)
+        )
+        if problem_type == "clasificacion":
+            scoring = {"accuracy": "accuracy", "f1_macro": "f1_macro"}
+            primary = "accuracy"
+        else:
+            scoring = {"r2": "r2", "rmse": "neg_root_mean_squared_error", "mae": "neg_mean_absolute_error"}
+            primary = "r2"
+
+        workers = max(1, min(CV_FOLDS, CV_MAX_WORKERS))
+        cv_pipeline = clone(pipeline)
+        per_fold_jobs = max(1, (os.cpu_count() or 1) // workers)
+        # Incluye los anidados (p. ej. model__regressor__n_jobs de un TransformedTargetRegressor).
+        original_n_jobs = {
+            name: value for name, value in cv_pipeline.get_params(deep=True).items()
+            if name.endswith("n_jobs") and value is not None and (value < 0 or value > per_fold_jobs)
+        }
+        if original_n_jobs:
+            cv_pipeline.set_params(**{name: per_fold_jobs for name in original_n_jobs})
+        memory = joblib.Memory(location=CV_CACHE_DIR, verbose=0)
+        cv_pipeline.set_params(memory=memory)
+
+        output = cross_validate(
+            cv_pipeline, X, y, cv=cv_strategy, scoring=scoring, n_jobs=workers,
+            return_estimator=False, error_score="raise",
+        )
+        try:
+            memory.reduce_size(bytes_limit=CV_CACHE_MAX_MB * 1024 * 1024)
+        except Exception as e:
+            logger.warning(f"No se pudo acotar la caché de validación cruzada: {e}")
+
+        folds = []
+        for i in range(len(output["fit_time"])):
+            fold = {"fold": i, "fit_time_sec": round(float(output["fit_time"][i]), 3)}
+            for name, scorer in scoring.items():
+                value = float(output[f"test_{name}"][i])
+                fold[name] = -value if scorer.startswith("neg_") else value
+            folds.append(fold)
+
+        primary_scores = np.array([fold[primary] for fold in folds])
+
+        # El modelo final no es el de un fold: se reajusta sobre todos los datos recibidos.
+        report_progress(40, "Ajustando el modelo")
+        cv_pipeline.set_params(memory=None, **original_n_jobs)
+        cv_pipeline.fit(X, y)
+
+        return {
+            "summary": {
+                "cv_mean_score": float(primary_scores.mean()),
+                "cv_std_dev": float(primary_scores.std()),
+                "cv_metric": primary,
+                "cv_folds": folds,
+                "cv_workers": workers,
+            },
+            "pipeline": cv_pipeline,
+        }
+
+    def _tune_pipeline(self, pipeline, X_train, y_train, model_name: str, problem_type: str,
+                       use_smote: bool, random_state: int, tuning: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Ajusta el preprocesador una vez, busca hiperparámetros sobre la matriz
+        transformada y deja en `pipeline` el mejor modelo ya entrenado con todo el train.
+        """
+        preprocessor = pipeline.named_steps['preprocessor']
+        Xt_train = preprocessor.fit_transform(X_train, y_train)
+        resample = None
+        if use_smote and problem_type == 'clasificacion':
+            resample = lambda X, y: SMOTE(random_state=random_state).fit_resample(X, y)
+
+        search = hs.successive_halving(
+            pipeline.named_steps['model'],
+            model_name,
+            problem_type,
+            Xt_train,
+            y_train,
+            time_budget_sec=tuning.get("time_budget_sec"),
+            cpu_budget=tuning.get("cpu_budget"),
+            n_candidates=int(tuning.get("n_candidates", 16)),
+            eta=int(tuning.get("eta", 3)),
+            random_state=random_state,
+            resample=resample,
+            on_rung=lambda rung, n_rungs: report_progress(
+                30 + 50 * rung / n_rungs, f"Búsqueda de hiperparámetros: ronda {rung + 1} de {n_rungs}"
+            ),
+        )
+        # El preprocesador ya está ajustado y SMOTE no participa en predict.
+        pipeline.steps[-1] = ('model', search.pop('model'))
+        return search
+
+    @staticmethod
+    def _stratify_target(y: pd.Series, problem_type: str):
+        """`y` para estratificar el split si es clasificación con al menos 2 ejemplos por clase."""
+        if problem_type == 'clasificacion' and y.nunique() > 1 and y.value_counts().min() >= 2:
+            return y
+        return None
+
     def _detectar_tipo_problema(self, y: pd.Series) -> str:
         """
         Detecta si el problema es 'clasificacion' o 'regresion'
@@ -912,7 +1197,8 @@ class PredictionService:
         Deserializa un pipeline de modelo y lo usa para predecir sobre nuevos datos.
 
         Args:
-            serialized_model_bytes: El pipeline completo serializado con joblib.
+            serialized_model_bytes: El pipeline completo serializado con joblib, o los
+                                    artefactos ya deserializados por ModelArtifactCache.
             input_data: Un diccionario con los datos para una única predicción.
                         Ej: {"edad": 30, "pais": "argentina", "ingresos": 50000}
 
@@ -920,15 +1206,8 @@ class PredictionService:
             Un diccionario con el resultado de la predicción o un error.
         """
         try:
-            # 1. Deserializar el pipeline desde los bytes
-            # Usamos BytesIO para tratar los bytes como un archivo, que es lo que joblib espera
-            from io import BytesIO
-            import joblib
-            import pandas as pd
-            import logging
-
-            buffer = BytesIO(serialized_model_bytes)
-            artifacts = joblib.load(buffer)
+            # 1. Deserializar el pipeline desde los bytes (o usar los artefactos ya cacheados)
+            artifacts = self._resolve_artifacts(serialized_model_bytes)
             pipeline = artifacts['pipeline']
             y_encoder = artifacts['y_encoder']
             input_df = pd.DataFrame(input_data, index=[0])
@@ -951,6 +1230,39 @@ class PredictionService:
             logger = logging.getLogger(__name__)
             logger.error(f"Error durante la predicción en 'make_prediction': {e}", exc_info=True)
             return {"success": False, "error": f"Error interno al procesar la predicción: {e}"}
+
+    def missing_features(self, serialized_model_bytes, row: dict) -> List[str]:
+        """
+        Features del entrenamiento que faltan en `row`. /predict las valida antes de
+        encolar la fila, así una fila incompleta falla igual sola o en lote.
+        """
+        training_features = self._resolve_artifacts(serialized_model_bytes).get('training_features') or []
+        return [col for col in training_features if col not in row]
+
+    def predict_rows(self, serialized_model_bytes, rows: List[dict]) -> dict:
+        """
+        Predice varias filas sueltas con una sola llamada al pipeline (lo usa el
+        micro-batching de /predict). Devuelve {"success", "data": [predicción por fila]}
+        en el mismo orden que `rows`. Las filas ya vienen validadas con missing_features.
+        """
+        try:
+            artifacts = self._resolve_artifacts(serialized_model_bytes)
+            pipeline = artifacts['pipeline']
+            y_encoder = artifacts.get('y_encoder')
+            input_df = pd.DataFrame.from_records(rows)
+            if artifacts.get('training_features'):
+                input_df = input_df.reindex(columns=artifacts['training_features'])
+
+            numeric_predictions = pipeline.predict(input_df)
+            if y_encoder:
+                final_predictions = y_encoder.inverse_transform(numeric_predictions)
+            else:
+                final_predictions = numeric_predictions
+            return {"success": True, "data": np.asarray(final_predictions).tolist()}
+
+        except Exception as e:
+            self.logger.error(f"Error en predict_rows ({len(rows)} filas): {e}", exc_info=True)
+            return {"success": False, "error": f"Error interno al procesar la predicción: {e}"}
         
 
 
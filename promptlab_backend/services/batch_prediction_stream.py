@@ -0,0 +1,124 @@
+# services/batch_prediction_stream.py
+import os
+import json
+import logging
+from typing import Iterator, Tuple, BinaryIO, Any
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils.dataframe_cache import PARQUET_ROW_GROUP_SIZE
+from . import arrow_backend as ab
+from .ingestion import sniff_csv
+
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# PREDICCIÓN POR LOTES EN STREAMING
+# ==============================================================================
+# El dataset de entrada se lee por partes (row groups en Parquet, `chunksize` en CSV),
+# cada parte se predice y se emite enseguida: como NDJSON/CSV hacia el cliente o como
+# row groups de un Parquet nuevo. En memoria vive una parte a la vez, así que el pico
+# no depende del tamaño del dataset y las primeras filas salen sin esperar al resto.
+
+BATCH_PREDICT_CHUNK_ROWS = int(os.getenv("BATCH_PREDICT_CHUNK_ROWS", 50_000))
+STREAM_FORMATS = ("ndjson", "csv", "dataset")
+PREDICTION_COLUMN = "prediction"
+
+
+def iter_input_tables(stream: BinaryIO, extension: str, chunk_rows: int = BATCH_PREDICT_CHUNK_ROWS) -> Iterator[pa.Table]:
+    """
+    Partes del dataset como tablas Arrow. Parquet y CSV se leen de a `chunk_rows` filas;
+    Excel no admite lectura parcial con pandas y se lee entero (la ingesta ya convierte
+    las subidas a Parquet, así que es el caso raro).
+    """
+    extension = extension.lower().lstrip(".")
+    stream.seek(0)
+    if extension == "parquet":
+        for batch in pq.ParquetFile(stream).iter_batches(batch_size=chunk_rows):
+            yield pa.Table.from_batches([batch])
+    elif extension == "csv":
+        encoding, delimiter = sniff_csv(stream)
+        reader = pd.read_csv(stream, sep=delimiter, encoding=encoding, chunksize=chunk_rows, on_bad_lines="warn")
+        for chunk in reader:
+            yield pa.Table.from_pandas(chunk, preserve_index=False)
+    elif extension in ("xlsx", "xls"):
+        df = pd.read_excel(stream)
+        for start in range(0, len(df), chunk_rows):
+            yield pa.Table.from_pandas(df.iloc[start:start + chunk_rows], preserve_index=False)
+    else:
+        raise ValueError(f"Formato no soportado para predicción por lotes: {extension}")
+
+
+def iter_predicted_tables(prediction_service, artifacts: Any, tables: Iterator[pa.Table]) -> Iterator[pa.Table]:
+    """
+    Cada parte de entrada con la columna `prediction` agregada. Las columnas originales
+    se conservan como tablas Arrow (mismo esquema en todas las partes de un Parquet);
+    solo la entrada del modelo pasa por pandas. Lanza ValueError si una parte falla.
+    """
+    for table in tables:
+        if table.num_rows == 0:
+            continue
+        df = ab.to_numpy_backed(ab.table_to_pandas(table))
+        result = prediction_service.make_batch_prediction(artifacts, df)
+        if not result.get("success"):
+            raise ValueError(result.get("error") or "Error durante la predicción.")
+        predictions = np.asarray(result["data"][PREDICTION_COLUMN])
+        if PREDICTION_COLUMN in table.column_names:
+            table = table.drop([PREDICTION_COLUMN])
+        yield table.append_column(PREDICTION_COLUMN, pa.array(predictions, from_pandas=True))
+
+
+def iter_ndjson(tables: Iterator[pa.Table]) -> Iterator[str]:
+    """Una línea JSON por fila. Si una parte falla se emite una última línea {"error": ...}."""
+    rows = 0
+    try:
+        for table in tables:
+            text = table.to_pandas().to_json(orient="records", lines=True, date_format="iso", force_ascii=False)
+            rows += table.num_rows
+            yield text if text.endswith("\n") else text + "\n"
+    except Exception as e:
+        logger.error(f"❌ Predicción en streaming interrumpida tras {rows} filas: {e}", exc_info=True)
+        yield json.dumps({"error": str(e), "rows_sent": rows}, ensure_ascii=False) + "\n"
+
+
+def iter_csv(tables: Iterator[pa.Table]) -> Iterator[str]:
+    """CSV con encabezado en la primera parte. Un error corta el stream (queda registrado)."""
+    header = True
+    rows = 0
+    try:
+        for table in tables:
+            yield table.to_pandas().to_csv(index=False, header=header)
+            header = False
+            rows += table.num_rows
+    except Exception as e:
+        logger.error(f"❌ Predicción CSV en streaming interrumpida tras {rows} filas: {e}", exc_info=True)
+
+
+def write_parquet(tables: Iterator[pa.Table], destino: str) -> Tuple[int, int]:
+    """
+    Escribe las partes como row groups de un Parquet nuevo. El esquema lo fija la primera
+    parte; las demás se convierten a él. Devuelve (filas, columnas).
+    """
+    writer = None
+    rows = 0
+    try:
+        for table in tables:
+            if writer is None:
+                writer = pq.ParquetWriter(destino, table.schema, compression="snappy")
+            elif table.schema != writer.schema:
+                try:
+                    table = table.cast(writer.schema)
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+                    raise ValueError(f"Los tipos de columnas cambian entre partes del dataset: {e}")
+            writer.write_table(table, row_group_size=PARQUET_ROW_GROUP_SIZE)
+            rows += table.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError("El dataset de entrada no tiene filas.")
+    return rows, len(writer.schema.names)
@@ -0,0 +1,260 @@
+# services/chunked_upload.py
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Optional, Dict, Any, BinaryIO
+
+from werkzeug.utils import secure_filename
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SPOOL_DIR = os.path.join(tempfile.gettempdir(), "promptlab_uploads")
+DEFAULT_PART_SIZE_MB = 8        # Debe quedar por debajo de MAX_CONTENT_LENGTH de Flask
+DEFAULT_MAX_UPLOAD_MB = 2048
+DEFAULT_UPLOAD_TTL_SEC = 24 * 60 * 60
+COPY_CHUNK_BYTES = 1024 * 1024
+ALLOWED_UPLOAD_EXTENSIONS = {'csv', 'xlsx', 'xls', 'pdf', 'docx', 'txt'}
+
+MANIFEST_NAME = "manifest.json"
+DATA_NAME = "data.part"
+
+
+class UploadNotFound(Exception):
+    """La subida no existe, expiró o pertenece a otro usuario."""
+
+
+class ChunkedUploadManager:
+    """
+    Subidas por partes reanudables: iniciar, subir partes (en cualquier orden) y completar.
+
+    Cada parte se escribe directamente en su posición dentro de un archivo de spool
+    local, así que la memoria usada es la de un bloque de copia, no la del archivo.
+    El manifiesto (partes confirmadas + sha256 de cada una) vive junto al spool en disco:
+    una subida interrumpida se retoma consultando el estado y enviando solo las partes
+    que faltan, incluso si el worker se reinició entre medio.
+    """
+
+    def __init__(
+        self,
+        spool_dir: Optional[str] = None,
+        part_size: Optional[int] = None,
+        max_upload_bytes: Optional[int] = None,
+        ttl_sec: Optional[int] = None,
+    ):
+        self.spool_dir = spool_dir or os.getenv("UPLOAD_SPOOL_DIR", DEFAULT_SPOOL_DIR)
+        self.part_size = part_size or int(os.getenv("UPLOAD_PART_SIZE_MB", DEFAULT_PART_SIZE_MB)) * 1024 * 1024
+        self.max_upload_bytes = max_upload_bytes or int(os.getenv("UPLOAD_MAX_SIZE_MB", DEFAULT_MAX_UPLOAD_MB)) * 1024 * 1024
+        self.ttl_sec = ttl_sec or int(os.getenv("UPLOAD_TTL_SEC", DEFAULT_UPLOAD_TTL_SEC))
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # Manifiesto en disco
+    # ------------------------------------------------------------------
+
+    def _upload_dir(self, upload_id: str) -> str:
+        # upload_id es un uuid generado aquí: se valida para no salir del directorio de spool.
+        try:
+            uuid.UUID(upload_id)
+        except (ValueError, TypeError):
+            raise UploadNotFound("Identificador de subida inválido.")
+        return os.path.join(self.spool_dir, upload_id)
+
+    def _lock_for(self, upload_id: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def _write_manifest(self, manifest: Dict[str, Any]) -> None:
+        folder = self._upload_dir(manifest["upload_id"])
+        tmp_path = os.path.join(folder, f".{MANIFEST_NAME}.{uuid.uuid4().hex}")
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(manifest, fh)
+        os.replace(tmp_path, os.path.join(folder, MANIFEST_NAME))  # atómico: nunca queda a medias
+
+    def _read_manifest(self, user_id: str, upload_id: str) -> Dict[str, Any]:
+        manifest_file = os.path.join(self._upload_dir(upload_id), MANIFEST_NAME)
+        try:
+            with open(manifest_file, "r", encoding="utf-8") as fh:
+                manifest = json.load(fh)
+        except (OSError, ValueError):
+            raise UploadNotFound("La subida no existe o expiró.")
+        if manifest.get("user_id") != user_id:
+            raise UploadNotFound("La subida no existe o expiró.")
+        return manifest
+
+    def _expected_part_size(self, manifest: Dict[str, Any], part_number: int) -> int:
+        if part_number < manifest["total_parts"] - 1:
+            return manifest["part_size"]
+        return manifest["total_size"] - manifest["part_size"] * (manifest["total_parts"] - 1)
+
+    @staticmethod
+    def summary(manifest: Dict[str, Any]) -> Dict[str, Any]:
+        received = sorted(int(n) for n in manifest["parts"])
+        missing = [n for n in range(manifest["total_parts"]) if str(n) not in manifest["parts"]]
+        return {
+            "upload_id": manifest["upload_id"],
+            "project_id": manifest["project_id"],
+            "filename": manifest["filename"],
+            "total_size": manifest["total_size"],
+            "part_size": manifest["part_size"],
+            "total_parts": manifest["total_parts"],
+            "received_parts": received,
+            "missing_parts": missing,
+            "next_part": missing[0] if missing else None,
+            "status": manifest["status"],
+        }
+
+    # ------------------------------------------------------------------
+    # Protocolo
+    # ------------------------------------------------------------------
+
+    def initiate(self, user_id: str, project_id: str, filename: str, total_size: int,
+                 sha256: Optional[str] = None) -> Dict[str, Any]:
+        """Reserva el spool y devuelve el tamaño de parte y la cantidad de partes esperadas."""
+        self.cleanup_expired()
+
+        filename = secure_filename(filename or "")
+        extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+        if extension not in ALLOWED_UPLOAD_EXTENSIONS:
+            raise ValueError(f"Extensión no permitida: '{filename}'.")
+        if not isinstance(total_size, int) or total_size <= 0:
+            raise ValueError("'size' debe ser un entero positivo (bytes).")
+        if total_size > self.max_upload_bytes:
+            raise ValueError(f"El archivo supera el máximo de {self.max_upload_bytes // (1024 * 1024)} MB.")
+
+        upload_id = str(uuid.uuid4())
+        folder = self._upload_dir(upload_id)
+        os.makedirs(folder)
+        # Archivo del tamaño final: cada parte se escribe en su offset.
+        with open(os.path.join(folder, DATA_NAME), "wb") as fh:
+            fh.truncate(total_size)
+
+        manifest = {
+            "upload_id": upload_id,
+            "user_id": user_id,
+            "project_id": project_id,
+            "filename": filename,
+            "total_size": total_size,
+            "part_size": self.part_size,
+            "total_parts": -(-total_size // self.part_size),
+            "sha256": sha256.lower() if sha256 else None,
+            "parts": {},
+            "status": "uploading",
+            "created_at": time.time(),
+            "updated_at": time.time(),
+        }
+        self._write_manifest(manifest)
+        logger.info(f"📤 Subida {upload_id} iniciada: '{filename}' ({total_size} bytes, {manifest['total_parts']} partes).")
+        return self.summary(manifest)
+
+    def upload_part(self, user_id: str, upload_id: str, part_number: int, stream: BinaryIO,
+                    checksum: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Copia el cuerpo de la petición al spool en bloques de 1 MB calculando su sha256.
+        La parte solo se confirma si el tamaño (y el checksum, si se envía) coinciden;
+        reenviar una parte ya confirmada la reemplaza (reintento idempotente).
+        """
+        manifest = self._read_manifest(user_id, upload_id)
+        if manifest["status"] != "uploading":
+            raise ValueError("La subida ya fue completada.")
+        if not 0 <= part_number < manifest["total_parts"]:
+            raise ValueError(f"Número de parte fuera de rango (0..{manifest['total_parts'] - 1}).")
+
+        expected = self._expected_part_size(manifest, part_number)
+        digest = hashlib.sha256()
+        written = 0
+        data_file = os.path.join(self._upload_dir(upload_id), DATA_NAME)
+        with open(data_file, "r+b") as fh:
+            fh.seek(part_number * manifest["part_size"])
+            while True:
+                chunk = stream.read(COPY_CHUNK_BYTES)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > expected:
+                    raise ValueError(f"La parte {part_number} excede el tamaño esperado ({expected} bytes).")
+                digest.update(chunk)
+                fh.write(chunk)
+
+        if written != expected:
+            raise ValueError(f"La parte {part_number} llegó incompleta ({written} de {expected} bytes).")
+        part_sha = digest.hexdigest()
+        if checksum and checksum.lower() != part_sha:
+            raise ValueError(f"Checksum inválido para la parte {part_number}.")
+
+        # El manifiesto se relee bajo el lock: otras partes pueden haberse confirmado en paralelo.
+        with self._lock_for(upload_id):
+            manifest = self._read_manifest(user_id, upload_id)
+            manifest["parts"][str(part_number)] = part_sha
+            manifest["updated_at"] = time.time()
+            self._write_manifest(manifest)
+
+        return {"part_number": part_number, "sha256": part_sha, **self.summary(manifest)}
+
+    def status(self, user_id: str, upload_id: str) -> Dict[str, Any]:
+        """Estado para reanudar: partes confirmadas y las que faltan."""
+        return self.summary(self._read_manifest(user_id, upload_id))
+
+    def complete(self, user_id: str, upload_id: str) -> Dict[str, Any]:
+        """
+        Verifica que estén todas las partes (y el sha256 del archivo completo, si se
+        declaró al iniciar) y devuelve {"path", "filename", "project_id"} del spool listo
+        para la ingesta. El spool se borra con discard() una vez procesado.
+        """
+        with self._lock_for(upload_id):
+            manifest = self._read_manifest(user_id, upload_id)
+            summary = self.summary(manifest)
+            if summary["missing_parts"]:
+                raise ValueError(f"Faltan {len(summary['missing_parts'])} partes (siguiente: {summary['next_part']}).")
+
+            data_file = os.path.join(self._upload_dir(upload_id), DATA_NAME)
+            if manifest.get("sha256"):
+                digest = hashlib.sha256()
+                with open(data_file, "rb") as fh:
+                    for chunk in iter(lambda: fh.read(COPY_CHUNK_BYTES), b""):
+                        digest.update(chunk)
+                if digest.hexdigest() != manifest["sha256"]:
+                    raise ValueError("El sha256 del archivo completo no coincide con el declarado.")
+
+            manifest["status"] = "complete"
+            manifest["updated_at"] = time.time()
+            self._write_manifest(manifest)
+
+        return {"path": data_file, "filename": manifest["filename"], "project_id": manifest["project_id"]}
+
+    def discard(self, user_id: str, upload_id: str) -> None:
+        """Borra el spool y el manifiesto (abortar o limpiar tras la ingesta)."""
+        self._read_manifest(user_id, upload_id)
+        shutil.rmtree(self._upload_dir(upload_id), ignore_errors=True)
+        with self._locks_guard:
+            self._locks.pop(upload_id, None)
+
+    def cleanup_expired(self) -> int:
+        """Elimina las subidas sin actividad durante más de UPLOAD_TTL_SEC."""
+        removed = 0
+        now = time.time()
+        try:
+            entries = os.listdir(self.spool_dir)
+        except OSError:
+            return 0
+        for name in entries:
+            folder = os.path.join(self.spool_dir, name)
+            try:
+                with open(os.path.join(folder, MANIFEST_NAME), "r", encoding="utf-8") as fh:
+                    updated_at = json.load(fh).get("updated_at", 0)
+            except (OSError, ValueError):
+                updated_at = os.path.getmtime(folder) if os.path.isdir(folder) else now
+            if now - updated_at > self.ttl_sec:
+                shutil.rmtree(folder, ignore_errors=True)
+                removed += 1
+        if removed:
+            logger.info(f"🧹 {removed} subidas por partes expiradas eliminadas del spool.")
+        return removed
@@ -7,6 +7,9 @@ import re
 import numpy as np
 import pandas as pd
 
+from . import transform_engine as te
+from . import arrow_backend as ab
+
 # ===================== CONFIGURACIÓN DE LOGGING =====================
 logging.basicConfig(
     level=logging.INFO,
@@ -38,7 +41,9 @@ def detectar_columnas_posiblemente_numericas(df: pd.DataFrame, umbral_conversion
     """
     sospechosas = []
     logger.info("Iniciando detección de columnas posiblemente numéricas...")
-    columnas_objeto = df.select_dtypes(include=['object']).columns
+    columnas_objeto = [
+        col for col in ab.text_columns(df) if not isinstance(df[col].dtype, pd.CategoricalDtype)
+    ]
     
     if not any(columnas_objeto):
         logger.info("No se encontraron columnas de tipo 'object' para analizar.")
@@ -313,26 +318,31 @@ def convertir_a_flotante(df: pd.DataFrame, columna: str) -> Tuple[pd.DataFrame,
     return df_copia, message
 
 
-def convertir_a_float_robusto(col):
-    def parsear(valor):
-        if pd.isna(valor):
-            return np.nan
-        try:
-            return float(valor)
-        except:
-            pass
-
-        if isinstance(valor, str):
-            # Extraer el primer número válido del string
-            match = re.search(r"[-+]?\d*\.\d+|\d+", valor)
-            if match:
-                try:
-                    return float(match.group())
-                except:
-                    return np.nan
+PATRON_PRIMER_NUMERO = re.compile(r"[-+]?\d*\.\d+|\d+")
+
+
+def _parsear_float(valor):
+    if pd.isna(valor):
         return np.nan
+    try:
+        return float(valor)
+    except:
+        pass
+
+    if isinstance(valor, str):
+        # Extraer el primer número válido del string
+        match = PATRON_PRIMER_NUMERO.search(valor)
+        if match:
+            try:
+                return float(match.group())
+            except:
+                return np.nan
+    return np.nan
+
 
-    return col.apply(parsear)
+def convertir_a_float_robusto(col):
+    # El parseo con regex se hace una vez por valor distinto, no por fila.
+    return te.aplicar_por_unicos(col, _parsear_float, dtype="float64", conservar_nulos=False)
 
 def convertir_columna_numerica(df, columna, tipo='float'):
     if tipo == 'float':
@@ -7,6 +7,9 @@ from sklearn.preprocessing import LabelEncoder
 import logging
 from typing import Tuple # <-- Asegúrate de tener esta importación
 
+from . import transform_engine as te
+from . import arrow_backend as ab
+
 # Configuración del log
 logging.basicConfig(level=logging.INFO)
 # logging.getLogger().setLevel(logging.DEBUG)
@@ -33,9 +36,8 @@ def valores_unicos_y_conteo(df: pd.DataFrame, columna: str) -> tuple[pd.DataFram
 
 def detectar_tipos_columnas(df: pd.DataFrame) -> tuple[list, list]:
     """Devuelve listas de columnas categóricas y numéricas."""
-    categoricas = df.select_dtypes(
-        include=['object', 'category']).columns.tolist()
-    numericas = df.select_dtypes(include=['int64', 'float64']).columns.tolist()
+    categoricas = ab.text_columns(df)
+    numericas = df.select_dtypes(include=['number']).columns.tolist()
     return categoricas, numericas
     
     
@@ -43,8 +45,8 @@ def detectar_tipos_columnas(df: pd.DataFrame) -> tuple[list, list]:
 
 def describe_categoricas(df: pd.DataFrame) -> pd.DataFrame:
     """Genera estadísticas descriptivas para todas las columnas categóricas."""
-    categoricas = df.select_dtypes(include=['object', 'category']).columns
-    if categoricas.empty:
+    categoricas = ab.text_columns(df)
+    if not categoricas:
         return pd.DataFrame(columns=['count', 'unique', 'top', 'freq'])
     return df[categoricas].describe().T
 
@@ -81,13 +83,33 @@ def _limpiar_texto_individual(texto: str) -> str:
     return texto
 
 
+def _limpiar_texto_unicos(unicos: pd.Series) -> pd.Series:
+    """
+    Versión vectorizada de _limpiar_texto_individual sobre los valores distintos de
+    una columna (mismo resultado; los valores que no son texto quedan igual).
+    """
+    es_texto = unicos.map(lambda v: isinstance(v, str)).astype(bool)
+    if not es_texto.any():
+        return unicos
+    limpios = (
+        unicos[es_texto].str.strip().str.lower()
+        .map(unidecode)
+        .str.replace(r"[^a-z0-9\s-]", "", regex=True)
+        .str.replace(r"\s+", " ", regex=True)
+        .str.strip()
+    )
+    resultado = unicos.copy()
+    resultado[es_texto] = limpios
+    return resultado
+
+
 def limpiar_columnas_categoricas(df: pd.DataFrame, columnas: list) -> Tuple[pd.DataFrame, str]: # <-- CAMBIO 1
-    """Limpia múltiples columnas categóricas del DataFrame."""
+    """Limpia múltiples columnas categóricas del DataFrame (una vez por valor distinto)."""
     df_copia = df.copy()
     for col in columnas:
-        if col in df_copia.columns and df_copia[col].dtype == 'object':
+        if col in df_copia.columns and ab.is_text_dtype(df_copia[col].dtype):
             logging.info(f"Limpieza iniciada en columna: {col}")
-            df_copia[col] = df_copia[col].apply(_limpiar_texto_individual)
+            df_copia[col] = te.transformar_unicos(df_copia[col], _limpiar_texto_unicos)
     
     # <-- CAMBIO 2
     message = f"✅ Formato estandarizado para las columnas: {', '.join(columnas)}."
@@ -204,4 +226,4 @@ def imputar_constante(df: pd.DataFrame, columna: str, valor: str) -> Tuple[pd.Da
     
     df_copia[columna] = df_copia[columna].fillna(valor)
     mensaje = f"✅ Se imputaron {null_count} valores nulos en '{columna}' con el valor '{valor}'."
-    return df_copia, mensaje
\ No newline at end of file
+    return df_copia, mensaje
\ No newline at end of file
@@ -17,6 +17,7 @@ import sqlparse
 from sqlparse.sql import IdentifierList, Identifier
 from sqlparse.tokens import Keyword, DML
 from services import data_handler
+from services import ingestion
 from utils import supabase_handler  # Ajustar path según proyecto
 
 
@@ -133,37 +134,44 @@ class DataService:
             original_filename = secure_filename(file.filename)
             dataset_type = data_handler.detect_file_type(original_filename)
             
-            file.seek(0)
-            file_bytes = file.read()
-            file_size = len(file_bytes)
+            # El tamaño se mide sin leer el archivo: los tabulares se procesan por lotes.
+            file.stream.seek(0, os.SEEK_END)
+            file_size = file.stream.tell()
+            file.stream.seek(0)
             
             path = None
             metadata = {}
 
             if dataset_type == 'tabular':
                 ext = original_filename.rsplit('.', 1)[-1].lower()
-                # Usamos la función de data_handler que sí existe para leer el archivo
-                df, _ = data_handler._read_tabular(io.BytesIO(file_bytes), ext)
-                
-                if df is None:
-                    raise ValueError("No se pudo leer el archivo tabular.")
-                
-                for col in df.select_dtypes(include=['object']).columns:
-                    df[col] = df[col].astype(str)
-                logger.info("Columnas de tipo 'object' convertidas a 'string' para asegurar la compatibilidad con Parquet.")
-
-                    
-                path, msg = self.storage_handler.save_dataframe(df, user_id, project_id, original_filename)
-                if not path:
-                    raise Exception(f"Error guardando Parquet: {msg}")
-
-                metadata = {"rows": df.shape[0], "columns": df.shape[1], "sizeBytes": file_size}
+                # Ingesta en streaming: detecta codificación/delimitador con una muestra,
+                # escribe el Parquet por row groups y calcula el perfil inicial y el índice
+                # de hashes de fila sin tener nunca el archivo completo en memoria.
+                try:
+                    ingested = ingestion.ingest_tabular(
+                        file.stream, ext, self.storage_handler, user_id, project_id, original_filename
+                    )
+                except ValueError as e:
+                    raise ValueError(f"No se pudo leer el archivo tabular: {e}")
+
+                path = ingested["path"]
+                metadata = {
+                    "rows": ingested["rows"],
+                    "columns": ingested["columns"],
+                    "sizeBytes": file_size,
+                    "encoding": ingested["encoding"],
+                    "delimiter": ingested["delimiter"],
+                    "profile": ingested["profile"],
+                    # Esquema compacto elegido en la ingesta y memoria estimada antes/después.
+                    "dtypes": ingested["dtypes"],
+                }
 
             elif dataset_type in ['text', 'pdf', 'docx', 'json', 'md']:
                 base_name, _ = os.path.splitext(original_filename)
                 folder_name = base_name.strip().replace(" ", "_")
 
                 # Guardamos el archivo original, sin procesar
+                file_bytes = file.read()
                 path, msg = self.storage_handler.save_file(
                     file_bytes=file_bytes,
                     user_id=user_id,
@@ -625,4 +633,4 @@ def rename_dataset(self, dataset_id: str, user_id: str, new_name: str) -> Dict[s
         # Es mejor devolver un mensaje genérico al frontend por seguridad
         return {"success": False, "error": "Error interno al procesar la solicitud."}
     
-    
\ No newline at end of file
+    
\ No newline at end of file
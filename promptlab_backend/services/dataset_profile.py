@@ -0,0 +1,506 @@
+# services/dataset_profile.py
+import os
+import re
+import math
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Iterable
+
+import numpy as np
+import pandas as pd
+
+from . import clean_text as ct
+from . import row_hash as rh
+from . import sketches as sk
+from . import arrow_backend as ab
+
+
+logger = logging.getLogger(__name__)
+
+NULL_LIKE_VALUES = ['nan', 'na', 'n/a', 'null', '', '--', 'undefined']
+NULL_LIKE_REGEX = re.compile(r'^\s*(' + '|'.join(re.escape(v) for v in NULL_LIKE_VALUES) + r')\s*$')
+
+RARE_VALUE_THRESHOLD = 0.01   # mismo umbral que ct.valores_poco_frecuentes
+IQR_FACTOR = 1.5              # mismo factor que cn.detectar_outliers_iqr
+DEFAULT_PROFILE_CACHE_SIZE = 64
+
+# Modo aproximado (sketches): se activa solo por encima de este tamaño, salvo que se pida.
+PROFILE_MODES = ("auto", "exact", "approx")
+APPROX_MIN_ROWS = int(os.getenv("PROFILE_APPROX_MIN_ROWS", 1_000_000))
+APPROX_SAMPLE_SIZE = int(os.getenv("PROFILE_SAMPLE_SIZE", 200_000))
+APPROX_TOP_CANDIDATES = 100
+
+
+# ==============================================================================
+# 1. NORMALIZACIÓN DE NULOS (una sola vez por DataFrame)
+# ==============================================================================
+
+def _is_text_column(series: pd.Series) -> bool:
+    return series.dtype == object or pd.api.types.is_string_dtype(series.dtype)
+
+
+def normalize_null_like(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Equivalente a `df.replace(null_regex, np.nan, regex=True)` pero sin copiar el frame
+    entero ni evaluar la regex fila por fila: solo se miran los valores únicos de las
+    columnas de texto, y únicamente las columnas que cambian se reemplazan.
+    """
+    replacements = {}
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Columnas compactadas en la ingesta: basta con mirar las categorías.
+            tokens = [v for v in series.cat.categories if isinstance(v, str) and NULL_LIKE_REGEX.match(v)]
+            if tokens:
+                replacements[col] = series.cat.remove_categories(tokens)
+            continue
+        if ab.is_arrow_string(series.dtype):
+            # Backend Arrow: la regex se evalúa con pyarrow.compute sobre toda la columna.
+            mask = series.str.fullmatch(NULL_LIKE_REGEX.pattern).fillna(False)
+            if mask.any():
+                replacements[col] = series.mask(mask)
+            continue
+        if not _is_text_column(series):
+            continue
+        uniques = pd.unique(series.dropna())
+        tokens = [v for v in uniques if isinstance(v, str) and NULL_LIKE_REGEX.match(v)]
+        if tokens:
+            replacements[col] = series.where(~series.isin(tokens), np.nan)
+
+    if not replacements:
+        return df
+    # Copia superficial: las columnas no tocadas comparten memoria con el original.
+    df_out = df.copy(deep=False)
+    for col, series in replacements.items():
+        df_out[col] = series
+    return df_out
+
+
+# ==============================================================================
+# 2. PERFIL DE COLUMNA
+# ==============================================================================
+
+def _detect_kind(series: pd.Series) -> str:
+    if pd.api.types.is_numeric_dtype(series):
+        return "numeric"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "datetime"
+    if pd.api.types.is_string_dtype(series) or isinstance(series.dtype, pd.CategoricalDtype):
+        return "categorical"
+    return "unknown"
+
+
+def _mode_from_counts(counts: pd.Series) -> Any:
+    """Igual que `Series.mode().iloc[0]`: entre los empatados, el menor valor."""
+    if counts.empty:
+        return None
+    tied = counts[counts == counts.iloc[0]].index.tolist()
+    try:
+        return sorted(tied)[0]
+    except TypeError:
+        return tied[0]
+
+
+def _profile_numeric(series: pd.Series, n_rows: int) -> Dict[str, Any]:
+    values = series.dropna()
+    profile: Dict[str, Any] = {"statistics": {}, "iqr": None, "outlier_count": 0}
+
+    # Los booleanos son "numéricos" para pandas pero no admiten cuantiles;
+    # el análisis original terminaba sin estadísticas para ellos.
+    if pd.api.types.is_bool_dtype(series) or values.empty:
+        profile["statistics_available"] = not pd.api.types.is_bool_dtype(series)
+        return profile
+
+    q1, q2, q3 = values.quantile([0.25, 0.5, 0.75]).tolist()
+    profile["statistics"] = {
+        "count": float(values.size),
+        "mean": float(values.mean()),
+        "std": float(values.std()) if values.size > 1 else np.nan,
+        "min": float(values.min()),
+        "25%": float(q1),
+        "50%": float(q2),
+        "75%": float(q3),
+        "max": float(values.max()),
+    }
+    profile["statistics_available"] = True
+
+    iqr = q3 - q1
+    if iqr != 0:
+        lower = q1 - IQR_FACTOR * iqr
+        upper = q3 + IQR_FACTOR * iqr
+        profile["iqr"] = {"q1": float(q1), "q3": float(q3), "lower": float(lower), "upper": float(upper)}
+        profile["outlier_count"] = int(((values < lower) | (values > upper)).sum())
+    return profile
+
+
+def _profile_categorical(series: pd.Series, n_rows: int) -> Dict[str, Any]:
+    # Un único value_counts alimenta: únicos, top/freq, valores raros y problemas de formato.
+    counts_with_nulls = series.value_counts(dropna=False)
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        counts_with_nulls = counts_with_nulls[counts_with_nulls > 0]  # categorías sin uso
+    counts = counts_with_nulls[counts_with_nulls.index.notna()]
+
+    rare_mask = (counts / n_rows) < RARE_VALUE_THRESHOLD if n_rows else counts.astype(bool)
+    distinct = int(counts.size)
+
+    # El formato solo se evalúa sobre los valores únicos, no sobre cada fila.
+    cleaned_uniques = pd.Series(counts.index, dtype=object).map(ct._limpiar_texto_individual)
+    distinct_after_format = int(cleaned_uniques.nunique())
+
+    text_uniques = pd.Series([v for v in counts.index if isinstance(v, str)], dtype=object)
+    distinct_stripped = int(text_uniques.str.strip().nunique()) + (distinct - int(text_uniques.size))
+
+    return {
+        "statistics": {
+            "count": int(counts.sum()),
+            "unique": distinct,
+            "top": _mode_from_counts(counts),
+            "freq": int(counts.iloc[0]) if not counts.empty else None,
+        },
+        "value_counts": counts_with_nulls,
+        "rare_values_count": int(rare_mask.sum()),
+        "distinct_after_format": distinct_after_format,
+        "distinct_stripped": distinct_stripped,
+    }
+
+
+def _profile_column_approx(series: pd.Series, sample_pos: Optional[np.ndarray]) -> Dict[str, Any]:
+    """
+    Perfil aproximado con memoria acotada:
+      - nulos, conteo, media, desvío, mín y máx: exactos (reducciones vectorizadas),
+      - distintos: HyperLogLog,
+      - cuantiles / IQR: muestra uniforme con cota DKW (el conteo de outliers se hace
+        exacto, pero contra límites aproximados),
+      - valores frecuentes / raros: candidatos de la muestra, frecuencias por Count-Min.
+    Cada columna lleva sus `error_bounds`.
+    """
+    n_rows = len(series)
+    notna = series.notna().to_numpy()
+    hashes = rh.value_hashes(series)[notna]
+    sample = series.iloc[sample_pos] if sample_pos is not None else series
+
+    hll = sk.HyperLogLog()
+    hll.add_hashes(hashes)
+    non_null = int(notna.sum())
+    distinct = min(int(round(hll.estimate())), non_null)
+    error_bounds: Dict[str, Any] = {
+        "confidence": sk.DEFAULT_CONFIDENCE,
+        "distinct_relative_error": round(hll.relative_error, 4),
+    }
+
+    if _detect_kind(series) == "numeric":
+        profile: Dict[str, Any] = {"statistics": {}, "iqr": None, "outlier_count": 0}
+        values = series[notna]
+        if pd.api.types.is_bool_dtype(series) or values.empty:
+            profile["statistics_available"] = not pd.api.types.is_bool_dtype(series)
+        else:
+            sample_values = sample.dropna()
+            q1, q2, q3 = sample_values.quantile([0.25, 0.5, 0.75]).tolist()
+            profile["statistics"] = {
+                "count": float(non_null),
+                "mean": float(values.mean()),
+                "std": float(values.std()) if non_null > 1 else np.nan,
+                "min": float(values.min()),
+                "25%": float(q1),
+                "50%": float(q2),
+                "75%": float(q3),
+                "max": float(values.max()),
+            }
+            profile["statistics_available"] = True
+            error_bounds["quantile_rank_error"] = round(sk.dkw_rank_error(len(sample_values)), 5)
+            iqr = q3 - q1
+            if iqr != 0:
+                lower, upper = q1 - IQR_FACTOR * iqr, q3 + IQR_FACTOR * iqr
+                profile["iqr"] = {"q1": float(q1), "q3": float(q3), "lower": float(lower), "upper": float(upper)}
+                profile["outlier_count"] = int(((values < lower) | (values > upper)).sum())
+        profile.update({"distinct": distinct, "approximate": True, "error_bounds": error_bounds})
+        return profile
+
+    cms = sk.CountMinSketch()
+    cms.add_hashes(hashes)
+    sample_counts = sample.value_counts()
+    candidates = pd.Series(sample_counts.index[:APPROX_TOP_CANDIDATES], dtype=series.dtype)
+    estimates = cms.estimate_hashes(rh.value_hashes(candidates)) if len(candidates) else np.empty(0, dtype=np.int64)
+    counts = pd.Series(estimates, index=candidates.to_numpy()).sort_values(ascending=False)
+    error_bounds["frequency_absolute_error"] = int(math.ceil(cms.absolute_error))
+
+    null_count = n_rows - non_null
+    counts_with_nulls = counts
+    if null_count:
+        counts_with_nulls = pd.concat([counts, pd.Series([null_count], index=[np.nan])]).sort_values(ascending=False)
+
+    heavy = int(((counts / n_rows) >= RARE_VALUE_THRESHOLD).sum()) if n_rows else 0
+
+    # Formato y espacios: la proporción de únicos que se fusionan en la muestra se extrapola.
+    sample_uniques = pd.Series(sample_counts.index, dtype=object)
+    ratio_format = sample_uniques.map(ct._limpiar_texto_individual).nunique() / len(sample_uniques) if len(sample_uniques) else 1.0
+    text_uniques = pd.Series([v for v in sample_uniques if isinstance(v, str)], dtype=object)
+    stripped = text_uniques.str.strip().nunique() + (len(sample_uniques) - len(text_uniques))
+    ratio_strip = stripped / len(sample_uniques) if len(sample_uniques) else 1.0
+
+    return {
+        "statistics": {
+            "count": non_null,
+            "unique": distinct,
+            "top": counts.index[0] if not counts.empty else None,
+            "freq": int(counts.iloc[0]) if not counts.empty else None,
+        },
+        "value_counts": counts_with_nulls,
+        "rare_values_count": max(distinct - heavy, 0),
+        "distinct_after_format": int(round(distinct * ratio_format)),
+        "distinct_stripped": int(round(distinct * ratio_strip)),
+        "distinct": distinct,
+        "approximate": True,
+        "error_bounds": error_bounds,
+    }
+
+
+def resolve_mode(n_rows: int, mode: Optional[str] = "auto") -> bool:
+    """True si corresponde el perfil aproximado para `n_rows` filas en el modo pedido."""
+    if mode == "approx":
+        return True
+    if mode == "exact":
+        return False
+    return n_rows >= APPROX_MIN_ROWS
+
+
+# ==============================================================================
+# 3. PERFIL DEL DATASET
+# ==============================================================================
+
+class DatasetProfile:
+    """
+    Estadísticas de un DataFrame calculadas en una sola pasada por columna.
+    Es lo único que necesitan el diagnóstico, el chequeo de calidad, el resumen de
+    columnas y el detalle de columna, así que se puede cachear por versión del dataset
+    y servir esas cuatro vistas sin volver a tocar el DataFrame.
+    """
+
+    def __init__(
+        self,
+        n_rows: int,
+        n_cols: int,
+        duplicate_count: int,
+        columns: "OrderedDict[Any, Dict[str, Any]]",
+        row_hashes: Optional[np.ndarray] = None,
+        approximate: bool = False,
+        error_bounds: Optional[Dict[str, Any]] = None,
+    ):
+        self.n_rows = n_rows
+        self.n_cols = n_cols
+        self.duplicate_count = duplicate_count
+        self.columns = columns
+        # Hash de 64 bits por fila (services/row_hash.py): permite recalcular duplicados
+        # tras un cambio de columnas sin volver a comparar filas completas.
+        self.row_hashes = row_hashes
+        # En modo aproximado las cifras salen de sketches y llevan cotas de error.
+        self.approximate = approximate
+        self.error_bounds = error_bounds or {}
+
+    @property
+    def duplicate_percentage(self) -> float:
+        return (self.duplicate_count / self.n_rows) * 100 if self.n_rows > 0 else 0
+
+    @property
+    def total_nulls(self) -> int:
+        return int(sum(c["null_count"] for c in self.columns.values()))
+
+    @property
+    def total_cells(self) -> int:
+        return self.n_rows * self.n_cols
+
+    def column(self, name) -> Optional[Dict[str, Any]]:
+        return self.columns.get(name)
+
+    def outlier_columns(self) -> List[Any]:
+        # Igual que el chequeo original: solo dtypes numéricos "puros" (sin booleanos).
+        return [
+            name for name, c in self.columns.items()
+            if c["kind"] == "numeric" and c.get("outlier_count", 0) > 0
+        ]
+
+
+def profile_column(
+    series: pd.Series,
+    original_dtype: Optional[str] = None,
+    approximate: bool = False,
+    sample_pos: Optional[np.ndarray] = None,
+) -> Dict[str, Any]:
+    """Perfil de una columna ya normalizada (nulos tipo 'n/a' convertidos a NaN)."""
+    n_rows = len(series)
+    null_count = int(series.isna().sum())
+    kind = _detect_kind(series)
+
+    column: Dict[str, Any] = {
+        "dtype": str(series.dtype),
+        "original_dtype": original_dtype or str(series.dtype),
+        "kind": kind,
+        "null_count": null_count,
+        "null_percentage": (null_count / n_rows) * 100 if n_rows else np.nan,
+    }
+    if approximate:
+        column.update(_profile_column_approx(series, sample_pos))
+        return column
+    if kind == "numeric":
+        column.update(_profile_numeric(series, n_rows))
+    else:
+        column.update(_profile_categorical(series, n_rows))
+    column["distinct"] = (
+        column["statistics"].get("unique") if kind != "numeric" else int(series.nunique())
+    )
+    return column
+
+
+def _duplicates_from_hashes(row_hashes: np.ndarray, approximate: bool) -> Dict[str, Any]:
+    if approximate:
+        return sk.estimate_duplicates(row_hashes, target_sample=APPROX_SAMPLE_SIZE)
+    return {"count": rh.count_duplicates(row_hashes), "error_bound": 0}
+
+
+def row_hash_index(df: pd.DataFrame) -> np.ndarray:
+    """
+    Hashes de fila con la misma normalización de nulos que el perfil. Es lo que se
+    persiste junto al Parquet (`<ruta>.rowhash.npz`) en la ingesta y tras cada guardado.
+    """
+    return rh.combine_row_hashes(normalize_null_like(df))
+
+
+def build_profile(df: pd.DataFrame, mode: str = "auto", row_hashes: Optional[np.ndarray] = None) -> DatasetProfile:
+    """
+    Normaliza nulos una vez y perfila todas las columnas en una sola pasada.
+    `mode`: "exact", "approx" o "auto" (aproximado a partir de PROFILE_APPROX_MIN_ROWS filas).
+    `row_hashes`: índice de hashes persistido para este mismo DataFrame; si viene, no se rehashea.
+    """
+    df_norm = normalize_null_like(df)
+    approximate = resolve_mode(len(df_norm), mode)
+    sample_pos = sk.sample_positions(len(df_norm), APPROX_SAMPLE_SIZE) if approximate else None
+
+    reuse_hashes = row_hashes is not None and len(row_hashes) == len(df_norm)
+    columns: "OrderedDict[Any, Dict[str, Any]]" = OrderedDict()
+    if not reuse_hashes:
+        row_hashes = np.zeros(len(df_norm), dtype=np.uint64)
+    for col in df_norm.columns:
+        columns[col] = profile_column(
+            df_norm[col], original_dtype=str(df[col].dtype), approximate=approximate, sample_pos=sample_pos
+        )
+        if not reuse_hashes:
+            row_hashes += rh.column_row_hash(df_norm[col])
+
+    duplicates = _duplicates_from_hashes(row_hashes, approximate)
+    return DatasetProfile(
+        n_rows=int(df_norm.shape[0]),
+        n_cols=int(df_norm.shape[1]),
+        duplicate_count=duplicates["count"],
+        columns=columns,
+        row_hashes=row_hashes,
+        approximate=approximate,
+        error_bounds={"duplicates": duplicates["error_bound"]} if approximate else None,
+    )
+
+
+def update_profile(
+    base: DatasetProfile,
+    df_before: pd.DataFrame,
+    df_after: pd.DataFrame,
+    changed_columns: Iterable,
+) -> DatasetProfile:
+    """
+    Perfil de `df_after` a partir del perfil de `df_before`, re-perfilando solo
+    `changed_columns` (más las columnas agregadas o eliminadas). Las filas deben ser
+    las mismas y en el mismo orden; si no, hay que usar build_profile.
+    El costo es proporcional a las columnas tocadas, no al ancho del dataset.
+    """
+    mode = "approx" if base.approximate else "exact"
+    if base.row_hashes is None or base.n_rows != len(df_before) or len(df_before) != len(df_after):
+        return build_profile(df_after, mode=mode)
+
+    before_cols, after_cols = set(df_before.columns), set(df_after.columns)
+    touched = (set(changed_columns) & (before_cols | after_cols)) | (before_cols ^ after_cols)
+    if not touched:
+        return base
+
+    before_norm = normalize_null_like(df_before[[c for c in df_before.columns if c in touched]])
+    after_norm = normalize_null_like(df_after[[c for c in df_after.columns if c in touched]])
+
+    sample_pos = sk.sample_positions(len(df_after), APPROX_SAMPLE_SIZE) if base.approximate else None
+    columns: "OrderedDict[Any, Dict[str, Any]]" = OrderedDict()
+    for col in df_after.columns:
+        if col in touched or col not in base.columns:
+            columns[col] = profile_column(
+                after_norm[col], original_dtype=str(df_after[col].dtype),
+                approximate=base.approximate, sample_pos=sample_pos,
+            )
+        else:
+            columns[col] = base.columns[col]
+
+    row_hashes = rh.update_row_hashes(base.row_hashes, before_norm, after_norm, touched)
+    duplicates = _duplicates_from_hashes(row_hashes, base.approximate)
+    return DatasetProfile(
+        n_rows=int(df_after.shape[0]),
+        n_cols=int(df_after.shape[1]),
+        duplicate_count=duplicates["count"],
+        columns=columns,
+        row_hashes=row_hashes,
+        approximate=base.approximate,
+        error_bounds={"duplicates": duplicates["error_bound"]} if base.approximate else None,
+    )
+
+
+# ==============================================================================
+# 4. CACHÉ DE PERFILES POR VERSIÓN
+# ==============================================================================
+
+class ProfileCache:
+    """LRU en memoria de perfiles, indexada por una clave de versión del dataset."""
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or int(os.getenv("DATASET_PROFILE_CACHE_SIZE", DEFAULT_PROFILE_CACHE_SIZE))
+        self._entries: "OrderedDict[str, DatasetProfile]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: Optional[str]) -> Optional[DatasetProfile]:
+        if not key:
+            return None
+        with self._lock:
+            profile = self._entries.get(key)
+            if profile is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return profile
+
+    def put(self, key: Optional[str], profile: DatasetProfile) -> None:
+        if not key:
+            return
+        with self._lock:
+            self._entries[key] = profile
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_build(
+        self, key: Optional[str], df: pd.DataFrame, mode: str = "auto", row_hashes: Optional[np.ndarray] = None
+    ) -> DatasetProfile:
+        profile = self.get(key)
+        if profile is None:
+            profile = build_profile(df, mode=mode, row_hashes=row_hashes)
+            self.put(key, profile)
+        return profile
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+
+profile_cache = ProfileCache()
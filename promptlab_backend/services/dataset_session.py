@@ -0,0 +1,346 @@
+# services/dataset_session.py
+import os
+import time
+import logging
+import threading
+from typing import Optional, Dict, Any, List
+
+import numpy as np
+import pandas as pd
+
+from .dataset_versioning import DatasetVersionStore, compute_delta, delta_is_empty
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IDLE_TIMEOUT_SEC = 15 * 60   # Se cierra (con guardado) tras 15 min sin uso
+DEFAULT_WRITE_BEHIND_SEC = 2 * 60    # Un cambio pendiente no espera más de 2 min en memoria
+
+
+class DatasetSessionConflict(Exception):
+    """La sesión cambió entre la lectura y la escritura (dos acciones concurrentes)."""
+
+
+class DatasetSession:
+    """
+    Sesión de edición de un dataset tabular.
+    El DataFrame vive en memoria del worker y las acciones de limpieza lo reemplazan
+    sin pasar por Storage. `dirty` indica que hay cambios pendientes de persistir.
+    """
+
+    def __init__(self, user_id: str, dataset_id: str, storage_path: str, df: pd.DataFrame,
+                 row_hashes: Optional[np.ndarray] = None):
+        self.user_id = user_id
+        self.dataset_id = dataset_id
+        self.storage_path = storage_path
+        self.df = df
+        # Índice de hashes de fila de `df` (None si todavía no se conoce); se persiste al guardar.
+        self.row_hashes = row_hashes
+        # Historial de versiones: manifiesto vigente y deltas aún no subidos.
+        self.track_versions = False
+        self.manifest: Optional[Dict[str, Any]] = None
+        self.pending_deltas: List[Dict[str, Any]] = []
+        self.dirty = False
+        self.revision = 0  # Se incrementa con cada cambio; identifica el estado para las cachés
+        self.actions_applied: List[str] = []
+        self.opened_at = time.time()
+        self.last_access = self.opened_at
+        self.last_flush = self.opened_at
+        self.first_dirty_at: Optional[float] = None
+        # Serializa las acciones sobre el mismo dataset (dos pestañas, doble click, etc.)
+        self.lock = threading.RLock()
+
+    def touch(self) -> None:
+        self.last_access = time.time()
+
+    def update(self, df: pd.DataFrame, action: Optional[str] = None, base: Optional[pd.DataFrame] = None) -> None:
+        """
+        Reemplaza el DataFrame de la sesión y lo marca como pendiente de guardar.
+        Si se pasa `base` (el DataFrame sobre el que se calculó la acción) y la sesión
+        ya no apunta a él, otra acción ganó la carrera y se lanza DatasetSessionConflict.
+        """
+        with self.lock:
+            if base is not None and self.df is not base:
+                raise DatasetSessionConflict("El dataset fue modificado por otra acción. Recargá e intentá de nuevo.")
+            if self.track_versions:
+                delta = compute_delta(self.df, df)
+                if not delta_is_empty(delta):
+                    # Solo el delta (columnas tocadas) y la forma: no se retienen frames intermedios.
+                    self.pending_deltas.append({
+                        "action": action, "delta": delta, "shape": df.shape, "shape_before": self.df.shape,
+                    })
+            self.df = df
+            self.row_hashes = None  # Lo vuelve a fijar quien conozca el perfil del nuevo estado
+            self.revision += 1
+            if not self.dirty:
+                self.first_dirty_at = time.time()
+            self.dirty = True
+            if action:
+                self.actions_applied.append(action)
+            self.touch()
+
+    @property
+    def needs_materialize(self) -> bool:
+        """Hay versiones guardadas como deltas que el archivo principal todavía no refleja."""
+        return self.manifest is not None and self.manifest["head"] != self.manifest["materialized"]
+
+    def summary(self) -> Dict[str, Any]:
+        head = self.manifest["head"] if self.manifest else 0
+        return {
+            "dataset_id": self.dataset_id,
+            "rows": int(self.df.shape[0]),
+            "columns": int(self.df.shape[1]),
+            "dirty": self.dirty,
+            "revision": self.revision,
+            "pending_actions": len(self.actions_applied),
+            "opened_at": self.opened_at,
+            "last_access": self.last_access,
+            "last_flush": self.last_flush,
+            "version": head + len(self.pending_deltas),
+            "can_undo": self.track_versions and (head > 0 or bool(self.pending_deltas)),
+            "can_redo": bool(self.manifest) and not self.pending_deltas and head < len(self.manifest["versions"]) - 1,
+        }
+
+
+class DatasetSessionManager:
+    """
+    Registro de sesiones de edición abiertas, indexadas por dataset_id.
+
+    La persistencia a Storage ocurre solo en tres casos:
+      - commit explícito del usuario,
+      - cierre por inactividad (`idle_timeout_sec`),
+      - write-behind: un cambio pendiente más viejo que `write_behind_sec`.
+    `flush_due()` debe llamarse periódicamente (lo programa el scheduler de la API).
+
+    Con `version_store` cada guardado sube solo los deltas de las acciones (historial
+    con deshacer/rehacer) y el archivo principal se reescribe una vez, al cerrar.
+    """
+
+    def __init__(
+        self,
+        storage_handler=None,
+        idle_timeout_sec: Optional[int] = None,
+        write_behind_sec: Optional[int] = None,
+        version_store: Optional[DatasetVersionStore] = None,
+    ):
+        self.storage_handler = storage_handler
+        self.version_store = version_store
+        self.idle_timeout_sec = idle_timeout_sec or int(os.getenv("DATASET_SESSION_IDLE_SEC", DEFAULT_IDLE_TIMEOUT_SEC))
+        self.write_behind_sec = write_behind_sec or int(os.getenv("DATASET_SESSION_WRITE_BEHIND_SEC", DEFAULT_WRITE_BEHIND_SEC))
+        self._sessions: Dict[str, DatasetSession] = {}
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+    def open(self, user_id: str, dataset_id: str, storage_path: str) -> DatasetSession:
+        """
+        Abre (o reutiliza) la sesión de un dataset. Descarga el archivo una sola vez.
+        Lanza PermissionError si la sesión existente pertenece a otro usuario
+        y ValueError si el archivo no se pudo cargar.
+        """
+        with self._lock:
+            session = self._sessions.get(dataset_id)
+            if session is not None:
+                if session.user_id != user_id:
+                    raise PermissionError("El dataset tiene una sesión abierta de otro usuario.")
+                session.touch()
+                return session
+
+        version = self.storage_handler.get_object_version(storage_path)
+        df = self.storage_handler.load_file_as_dataframe(user_id=user_id, path=storage_path, version=version)
+        if df is None:
+            raise ValueError("No se pudo cargar el dataset para abrir la sesión.")
+        row_hashes = self.storage_handler.load_row_hashes(storage_path, version, n_rows=len(df))
+
+        manifest = None
+        if self.version_store is not None:
+            manifest = self.version_store.load_manifest(storage_path, version)
+            if manifest is not None and manifest["head"] != manifest["materialized"]:
+                # Quedaron versiones sin materializar (p. ej. el proceso se reinició): se recuperan.
+                df = self.version_store.checkout(
+                    user_id, manifest, manifest["head"], base_df=df, base_at=manifest["materialized"]
+                )
+                row_hashes = None
+
+        new_session = DatasetSession(user_id, dataset_id, storage_path, df, row_hashes=row_hashes)
+        new_session.track_versions = self.version_store is not None
+        new_session.manifest = manifest
+        with self._lock:
+            # Otro hilo pudo abrirla mientras descargábamos: nos quedamos con la primera.
+            session = self._sessions.setdefault(dataset_id, new_session)
+        logger.info(f"📂 Sesión de edición abierta para dataset {dataset_id} ({df.shape[0]} filas).")
+        return session
+
+    def get(self, user_id: str, dataset_id: str) -> Optional[DatasetSession]:
+        """Devuelve la sesión abierta del usuario para ese dataset, o None."""
+        with self._lock:
+            session = self._sessions.get(dataset_id)
+        if session is None or session.user_id != user_id:
+            return None
+        session.touch()
+        return session
+
+    def commit(self, user_id: str, dataset_id: str) -> Dict[str, Any]:
+        session = self.get(user_id, dataset_id)
+        if session is None:
+            return {"success": False, "error": "No hay una sesión abierta para este dataset."}
+        with session.lock:
+            flushed = self._flush(session)
+            # Un commit explícito deja el archivo principal al día para el resto de la app.
+            flushed = self._materialize(session) or flushed
+        return {"success": True, "data": {**session.summary(), "flushed": flushed}}
+
+    def close(self, user_id: str, dataset_id: str, commit: bool = True) -> Dict[str, Any]:
+        session = self.get(user_id, dataset_id)
+        if session is None:
+            return {"success": False, "error": "No hay una sesión abierta para este dataset."}
+        with session.lock:
+            flushed = self._flush(session) if commit else False
+            discarded = False if commit else self._discard(session)
+            self._materialize(session)
+            with self._lock:
+                self._sessions.pop(dataset_id, None)
+        logger.info(f"📁 Sesión de dataset {dataset_id} cerrada (guardado={flushed}, descartado={discarded}).")
+        return {"success": True, "data": {"dataset_id": dataset_id, "flushed": flushed, "discarded": discarded}}
+
+    def _discard(self, session: DatasetSession) -> bool:
+        """
+        Descarta los cambios sin guardar. Con historial, `session.df` vuelve al estado de
+        `head` para que la materialización posterior no escriba las ediciones descartadas.
+        Devuelve True si había algo que descartar. Se llama con `session.lock` tomado.
+        """
+        had_changes = bool(session.pending_deltas) if session.track_versions else session.dirty
+        session.pending_deltas = []
+        session.dirty = False
+        session.first_dirty_at = None
+        session.actions_applied = []
+        if had_changes and self.version_store is not None and session.needs_materialize:
+            session.df = self.version_store.checkout(session.user_id, session.manifest, session.manifest["head"])
+            session.row_hashes = None
+            session.revision += 1
+        return had_changes
+
+    # ------------------------------------------------------------------
+    # Persistencia
+    # ------------------------------------------------------------------
+    def _flush(self, session: DatasetSession) -> bool:
+        """Persiste los cambios pendientes. Se llama con `session.lock` tomado."""
+        if not session.dirty:
+            return False
+        if self.version_store is not None:
+            self._commit_versions(session)
+        else:
+            self.storage_handler.save_dataframe_to_storage(
+                user_id=session.user_id, path=session.storage_path, df=session.df, row_hashes=session.row_hashes
+            )
+        logger.info(
+            f"💾 Sesión {session.dataset_id}: {len(session.actions_applied)} acciones persistidas en un solo guardado."
+        )
+        session.dirty = False
+        session.first_dirty_at = None
+        session.actions_applied = []
+        session.last_flush = time.time()
+        return True
+
+    def _commit_versions(self, session: DatasetSession) -> None:
+        """Sube una versión por acción pendiente (solo columnas/filas que cambiaron)."""
+        if not session.pending_deltas:
+            return
+        if session.manifest is None:
+            # La versión 0 es el archivo tal como está en Storage, antes de la primera acción.
+            version = self.storage_handler.get_object_version(session.storage_path)
+            session.manifest = self.version_store.start(
+                session.storage_path, session.pending_deltas[0]["shape_before"], version
+            )
+        for pending in session.pending_deltas:
+            self.version_store.append(session.manifest, pending["delta"], pending["action"], pending["shape"])
+        session.pending_deltas = []
+
+    def _materialize(self, session: DatasetSession) -> bool:
+        """
+        Reescribe el archivo principal con el estado actual si el historial va por delante.
+        Es la única escritura completa del dataset cuando hay historial de versiones.
+        """
+        if self.version_store is None or not session.needs_materialize:
+            return False
+        self.storage_handler.save_dataframe_to_storage(
+            user_id=session.user_id, path=session.storage_path, df=session.df, row_hashes=session.row_hashes
+        )
+        version = self.storage_handler.get_object_version(session.storage_path)
+        session.manifest = self.version_store.mark_materialized(session.manifest, version, session.df)
+        logger.info(f"📦 Dataset {session.dataset_id} materializado en la versión {session.manifest['head']}.")
+        return True
+
+    # ------------------------------------------------------------------
+    # Historial: deshacer / rehacer / versiones
+    # ------------------------------------------------------------------
+    def _move_head(self, user_id: str, dataset_id: str, step: int) -> Dict[str, Any]:
+        if self.version_store is None:
+            return {"success": False, "error": "El historial de versiones no está habilitado."}
+        session = self.get(user_id, dataset_id)
+        if session is None:
+            return {"success": False, "error": "No hay una sesión abierta para este dataset."}
+        with session.lock:
+            self._flush(session)  # Lo pendiente pasa a ser una versión más del historial
+            manifest = session.manifest
+            target = (manifest["head"] if manifest else 0) + step
+            if manifest is None or target < 0 or target >= len(manifest["versions"]):
+                return {"success": False, "error": "No hay más cambios para deshacer." if step < 0 else "No hay cambios para rehacer."}
+
+            # Rehacer parte del estado actual (un delta); deshacer, del punto de partida más cercano.
+            session.df = self.version_store.checkout(
+                user_id, manifest, target, base_df=session.df, base_at=manifest["head"]
+            )
+            self.version_store.set_head(manifest, target)
+            session.row_hashes = None
+            session.revision += 1
+            session.touch()
+        logger.info(f"↩️ Dataset {dataset_id}: versión {target} ({'deshacer' if step < 0 else 'rehacer'}).")
+        return {"success": True, "data": session.summary()}
+
+    def undo(self, user_id: str, dataset_id: str) -> Dict[str, Any]:
+        return self._move_head(user_id, dataset_id, -1)
+
+    def redo(self, user_id: str, dataset_id: str) -> Dict[str, Any]:
+        return self._move_head(user_id, dataset_id, +1)
+
+    def flush_due(self) -> None:
+        """
+        Tarea periódica: guarda las sesiones con cambios demasiado viejos (write-behind)
+        y cierra las inactivas. Los errores se registran pero no detienen el barrido.
+        """
+        now = time.time()
+        with self._lock:
+            sessions = list(self._sessions.values())
+
+        for session in sessions:
+            # Si otro hilo está aplicando una acción, lo dejamos para la próxima vuelta.
+            if not session.lock.acquire(blocking=False):
+                continue
+            try:
+                idle = now - session.last_access > self.idle_timeout_sec
+                overdue = session.dirty and session.first_dirty_at and now - session.first_dirty_at > self.write_behind_sec
+                if idle or overdue:
+                    self._flush(session)
+                if idle:
+                    self._materialize(session)
+                    with self._lock:
+                        self._sessions.pop(session.dataset_id, None)
+                    logger.info(f"⏱️ Sesión de dataset {session.dataset_id} cerrada por inactividad.")
+            except Exception as e:
+                logger.error(f"❌ Error persistiendo la sesión del dataset {session.dataset_id}: {e}", exc_info=True)
+            finally:
+                session.lock.release()
+
+    def flush_all(self) -> None:
+        """Guarda y materializa todas las sesiones con cambios (se usa al apagar el proceso)."""
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            with session.lock:
+                try:
+                    self._flush(session)
+                    self._materialize(session)
+                except Exception as e:
+                    logger.error(f"❌ Error persistiendo la sesión del dataset {session.dataset_id}: {e}", exc_info=True)
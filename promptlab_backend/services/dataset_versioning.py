@@ -0,0 +1,318 @@
+# services/dataset_versioning.py
+import io
+import os
+import json
+import time
+import uuid
+import logging
+from typing import Optional, Dict, Any, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+VERSIONS_SUFFIX = ".versions"
+DEFAULT_MAX_VERSIONS = 50   # Al superarlo, el historial se re-basa sobre el archivo materializado
+IMMUTABLE = "inmutable"     # Versión fija para la caché local: los fragmentos nunca se reescriben
+
+
+def versions_folder(path: str) -> str:
+    """Carpeta del historial, junto al archivo: `<ruta>.versions/`."""
+    return f"{path}{VERSIONS_SUFFIX}"
+
+
+def manifest_path(path: str) -> str:
+    return f"{versions_folder(path)}/manifest.json"
+
+
+# ==============================================================================
+# 1. DELTAS ENTRE DOS ESTADOS DEL DATAFRAME
+# ==============================================================================
+
+def _same_values(before: pd.Series, after: pd.Series) -> bool:
+    if before.dtype != after.dtype:
+        return False
+    return before.reset_index(drop=True).equals(after.reset_index(drop=True))
+
+
+def compute_delta(df_before: pd.DataFrame, df_after: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Describe `df_after` en función de `df_before` con lo mínimo:
+      - row_positions: posiciones de `df_before` que sobreviven (filtros, reordenamientos);
+        None si las filas no cambiaron,
+      - columns: solo las columnas nuevas o con algún valor distinto,
+      - order: orden final de las columnas (las que faltan se eliminaron),
+      - snapshot: el DataFrame completo, solo si aparecieron filas que no existían antes.
+    """
+    delta: Dict[str, Any] = {"order": list(df_after.columns), "row_positions": None, "columns": {}, "snapshot": None}
+
+    if len(df_before) == len(df_after) and df_before.index.equals(df_after.index):
+        base = df_before
+    else:
+        positions = df_before.index.get_indexer(df_after.index) if df_before.index.is_unique else None
+        if positions is None or (len(positions) and positions.min() < 0):
+            delta["snapshot"] = df_after
+            return delta
+        delta["row_positions"] = positions.astype(np.int64)
+        base = df_before.iloc[positions]
+
+    for col in df_after.columns:
+        if col not in base.columns or not _same_values(base[col], df_after[col]):
+            delta["columns"][col] = df_after[col]
+    return delta
+
+
+def apply_delta(df: pd.DataFrame, delta: Dict[str, Any]) -> pd.DataFrame:
+    """Inversa de compute_delta: reconstruye el estado siguiente a partir de `df`."""
+    if delta.get("snapshot") is not None:
+        return delta["snapshot"]
+    out = df.iloc[delta["row_positions"]] if delta.get("row_positions") is not None else df
+    out = out.copy(deep=False)
+    for col, values in delta["columns"].items():
+        out[col] = values.set_axis(out.index)
+    return out[delta["order"]]
+
+
+def delta_is_empty(delta: Dict[str, Any]) -> bool:
+    return (
+        delta.get("snapshot") is None
+        and delta.get("row_positions") is None
+        and not delta["columns"]
+    )
+
+
+# ==============================================================================
+# 2. HISTORIAL PERSISTIDO (manifiesto + fragmentos Parquet)
+# ==============================================================================
+
+class DatasetVersionStore:
+    """
+    Historial de versiones de un dataset guardado junto al archivo en Storage:
+
+        <ruta>.versions/manifest.json
+        <ruta>.versions/v0-<id>.<ext>            copia del archivo al iniciar el historial
+        <ruta>.versions/v<n>-<id>.cols.parquet   columnas que cambió la versión n
+        <ruta>.versions/v<n>-<id>.rows.parquet   posiciones de filas que sobreviven
+
+    Cada versión sube solo lo que cambió. La versión k se reconstruye desde el último
+    snapshot <= k (o desde el archivo principal si ya está materializado en una versión
+    <= k) aplicando los deltas en orden; deshacer y rehacer solo mueven `head`.
+    El archivo principal se reescribe únicamente al materializar (cierre de la sesión).
+    """
+
+    def __init__(self, storage_handler, max_versions: Optional[int] = None):
+        self.storage = storage_handler
+        self.max_versions = max_versions or int(os.getenv("DATASET_MAX_VERSIONS", DEFAULT_MAX_VERSIONS))
+
+    # ------------------------------------------------------------------
+    # Manifiesto
+    # ------------------------------------------------------------------
+    def load_manifest(self, path: str, current_version: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        Manifiesto vigente del dataset. Si el archivo principal fue reescrito por fuera
+        del historial (su versión ya no coincide) el manifiesto se descarta.
+        """
+        data = self.storage.download_object(manifest_path(path))
+        if not data:
+            return None
+        try:
+            manifest = json.loads(data)
+        except ValueError:
+            logger.warning(f"⚠️ Manifiesto de versiones ilegible para '{path}', se ignora.")
+            return None
+        if current_version and manifest.get("base_version") != current_version:
+            logger.info(f"🧾 El archivo '{path}' cambió fuera del historial; se inicia uno nuevo.")
+            self._remove_fragments(manifest["versions"])
+            return None
+        return manifest
+
+    def _save_manifest(self, manifest: Dict[str, Any]) -> None:
+        self.storage.upload_object(
+            manifest_path(manifest["path"]),
+            json.dumps(manifest, default=str).encode("utf-8"),
+            content_type="application/json",
+        )
+
+    def start(self, path: str, shape: Tuple[int, int], current_version: Optional[str]) -> Dict[str, Any]:
+        """Abre el historial: la versión 0 es una copia del lado del servidor del archivo actual."""
+        ext = os.path.splitext(path)[-1].lower()
+        snapshot = f"{versions_folder(path)}/v0-{uuid.uuid4().hex[:8]}{ext}"
+        self.storage.copy_object(path, snapshot)
+        return {
+            "path": path,
+            "base_version": current_version,
+            "materialized": 0,
+            "head": 0,
+            "versions": [{
+                "version": 0,
+                "action": "original",
+                "created_at": time.time(),
+                "snapshot": snapshot,
+                "snapshot_format": "original",
+                "rows": int(shape[0]),
+                "columns": int(shape[1]),
+                "bytes": 0,
+            }],
+        }
+
+    # ------------------------------------------------------------------
+    # Escritura de versiones
+    # ------------------------------------------------------------------
+    def _upload_frame(self, path: str, df: pd.DataFrame) -> int:
+        buffer = io.BytesIO()
+        df.to_parquet(buffer, index=False)
+        data = buffer.getvalue()
+        self.storage.upload_object(path, data, content_type="application/parquet")
+        return len(data)
+
+    def append(self, manifest: Dict[str, Any], delta: Dict[str, Any], action: Optional[str], shape: Tuple[int, int]) -> Dict[str, Any]:
+        """
+        Agrega una versión con el delta dado. Si `head` no es la última (hubo deshacer),
+        las versiones posteriores se descartan antes, como en cualquier editor.
+        """
+        head = manifest["head"]
+        if head < len(manifest["versions"]) - 1:
+            self._remove_fragments(manifest["versions"][head + 1:])
+            del manifest["versions"][head + 1:]
+
+        number = head + 1
+        prefix = f"{versions_folder(manifest['path'])}/v{number}-{uuid.uuid4().hex[:8]}"
+        entry: Dict[str, Any] = {
+            "version": number,
+            "action": action or "edición",
+            "created_at": time.time(),
+            "order": [str(c) for c in delta["order"]],
+            "rows": int(shape[0]),
+            "columns": int(shape[1]),
+            "bytes": 0,
+        }
+
+        if delta.get("snapshot") is not None:
+            frame = delta["snapshot"].copy(deep=False)
+            frame.columns = [f"c{i}" for i in range(frame.shape[1])]
+            entry["snapshot"] = f"{prefix}.snapshot.parquet"
+            entry["bytes"] += self._upload_frame(entry["snapshot"], frame)
+        else:
+            if delta.get("row_positions") is not None:
+                entry["row_positions"] = f"{prefix}.rows.parquet"
+                entry["bytes"] += self._upload_frame(entry["row_positions"], pd.DataFrame({"pos": delta["row_positions"]}))
+            if delta["columns"]:
+                names = list(delta["columns"].keys())
+                frame = pd.DataFrame(
+                    {f"c{i}": delta["columns"][name].reset_index(drop=True) for i, name in enumerate(names)}
+                )
+                entry["changed"] = [[str(name), f"c{i}"] for i, name in enumerate(names)]
+                entry["fragment"] = f"{prefix}.cols.parquet"
+                entry["bytes"] += self._upload_frame(entry["fragment"], frame)
+
+        manifest["versions"].append(entry)
+        manifest["head"] = number
+        self._save_manifest(manifest)
+        logger.info(f"🧾 Versión {number} de '{manifest['path']}' guardada ({entry['bytes']} bytes, acción '{entry['action']}').")
+        return entry
+
+    def set_head(self, manifest: Dict[str, Any], head: int) -> None:
+        manifest["head"] = head
+        self._save_manifest(manifest)
+
+    def mark_materialized(self, manifest: Dict[str, Any], current_version: Optional[str], df: pd.DataFrame) -> Dict[str, Any]:
+        """
+        Registra que el archivo principal ya refleja `head`. Si el historial creció más
+        allá de `max_versions`, se re-basa: la nueva versión 0 es una copia del archivo.
+        """
+        manifest["materialized"] = manifest["head"]
+        manifest["base_version"] = current_version
+        if len(manifest["versions"]) > self.max_versions:
+            old_versions = manifest["versions"]
+            manifest = self.start(manifest["path"], df.shape, current_version)
+            self._remove_fragments(old_versions)
+            logger.info(f"🗜️ Historial de '{manifest['path']}' compactado ({len(old_versions)} versiones).")
+        self._save_manifest(manifest)
+        return manifest
+
+    def _remove_fragments(self, versions: List[Dict[str, Any]]) -> None:
+        paths = [
+            v[key] for v in versions
+            for key in ("snapshot", "fragment", "row_positions") if v.get(key)
+        ]
+        self.storage.remove_objects(paths)
+
+    # ------------------------------------------------------------------
+    # Lectura (reconstrucción)
+    # ------------------------------------------------------------------
+    def _read_frame(self, user_id: str, path: str) -> pd.DataFrame:
+        df = self.storage.load_file_as_dataframe(user_id=user_id, path=path, version=IMMUTABLE)
+        if df is None:
+            raise ValueError(f"Falta el fragmento de versión '{path}'.")
+        return df
+
+    def _load_delta(self, user_id: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+        order = entry["order"]
+        if entry.get("snapshot"):
+            snapshot = self._read_frame(user_id, entry["snapshot"])
+            snapshot.columns = order
+            return {"snapshot": snapshot, "order": order}
+        delta: Dict[str, Any] = {"order": order, "row_positions": None, "columns": {}, "snapshot": None}
+        if entry.get("row_positions"):
+            delta["row_positions"] = self._read_frame(user_id, entry["row_positions"])["pos"].to_numpy()
+        if entry.get("fragment"):
+            frame = self._read_frame(user_id, entry["fragment"])
+            delta["columns"] = {name: frame[key] for name, key in entry["changed"]}
+        return delta
+
+    def checkout(
+        self,
+        user_id: str,
+        manifest: Dict[str, Any],
+        version: int,
+        base_df: Optional[pd.DataFrame] = None,
+        base_at: Optional[int] = None,
+    ) -> pd.DataFrame:
+        """
+        DataFrame de la versión `version`, partiendo del estado conocido más cercano:
+          1. `base_df` (el estado de la versión `base_at`, p. ej. el de la sesión), si es anterior,
+          2. el archivo principal, si ya está materializado en una versión anterior,
+          3. el último snapshot anterior del historial.
+        """
+        versions = manifest["versions"]
+        if version < 0 or version >= len(versions):
+            raise ValueError(f"La versión {version} no existe.")
+
+        if base_df is not None and base_at is not None and base_at <= version:
+            start, df = base_at, base_df
+        elif manifest["materialized"] <= version:
+            start = manifest["materialized"]
+            df = self.storage.load_file_as_dataframe(
+                user_id=user_id, path=manifest["path"], version=manifest.get("base_version")
+            )
+            if df is None:
+                raise ValueError("No se pudo cargar el archivo principal del dataset.")
+        else:
+            start = max(v["version"] for v in versions[: version + 1] if v.get("snapshot"))
+            entry = versions[start]
+            if entry.get("snapshot_format") == "original":
+                df = self._read_frame(user_id, entry["snapshot"])
+            else:
+                df = self._load_delta(user_id, entry)["snapshot"]
+
+        for entry in versions[start + 1: version + 1]:
+            df = apply_delta(df, self._load_delta(user_id, entry))
+        return df
+
+    @staticmethod
+    def summary(manifest: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        if not manifest:
+            return {"head": 0, "materialized": 0, "can_undo": False, "can_redo": False, "versions": []}
+        head = manifest["head"]
+        return {
+            "head": head,
+            "materialized": manifest["materialized"],
+            "can_undo": head > 0,
+            "can_redo": head < len(manifest["versions"]) - 1,
+            "versions": [
+                {k: v.get(k) for k in ("version", "action", "created_at", "rows", "columns", "bytes")}
+                for v in manifest["versions"]
+            ],
+        }
@@ -0,0 +1,255 @@
+# services/dtype_optimizer.py
+import os
+import re
+import logging
+from typing import Optional, Dict, Any, Iterator, List
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from . import arrow_backend as ab
+
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# OPTIMIZADOR DE TIPOS (en la ingesta y al guardar)
+# ==============================================================================
+# Un CSV cargado "tal cual" deja cada texto como objeto Python y cada número en 64 bits.
+# Aquí se elige un esquema compacto recorriendo el Parquet por lotes y se reescribe con
+# él: el esquema Arrow queda guardado en el propio archivo, así que cada carga posterior
+# (load_file_as_dataframe, caché local, sesiones) ya recibe los tipos compactos.
+
+# Texto -> categoría si tiene pocos valores distintos (absolutos y relativos a las filas).
+CATEGORY_MAX_RATIO = float(os.getenv("DTYPE_CATEGORY_MAX_RATIO", 0.5))
+CATEGORY_MAX_UNIQUE = int(os.getenv("DTYPE_CATEGORY_MAX_UNIQUE", 100_000))
+# Ancho mínimo de los enteros: por debajo de 32 bits la aritmética de pandas desborda
+# sin avisar (int8: 100 + 100 = -56), así que no se baja de ahí por defecto.
+MIN_INT_BITS = int(os.getenv("DTYPE_MIN_INT_BITS", 32))
+FLOAT32_EXACT_INT = 2 ** 24   # enteros hasta aquí se representan exactos en float32
+
+TRUE_TOKENS = {"true", "yes", "si", "sí", "t", "y", "verdadero"}
+BOOL_PAIRS = [
+    {"true", "false"}, {"yes", "no"}, {"si", "no"}, {"sí", "no"},
+    {"t", "f"}, {"y", "n"}, {"verdadero", "falso"},
+]
+DATE_FORMATS = [
+    (re.compile(r"^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?$"), "ISO8601"),
+    (re.compile(r"^\d{1,2}/\d{1,2}/\d{4}$"), "%d/%m/%Y"),
+]
+
+PANDAS_OBJECT_OVERHEAD = 49 + 8   # str vacío de CPython + puntero en el array de objetos
+
+
+class _EstadoColumna:
+    """Lo que hace falta saber de una columna para decidir su tipo, acumulado por lotes."""
+
+    def __init__(self, arrow_type: pa.DataType):
+        self.arrow_type = arrow_type
+        self.nulls = 0
+        self.min = None
+        self.max = None
+        self.float32_exact = True
+        self.uniques: Optional[set] = set()   # None cuando supera CATEGORY_MAX_UNIQUE
+        self.text_bytes = 0
+        self.date_format: Optional[str] = None
+        self.date_ok = True
+
+
+class AnalizadorTipos:
+    """
+    Recorre lotes Arrow y propone un tipo compacto por columna:
+      - texto con pocos distintos -> dictionary (categoría en pandas),
+      - texto con dos valores tipo sí/no -> bool,
+      - texto con todas las fechas en un mismo formato -> timestamp,
+      - enteros -> el ancho mínimo que admite su rango (no menos de MIN_INT_BITS);
+        con nulos, float32 si el rango es exacto en float32 (pandas los carga como float),
+      - float64 -> float32 solo si todos los valores se conservan exactos.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.columns: Dict[str, _EstadoColumna] = {}
+
+    def add(self, batch: pa.RecordBatch) -> None:
+        self.rows += batch.num_rows
+        for name, col in zip(batch.schema.names, batch.columns):
+            estado = self.columns.get(name)
+            if estado is None:
+                estado = self.columns[name] = _EstadoColumna(col.type)
+            estado.nulls += col.null_count
+            if col.null_count == len(col):
+                continue
+            if pa.types.is_integer(col.type) or pa.types.is_floating(col.type):
+                min_max = pc.min_max(col)
+                lo, hi = min_max["min"].as_py(), min_max["max"].as_py()
+                estado.min = lo if estado.min is None else min(estado.min, lo)
+                estado.max = hi if estado.max is None else max(estado.max, hi)
+                if pa.types.is_floating(col.type) and estado.float32_exact:
+                    ida_y_vuelta = col.cast(pa.float32(), safe=False).cast(col.type)
+                    estado.float32_exact = bool(pc.all(pc.equal(ida_y_vuelta, col)).as_py() is not False)
+            elif pa.types.is_string(col.type) or pa.types.is_large_string(col.type):
+                estado.text_bytes += int(pc.sum(pc.binary_length(col)).as_py() or 0)
+                unicos = pc.unique(col.drop_null())
+                self._actualizar_unicos(estado, unicos)
+                self._actualizar_fechas(estado, unicos)
+
+    @staticmethod
+    def _actualizar_unicos(estado: _EstadoColumna, unicos: pa.Array) -> None:
+        if estado.uniques is None:
+            return
+        estado.uniques.update(unicos.to_pylist())
+        if len(estado.uniques) > CATEGORY_MAX_UNIQUE:
+            estado.uniques = None   # alta cardinalidad: ya no es candidata a categoría ni a bool
+
+    @staticmethod
+    def _actualizar_fechas(estado: _EstadoColumna, unicos: pa.Array) -> None:
+        if not estado.date_ok or len(unicos) == 0:
+            return
+        valores = pd.Series(unicos.to_pylist(), dtype=object).str.strip()
+        if estado.date_format is None:
+            for patron, formato in DATE_FORMATS:
+                if patron.match(valores.iloc[0]):
+                    estado.date_format = formato
+                    break
+            else:
+                estado.date_ok = False
+                return
+        patron = next(p for p, f in DATE_FORMATS if f == estado.date_format)
+        if not valores.str.match(patron).all():
+            estado.date_ok = False
+            return
+        # Todas deben ser fechas válidas (p. ej. 31/02 no lo es): si no, queda como texto.
+        parsed = pd.to_datetime(valores, format=estado.date_format, errors="coerce")
+        estado.date_ok = bool(parsed.notna().all())
+
+    def _tipo_entero(self, estado: _EstadoColumna) -> Optional[pa.DataType]:
+        if estado.min is None:
+            return None
+        if estado.nulls and -FLOAT32_EXACT_INT <= estado.min and estado.max <= FLOAT32_EXACT_INT:
+            return pa.float32()
+        for bits, tipo in ((8, pa.int8()), (16, pa.int16()), (32, pa.int32())):
+            if bits < MIN_INT_BITS:
+                continue
+            info = np.iinfo(f"int{bits}")
+            if info.min <= estado.min and estado.max <= info.max:
+                return tipo if tipo != estado.arrow_type else None
+        return None
+
+    def plan(self) -> Dict[str, Dict[str, Any]]:
+        """{columna: {"from", "to", "reason"}} solo para las columnas que cambian de tipo."""
+        plan: Dict[str, Dict[str, Any]] = {}
+        for name, estado in self.columns.items():
+            tipo, motivo, extra = None, None, {}
+            if pa.types.is_integer(estado.arrow_type):
+                tipo, motivo = self._tipo_entero(estado), "downcast"
+            elif pa.types.is_float64(estado.arrow_type):
+                if estado.min is not None and estado.float32_exact:
+                    tipo, motivo = pa.float32(), "downcast"
+            elif estado.uniques is not None and estado.uniques:
+                normalizados = {str(v).strip().lower() for v in estado.uniques}
+                no_nulos = self.rows - estado.nulls
+                if len(normalizados) == 2 and normalizados in BOOL_PAIRS:
+                    tipo, motivo = pa.bool_(), "boolean_like"
+                elif estado.date_ok and estado.date_format:
+                    tipo, motivo, extra = pa.timestamp("ns"), "date_like", {"format": estado.date_format}
+                elif no_nulos and len(estado.uniques) / no_nulos <= CATEGORY_MAX_RATIO:
+                    tipo, motivo = pa.dictionary(pa.int32(), estado.arrow_type), "low_cardinality"
+            elif estado.uniques is None and estado.date_ok and estado.date_format:
+                tipo, motivo, extra = pa.timestamp("ns"), "date_like", {"format": estado.date_format}
+
+            if tipo is not None:
+                plan[name] = {"from": str(estado.arrow_type), "to": str(tipo), "type": tipo, "reason": motivo, **extra}
+        return plan
+
+    def estimate_memory(self, plan: Dict[str, Dict[str, Any]]) -> Dict[str, int]:
+        """Bytes estimados del DataFrame en pandas con el esquema original y con el optimizado."""
+        antes = despues = 0
+        for name, estado in self.columns.items():
+            bruto = self._bytes_pandas(estado, estado.arrow_type)
+            antes += bruto
+            despues += self._bytes_pandas(estado, plan[name]["type"]) if name in plan else bruto
+        return {"estimated_bytes_before": int(antes), "estimated_bytes_after": int(despues)}
+
+    def _bytes_pandas(self, estado: _EstadoColumna, tipo: pa.DataType) -> int:
+        n = self.rows
+        if pa.types.is_dictionary(tipo):
+            categorias = len(estado.uniques or ())
+            codigo = 1 if categorias < 2 ** 7 else 2 if categorias < 2 ** 15 else 4
+            promedio = estado.text_bytes / max(n - estado.nulls, 1)
+            return n * codigo + int(categorias * (PANDAS_OBJECT_OVERHEAD + promedio))
+        if pa.types.is_string(tipo) or pa.types.is_large_string(tipo):
+            return n * 8 + (n - estado.nulls) * (PANDAS_OBJECT_OVERHEAD - 8) + estado.text_bytes
+        if pa.types.is_boolean(tipo):
+            return n * (8 if estado.nulls else 1)   # con nulos pandas usa object
+        if pa.types.is_integer(tipo) and estado.nulls:
+            return n * 8                            # con nulos pandas usa float64
+        return n * (tipo.bit_width // 8 if hasattr(tipo, "bit_width") else 8)
+
+
+def aplicar_plan(batches: Iterator[pa.RecordBatch], plan: Dict[str, Dict[str, Any]]) -> Iterator[pa.RecordBatch]:
+    """Convierte cada lote al esquema del plan (las conversiones son exactas por construcción)."""
+    for batch in batches:
+        columnas: List[pa.Array] = []
+        for name, col in zip(batch.schema.names, batch.columns):
+            destino = plan.get(name)
+            if destino is None:
+                columnas.append(col)
+                continue
+            motivo, tipo = destino["reason"], destino["type"]
+            if motivo == "low_cardinality":
+                col = pc.dictionary_encode(col)
+            elif motivo == "boolean_like":
+                valores = pc.utf8_lower(pc.utf8_trim_whitespace(col))
+                col = pc.if_else(pc.is_null(col), pa.scalar(None, pa.bool_()), pc.is_in(valores, value_set=pa.array(sorted(TRUE_TOKENS))))
+            elif motivo == "date_like":
+                parsed = pd.to_datetime(pd.Series(col.to_pylist(), dtype=object).str.strip(), format=destino["format"])
+                col = pa.array(parsed, type=tipo)
+            else:
+                col = col.cast(tipo, safe=False)
+            columnas.append(col)
+        yield pa.RecordBatch.from_arrays(columnas, names=batch.schema.names)
+
+
+def plan_resumen(plan: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """El plan sin los objetos de pyarrow (para guardarlo en los metadatos del dataset)."""
+    return {name: {k: v for k, v in info.items() if k != "type"} for name, info in plan.items()}
+
+
+def compactar_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Versión en memoria para los guardados posteriores a la ingesta: texto con pocos
+    distintos -> category y enteros/floats de 64 bits -> el tipo más chico que los
+    conserva exactos. No re-detecta booleanos ni fechas (eso lo decide el usuario al
+    editar). Devuelve una copia superficial; las columnas no tocadas comparten memoria.
+    """
+    cambios = {}
+    n = len(df)
+    for col in df.columns:
+        serie = df[col]
+        if ab.is_arrow_dtype(serie.dtype):
+            continue  # ya es columnar y compacta; Parquet la guarda con su tipo Arrow
+        if serie.dtype == object and n:
+            no_nulos = int(serie.notna().sum())
+            if not no_nulos or not all(isinstance(v, str) for v in pd.unique(serie.dropna())[:1000]):
+                continue
+            distintos = serie.nunique(dropna=True)
+            if distintos <= CATEGORY_MAX_UNIQUE and distintos / no_nulos <= CATEGORY_MAX_RATIO:
+                cambios[col] = serie.astype("category")
+        elif pd.api.types.is_integer_dtype(serie.dtype) and serie.dtype.itemsize * 8 > MIN_INT_BITS and n:
+            info = np.iinfo(f"int{MIN_INT_BITS}")
+            if info.min <= serie.min() and serie.max() <= info.max:
+                cambios[col] = serie.astype(f"int{MIN_INT_BITS}")
+        elif serie.dtype == np.float64 and n:
+            como_f32 = serie.astype(np.float32)
+            if como_f32.astype(np.float64).equals(serie):
+                cambios[col] = como_f32
+
+    if not cambios:
+        return df
+    df_out = df.copy(deep=False)
+    for col, serie in cambios.items():
+        df_out[col] = serie
+    return df_out
@@ -0,0 +1,282 @@
+# services/hyperparameter_search.py
+import os
+import math
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Callable
+
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import accuracy_score, r2_score
+
+from .job_queue import check_cancelled, bind_current_job
+
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# BÚSQUEDA DE HIPERPARÁMETROS CON SUCCESSIVE HALVING Y PRESUPUESTO
+# ==============================================================================
+# Se sortean `n_candidates` configuraciones del espacio del modelo y se evalúan por
+# rondas: en la primera cada una entrena con una submuestra chica de filas; solo el
+# mejor 1/eta pasa a la siguiente, con eta veces más filas; la última usa todo el
+# train. LightGBM y XGBoost cortan por early stopping contra una partición de
+# validación, y el número de árboles que resultó mejor se usa para el ajuste final.
+#
+# Todas las pruebas trabajan sobre la matriz ya preprocesada: el ColumnTransformer
+# se ajusta una sola vez. Si se agota `time_budget_sec` no se lanzan pruebas nuevas y
+# gana la mejor configuración vista hasta ese momento.
+
+TUNING_DEFAULT_TIME_BUDGET_SEC = float(os.getenv("TUNING_DEFAULT_TIME_BUDGET_SEC", 120))
+TUNING_MAX_TIME_BUDGET_SEC = float(os.getenv("TUNING_MAX_TIME_BUDGET_SEC", 900))
+TUNING_DEFAULT_CPU_BUDGET = int(os.getenv("TUNING_DEFAULT_CPU_BUDGET", 0)) or (os.cpu_count() or 1)
+
+EARLY_STOPPING_ROUNDS = 30
+MIN_RUNG_SAMPLES = 200
+VALIDATION_FRACTION = 0.2
+
+
+def _log_uniform(low: float, high: float) -> Callable[[np.random.Generator], float]:
+    return lambda rng: float(10 ** rng.uniform(math.log10(low), math.log10(high)))
+
+
+def _uniform(low: float, high: float) -> Callable[[np.random.Generator], float]:
+    return lambda rng: float(rng.uniform(low, high))
+
+
+# Espacio por modelo: lista (se elige un valor) o función que sortea con el rng.
+SEARCH_SPACES: Dict[str, Dict[str, Any]] = {
+    "Random Forest": {
+        "n_estimators": [100, 200, 400],
+        "max_depth": [None, 8, 16, 32],
+        "min_samples_leaf": [1, 2, 4, 8],
+        "max_features": ["sqrt", 0.5, 1.0],
+    },
+    "XGBoost": {
+        "n_estimators": [2000],  # techo: el early stopping decide cuántos árboles
+        "learning_rate": _log_uniform(0.01, 0.3),
+        "max_depth": [3, 4, 5, 6, 8, 10],
+        "min_child_weight": [1, 3, 5, 10],
+        "subsample": _uniform(0.6, 1.0),
+        "colsample_bytree": _uniform(0.6, 1.0),
+    },
+    "LightGBM": {
+        "n_estimators": [2000],
+        "learning_rate": _log_uniform(0.01, 0.3),
+        "num_leaves": [15, 31, 63, 127],
+        "min_child_samples": [5, 10, 20, 50],
+        "subsample": _uniform(0.6, 1.0),
+        "subsample_freq": [1],
+        "colsample_bytree": _uniform(0.6, 1.0),
+    },
+    "Gradient Boosting": {
+        "n_estimators": [500],
+        "learning_rate": _log_uniform(0.02, 0.3),
+        "max_depth": [2, 3, 4, 5],
+        "subsample": _uniform(0.6, 1.0),
+        # early stopping propio de sklearn sobre una fracción interna
+        "n_iter_no_change": [10],
+        "validation_fraction": [0.1],
+    },
+}
+
+
+def sample_configs(model_name: str, n_candidates: int, rng: np.random.Generator) -> List[Dict[str, Any]]:
+    space = SEARCH_SPACES.get(model_name, {})
+    configs, seen = [], set()
+    for _ in range(n_candidates * 5):
+        config = {
+            param: (values(rng) if callable(values) else values[int(rng.integers(len(values)))])
+            for param, values in space.items()
+        }
+        key = repr(sorted(config.items()))
+        if key not in seen:
+            seen.add(key)
+            configs.append(config)
+        if len(configs) >= n_candidates:
+            break
+    return configs or [{}]
+
+
+def _score(problem_type: str, y_true, y_pred) -> float:
+    return float(accuracy_score(y_true, y_pred)) if problem_type == "clasificacion" else float(r2_score(y_true, y_pred))
+
+
+def _fit(estimator, model_name: str, X, y, X_val, y_val, n_classes: int):
+    """Ajusta con early stopping si el modelo lo soporta; devuelve la mejor iteración (o None)."""
+    if model_name == "LightGBM":
+        import lightgbm
+        estimator.set_params(verbose=-1)
+        estimator.fit(X, y, eval_set=[(X_val, y_val)],
+                      callbacks=[lightgbm.early_stopping(EARLY_STOPPING_ROUNDS, verbose=False)])
+        return getattr(estimator, "best_iteration_", None)
+    if model_name == "XGBoost":
+        if n_classes:
+            eval_metric = "mlogloss" if n_classes > 2 else "logloss"
+        else:
+            eval_metric = "rmse"
+        estimator.set_params(early_stopping_rounds=EARLY_STOPPING_ROUNDS, eval_metric=eval_metric)
+        estimator.fit(X, y, eval_set=[(X_val, y_val)], verbose=False)
+        return getattr(estimator, "best_iteration", None)
+    estimator.fit(X, y)
+    return getattr(estimator, "n_estimators_", None) if model_name == "Gradient Boosting" else None
+
+
+def successive_halving(
+    base_estimator,
+    model_name: str,
+    problem_type: str,
+    X_train,
+    y_train,
+    time_budget_sec: Optional[float] = None,
+    cpu_budget: Optional[int] = None,
+    n_candidates: int = 16,
+    eta: int = 3,
+    random_state: int = 42,
+    resample: Optional[Callable] = None,
+    on_rung: Optional[Callable[[int, int], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Busca la mejor configuración de `base_estimator` y la reentrena con todo el train.
+
+    `X_train` / `y_train` son la matriz ya preprocesada. `resample(X, y)` (p. ej. SMOTE)
+    se aplica solo a las filas de entrenamiento de cada prueba. `on_rung(ronda, total)`
+    se llama al empezar cada ronda (progreso del trabajo en segundo plano).
+    Devuelve {"model", "best_params", "best_score", "trials", "rungs", "budget_exhausted", ...}.
+    """
+    started = time.monotonic()
+    time_budget_sec = min(float(time_budget_sec or TUNING_DEFAULT_TIME_BUDGET_SEC), TUNING_MAX_TIME_BUDGET_SEC)
+    deadline = started + time_budget_sec
+    cpu_budget = max(1, int(cpu_budget or TUNING_DEFAULT_CPU_BUDGET))
+    eta = max(2, int(eta))
+    rng = np.random.default_rng(random_state)
+
+    # Las pruebas usan numpy; el modelo final se ajusta con los nombres de columna del
+    # preprocesador (set_output="pandas"), igual que cuando se entrena dentro del pipeline.
+    feature_names = [str(c) for c in X_train.columns] if hasattr(X_train, "columns") else None
+    X_train = np.asarray(X_train, dtype=np.float64)
+    y_train = np.asarray(y_train)
+    n_classes = int(len(np.unique(y_train))) if problem_type == "clasificacion" else 0
+    stratify = y_train if n_classes and np.min(np.unique(y_train, return_counts=True)[1]) >= 2 else None
+    X_fit, X_val, y_fit, y_val = train_test_split(
+        X_train, y_train, test_size=VALIDATION_FRACTION, random_state=random_state, stratify=stratify
+    )
+
+    configs = sample_configs(model_name, max(1, int(n_candidates)), rng)
+    n_rungs = max(1, int(math.floor(math.log(len(configs), eta))) + 1)
+    candidates = [{"id": i, "params": params} for i, params in enumerate(configs)]
+    trials: List[Dict[str, Any]] = []
+    rungs: List[Dict[str, Any]] = []
+    budget_exhausted = False
+
+    def _run_trial(candidate, rows: np.ndarray, rung: int, n_jobs: int):
+        # Un trabajo cancelado no lanza pruebas nuevas (las que ya corren terminan).
+        check_cancelled()
+        if time.monotonic() >= deadline:
+            return None
+        estimator = clone(base_estimator).set_params(**candidate["params"])
+        if "n_jobs" in estimator.get_params():
+            estimator.set_params(n_jobs=n_jobs)
+        X_part, y_part = X_fit[rows], y_fit[rows]
+        if resample is not None:
+            X_part, y_part = resample(X_part, y_part)
+        trial_start = time.monotonic()
+        best_iteration = _fit(estimator, model_name, X_part, y_part, X_val, y_val, n_classes)
+        return {
+            "candidate": candidate["id"],
+            "rung": rung,
+            "n_samples": int(len(rows)),
+            "score": _score(problem_type, y_val, estimator.predict(X_val)),
+            "best_iteration": int(best_iteration) if best_iteration is not None else None,
+            "fit_sec": round(time.monotonic() - trial_start, 3),
+        }
+
+    for rung in range(n_rungs):
+        # Filas de esta ronda: crece por eta hasta usar todo X_fit en la última.
+        fraction = eta ** (rung - (n_rungs - 1))
+        n_rows = len(X_fit) if rung == n_rungs - 1 else max(min(MIN_RUNG_SAMPLES, len(X_fit)), int(len(X_fit) * fraction))
+        rows = _subsample_rows(y_fit, n_rows, n_classes, random_state + rung)
+        if on_rung is not None:
+            on_rung(rung, n_rungs)
+
+        parallel = max(1, min(len(candidates), cpu_budget))
+        n_jobs = max(1, cpu_budget // parallel)
+        with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="tuning") as pool:
+            trial = bind_current_job(lambda c: _safe_trial(_run_trial, c, rows, rung, n_jobs))
+            outcomes = list(pool.map(trial, candidates))
+
+        finished = [o for o in outcomes if o is not None and "error" not in o]
+        trials.extend(o for o in outcomes if o is not None)
+        rungs.append({"rung": rung, "n_samples": n_rows, "candidates": len(candidates), "completed": len(finished)})
+        if len(finished) < len(candidates):
+            budget_exhausted = budget_exhausted or time.monotonic() >= deadline
+        if not finished:
+            break
+
+        finished.sort(key=lambda o: o["score"], reverse=True)
+        survivors = {o["candidate"] for o in finished[:max(1, len(finished) // eta)]}
+        candidates = [c for c in candidates if c["id"] in survivors]
+        if budget_exhausted or rung == n_rungs - 1:
+            break
+
+    completed = [t for t in trials if "error" not in t]
+    if not completed:
+        raise RuntimeError("Ninguna prueba terminó dentro del presupuesto de tiempo.")
+
+    # La mejor de la ronda más alta alcanzada (más filas = estimación más confiable).
+    top_rung = max(t["rung"] for t in completed)
+    best_trial = max((t for t in completed if t["rung"] == top_rung), key=lambda t: t["score"])
+    best_params = dict(configs[best_trial["candidate"]])
+    if model_name in ("LightGBM", "XGBoost") and best_trial["best_iteration"] is not None:
+        # Sin partición de validación en el ajuste final: se fijan los árboles encontrados.
+        best_params["n_estimators"] = int(best_trial["best_iteration"]) + 1
+
+    final = clone(base_estimator).set_params(**best_params)
+    if "n_jobs" in final.get_params():
+        final.set_params(n_jobs=cpu_budget)
+    if model_name == "LightGBM":
+        final.set_params(verbose=-1)
+    X_final, y_final = (resample(X_train, y_train) if resample is not None else (X_train, y_train))
+    if feature_names is not None:
+        X_final = pd.DataFrame(np.asarray(X_final), columns=feature_names)
+    check_cancelled()
+    final.fit(X_final, y_final)
+
+    return {
+        "model": final,
+        "best_params": best_params,
+        "best_score": best_trial["score"],
+        "score_metric": "accuracy" if problem_type == "clasificacion" else "r2",
+        "trials": trials,
+        "rungs": rungs,
+        "n_candidates": len(configs),
+        "eta": eta,
+        "budget_exhausted": budget_exhausted,
+        "time_budget_sec": time_budget_sec,
+        "cpu_budget": cpu_budget,
+        "elapsed_sec": round(time.monotonic() - started, 3),
+    }
+
+
+def _subsample_rows(y: np.ndarray, n_rows: int, n_classes: int, seed: int) -> np.ndarray:
+    """Índices de una submuestra; estratificada en clasificación para no perder clases chicas."""
+    if n_rows >= len(y):
+        return np.arange(len(y))
+    if n_classes and n_rows >= n_classes:
+        try:
+            rows, _ = train_test_split(np.arange(len(y)), train_size=n_rows, stratify=y, random_state=seed)
+            return np.sort(rows)
+        except ValueError:
+            pass
+    return np.sort(np.random.default_rng(seed).choice(len(y), size=n_rows, replace=False))
+
+
+def _safe_trial(run_trial, candidate, rows, rung, n_jobs):
+    try:
+        return run_trial(candidate, rows, rung, n_jobs)
+    except Exception as e:
+        logger.warning(f"⚠️ Prueba {candidate['id']} ({candidate['params']}) falló: {e}")
+        return {"candidate": candidate["id"], "rung": rung, "error": str(e)}
@@ -0,0 +1,424 @@
+# services/ingestion.py
+import os
+import re
+import csv
+import codecs
+import logging
+import tempfile
+from typing import Optional, Dict, Any, List, Iterator, Tuple, BinaryIO
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from utils.dataframe_cache import PARQUET_ROW_GROUP_SIZE
+from . import row_hash as rh
+from . import sketches as sk
+from . import dtype_optimizer as dto
+from .dataset_profile import normalize_null_like
+
+try:
+    import chardet
+except ImportError:
+    chardet = None
+
+
+logger = logging.getLogger(__name__)
+
+SNIFF_BYTES = 64 * 1024
+CSV_DELIMITERS = [',', ';', '\t', '|']
+# Bytes que el lector de pyarrow parsea por lote: acota la memoria pico de la ingesta.
+INGEST_BLOCK_BYTES = int(os.getenv("INGEST_BLOCK_BYTES", 8 * 1024 * 1024))
+# 0 = sin límite. El viejo tope de 10.000 filas existía para no cargar todo en memoria.
+MAX_INGEST_ROWS = int(os.getenv("MAX_INGEST_ROWS", 0))
+EXCEL_BATCH_ROWS = 50_000
+SUMMARY_HLL_PRECISION = 12
+
+_CONVERSION_ERROR = re.compile(r"column #(\d+).*conversion error to (\w+)", re.IGNORECASE | re.DOTALL)
+
+
+# ==============================================================================
+# 1. DETECCIÓN DE CODIFICACIÓN Y DELIMITADOR (sobre una muestra de bytes)
+# ==============================================================================
+
+def sniff_encoding(sample: bytes) -> str:
+    """
+    Detecta la codificación con los primeros bytes del archivo: BOM, luego UTF-8 estricto,
+    luego chardet (si está instalado) y por último latin-1, que nunca falla.
+    """
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8"  # el lector de pyarrow descarta el BOM de UTF-8
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+
+    # La muestra puede cortar un carácter multibyte al final: se valida hasta el último salto.
+    cut = sample.rfind(b"\n")
+    try:
+        (sample[:cut] if cut > 0 else sample).decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+
+    if chardet is not None:
+        guess = chardet.detect(sample)
+        if guess.get("encoding") and (guess.get("confidence") or 0) >= 0.5:
+            try:
+                codecs.lookup(guess["encoding"])
+                return guess["encoding"].lower()
+            except LookupError:
+                pass
+    return "latin-1"
+
+
+def sniff_delimiter(text: str) -> str:
+    """Delimitador más probable entre , ; tab y | según las primeras líneas."""
+    lines = [line for line in text.splitlines()[:50] if line.strip()]
+    if not lines:
+        return ','
+    try:
+        return csv.Sniffer().sniff("\n".join(lines), delimiters="".join(CSV_DELIMITERS)).delimiter
+    except csv.Error:
+        # Sin consenso del Sniffer: el delimitador que más aparece en la cabecera.
+        counts = {d: lines[0].count(d) for d in CSV_DELIMITERS}
+        best = max(counts, key=counts.get)
+        return best if counts[best] > 0 else ','
+
+
+def sniff_csv(stream: BinaryIO) -> Tuple[str, str]:
+    """(codificación, delimitador) leyendo solo SNIFF_BYTES del inicio; deja el stream al principio."""
+    stream.seek(0)
+    sample = stream.read(SNIFF_BYTES)
+    stream.seek(0)
+    encoding = sniff_encoding(sample)
+    delimiter = sniff_delimiter(sample.decode(encoding, errors="replace"))
+    return encoding, delimiter
+
+
+# ==============================================================================
+# 2. LECTURA EN LOTES
+# ==============================================================================
+
+def _saltar_fila_invalida(row) -> str:
+    # Igual que on_bad_lines='warn' de pandas: la fila se descarta y se registra.
+    logger.warning(f"⚠️ Fila {row.number} descartada ({row.actual_columns} columnas, se esperaban {row.expected_columns}).")
+    return "skip"
+
+
+def _abrir_csv(stream: BinaryIO, encoding: str, delimiter: str, column_types: Dict[str, pa.DataType]):
+    stream.seek(0)
+    return pa_csv.open_csv(
+        stream,
+        read_options=pa_csv.ReadOptions(encoding=encoding, block_size=INGEST_BLOCK_BYTES),
+        parse_options=pa_csv.ParseOptions(delimiter=delimiter, invalid_row_handler=_saltar_fila_invalida),
+        convert_options=pa_csv.ConvertOptions(strings_can_be_null=True, column_types=column_types),
+    )
+
+
+def _lotes_csv(
+    stream: BinaryIO,
+    encoding: str,
+    delimiter: str,
+    column_types: Dict[str, pa.DataType],
+    nombres: List[str],
+) -> Iterator[pa.RecordBatch]:
+    """
+    Lotes del CSV con tipos fijos. Las fechas quedan como texto (como en pandas) y los
+    tipos que pyarrow infiere del primer lote se fijan para el resto del archivo.
+    `nombres` recibe las columnas en orden (los errores de conversión las citan por posición).
+    """
+    reader = _abrir_csv(stream, encoding, delimiter, column_types)
+    temporales = {
+        f.name: pa.string() for f in reader.schema
+        if pa.types.is_temporal(f.type) and f.name not in column_types
+    }
+    if temporales:
+        column_types.update(temporales)
+        reader = _abrir_csv(stream, encoding, delimiter, column_types)
+    nombres[:] = reader.schema.names
+    for field in reader.schema:
+        column_types.setdefault(field.name, field.type)
+    yield from reader
+
+
+def _lotes_excel(stream: BinaryIO) -> Iterator[pa.RecordBatch]:
+    """Lotes de la primera hoja de un .xlsx leída en modo streaming (openpyxl read_only)."""
+    import openpyxl
+
+    stream.seek(0)
+    workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        names = [str(h) if h is not None else f"Unnamed: {i}" for i, h in enumerate(header)]
+        schema = None
+        buffer: List[tuple] = []
+
+        def _a_lote(filas):
+            nonlocal schema
+            df = pd.DataFrame(filas, columns=names).infer_objects()
+            # Igual que en la ingesta anterior: las columnas mixtas se guardan como texto.
+            for col in df.select_dtypes(include=["object"]).columns:
+                df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+            table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+            if schema is None:
+                schema = table.schema
+            return table.to_batches()
+
+        for row in rows:
+            if all(v is None for v in row):
+                continue
+            buffer.append(row[:len(names)])
+            if len(buffer) >= EXCEL_BATCH_ROWS:
+                yield from _a_lote(buffer)
+                buffer = []
+        if buffer:
+            yield from _a_lote(buffer)
+    finally:
+        workbook.close()
+
+
+def _lotes_excel_completo(stream: BinaryIO) -> Iterator[pa.RecordBatch]:
+    """Respaldo para .xls y hojas con tipos que cambian entre lotes: lectura completa con pandas."""
+    stream.seek(0)
+    df = pd.read_excel(stream)
+    for col in df.select_dtypes(include=["object"]).columns:
+        df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    yield from pa.Table.from_pandas(df, preserve_index=False).to_batches(max_chunksize=PARQUET_ROW_GROUP_SIZE)
+
+
+# ==============================================================================
+# 3. ESCRITURA INCREMENTAL A PARQUET
+# ==============================================================================
+
+def _escribir_parquet(batches: Iterator[pa.RecordBatch], destino: str) -> Tuple[int, Dict[str, int]]:
+    """
+    Escribe los lotes como row groups de PARQUET_ROW_GROUP_SIZE filas. En memoria solo
+    vive el row group en curso. Devuelve (filas, nulos por columna).
+    """
+    writer = None
+    pendientes: List[pa.RecordBatch] = []
+    pendientes_filas = 0
+    total = 0
+    nulos: Dict[str, int] = {}
+
+    def _vaciar():
+        nonlocal pendientes, pendientes_filas
+        if pendientes:
+            writer.write_table(pa.Table.from_batches(pendientes), row_group_size=PARQUET_ROW_GROUP_SIZE)
+        pendientes, pendientes_filas = [], 0
+
+    try:
+        for batch in batches:
+            if MAX_INGEST_ROWS and total + batch.num_rows > MAX_INGEST_ROWS:
+                batch = batch.slice(0, MAX_INGEST_ROWS - total)
+            if batch.num_rows == 0:
+                break
+            if writer is None:
+                writer = pq.ParquetWriter(destino, batch.schema, compression="snappy")
+            for name, column in zip(batch.schema.names, batch.columns):
+                nulos[name] = nulos.get(name, 0) + column.null_count
+            pendientes.append(batch)
+            pendientes_filas += batch.num_rows
+            total += batch.num_rows
+            if pendientes_filas >= PARQUET_ROW_GROUP_SIZE:
+                _vaciar()
+            if MAX_INGEST_ROWS and total >= MAX_INGEST_ROWS:
+                logger.warning(f"⚠️ Ingesta truncada a MAX_INGEST_ROWS={MAX_INGEST_ROWS} filas.")
+                break
+        if writer is not None:
+            _vaciar()
+    finally:
+        if writer is not None:
+            writer.close()
+    return total, nulos
+
+
+def _csv_a_parquet(stream: BinaryIO, destino: str, encoding: str, delimiter: str) -> Tuple[int, Dict[str, int]]:
+    """
+    Convierte el CSV en una sola pasada. Si un lote posterior no encaja con el tipo
+    inferido al principio (p. ej. un texto en una columna entera) se promueve solo esa
+    columna (int -> float -> texto) y se vuelve a empezar.
+    """
+    column_types: Dict[str, pa.DataType] = {}
+    nombres: List[str] = []
+    for _ in range(64):
+        try:
+            return _escribir_parquet(_lotes_csv(stream, encoding, delimiter, column_types, nombres), destino)
+        except pa.ArrowInvalid as e:
+            match = _CONVERSION_ERROR.search(str(e))
+            if not match or int(match.group(1)) >= len(nombres):
+                raise
+            name = nombres[int(match.group(1))]
+            promoted = pa.float64() if match.group(2).lower().startswith(("int", "uint")) else pa.string()
+            if column_types.get(name) == promoted:
+                promoted = pa.string()
+            logger.info(f"🔁 Columna '{name}' promovida a {promoted} por valores incompatibles; se reinicia la lectura.")
+            column_types[name] = promoted
+    raise ValueError("No se pudieron determinar tipos estables para las columnas del CSV.")
+
+
+def _excel_a_parquet(stream: BinaryIO, destino: str, extension: str) -> Tuple[int, Dict[str, int]]:
+    if extension == "xlsx":
+        try:
+            return _escribir_parquet(_lotes_excel(stream), destino)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, ValueError) as e:
+            logger.info(f"🔁 La hoja no admite lectura por lotes ({e}); se lee completa.")
+    return _escribir_parquet(_lotes_excel_completo(stream), destino)
+
+
+# ==============================================================================
+# 4. ESQUEMA COMPACTO (services/dtype_optimizer.py)
+# ==============================================================================
+
+def _optimizar_tipos(origen: str, destino: str) -> Tuple[Optional[Dict[str, int]], Dict[str, Any]]:
+    """
+    Analiza el Parquet crudo por lotes, elige tipos compactos y, si alguno cambia, lo
+    reescribe en `destino` con ese esquema. Devuelve (nulos por columna o None si no
+    hubo reescritura, resumen con el plan y la memoria estimada antes/después).
+    """
+    analizador = dto.AnalizadorTipos()
+    for batch in pq.ParquetFile(origen).iter_batches(batch_size=PARQUET_ROW_GROUP_SIZE):
+        analizador.add(batch)
+    plan = analizador.plan()
+    resumen = {"changes": dto.plan_resumen(plan), **analizador.estimate_memory(plan)}
+    if not plan:
+        return None, resumen
+
+    lotes = pq.ParquetFile(origen).iter_batches(batch_size=PARQUET_ROW_GROUP_SIZE)
+    _, nulos = _escribir_parquet(dto.aplicar_plan(lotes, plan), destino)
+    antes, despues = resumen["estimated_bytes_before"], resumen["estimated_bytes_after"]
+    logger.info(
+        f"🗜️ Tipos compactos en {len(plan)} columna(s): memoria estimada "
+        f"{antes / 1e6:.1f} MB -> {despues / 1e6:.1f} MB."
+    )
+    return nulos, resumen
+
+
+# ==============================================================================
+# 5. PERFIL INICIAL SOBRE EL PARQUET YA ESCRITO (por row group)
+# ==============================================================================
+
+def _lote_como_pandas(batch: pa.RecordBatch, nulos: Dict[str, int]) -> pd.DataFrame:
+    """
+    Convierte un lote con los mismos dtypes que tendrá el DataFrame completo: un entero o
+    booleano con nulos en cualquier parte del archivo es float/object en pandas aunque
+    este lote no los tenga. Sin esto los hashes de fila no coincidirían con los del archivo.
+    """
+    df = batch.to_pandas()
+    for col in df.columns:
+        if not nulos.get(col):
+            continue
+        if pd.api.types.is_bool_dtype(df[col]):
+            df[col] = df[col].astype(object)
+        elif pd.api.types.is_integer_dtype(df[col]):
+            df[col] = df[col].astype("float64")
+    return df
+
+
+def _perfil_inicial(destino: str, nulos: Dict[str, int]) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """
+    Recorre el Parquet local de a un row group y calcula el índice de hashes de fila
+    (el mismo que row_hash_index sobre el DataFrame completo) y un resumen por columna:
+    nulos, distintos aproximados (HyperLogLog) y mín/máx/media de las numéricas.
+    """
+    parquet = pq.ParquetFile(destino)
+    hashes: List[np.ndarray] = []
+    resumen: Dict[str, Dict[str, Any]] = {}
+    hlls: Dict[str, sk.HyperLogLog] = {}
+
+    for batch in parquet.iter_batches(batch_size=PARQUET_ROW_GROUP_SIZE):
+        df_norm = normalize_null_like(_lote_como_pandas(batch, nulos))
+        hashes.append(rh.combine_row_hashes(df_norm))
+        for col in df_norm.columns:
+            series = df_norm[col]
+            info = resumen.setdefault(col, {"dtype": str(series.dtype), "null_count": 0})
+            info["null_count"] += int(series.isna().sum())
+            valores = series.dropna()
+            hlls.setdefault(col, sk.HyperLogLog(p=SUMMARY_HLL_PRECISION)).add_hashes(rh.value_hashes(valores))
+            if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series) and not valores.empty:
+                info["min"] = min(info.get("min", np.inf), float(valores.min()))
+                info["max"] = max(info.get("max", -np.inf), float(valores.max()))
+                info["_sum"] = info.get("_sum", 0.0) + float(valores.sum())
+                info["_count"] = info.get("_count", 0) + int(valores.size)
+
+    for col, info in resumen.items():
+        info["distinct_estimate"] = int(round(hlls[col].estimate()))
+        if "_count" in info:
+            info["mean"] = info.pop("_sum") / info.pop("_count")
+
+    row_hashes = np.concatenate(hashes) if hashes else np.zeros(0, dtype=np.uint64)
+    return row_hashes, {
+        "columns": resumen,
+        "duplicate_rows": rh.count_duplicates(row_hashes),
+    }
+
+
+# ==============================================================================
+# 6. PIPELINE DE INGESTA
+# ==============================================================================
+
+def ingest_tabular(
+    stream: BinaryIO,
+    extension: str,
+    storage_handler,
+    user_id: str,
+    project_id: str,
+    original_filename: str,
+) -> Dict[str, Any]:
+    """
+    Convierte un CSV/Excel subido a Parquet sin cargarlo entero en memoria y lo sube a
+    Storage junto con su índice de hashes de fila. La memoria pico depende del tamaño
+    de lote (INGEST_BLOCK_BYTES / PARQUET_ROW_GROUP_SIZE), no del tamaño del archivo.
+
+    Devuelve {"path", "rows", "columns", "encoding", "delimiter", "profile", "dtypes"}.
+    Lanza ValueError si el archivo está vacío o no se puede leer.
+    """
+    extension = extension.lower().lstrip(".")
+    fd, destino = tempfile.mkstemp(suffix=".parquet", prefix="ingest_")
+    os.close(fd)
+    fd, compacto = tempfile.mkstemp(suffix=".parquet", prefix="ingest_opt_")
+    os.close(fd)
+    encoding = delimiter = None
+    try:
+        if extension == "csv":
+            encoding, delimiter = sniff_csv(stream)
+            logger.info(f"🔎 CSV detectado: codificación={encoding}, delimitador={delimiter!r}")
+            rows, nulos = _csv_a_parquet(stream, destino, encoding, delimiter)
+        elif extension in ("xlsx", "xls"):
+            rows, nulos = _excel_a_parquet(stream, destino, extension)
+        else:
+            raise ValueError(f"Extensión tabular no soportada: {extension}")
+
+        if rows == 0 or not nulos:
+            raise ValueError("Archivo tabular vacío o mal formado.")
+
+        # El perfil y los hashes se calculan sobre el archivo final: dependen de los dtypes.
+        nulos_compacto, dtypes = _optimizar_tipos(destino, compacto)
+        final = compacto if nulos_compacto is not None else destino
+        row_hashes, profile = _perfil_inicial(final, nulos_compacto or nulos)
+        path, msg = storage_handler.save_parquet_file(
+            final, user_id, project_id, original_filename, row_hashes=row_hashes
+        )
+        if not path:
+            raise IOError(f"Error guardando Parquet: {msg}")
+
+        logger.info(f"✅ Ingesta completa: {rows} filas x {len(nulos)} columnas -> {path}")
+        return {
+            "path": path,
+            "rows": rows,
+            "columns": len(nulos),
+            "encoding": encoding,
+            "delimiter": delimiter,
+            "profile": profile,
+            "dtypes": dtypes,
+        }
+    finally:
+        for temporal in (destino, compacto):
+            try:
+                os.remove(temporal)
+            except OSError:
+                pass
@@ -0,0 +1,459 @@
+# services/job_queue.py
+import os
+import sys
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Callable, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# COLA DE TRABAJOS EN SEGUNDO PLANO
+# ==============================================================================
+# Los endpoints pesados (entrenamientos, análisis de PDF, enriquecimiento con
+# imágenes) encolan su trabajo y responden enseguida con un job_id; el cliente
+# consulta estado, progreso y resultado en /api/jobs/<id>.
+#
+# Backends:
+# - "rq": cola Redis consumida por el servicio `worker` de docker-compose. Se usa si
+#   hay REDIS_URL (con JOBS_BACKEND=auto). REDIS_URL=fakeredis:// usa fakeredis y
+#   ejecuta cada trabajo al encolarlo (útil en pruebas).
+# - "thread": pool de hilos dentro del proceso de la API. Es el respaldo sin Redis.
+# - "inline": ejecuta el trabajo al encolarlo, en el mismo hilo (pruebas/depuración).
+#
+# Estados: queued -> started -> finished | failed | canceled. Los resultados se
+# conservan JOB_RESULT_TTL_SEC (los fallidos, JOB_FAILURE_TTL_SEC).
+#
+# Los trabajos son funciones importables de tasks.py con argumentos simples.
+#
+# Cancelación de un trabajo en curso:
+# - RQ: el worker mata el proceso del trabajo, esté donde esté.
+# - Hilos: es cooperativa. Se aplica en el próximo report_progress/check_cancelled,
+#   que el entrenamiento llama entre sus pasos largos (rondas y pruebas de la búsqueda
+#   de hiperparámetros, validación cruzada, ajuste final). Un ajuste individual que
+#   ya empezó (un fold, una prueba) termina antes de que la cancelación surta efecto.
+
+JOBS_ASYNC_ENDPOINTS = os.getenv("JOBS_ASYNC_ENDPOINTS", "1").lower() in ("1", "true", "yes")
+JOBS_BACKEND = os.getenv("JOBS_BACKEND", "auto").lower()
+REDIS_URL = os.getenv("REDIS_URL", "")
+JOBS_QUEUE_NAME = os.getenv("JOBS_QUEUE_NAME", "default")
+JOBS_THREAD_WORKERS = int(os.getenv("JOBS_THREAD_WORKERS", 2))
+JOB_TIMEOUT_SEC = int(os.getenv("JOB_TIMEOUT_SEC", 3600))
+JOB_RESULT_TTL_SEC = int(os.getenv("JOB_RESULT_TTL_SEC", 86400))
+JOB_FAILURE_TTL_SEC = int(os.getenv("JOB_FAILURE_TTL_SEC", 86400))
+
+JOB_STATUSES = ("queued", "started", "finished", "failed", "canceled")
+
+
+class JobCancelled(BaseException):
+    """
+    Se lanza dentro del trabajo (desde report_progress) cuando se pidió cancelarlo.
+    Hereda de BaseException para que los `except Exception` de los endpoints no la
+    conviertan en una respuesta de error normal.
+    """
+
+
+_local = threading.local()
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def report_progress(percent: Optional[float] = None, message: Optional[str] = None) -> None:
+    """
+    Publica el avance del trabajo en curso (0-100 y/o un mensaje). Fuera de un trabajo
+    no hace nada, así que los endpoints pueden llamarla siempre. En el backend de hilos
+    es también el punto de cancelación: lanza JobCancelled si se pidió cancelar.
+    """
+    progress = {
+        "percent": None if percent is None else round(float(percent), 1),
+        "message": message,
+        "updated_at": _now(),
+    }
+    job = getattr(_local, "job", None)
+    if job is not None:
+        with job.lock:
+            job.progress = progress
+            cancel_requested = job.cancel_requested
+        if cancel_requested:
+            raise JobCancelled()
+        return
+
+    rq_job = _current_rq_job()
+    if rq_job is not None:
+        try:
+            rq_job.meta["progress"] = progress
+            rq_job.save_meta()
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo guardar el progreso del trabajo {rq_job.id}: {e}")
+
+
+def check_cancelled() -> None:
+    """
+    Punto de cancelación sin publicar progreso: lanza JobCancelled si se pidió cancelar
+    el trabajo en curso del backend de hilos. Fuera de un trabajo (o en RQ) no hace nada.
+    """
+    job = getattr(_local, "job", None)
+    if job is not None:
+        with job.lock:
+            cancel_requested = job.cancel_requested
+        if cancel_requested:
+            raise JobCancelled()
+
+
+def bind_current_job(func: Callable) -> Callable:
+    """
+    Envuelve `func` para que, ejecutada en otro hilo (p. ej. un ThreadPoolExecutor
+    interno), siga viendo el trabajo del hilo que la creó: así report_progress y
+    check_cancelled funcionan también dentro de esos hilos.
+    """
+    job = getattr(_local, "job", None)
+    if job is None:
+        return func
+
+    def bound(*args, **kwargs):
+        previous = getattr(_local, "job", None)
+        _local.job = job
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.job = previous
+    return bound
+
+
+def _current_rq_job():
+    if "rq" not in sys.modules:
+        return None
+    try:
+        from rq import get_current_job
+        return get_current_job()
+    except Exception:
+        return None
+
+
+# ==============================================================================
+# BACKEND EN PROCESO (HILOS)
+# ==============================================================================
+
+class _ThreadJob:
+    __slots__ = (
+        "id", "kind", "owner", "func", "args", "kwargs", "status", "progress", "result",
+        "error", "created_at", "started_at", "ended_at", "ended_mono", "cancel_requested", "lock",
+        "result_ttl_sec",
+    )
+
+    def __init__(self, kind: str, owner: Optional[str], func: Callable, args: tuple, kwargs: dict,
+                 result_ttl_sec: int):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.owner = owner
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.status = "queued"
+        self.progress: Optional[Dict[str, Any]] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = _now()
+        self.started_at: Optional[str] = None
+        self.ended_at: Optional[str] = None
+        self.ended_mono: Optional[float] = None
+        self.cancel_requested = False
+        self.lock = threading.Lock()
+        self.result_ttl_sec = result_ttl_sec
+
+
+class ThreadJobBackend:
+    """
+    Trabajos en un pool de hilos del propio proceso. La cancelación de un trabajo en
+    curso es cooperativa (se aplica en el próximo report_progress o check_cancelled) y
+    no hay timeout forzado: un hilo no se puede interrumpir desde afuera.
+    """
+
+    name = "thread"
+
+    def __init__(self, max_workers: Optional[int] = None, inline: bool = False,
+                 result_ttl_sec: Optional[int] = None, failure_ttl_sec: Optional[int] = None):
+        self.inline = inline
+        if inline:
+            self.name = "inline"
+        self.result_ttl_sec = JOB_RESULT_TTL_SEC if result_ttl_sec is None else result_ttl_sec
+        self.failure_ttl_sec = JOB_FAILURE_TTL_SEC if failure_ttl_sec is None else failure_ttl_sec
+        self._executor = None if inline else ThreadPoolExecutor(
+            max_workers=max(1, max_workers or JOBS_THREAD_WORKERS), thread_name_prefix="promptlab-job"
+        )
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, _ThreadJob] = {}
+
+    def _sweep(self) -> None:
+        """Descarta los trabajos terminados cuya retención venció (con el lock tomado)."""
+        now = time.monotonic()
+        for job_id in [
+            j.id for j in self._jobs.values()
+            if j.ended_mono is not None
+            and now - j.ended_mono > (j.result_ttl_sec if j.status == "finished" else self.failure_ttl_sec)
+        ]:
+            self._jobs.pop(job_id, None)
+
+    def _run(self, job: _ThreadJob) -> None:
+        with job.lock:
+            if job.cancel_requested:
+                job.status = "canceled"
+                job.ended_at, job.ended_mono = _now(), time.monotonic()
+                job.func, job.args, job.kwargs = None, (), {}
+                return
+            job.status = "started"
+            job.started_at = _now()
+
+        _local.job = job
+        try:
+            result = job.func(*job.args, **job.kwargs)
+            status, error = "finished", None
+        except JobCancelled:
+            result, status, error = None, "canceled", None
+            logger.info(f"🛑 Trabajo {job.id} ({job.kind}) cancelado.")
+        except Exception as e:
+            result, status, error = None, "failed", str(e)
+            logger.error(f"❌ Trabajo {job.id} ({job.kind}) falló: {e}", exc_info=True)
+        finally:
+            _local.job = None
+
+        with job.lock:
+            job.result = result
+            job.status = status
+            job.error = error
+            job.ended_at, job.ended_mono = _now(), time.monotonic()
+            # La función y sus argumentos (p. ej. archivos subidos) ya no hacen falta.
+            job.func, job.args, job.kwargs = None, (), {}
+
+    def enqueue(self, func: Callable, args: tuple, kwargs: dict, kind: str, owner: Optional[str],
+                timeout_sec: int, result_ttl_sec: Optional[int] = None) -> str:
+        job = _ThreadJob(kind, owner, func, args, kwargs,
+                         self.result_ttl_sec if result_ttl_sec is None else result_ttl_sec)
+        with self._lock:
+            self._sweep()
+            self._jobs[job.id] = job
+        if self.inline:
+            self._run(job)
+        else:
+            self._executor.submit(self._run, job)
+        return job.id
+
+    def fetch(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._sweep()
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        with job.lock:
+            return {
+                "job_id": job.id, "kind": job.kind, "owner": job.owner, "status": job.status,
+                "progress": job.progress, "result": job.result, "error": job.error,
+                "created_at": job.created_at, "started_at": job.started_at, "ended_at": job.ended_at,
+            }
+
+    def cancel(self, job_id: str) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return False
+        with job.lock:
+            if job.status not in ("queued", "started"):
+                return False
+            job.cancel_requested = True
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._sweep()
+            counts = {status: 0 for status in JOB_STATUSES}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        return {"backend": self.name, "jobs": counts}
+
+
+# ==============================================================================
+# BACKEND RQ (REDIS)
+# ==============================================================================
+
+_RQ_STATUS = {
+    "queued": "queued", "deferred": "queued", "scheduled": "queued",
+    "started": "started", "finished": "finished", "failed": "failed",
+    "stopped": "canceled", "canceled": "canceled",
+}
+
+
+class RQJobBackend:
+    """
+    Trabajos en la cola RQ que consume el servicio `worker` (`rq worker --url $REDIS_URL`).
+    RQ guarda la función como "modulo.nombre": el worker importa tasks.py, no la API.
+    """
+
+    name = "rq"
+
+    def __init__(self, redis_url: str, queue_name: Optional[str] = None):
+        from rq import Queue
+
+        if redis_url.startswith("fakeredis://"):
+            import fakeredis
+            self.connection = fakeredis.FakeStrictRedis()
+            # Sin worker que consuma la cola: cada trabajo se ejecuta al encolarlo.
+            self.queue = Queue(queue_name or JOBS_QUEUE_NAME, connection=self.connection, is_async=False)
+            self.name = "rq-fakeredis"
+        else:
+            from redis import Redis
+            self.connection = Redis.from_url(redis_url)
+            self.connection.ping()
+            self.queue = Queue(queue_name or JOBS_QUEUE_NAME, connection=self.connection)
+
+    def _job(self, job_id: str):
+        from rq.job import Job
+        from rq.exceptions import NoSuchJobError
+        try:
+            return Job.fetch(job_id, connection=self.connection)
+        except NoSuchJobError:
+            return None
+
+    def enqueue(self, func: Callable, args: tuple, kwargs: dict, kind: str, owner: Optional[str],
+                timeout_sec: int, result_ttl_sec: Optional[int] = None) -> str:
+        job = self.queue.enqueue_call(
+            func=func, args=args, kwargs=kwargs, timeout=timeout_sec,
+            result_ttl=JOB_RESULT_TTL_SEC if result_ttl_sec is None else result_ttl_sec, failure_ttl=JOB_FAILURE_TTL_SEC,
+            meta={"kind": kind, "owner": owner, "progress": None},
+        )
+        return job.id
+
+    def fetch(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._job(job_id)
+        if job is None:
+            return None
+        status = _RQ_STATUS.get(str(job.get_status(refresh=True) or "queued").split(".")[-1].lower(), "queued")
+        meta = job.meta or {}
+        error = None
+        if status == "failed" and job.exc_info:
+            error = job.exc_info.strip().splitlines()[-1]
+
+        def _iso(dt):
+            return dt.replace(tzinfo=timezone.utc).isoformat() if dt else None
+
+        return {
+            "job_id": job.id, "kind": meta.get("kind"), "owner": meta.get("owner"), "status": status,
+            "progress": meta.get("progress"), "result": job.result if status == "finished" else None,
+            "error": error, "created_at": _iso(job.created_at), "started_at": _iso(job.started_at),
+            "ended_at": _iso(job.ended_at),
+        }
+
+    def cancel(self, job_id: str) -> bool:
+        from rq.command import send_stop_job_command
+        job = self._job(job_id)
+        if job is None:
+            return False
+        status = _RQ_STATUS.get(str(job.get_status(refresh=True)).split(".")[-1].lower())
+        if status == "queued":
+            job.cancel()
+            return True
+        if status == "started":
+            # El worker mata el proceso que ejecuta el trabajo y lo marca como "stopped".
+            send_stop_job_command(self.connection, job_id)
+            return True
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "queue": self.queue.name,
+            "jobs": {
+                "queued": self.queue.count,
+                "started": self.queue.started_job_registry.count,
+                "finished": self.queue.finished_job_registry.count,
+                "failed": self.queue.failed_job_registry.count,
+                "canceled": self.queue.canceled_job_registry.count,
+            },
+        }
+
+
+# ==============================================================================
+# FACHADA
+# ==============================================================================
+
+class JobQueue:
+    """
+    Punto de entrada único para encolar y consultar trabajos. El backend se elige en
+    el primer uso: RQ si está configurado y responde, si no el pool de hilos.
+    Cada trabajo guarda su dueño: `get`/`cancel` con otro `owner` se comportan como
+    si el trabajo no existiera.
+    """
+
+    def __init__(self, backend: Optional[str] = None, redis_url: Optional[str] = None):
+        self._requested = (backend or JOBS_BACKEND).lower()
+        self._redis_url = REDIS_URL if redis_url is None else redis_url
+        self._backend = None
+        self._init_lock = threading.Lock()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._init_lock:
+                if self._backend is None:
+                    self._backend = self._create_backend()
+                    logger.info(f"🧵 Cola de trabajos usando el backend '{self._backend.name}'.")
+        return self._backend
+
+    def _create_backend(self):
+        if self._requested == "inline":
+            return ThreadJobBackend(inline=True)
+        if self._requested == "thread":
+            return ThreadJobBackend()
+        if self._requested == "rq" or (self._requested == "auto" and self._redis_url):
+            try:
+                return RQJobBackend(self._redis_url or "redis://localhost:6379")
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo usar RQ ({e}); los trabajos se ejecutarán en hilos del proceso.")
+        return ThreadJobBackend()
+
+    def enqueue(self, func: Callable, args: tuple = (), kwargs: Optional[dict] = None, kind: str = "job",
+                owner: Optional[str] = None, timeout_sec: Optional[int] = None,
+                result_ttl_sec: Optional[int] = None) -> str:
+        """
+        Encola `func(*args, **kwargs)` (una función importable de tasks.py) y devuelve el
+        job_id. `result_ttl_sec` acorta la retención de resultados pesados.
+        """
+        job_id = self.backend.enqueue(
+            func, args, kwargs or {}, kind, owner, timeout_sec or JOB_TIMEOUT_SEC, result_ttl_sec
+        )
+        logger.info(f"📥 Trabajo {job_id} ({kind}) encolado para el usuario {owner}.")
+        return job_id
+
+    def get(self, job_id: str, owner: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Estado completo del trabajo (incluye `result` si terminó), o None si no existe o venció."""
+        found = self._find(job_id, owner)
+        return found[1] if found else None
+
+    def _find(self, job_id: str, owner: Optional[str]):
+        job = self.backend.fetch(job_id)
+        if job is None or (owner is not None and job.get("owner") != owner):
+            return None
+        return self.backend, job
+
+    def cancel(self, job_id: str, owner: Optional[str] = None) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """(cancelado, estado). Devuelve (False, None) si el trabajo no existe."""
+        found = self._find(job_id, owner)
+        if found is None:
+            return False, None
+        backend = found[0]
+        canceled = backend.cancel(job_id)
+        if canceled:
+            logger.info(f"🛑 Cancelación solicitada para el trabajo {job_id}.")
+        return canceled, backend.fetch(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.backend.stats()
+
+
+job_queue = JobQueue()
@@ -9,6 +9,10 @@ from pathlib import Path
 from typing import  Dict
 import traceback
 
+from . import row_hash as rh
+from . import ingestion
+from . import arrow_backend as ab
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
@@ -190,21 +194,24 @@ def get_column_types(df):
         Tuple[List[str], List[str]]: Columnas numéricas y categóricas.
     """
     numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
-    categorical_cols = df.select_dtypes(
-        include=['object', 'category', 'bool']).columns.tolist()
+    categorical_cols = ab.text_columns(df, include_bool=True)
     return numeric_cols, categorical_cols
 
 # ===================== DUPLICADOS =====================
 
 
-def detectar_duplicados(df: pd.DataFrame, columnas: Optional[List[str]] = None) -> Tuple[pd.DataFrame, int, float]:
+def detectar_duplicados(df: pd.DataFrame, columnas: Optional[List[str]] = None,
+                        row_hashes: Optional[np.ndarray] = None) -> Tuple[pd.DataFrame, int, float]:
     """
     Detecta filas duplicadas en un DataFrame.
+    La comparación se hace sobre el hash de 64 bits de cada fila, no sobre las filas completas.
 
     Args:
         df (pd.DataFrame): DataFrame a analizar.
         columnas (Optional[List[str]]): Columnas sobre las que buscar duplicados. 
                                         Si es None, analiza todas las columnas.
+        row_hashes (Optional[np.ndarray]): Hashes de fila ya calculados (índice persistido).
+                                           Solo se usan cuando no se pide un subconjunto.
 
     Returns:
         Tuple[pd.DataFrame, int, float]: 
@@ -213,14 +220,26 @@ def detectar_duplicados(df: pd.DataFrame, columnas: Optional[List[str]] = None)
             - porcentaje respecto al total.
     """
     total = len(df)
-    if columnas:
-        duplicados = df[df.duplicated(subset=columnas)]
-    else:
-        duplicados = df[df.duplicated()]
+    mascara = rh.duplicated_mask(_hashes_para_duplicados(df, columnas, row_hashes))
+    duplicados = df[mascara]
 
     porcentaje = (len(duplicados) / total) * 100 if total > 0 else 0
     return duplicados, len(duplicados), porcentaje
 
+
+def contar_duplicados(df: pd.DataFrame, columnas: Optional[List[str]] = None,
+                      row_hashes: Optional[np.ndarray] = None) -> int:
+    """Cantidad de filas duplicadas sin materializar el DataFrame de duplicados."""
+    return rh.count_duplicates(_hashes_para_duplicados(df, columnas, row_hashes))
+
+
+def _hashes_para_duplicados(df: pd.DataFrame, columnas: Optional[List[str]],
+                            row_hashes: Optional[np.ndarray]) -> np.ndarray:
+    """Usa el índice de hashes si corresponde a todas las columnas; si no, lo calcula."""
+    if not columnas and row_hashes is not None and len(row_hashes) == len(df):
+        return row_hashes
+    return rh.subset_row_hashes(df, columnas)
+
 # --- CORRECCIÓN: Eliminada la función 'detectar_duplicados_completos' por ser redundante ---
 
 # ===================== NULOS =====================
@@ -271,15 +290,17 @@ def nan_en_columna(df: pd.DataFrame, columna: str) -> Tuple[Optional[dict], Opti
 # --- CORRECCIÓN: Las funciones ahora retornan (DataFrame, mensaje) ---
 
 
-def eliminar_duplicados(df: pd.DataFrame, subset: Optional[List[str]] = None, keep: str = 'first') -> Tuple[pd.DataFrame, str]:
+def eliminar_duplicados(df: pd.DataFrame, subset: Optional[List[str]] = None, keep: str = 'first',
+                        row_hashes: Optional[np.ndarray] = None) -> Tuple[pd.DataFrame, str]:
     """
-    Elimina filas duplicadas de un DataFrame.
+    Elimina filas duplicadas de un DataFrame comparando hashes de fila.
 
     Args:
         df (pd.DataFrame): El DataFrame de entrada.
         subset (Optional[List[str]]): Lista de columnas a considerar para identificar duplicados.
                                       Si es None, se consideran todas las columnas.
         keep (str): Qué duplicado conservar ('first', 'last', False para eliminar todos).
+        row_hashes (Optional[np.ndarray]): Hashes de fila ya calculados sobre todas las columnas.
 
     Returns:
         Tuple[pd.DataFrame, str]: Un tuple con el nuevo DataFrame limpio y un mensaje de resumen.
@@ -289,7 +310,8 @@ def eliminar_duplicados(df: pd.DataFrame, subset: Optional[List[str]] = None, ke
         raise TypeError("La entrada 'df' debe ser un DataFrame de pandas.")
 
     cantidad_antes = df.shape[0]
-    df_limpio = df.drop_duplicates(subset=subset, keep=keep)
+    mascara = rh.duplicated_mask(_hashes_para_duplicados(df, subset, row_hashes), keep=keep)
+    df_limpio = df[~mascara]
     cantidad_despues = df_limpio.shape[0]
     eliminados = cantidad_antes - cantidad_despues
 
@@ -428,8 +450,8 @@ def describe_categoricas(df: pd.DataFrame) -> Tuple[Optional[pd.DataFrame], Opti
     Returns:
         Tuple[Optional[pd.DataFrame], Optional[str]]: DataFrame con estadísticas o mensaje de error.
     """
-    categoricas = df.select_dtypes(include=['object', 'category']).columns
-    if categoricas.empty:
+    categoricas = ab.text_columns(df)
+    if not categoricas:
         return None, "No hay columnas categóricas para describir."
     return df[categoricas].describe().T, None
 
@@ -543,8 +565,17 @@ def eliminar_columnas(df: pd.DataFrame, columnas: list) -> Tuple[pd.DataFrame, s
 
 def robust_read_csv(bytes_content):
     """
-    Intenta leer un CSV con varias codificaciones y delimitadores comunes.
+    Lee un CSV detectando codificación y delimitador con una muestra de bytes (un solo
+    parseo con el motor C). Si la detección falla, prueba las combinaciones comunes.
     """
+    try:
+        encoding, delimiter = ingestion.sniff_csv(bytes_content)
+        df = pd.read_csv(bytes_content, encoding=encoding, delimiter=delimiter, low_memory=False)
+        if df.shape[1] > 1 or (df.shape[1] == 1 and df.shape[0] > 1):
+            return df
+    except Exception as e:
+        logger.info(f"Detección de formato CSV sin éxito ({e}); se prueban combinaciones comunes.")
+
     encodings_to_try = ['utf-8', 'latin-1', 'cp1252', 'utf-16']
     delimiters_to_try = [',', ';', '\t', '|']
     
@@ -0,0 +1,167 @@
+# services/model_artifact_cache.py
+import os
+import time
+import logging
+import threading
+from io import BytesIO
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable
+
+import joblib
+
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# CACHÉ EN MEMORIA DE ARTEFACTOS DE MODELOS TABULARES
+# ==============================================================================
+# Cada predicción, análisis de sensibilidad o evaluación descargaba el .joblib desde
+# Storage y lo deserializaba de nuevo. Acá se guardan los artefactos ya cargados
+# (pipeline, y_encoder, training_features, ...) indexados por (model_id, versión del
+# objeto en Storage): una versión nueva nunca sirve artefactos viejos.
+#
+# - Presupuesto de memoria (MODEL_CACHE_MAX_MB) con desalojo LRU. El tamaño de cada
+#   entrada se aproxima con el de su .joblib serializado.
+# - TTL (MODEL_CACHE_TTL_SEC) contado desde que se cargó la entrada.
+# - Una sola carga por modelo aunque lleguen varias peticiones a la vez.
+
+MODEL_CACHE_MAX_MB = int(os.getenv("MODEL_CACHE_MAX_MB", 512))
+MODEL_CACHE_TTL_SEC = int(os.getenv("MODEL_CACHE_TTL_SEC", 1800))
+
+
+def load_artifacts(serialized_model_bytes: bytes) -> Dict[str, Any]:
+    """Deserializa los artefactos guardados con joblib.dump."""
+    return joblib.load(BytesIO(serialized_model_bytes))
+
+
+class ModelArtifactCache:
+    """LRU en memoria de artefactos deserializados, con presupuesto en bytes y TTL."""
+
+    def __init__(self, max_bytes: Optional[int] = None, ttl_sec: Optional[int] = None):
+        self.max_bytes = max_bytes if max_bytes is not None else MODEL_CACHE_MAX_MB * 1024 * 1024
+        self.ttl_sec = ttl_sec if ttl_sec is not None else MODEL_CACHE_TTL_SEC
+
+        self._lock = threading.Lock()
+        # (model_id, versión) -> (artefactos, bytes, cargado_en)
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._loading: Dict[tuple, threading.Lock] = {}
+        self._total_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    # ------------------------------------------------------------------
+    # Helpers internos (se llaman con el lock tomado)
+    # ------------------------------------------------------------------
+    def _drop(self, key: tuple) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry[1]
+
+    def _evict_if_needed(self) -> None:
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, (_, size, _) = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self._evictions += 1
+            logger.info(f"🧹 Caché de modelos: desalojado {key[0]} ({size} bytes)")
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+    def get(self, model_id: str, version: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Artefactos cacheados para (model_id, versión), o None si no están o vencieron."""
+        if not version:
+            return None
+        key = (model_id, version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[2] > self.ttl_sec:
+                self._drop(key)
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, model_id: str, version: Optional[str], artifacts: Dict[str, Any], size_bytes: int) -> None:
+        if not version or artifacts is None:
+            return
+        if size_bytes > self.max_bytes:
+            logger.info(f"ℹ️ Modelo {model_id} ({size_bytes} bytes) supera el presupuesto de la caché; no se guarda.")
+            return
+        with self._lock:
+            # Las demás versiones del mismo modelo ya no sirven.
+            for stale in [k for k in self._entries if k[0] == model_id]:
+                self._drop(stale)
+            self._entries[(model_id, version)] = (artifacts, size_bytes, time.monotonic())
+            self._total_bytes += size_bytes
+            self._evict_if_needed()
+
+    def get_or_load(
+        self, model_id: str, version: Optional[str], fetch_bytes: Callable[[], Optional[bytes]]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Devuelve los artefactos del modelo; si no están cacheados llama a `fetch_bytes()`
+        (la descarga desde Storage), los deserializa y los guarda. Devuelve None si la
+        descarga no trajo nada. Sin versión no se cachea: se carga y listo.
+        """
+        artifacts = self.get(model_id, version)
+        if artifacts is not None:
+            return artifacts
+        if not version:
+            data = fetch_bytes()
+            return load_artifacts(data) if data else None
+
+        key = (model_id, version)
+        with self._lock:
+            load_lock = self._loading.setdefault(key, threading.Lock())
+        try:
+            with load_lock:
+                # Otra petición pudo haberlo cargado mientras esperábamos.
+                with self._lock:
+                    entry = self._entries.get(key)
+                if entry is not None:
+                    return entry[0]
+
+                data = fetch_bytes()
+                if not data:
+                    return None
+                artifacts = load_artifacts(data)
+                self.put(model_id, version, artifacts, len(data))
+                logger.info(f"📦 Modelo {model_id} deserializado y cacheado ({len(data)} bytes).")
+                return artifacts
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+
+    def invalidate(self, model_id: str) -> int:
+        """Elimina todas las versiones cacheadas de un modelo. Devuelve cuántas se borraron."""
+        with self._lock:
+            stale = [k for k in self._entries if k[0] == model_id]
+            for key in stale:
+                self._drop(key)
+        if stale:
+            logger.info(f"🗑️ Caché de modelos invalidada para {model_id} ({len(stale)} entradas)")
+        return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "entries": len(self._entries),
+                "size_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_sec": self.ttl_sec,
+            }
+
+
+model_artifact_cache = ModelArtifactCache()
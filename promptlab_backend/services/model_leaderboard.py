@@ -0,0 +1,366 @@
+# services/model_leaderboard.py
+import os
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Dict, Any, List
+
+import numpy as np
+import pandas as pd
+import joblib
+from sklearn.base import clone
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import accuracy_score, f1_score, r2_score, mean_squared_error, mean_absolute_error
+
+from . import arrow_backend as ab
+
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# LEADERBOARD: VARIOS MODELOS SOBRE LAS MISMAS FEATURES PREPROCESADAS
+# ==============================================================================
+# Comparar modelos con /train-model repetía la descarga del dataset y el ajuste del
+# preprocesador en cada llamada. Acá el split y el preprocesador se ajustan una vez,
+# las matrices transformadas se guardan en disco (joblib, se leen con mmap) y cada
+# candidato se entrena en su propio proceso. El presupuesto de CPU
+# (LEADERBOARD_CPU_BUDGET) se reparte entre los procesos para no sobresuscribir:
+# 4 modelos con 8 núcleos -> 4 procesos con n_jobs=2 cada uno.
+
+LEADERBOARD_CPU_BUDGET = int(os.getenv("LEADERBOARD_CPU_BUDGET", 0)) or (os.cpu_count() or 1)
+LEADERBOARD_EXECUTOR = os.getenv("LEADERBOARD_EXECUTOR", "process").lower()
+LEADERBOARD_FEATURE_CACHE_SIZE = int(os.getenv("LEADERBOARD_FEATURE_CACHE_SIZE", 4))
+
+RANKING_METRICS = {"clasificacion": ("accuracy", "f1_macro"), "regresion": ("r2", "rmse", "mae")}
+LOWER_IS_BETTER = {"rmse", "mae"}
+
+
+# ------------------------------------------------------------------------------
+# Caché de matrices transformadas (una carpeta por split)
+# ------------------------------------------------------------------------------
+
+class FeatureMatrixCache:
+    """
+    Carpetas temporales con X_train/X_test/y_train/y_test ya preprocesados, indexadas
+    por la clave del split (versión del dataset + target + estrategias + test_size).
+    LRU de pocas entradas.
+
+    `acquire`/`put` fijan la carpeta mientras un leaderboard la usa y `release` la
+    suelta: una carpeta reemplazada o desalojada se borra recién cuando nadie la tiene
+    fijada (otra petición puede estar leyéndola desde su pool de procesos).
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max(1, max_entries or LEADERBOARD_FEATURE_CACHE_SIZE)
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._pins: Dict[str, int] = {}   # carpeta -> usos en curso
+        self._doomed: set = set()         # carpetas fuera de la caché, a borrar al soltarlas
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    # Helpers internos (se llaman con el lock tomado)
+    def _pin(self, folder: str) -> None:
+        self._pins[folder] = self._pins.get(folder, 0) + 1
+
+    def _discard(self, folder: str) -> None:
+        if self._pins.get(folder):
+            self._doomed.add(folder)
+        else:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    def acquire(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Entrada cacheada con su carpeta fijada (devolverla con `release`), o None."""
+        if not key:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not os.path.isdir(entry["dir"]):
+                self._entries.pop(key, None)
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            self._pin(entry["dir"])
+            return entry
+
+    def put(self, key: Optional[str], entry: Dict[str, Any]) -> None:
+        """Guarda la entrada y deja su carpeta fijada para quien la generó (ver `release`)."""
+        if not key:
+            return
+        with self._lock:
+            self._pin(entry["dir"])
+            previous = self._entries.pop(key, None)
+            if previous is not None and previous["dir"] != entry["dir"]:
+                self._discard(previous["dir"])
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._discard(evicted["dir"])
+
+    def release(self, entry: Dict[str, Any]) -> None:
+        folder = entry["dir"]
+        with self._lock:
+            remaining = self._pins.get(folder, 0) - 1
+            if remaining > 0:
+                self._pins[folder] = remaining
+                return
+            self._pins.pop(folder, None)
+            if folder in self._doomed:
+                self._doomed.discard(folder)
+                shutil.rmtree(folder, ignore_errors=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "in_use": len(self._pins),
+            }
+
+
+feature_matrix_cache = FeatureMatrixCache()
+
+
+def split_cache_key(dataset_version: Optional[str], target_col: str, encoding_strategies: Dict[str, str],
+                    problem_type: Optional[str], test_size: float, random_state: int) -> Optional[str]:
+    if not dataset_version:
+        return None
+    raw = f"{dataset_version}|{target_col}|{sorted(encoding_strategies.items())}|{problem_type}|{test_size}|{random_state}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def _prepare_split(prediction_service, df: pd.DataFrame, target_col: str, encoding_strategies: Dict[str, str],
+                   problem_type: Optional[str], test_size: float, random_state: int) -> Dict[str, Any]:
+    """Split + preprocesador ajustado una sola vez; las matrices quedan en una carpeta temporal."""
+    from .backend_predictivo import SafeLabelEncoder
+
+    df = ab.to_numpy_backed(df)
+    X = df[[col for col in df.columns if col != target_col]]
+    y_original = df[target_col]
+
+    if problem_type not in ("clasificacion", "regresion"):
+        problem_type = prediction_service._detectar_tipo_problema(y_original)
+
+    labels = None
+    if problem_type == "clasificacion":
+        y_encoder = SafeLabelEncoder()
+        y = pd.Series(y_encoder.fit_transform(y_original), name=target_col, index=y_original.index)
+        labels = y_encoder.classes_.tolist()
+    else:
+        y = y_original
+
+    stratify = prediction_service._stratify_target(y, problem_type)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=test_size, random_state=random_state, stratify=stratify
+    )
+
+    preprocessor = prediction_service._build_dynamic_preprocessor(X, encoding_strategies)
+    started = time.perf_counter()
+    Xt_train = preprocessor.fit_transform(X_train)
+    Xt_test = preprocessor.transform(X_test)
+    preprocess_sec = round(time.perf_counter() - started, 3)
+
+    folder = tempfile.mkdtemp(prefix="leaderboard_")
+    for name, matrix in (("X_train", Xt_train), ("X_test", Xt_test), ("y_train", y_train), ("y_test", y_test)):
+        joblib.dump(np.ascontiguousarray(np.asarray(matrix, dtype=np.float64)), os.path.join(folder, f"{name}.joblib"))
+
+    return {
+        "dir": folder,
+        "problem_type": problem_type,
+        "labels": labels,
+        "feature_names": [str(name) for name in preprocessor.get_feature_names_out()],
+        "n_train": int(len(X_train)),
+        "n_test": int(len(X_test)),
+        "preprocess_sec": preprocess_sec,
+    }
+
+
+# ------------------------------------------------------------------------------
+# Entrenamiento de un candidato (corre en un proceso del pool)
+# ------------------------------------------------------------------------------
+
+def _fit_candidate(model_name: str, estimator, folder: str, problem_type: str, use_smote: bool,
+                   random_state: int, feature_names: List[str]) -> Dict[str, Any]:
+    load = lambda name: joblib.load(os.path.join(folder, f"{name}.joblib"), mmap_mode="r")
+    X_train, X_test = load("X_train"), load("X_test")
+    y_train, y_test = load("y_train"), load("y_test")
+    if problem_type == "clasificacion":
+        y_train, y_test = y_train.astype(int), y_test.astype(int)
+
+    if use_smote and problem_type == "clasificacion":
+        from imblearn.over_sampling import SMOTE
+        X_train, y_train = SMOTE(random_state=random_state).fit_resample(np.asarray(X_train), y_train)
+
+    started = time.perf_counter()
+    estimator.fit(X_train, y_train)
+    fit_sec = time.perf_counter() - started
+    y_pred = estimator.predict(X_test)
+
+    if problem_type == "clasificacion":
+        metrics = {
+            "accuracy": float(accuracy_score(y_test, y_pred)),
+            "f1_macro": float(f1_score(y_test, y_pred, average="macro", zero_division=0)),
+        }
+    else:
+        metrics = {
+            "r2": float(r2_score(y_test, y_pred)),
+            "rmse": float(np.sqrt(mean_squared_error(y_test, y_pred))),
+            "mae": float(mean_absolute_error(y_test, y_pred)),
+        }
+
+    top_features = {}
+    importances = getattr(estimator, "feature_importances_", None)
+    if importances is not None and len(importances) == len(feature_names):
+        order = np.argsort(importances)[::-1][:10]
+        top_features = {feature_names[i]: float(importances[i]) for i in order}
+
+    return {"model_name": model_name, "metrics": metrics, "fit_sec": round(fit_sec, 3),
+            "top_features": top_features}
+
+
+def _candidate_estimator(prediction_service, problem_type: str, model_name: str, n_jobs: int):
+    estimator = clone(prediction_service.models[problem_type][model_name])
+    if "n_jobs" in estimator.get_params():
+        estimator.set_params(n_jobs=n_jobs)
+    return estimator
+
+
+def _release_split(split: Dict[str, Any], cache_key: Optional[str]) -> None:
+    """Suelta la carpeta del split: la cacheada se desfija, la efímera se borra."""
+    if cache_key:
+        feature_matrix_cache.release(split)
+    else:
+        shutil.rmtree(split["dir"], ignore_errors=True)
+
+
+def _executor(workers: int):
+    if LEADERBOARD_EXECUTOR == "thread":
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="leaderboard")
+    # forkserver/spawn: no se hereda el estado del servidor (hilos, locks, clientes).
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+
+
+# ------------------------------------------------------------------------------
+# API pública
+# ------------------------------------------------------------------------------
+
+def build_leaderboard(
+    prediction_service,
+    df: pd.DataFrame,
+    target_col: str,
+    model_names: Optional[List[str]] = None,
+    encoding_strategies: Optional[Dict[str, str]] = None,
+    problem_type: Optional[str] = None,
+    use_smote: bool = False,
+    test_size: float = 0.25,
+    random_state: int = 42,
+    rank_by: Optional[str] = None,
+    cache_key: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Entrena en paralelo los modelos de `prediction_service.models` (o los de
+    `model_names`) sobre el mismo split preprocesado y los devuelve ordenados por
+    `rank_by` (accuracy / r2 por defecto). Un candidato que falla queda con `error`
+    al final de la tabla y no frena a los demás.
+    """
+    encoding_strategies = encoding_strategies or {}
+    if not isinstance(df, pd.DataFrame) or df.empty:
+        return {"success": False, "error": "El dataset está vacío o no es un DataFrame."}
+    if target_col not in df.columns:
+        return {"success": False, "error": f"La columna objetivo '{target_col}' no está en el DataFrame."}
+    if not (0 < test_size < 1):
+        return {"success": False, "error": "'test_size' debe estar entre 0 y 1."}
+
+    started = time.perf_counter()
+    try:
+        split = feature_matrix_cache.acquire(cache_key)
+        split_cached = split is not None
+        if split is None:
+            split = _prepare_split(prediction_service, df, target_col, encoding_strategies,
+                                   problem_type, test_size, random_state)
+            if cache_key:
+                feature_matrix_cache.put(cache_key, split)
+    except Exception as e:
+        logger.error(f"❌ Error preparando el split del leaderboard: {e}", exc_info=True)
+        return {"success": False, "error": f"Error preprocesando el dataset: {e}"}
+
+    problem_type = split["problem_type"]
+    available = prediction_service.models.get(problem_type, {})
+    names = [n for n in (model_names or list(available)) if n in available]
+    unknown = [n for n in (model_names or []) if n not in available]
+    if not names:
+        _release_split(split, cache_key)
+        return {"success": False, "error": f"Ningún modelo disponible para {problem_type}. Opciones: {list(available)}"}
+
+    rank_by = rank_by if rank_by in RANKING_METRICS[problem_type] else RANKING_METRICS[problem_type][0]
+    workers = max(1, min(len(names), LEADERBOARD_CPU_BUDGET))
+    n_jobs = max(1, LEADERBOARD_CPU_BUDGET // workers)
+    logger.info(f"🏁 Leaderboard: {len(names)} modelos, {workers} procesos x n_jobs={n_jobs} ({problem_type}).")
+
+    rows: List[Dict[str, Any]] = []
+    try:
+        with _executor(workers) as pool:
+            futures = {
+                pool.submit(
+                    _fit_candidate, name, _candidate_estimator(prediction_service, problem_type, name, n_jobs),
+                    split["dir"], problem_type, use_smote, random_state, split["feature_names"],
+                ): name
+                for name in names
+            }
+            for future in as_completed(futures):
+                try:
+                    rows.append(future.result())
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    logger.warning(f"⚠️ Leaderboard: '{futures[future]}' falló: {e}")
+                    rows.append({"model_name": futures[future], "error": str(e)})
+    except BrokenProcessPool as e:
+        logger.error(f"❌ El pool de procesos del leaderboard se cayó: {e}", exc_info=True)
+        return {"success": False, "error": "El entrenamiento en paralelo se interrumpió (¿memoria insuficiente?)."}
+    finally:
+        _release_split(split, cache_key)
+
+    def _sort_key(row):
+        value = row.get("metrics", {}).get(rank_by)
+        if value is None:
+            return (1, 0.0)
+        return (0, value if rank_by in LOWER_IS_BETTER else -value)
+
+    rows.sort(key=_sort_key)
+    for position, row in enumerate(rows, start=1):
+        row["rank"] = position if "metrics" in row else None
+
+    wall_sec = round(time.perf_counter() - started, 3)
+    return {
+        "success": True,
+        "data": {
+            "problem_type": problem_type,
+            "rank_by": rank_by,
+            "leaderboard": rows,
+            "labels": split["labels"],
+            "n_train": split["n_train"],
+            "n_test": split["n_test"],
+            "ignored_models": unknown,
+            "timing": {
+                "wall_sec": wall_sec,
+                "sum_fit_sec": round(sum(r.get("fit_sec", 0.0) for r in rows), 3),
+                "preprocess_sec": 0.0 if split_cached else split["preprocess_sec"],
+                "preprocess_cached": split_cached,
+                "workers": workers,
+                "n_jobs_per_model": n_jobs,
+            },
+        },
+    }
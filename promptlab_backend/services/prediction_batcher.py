@@ -0,0 +1,153 @@
+# services/prediction_batcher.py
+import os
+import time
+import logging
+import threading
+from typing import Optional, Dict, Any, List, Callable, Hashable
+
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# MICRO-BATCHING DE PREDICCIONES DE UNA FILA
+# ==============================================================================
+# Con batch de 1 fila casi todo el costo de /predict es fijo (ColumnTransformer,
+# validaciones de sklearn, recorrer el ensamble). Las peticiones concurrentes contra
+# el mismo modelo se juntan durante una ventana corta (PREDICT_BATCH_WINDOW_MS) o
+# hasta PREDICT_BATCH_MAX_SIZE filas, se predicen con una sola llamada vectorizada y
+# cada petición recibe su resultado.
+#
+# No hay hilos propios: la primera petición de cada lote hace de "líder", espera la
+# ventana y ejecuta la predicción; las demás solo esperan su resultado.
+
+PREDICT_BATCHING = os.getenv("PREDICT_BATCHING", "1").lower() in ("1", "true", "yes")
+PREDICT_BATCH_MAX_SIZE = int(os.getenv("PREDICT_BATCH_MAX_SIZE", 64))
+PREDICT_BATCH_WINDOW_MS = float(os.getenv("PREDICT_BATCH_WINDOW_MS", 3))
+
+# Margen para que un seguidor no espere para siempre si el líder muere.
+_RESULT_TIMEOUT_SEC = 60
+
+
+class _Batch:
+    __slots__ = ("rows", "enqueued_at", "results", "full", "done", "started_at")
+
+    def __init__(self):
+        self.rows: List[dict] = []
+        self.enqueued_at: List[float] = []
+        self.results: List[Dict[str, Any]] = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.started_at = 0.0
+
+
+class PredictionBatcher:
+    """
+    Junta filas sueltas por modelo y las predice en lote.
+
+    `predict_many(model, rows)` debe devolver {"success", "data": [predicción por fila]};
+    `predict_one(model, row)` se usa si el lote falla, para que una fila inválida no
+    arrastre a las demás peticiones del mismo lote.
+    """
+
+    def __init__(
+        self,
+        predict_many: Callable[[Any, List[dict]], Dict[str, Any]],
+        predict_one: Callable[[Any, dict], Dict[str, Any]],
+        max_batch_size: Optional[int] = None,
+        window_ms: Optional[float] = None,
+        enabled: Optional[bool] = None,
+    ):
+        self._predict_many = predict_many
+        self._predict_one = predict_one
+        self.max_batch_size = max(1, max_batch_size or PREDICT_BATCH_MAX_SIZE)
+        self.window_sec = (PREDICT_BATCH_WINDOW_MS if window_ms is None else window_ms) / 1000.0
+        self.enabled = PREDICT_BATCHING if enabled is None else enabled
+
+        self._lock = threading.Lock()
+        self._open: Dict[Hashable, _Batch] = {}
+        self._batches = 0
+        self._rows = 0
+        self._fallbacks = 0
+        self._queue_ms_total = 0.0
+        self._queue_ms_max = 0.0
+
+    def predict(self, key: Hashable, model: Any, row: dict) -> Dict[str, Any]:
+        """
+        Predicción de una fila con el formato de PredictionService.make_prediction, más
+        `batching: {batch_size, queue_ms}` (cuántas filas compartieron la llamada y cuánto
+        esperó esta en la cola). `key` identifica al modelo y su versión: solo se juntan
+        filas con la misma clave.
+        """
+        if not self.enabled or self.max_batch_size == 1:
+            return self._predict_one(model, row)
+
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = _Batch()
+                self._open[key] = batch
+            position = len(batch.rows)
+            batch.rows.append(row)
+            batch.enqueued_at.append(time.monotonic())
+            if len(batch.rows) >= self.max_batch_size:
+                self._open.pop(key, None)
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window_sec)
+            with self._lock:
+                if self._open.get(key) is batch:
+                    self._open.pop(key)
+            self._run(batch, model)
+        elif not batch.done.wait(_RESULT_TIMEOUT_SEC):
+            return {"success": False, "error": "Tiempo de espera agotado en la cola de predicción."}
+
+        return batch.results[position]
+
+    def _run(self, batch: _Batch, model: Any) -> None:
+        # A partir de acá nadie más agrega filas a `batch`.
+        batch.started_at = time.monotonic()
+        size = len(batch.rows)
+        queue_ms = [round((batch.started_at - t) * 1000, 2) for t in batch.enqueued_at]
+        try:
+            result = self._predict_many(model, batch.rows)
+            if result.get("success") and len(result.get("data") or []) == size:
+                batch.results = [
+                    {"success": True, "prediction_data": {"prediction": prediction}}
+                    for prediction in result["data"]
+                ]
+            else:
+                if size > 1:
+                    logger.warning(f"⚠️ Lote de {size} predicciones falló; se reintenta fila por fila.")
+                    with self._lock:
+                        self._fallbacks += 1
+                batch.results = [self._predict_one(model, row) for row in batch.rows]
+        except Exception as e:
+            logger.error(f"❌ Error en el lote de predicciones: {e}", exc_info=True)
+            batch.results = [
+                {"success": False, "error": f"Error interno al procesar la predicción: {e}"} for _ in range(size)
+            ]
+        finally:
+            for result, waited in zip(batch.results, queue_ms):
+                result["batching"] = {"batch_size": size, "queue_ms": waited}
+            with self._lock:
+                self._batches += 1
+                self._rows += size
+                self._queue_ms_total += sum(queue_ms)
+                self._queue_ms_max = max(self._queue_ms_max, max(queue_ms))
+            batch.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "max_batch_size": self.max_batch_size,
+                "window_ms": round(self.window_sec * 1000, 2),
+                "batches": self._batches,
+                "rows": self._rows,
+                "avg_batch_size": round(self._rows / self._batches, 2) if self._batches else 0.0,
+                "avg_queue_ms": round(self._queue_ms_total / self._rows, 2) if self._rows else 0.0,
+                "max_queue_ms": round(self._queue_ms_max, 2),
+                "fallbacks": self._fallbacks,
+            }
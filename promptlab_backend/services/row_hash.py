@@ -0,0 +1,127 @@
+# services/row_hash.py
+import io
+import hashlib
+import logging
+from typing import Iterable, Optional, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from . import arrow_backend as ab
+
+
+logger = logging.getLogger(__name__)
+
+# Hash fijo para cualquier nulo (NaN, None, NaT): dos filas con nulos en la misma
+# posición deben considerarse iguales, igual que en df.duplicated().
+NULL_HASH = np.uint64(0x9E3779B97F4A7C15)
+
+# El índice de hashes se guarda junto al Parquet como `<ruta>.rowhash.npz`.
+SIDECAR_SUFFIX = ".rowhash.npz"
+
+
+def _column_salt(name) -> np.uint64:
+    """Multiplicador impar derivado del nombre de la columna (evita que columnas intercambiadas colisionen)."""
+    digest = hashlib.blake2b(str(name).encode("utf-8"), digest_size=8).digest()
+    return np.uint64(int.from_bytes(digest, "little") | 1)
+
+
+def value_hashes(series: pd.Series) -> np.ndarray:
+    """
+    Hash de 64 bits de cada valor (vectorizado; pandas ya factoriza internamente los
+    objetos repetidos). Todos los nulos reciben NULL_HASH.
+    """
+    # Con el backend Arrow se hashea la misma representación que en el backend numpy.
+    series = ab.series_to_numpy(series)
+    # El ancho numérico no cambia el valor: int32/float32 (tipos compactos) se hashean
+    # como int64/float64 para que el índice no dependa de cómo se guardó la columna.
+    if pd.api.types.is_signed_integer_dtype(series.dtype) and series.dtype.itemsize < 8:
+        series = series.astype(np.int64)
+    elif pd.api.types.is_float_dtype(series.dtype) and series.dtype.itemsize < 8:
+        series = series.astype(np.float64)
+    hashes = pd.util.hash_pandas_object(series, index=False).to_numpy(dtype=np.uint64, copy=True)
+    hashes[series.isna().to_numpy()] = NULL_HASH
+    return hashes
+
+
+def column_row_hash(series: pd.Series) -> np.ndarray:
+    """Hash por fila de una columna, ya multiplicado por la sal de la columna."""
+    return value_hashes(series) * _column_salt(series.name)
+
+
+def combine_row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """
+    Hash de fila = suma (módulo 2^64) de los hashes de columna. Al ser una suma,
+    cambiar una columna se resuelve restando su hash viejo y sumando el nuevo.
+    """
+    row_hashes = np.zeros(len(df), dtype=np.uint64)
+    for col in df.columns:
+        row_hashes += column_row_hash(df[col])
+    return row_hashes
+
+
+def update_row_hashes(
+    row_hashes: np.ndarray,
+    df_before: pd.DataFrame,
+    df_after: pd.DataFrame,
+    columns: Iterable,
+) -> np.ndarray:
+    """
+    Actualiza los hashes de fila tocando solo `columns` (misma cantidad y orden de filas).
+    Una columna que desaparece solo resta; una nueva solo suma.
+    """
+    updated = row_hashes.copy()
+    for col in columns:
+        if col in df_before.columns:
+            updated -= column_row_hash(df_before[col])
+        if col in df_after.columns:
+            updated += column_row_hash(df_after[col])
+    return updated
+
+
+def count_duplicates(row_hashes: Optional[np.ndarray]) -> int:
+    """Filas repetidas (sin contar la primera aparición), como df.duplicated().sum()."""
+    if row_hashes is None or len(row_hashes) == 0:
+        return 0
+    return int(len(row_hashes) - pd.unique(row_hashes).size)
+
+
+def subset_row_hashes(df: pd.DataFrame, columns: Optional[List] = None) -> np.ndarray:
+    """Hash de fila restringido a `columns` (para duplicados por subconjunto)."""
+    if not columns:
+        return combine_row_hashes(df)
+    if isinstance(columns, str):
+        columns = [columns]
+    return combine_row_hashes(df[list(columns)])
+
+
+def duplicated_mask(row_hashes: np.ndarray, keep="first") -> np.ndarray:
+    """Equivalente a df.duplicated(keep=keep) pero comparando enteros en vez de filas anchas."""
+    if len(row_hashes) == 0:
+        return np.zeros(0, dtype=bool)
+    return pd.Series(row_hashes, copy=False).duplicated(keep=keep).to_numpy()
+
+
+# ==============================================================================
+# ÍNDICE PERSISTIDO (sidecar junto al Parquet)
+# ==============================================================================
+
+def sidecar_path(path: str) -> str:
+    return f"{path}{SIDECAR_SUFFIX}"
+
+
+def to_sidecar_bytes(row_hashes: np.ndarray, version: Optional[str]) -> bytes:
+    """Serializa los hashes junto con la versión del archivo de datos que describen."""
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, row_hashes=row_hashes.astype(np.uint64, copy=False), version=np.array(version or ""))
+    return buffer.getvalue()
+
+
+def from_sidecar_bytes(data: bytes) -> Tuple[Optional[np.ndarray], Optional[str]]:
+    """Devuelve (hashes, versión) o (None, None) si el sidecar está corrupto."""
+    try:
+        with np.load(io.BytesIO(data), allow_pickle=False) as npz:
+            return npz["row_hashes"].astype(np.uint64, copy=False), str(npz["version"]) or None
+    except Exception as e:
+        logger.warning(f"⚠️ Índice de hashes de fila ilegible, se recalculará: {e}")
+        return None, None
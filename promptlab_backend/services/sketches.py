@@ -0,0 +1,147 @@
+# services/sketches.py
+import math
+import logging
+from typing import Dict, Any, Optional
+
+import numpy as np
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIDENCE = 0.95
+
+
+# ==============================================================================
+# 1. HYPERLOGLOG (cardinalidad aproximada)
+# ==============================================================================
+
+class HyperLogLog:
+    """
+    Estimador de valores distintos con memoria fija (2^p registros de 1 byte).
+    Error relativo típico: 1.04 / sqrt(2^p)  (p=14 -> ~0.8%).
+    """
+
+    def __init__(self, p: int = 14):
+        self.p = p
+        self.m = 1 << p
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    def add_hashes(self, hashes: np.ndarray) -> None:
+        if len(hashes) == 0:
+            return
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashes << np.uint64(self.p)
+        # Ceros a la izquierda de `rest`: con 53 bits alcanza (float64 los representa exactos).
+        _, exponent = np.frexp((rest >> np.uint64(11)).astype(np.float64))
+        rank = np.minimum(53 - exponent + 1, 64 - self.p + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def estimate(self) -> float:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        raw = alpha * self.m ** 2 / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * self.m and zeros > 0:
+            return self.m * math.log(self.m / zeros)  # linear counting para cardinalidades chicas
+        return float(raw)
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+
+# ==============================================================================
+# 2. COUNT-MIN (frecuencias aproximadas)
+# ==============================================================================
+
+class CountMinSketch:
+    """
+    Frecuencias aproximadas con memoria fija. Nunca subestima; sobreestima como mucho
+    en (e / width) * N con probabilidad 1 - e^-depth.
+    """
+
+    _SALTS = np.array(
+        [0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93,
+         0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53],
+        dtype=np.uint64,
+    )
+
+    def __init__(self, width_bits: int = 14, depth: int = 4):
+        self.width_bits = width_bits
+        self.width = 1 << width_bits
+        self.depth = min(depth, len(self._SALTS))
+        self.table = np.zeros((self.depth, self.width), dtype=np.int64)
+        self.total = 0
+
+    def _buckets(self, hashes: np.ndarray, row: int) -> np.ndarray:
+        return ((hashes * self._SALTS[row]) >> np.uint64(64 - self.width_bits)).astype(np.int64)
+
+    def add_hashes(self, hashes: np.ndarray) -> None:
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        for row in range(self.depth):
+            self.table[row] += np.bincount(self._buckets(hashes, row), minlength=self.width)
+        self.total += len(hashes)
+
+    def estimate_hashes(self, hashes: np.ndarray) -> np.ndarray:
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        estimates = [self.table[row][self._buckets(hashes, row)] for row in range(self.depth)]
+        return np.min(np.vstack(estimates), axis=0)
+
+    @property
+    def absolute_error(self) -> float:
+        return math.e / self.width * self.total
+
+    @property
+    def confidence(self) -> float:
+        return 1 - math.exp(-self.depth)
+
+
+# ==============================================================================
+# 3. CUANTILES POR MUESTRA (cota DKW)
+# ==============================================================================
+
+def dkw_rank_error(sample_size: int, confidence: float = DEFAULT_CONFIDENCE) -> float:
+    """
+    Cota de Dvoretzky–Kiefer–Wolfowitz: con probabilidad `confidence`, el cuantil q
+    de la muestra está entre los cuantiles q ± ε de la población.
+    """
+    if sample_size <= 0:
+        return 1.0
+    return math.sqrt(math.log(2 / (1 - confidence)) / (2 * sample_size))
+
+
+def sample_positions(n_rows: int, sample_size: int, seed: int = 0) -> Optional[np.ndarray]:
+    """Posiciones (ordenadas) de una muestra uniforme sin reemplazo; None si no hace falta muestrear."""
+    if n_rows <= sample_size:
+        return None
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.choice(n_rows, size=sample_size, replace=False))
+
+
+# ==============================================================================
+# 4. DUPLICADOS POR MUESTREO DE HASHES DE FILA
+# ==============================================================================
+
+def estimate_duplicates(row_hashes: np.ndarray, target_sample: int = 200_000) -> Dict[str, Any]:
+    """
+    Estima df.duplicated().sum() quedándose solo con las filas cuyo hash cae en una
+    fracción 1/2^s del espacio. Las filas idénticas tienen el mismo hash, así que
+    entran o salen juntas de la muestra y el conteo escalado es insesgado.
+    """
+    n_rows = len(row_hashes)
+    if n_rows == 0:
+        return {"count": 0, "error_bound": 0, "sampling_rate": 1.0}
+
+    shift = max(0, int(math.floor(math.log2(n_rows / target_sample)))) if n_rows > target_sample else 0
+    if shift == 0:
+        kept = row_hashes
+    else:
+        kept = row_hashes[(row_hashes >> np.uint64(64 - shift)) == 0]
+
+    scale = 1 << shift
+    sampled_duplicates = int(len(kept) - pd.unique(kept).size)
+    estimate = sampled_duplicates * scale
+    # Varianza ~ escala * D (grupos de duplicados chicos); cota al 95%.
+    error_bound = 0 if shift == 0 else int(math.ceil(1.96 * math.sqrt(max(estimate, 1) * scale)))
+    return {"count": int(estimate), "error_bound": error_bound, "sampling_rate": 1 / scale}
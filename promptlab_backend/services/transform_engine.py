@@ -0,0 +1,96 @@
+# services/transform_engine.py
+import logging
+from typing import Any, Callable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from . import arrow_backend as ab
+
+
+logger = logging.getLogger(__name__)
+
+
+# ==============================================================================
+# MOTOR DE TRANSFORMACIONES POR VALORES ÚNICOS
+# ==============================================================================
+# Las funciones de limpieza de texto son escalares (un valor -> un valor) y en
+# columnas categóricas se repiten los mismos valores millones de veces. En lugar de
+# aplicarlas fila por fila, se factoriza la columna, se transforma cada valor
+# distinto una sola vez y el resultado se expande con los códigos (un take de numpy).
+
+
+def factorizar(serie: pd.Series) -> Tuple[np.ndarray, pd.Index]:
+    """
+    Devuelve (códigos, únicos). Los nulos reciben el código -1.
+    Si la columna ya es categórica se reutilizan sus códigos sin recorrerla.
+    """
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie.cat.codes.to_numpy(), pd.Index(serie.cat.categories, dtype=object)
+    codigos, unicos = pd.factorize(serie)
+    return codigos, pd.Index(unicos, dtype=object)
+
+
+def expandir(
+    serie: pd.Series,
+    codigos: np.ndarray,
+    transformados,
+    dtype: Optional[Any] = None,
+    conservar_nulos: bool = True,
+) -> pd.Series:
+    """
+    Arma la columna resultado a partir de los valores únicos ya transformados.
+    Los nulos (código -1) conservan su valor original o pasan a NaN si `conservar_nulos` es False.
+    """
+    tabla = np.empty(len(transformados) + 1, dtype=object)
+    tabla[:-1] = list(transformados)
+    tabla[-1] = np.nan  # el código -1 indexa la última posición
+    valores = tabla[codigos]
+
+    nulos = codigos == -1
+    if conservar_nulos and nulos.any():
+        valores[nulos] = serie.to_numpy(dtype=object)[nulos]
+
+    resultado = pd.Series(valores, index=serie.index, name=serie.name)
+    return resultado.astype(dtype) if dtype is not None else resultado
+
+
+def aplicar_por_unicos(
+    serie: pd.Series,
+    funcion: Callable[[Any], Any],
+    dtype: Optional[Any] = None,
+    conservar_nulos: bool = True,
+) -> pd.Series:
+    """
+    Equivalente a `serie.apply(funcion)` para funciones escalares sin estado,
+    pero llamando a `funcion` una sola vez por valor distinto.
+    """
+    codigos, unicos = factorizar(serie)
+    transformados = [funcion(v) for v in unicos]
+    return expandir(serie, codigos, transformados, dtype=dtype, conservar_nulos=conservar_nulos)
+
+
+def transformar_unicos(
+    serie: pd.Series,
+    funcion_vectorizada: Callable[[pd.Series], pd.Series],
+    dtype: Optional[Any] = None,
+    conservar_nulos: bool = True,
+) -> pd.Series:
+    """
+    Igual que aplicar_por_unicos, pero la transformación recibe la Serie de valores
+    distintos completa (para poder usar operaciones `.str` vectorizadas sobre ellos).
+    `funcion_vectorizada` debe devolver una Serie alineada con la que recibe.
+    """
+    if ab.is_arrow_string(serie.dtype):
+        # Backend Arrow: los únicos se quedan en un array Arrow (las operaciones `.str`
+        # usan pyarrow.compute) y la expansión es un take de Arrow; la columna sigue
+        # siendo string[pyarrow]. Los nulos (código -1) quedan nulos en ambos modos.
+        codigos, unicos = pd.factorize(serie)
+        transformados = pd.Series(funcion_vectorizada(pd.Series(unicos)), dtype=serie.dtype)
+        valores = transformados.array.take(codigos, allow_fill=True)
+        resultado = pd.Series(valores, index=serie.index, name=serie.name)
+        return resultado.astype(dtype) if dtype is not None else resultado
+
+    codigos, unicos = factorizar(serie)
+    transformados = funcion_vectorizada(pd.Series(unicos, dtype=object))
+    return expandir(serie, codigos, transformados.to_numpy(dtype=object), dtype=dtype, conservar_nulos=conservar_nulos)
@@ -18,6 +18,7 @@ from sklearn.metrics import classification_report, confusion_matrix
 from sklearn.model_selection import train_test_split
 import copy
 from utils.supabase_handler import supabase_handler  
+from utils.bulk_fetcher import fetch_visuals
 
 # --- Logging robusto ---
 logger = logging.getLogger("VisionPredictionService")
@@ -47,6 +48,7 @@ class VisionPredictionService:
         temp_dir = Path(tempfile.mkdtemp(prefix="vision_dataset_"))
         self.logger.info(f"📁 Creando dataset temporal en: {temp_dir}")
 
+        validos = []
         for record in image_records:
             tags = record.get("tags")
             storage_path = record.get("storage_path")
@@ -54,21 +56,23 @@ class VisionPredictionService:
             if not tags or not storage_path:
                 self.logger.warning(f"Registro omitido: {record.get('id')}")
                 continue
+            validos.append((storage_path, tags[0]))
+
+        # Descarga concurrente: cada imagen se decodifica y guarda apenas llega.
+        for result in fetch_visuals([path for path, _ in validos]):
+            storage_path, label = validos[result.index]
+            if not result.ok:
+                self.logger.error(f"❌ No se pudo descargar {storage_path}: {result.error}")
+                continue
 
-            label = tags[0]
             label_dir = temp_dir / label
             label_dir.mkdir(exist_ok=True)
-
-            image_bytes = supabase_handler.download_visual_file(storage_path)
-            if image_bytes:
-                try:
-                    img = Image.open(BytesIO(image_bytes)).convert("RGB")
-                    file_name = Path(storage_path).stem
-                    img.save(label_dir / f"{file_name}.png", "PNG")
-                except Exception as e:
-                    self.logger.error(f"❌ No se pudo procesar {storage_path}: {e}")
-            else:
-                self.logger.error(f"❌ No se pudo descargar {storage_path}")
+            try:
+                img = Image.open(BytesIO(result.data)).convert("RGB")
+                file_name = Path(storage_path).stem
+                img.save(label_dir / f"{file_name}.png", "PNG")
+            except Exception as e:
+                self.logger.error(f"❌ No se pudo procesar {storage_path}: {e}")
 
         return temp_dir
 
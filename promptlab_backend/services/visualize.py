@@ -2,7 +2,7 @@
 
 import plotly.express as px
 import pandas as pd
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 import logging
 
 import plotly.graph_objects as go
@@ -275,6 +275,27 @@ PLOT_GENERATORS = {
     
 }
 
+# Gráficos que eligen sus columnas a partir del propio DataFrame (p. ej. "todas las numéricas").
+PLOTS_SIN_PROYECCION = {"pair_plot"}
+
+
+def columnas_necesarias(plot_type: str, params: Dict[str, Any]) -> Optional[List[str]]:
+    """
+    Columnas que el gráfico va a leer, para cargar solo esas del dataset.
+    Devuelve None cuando el gráfico necesita el DataFrame completo.
+    """
+    if plot_type in PLOTS_SIN_PROYECCION:
+        return None
+    if plot_type == "correlation_matrix" and not params.get('columnas'):
+        return None
+
+    columnas = [v for k, v in params.items() if k in ['x', 'y', 'color', 'size', 'hover'] and isinstance(v, str)]
+    columnas.extend(params.get('columnas') or [])
+    if plot_type == "map":
+        columnas.extend(['lat', 'lon'])
+    return list(dict.fromkeys(columnas))
+
+
 def generate_plot(df: pd.DataFrame, plot_type: str, params: Dict[str, Any]) -> Dict[str, Any]:
     """
     Genera una especificación JSON de un gráfico Plotly.
@@ -1,32 +1,435 @@
 
-# ... otras importaciones que necesites ...
+# ==============================================================================
+# TAREAS EN SEGUNDO PLANO
+# ==============================================================================
+# Funciones que la cola de trabajos (services/job_queue.py) ejecuta: en el worker RQ
+# (`rq worker`) o en el pool de hilos de la API. Reciben argumentos simples (ids,
+# rutas de Storage, la configuración JSON) y NO importan api.py: cada proceso arma
+# solo los servicios que la tarea necesita, la primera vez que los usa.
+#
+# Las tareas de los endpoints devuelven (cuerpo, código HTTP): la misma respuesta que
+# daría el endpoint sincrónico, que /api/jobs/<id>/result reenvía tal cual.
 
+import os
+import time
+import uuid
 import logging
+import threading
+from io import BytesIO
 
+import joblib
+import pandas as pd
+from supabase import create_client
+
+from services.data_service import DataService
+from services.backend_predictivo import PredictionService
+from services.TabularClusteringService import TabularClusteringService
 from services.vision_backend import VisionPredictionService
+from services.job_queue import report_progress
+from utils.supabase_handler import supabase_handler
+from utils.storage_transport import get_storage_transport
+
 # Configura un logger básico si el worker no lo tiene
 logger = logging.getLogger(__name__)
 
+STORAGE_BUCKET = "proyectos-usuarios"
+
+
+# --- SERVICIOS COMPARTIDOS ---
+# La API registra sus instancias con configure() para que los trabajos que corren en
+# sus hilos no dupliquen clientes ni modelos cargados; en el worker se crean a demanda.
+_services = {}
+_services_lock = threading.RLock()
+
+
+def _build_supabase_admin():
+    return create_client(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_SERVICE_KEY"))
+
+
+def _build_tabular_clustering_service():
+    service = TabularClusteringService()
+    service.configure(dataset_service=_service("dataset_service"), supabase_handler=supabase_handler)
+    return service
+
+
+def _build_model_manager():
+    # Import diferido: los modelos de visión solo hacen falta en las tareas de imágenes.
+    from services.model_manager import ModelManager
+    manager = ModelManager()
+    manager.setup_api_keys(google_api_key=os.getenv("GOOGLE_API_KEY"))
+    return manager
+
+
+_SERVICE_FACTORIES = {
+    "supabase_admin": _build_supabase_admin,
+    "storage_transport": get_storage_transport,
+    "dataset_service": lambda: DataService(db_client=_service("supabase_admin"), storage_handler=supabase_handler),
+    "prediction_service": PredictionService,
+    "tabular_clustering_service": _build_tabular_clustering_service,
+    "model_manager": _build_model_manager,
+}
+
+
+def configure(**services):
+    """Registra instancias ya creadas (p. ej. las de la API) para que las tareas las reutilicen."""
+    unknown = set(services) - set(_SERVICE_FACTORIES)
+    if unknown:
+        raise ValueError(f"Servicios desconocidos: {sorted(unknown)}")
+    with _services_lock:
+        _services.update(services)
+
+
+def _service(name):
+    with _services_lock:
+        if name not in _services:
+            logger.info(f"[TASKS] Creando servicio '{name}' para este proceso.")
+            _services[name] = _SERVICE_FACTORIES[name]()
+        return _services[name]
+
+
+# --- ENTRENAMIENTO DE MODELOS TABULARES ---
+
+def train_model_task(user_id, dataset_id, project_id, storage_path, config):
+    """
+    Entrena un modelo tabular con `config` (ya validada por el endpoint) y, salvo que
+    sea un experimento, lo sube a Storage y registra la fila en `trained_models`.
+    """
+    start_time = time.time()
+    target_col = config.get("target_col")
+    model_name = config.get("model_name")
+    project_name = config.get("project_name")
+    model_display_name = config.get("model_display_name")
+    is_experiment_only = bool(config.get("is_experiment_only", False))
+    storage_transport = _service("storage_transport")
+
+    try:
+        # --- PASO 1: CARGAR DATASET (SIN LIMPIEZA DE COLUMNAS) ---
+        report_progress(5, "Cargando dataset")
+        try:
+            df_fresh = supabase_handler.load_file_as_dataframe(user_id=user_id, path=storage_path)
+        except Exception as load_err:
+            logger.error(f"[TRAIN_MODEL] Error cargando dataset: {load_err}", exc_info=True)
+            return {"success": False, "error": "Error cargando dataset desde storage."}, 500
+
+        if df_fresh is None or df_fresh.empty:
+            return {"success": False, "error": "Dataset vacío o no cargado."}, 400
+
+        MAX_ROWS = 1_000_000
+        if len(df_fresh) > MAX_ROWS:
+            return {"success": False, "error": f"Dataset demasiado grande (máx {MAX_ROWS} filas)."}, 400
+
+        # --- PASO 2: ENTRENAR MODELO ---
+        report_progress(15, "Entrenando modelo")
+        training_response = _service("prediction_service").train_model(
+            df=df_fresh.copy(deep=True),
+            target_col=target_col,
+            model_name=model_name,
+            encoding_strategies=config.get("encoding_strategies", {}),
+            use_smote=bool(config.get("use_smote", False)),
+            use_cv=bool(config.get("use_cv", False)),
+            problem_type=config.get("problem_type"),
+            tuning=config.get("tuning") or None
+        )
+
+        if not training_response.get("success"):
+            return training_response, 400
+
+        training_data = training_response["data"]
+
+        # --- CASO EXPERIMENTO ---
+        if is_experiment_only:
+            if 'artifacts' in training_data:
+                del training_data['artifacts']
+            elapsed = round(time.time() - start_time, 2)
+            logger.info(f"[TRAIN_MODEL] Experimento completado en {elapsed}s (sin guardar)")
+            return {
+                "success": True,
+                "message": "Experimento completado con éxito.",
+                "results": training_data,
+                "elapsed_time_sec": elapsed,
+                "is_experiment": True
+            }, 200
+
+        # --- PASO 3: GUARDAR MODELO EN STORAGE ---
+        report_progress(90, "Guardando modelo")
+        artifacts_to_save = training_data.pop('artifacts', None)
+        if not artifacts_to_save:
+            return {"success": False, "error": "No se generaron artefactos del modelo."}, 500
+
+        buffer = BytesIO()
+        joblib.dump(artifacts_to_save, buffer)
+        model_bytes = buffer.getvalue()
+
+        model_id = str(uuid.uuid4())
+        model_storage_path = f"{user_id}/{project_id}/models/{model_id}.joblib"
+
+        try:
+            storage_transport.from_(STORAGE_BUCKET).upload(
+                path=model_storage_path,
+                file=model_bytes,
+                file_options={"content-type": "application/octet-stream"}
+            )
+            logger.info(f"[TRAIN_MODEL] Modelo guardado en Storage: {model_storage_path}")
+        except Exception as storage_error:
+            logger.error(f"[TRAIN_MODEL] Error guardando modelo en storage: {storage_error}", exc_info=True)
+            return {"success": False, "error": "Error al guardar el modelo."}, 500
+
+        # --- PASO 4: GUARDAR METADATA EN BD ---
+        feature_cols = [col for col in df_fresh.columns if col != target_col]
+
+        new_model_record = {
+            "id": model_id,
+            "project_id": project_id,
+            "user_id": user_id,
+            "model_name": model_name,
+            "source_dataset_id": dataset_id,
+            "target_col": target_col,
+            "feature_cols": feature_cols,
+            "model_storage_path": model_storage_path,
+            "evaluation_results": training_data,
+            "project_name": project_name,
+            "model_display_name": model_display_name
+        }
+
+        try:
+            _service("supabase_admin").table("trained_models").insert(new_model_record).execute()
+            logger.info(f"[TRAIN_MODEL] Metadata del modelo {model_id} guardada en BD.")
+
+        # --- MANEJO DE DUPLICADOS ---
+        except Exception as db_error:
+            storage_transport.from_(STORAGE_BUCKET).remove([model_storage_path])
+            if getattr(db_error, 'code', None) == '23505':
+                logger.warning(f"[TRAIN_MODEL] Intento de guardar modelo con nombre duplicado: {model_display_name}")
+                return {
+                    "success": False,
+                    "error": f"El nombre del modelo '{model_display_name}' ya existe en el proyecto '{project_name}'. Por favor, elige un nombre único."
+                }, 409
+            logger.error(f"[TRAIN_MODEL] Fallo guardando metadata BD: {db_error}", exc_info=True)
+            return {"success": False, "error": "Error guardando metadata en BD."}, 500
+
+        # --- PASO 5: RESPUESTA EXITOSA ---
+        elapsed = round(time.time() - start_time, 2)
+        logger.info(f"[TRAIN_MODEL] Entrenamiento completado en {elapsed}s")
+        return {
+            "success": True,
+            "message": "Modelo entrenado y guardado con éxito.",
+            "model_id": model_id,
+            "project_id": project_id,
+            "model_display_name": model_display_name,
+            "storage_path": model_storage_path,
+            "results": training_data,
+            "elapsed_time_sec": elapsed,
+            "is_experiment": False
+        }, 201
+
+    except Exception as e:
+        logger.error(f"[TRAIN_MODEL] Error fatal: {e}", exc_info=True)
+        return {"success": False, "error": "Error interno durante el entrenamiento."}, 500
+
+
+def train_clustering_model_task(user_id, dataset_id, config):
+    """Entrena y guarda un modelo de clustering (KMeans o DBSCAN) con `config` ya validada."""
+    algorithm = config.get("algorithm")
+    try:
+        report_progress(10, f"Entrenando {algorithm}")
+        result = _service("tabular_clustering_service").train_and_save_model(
+            user_id=user_id,
+            dataset_id=dataset_id,
+            algorithm=algorithm,
+            parameters=config.get("parameters", {}),
+            project_id=config.get("project_id"),
+            model_display_name=config.get("model_display_name"),
+            project_name=config.get("project_name")
+        )
+        return result, 201 if result.get("success") else 400
+
+    except Exception as e:
+        logger.error(f"[CLUSTERING_TRAIN] Error fatal: {e}", exc_info=True)
+        return {"success": False, "error": "Error interno al entrenar el modelo de clustering."}, 500
+
+
+# --- IMÁGENES Y PDF ---
+
+def enrich_with_image_urls_task(user_id, dataset_id, dataset_info, column_name):
+    """
+    Analiza las imágenes cuyas URLs están en `column_name` y crea un nuevo dataset
+    enriquecido. `dataset_info` es la fila del dataset original (storage_path,
+    project_id, dataset_name).
+    """
+    from vision_processor import procesar_imagen_completa, download_image_from_url
+
+    try:
+        model_manager = _service("model_manager")
+
+        # --- PASO 1: Cargar el dataset original ---
+        original_df = supabase_handler.load_file_as_dataframe(user_id=user_id, path=dataset_info["storage_path"])
+        if original_df is None:
+            return {"success": False, "error": "No se pudo cargar el dataset original."}, 500
+        if column_name not in original_df.columns:
+            return {"success": False, "error": f"La columna '{column_name}' no existe en el dataset."}, 400
+
+        # --- PASO 2: Procesar cada URL ---
+        results = []
+        total_rows = len(original_df)
+        for position, (index, row) in enumerate(original_df.iterrows()):
+            report_progress(90 * position / max(total_rows, 1), f"Imagen {position + 1} de {total_rows}")
+            image_url = row[column_name]
+            if pd.isna(image_url) or not isinstance(image_url, str) or not image_url.startswith("http"):
+                results.append({})
+                continue
+
+            try:
+                image_bytes = download_image_from_url(image_url)
+                if image_bytes:
+                    result = procesar_imagen_completa(
+                        image_bytes,
+                        image_url,
+                        model_manager_instance=model_manager
+                    )
+                    results.append(result)
+                else:
+                    results.append({"error": "Fallo en la descarga"})
+            except Exception as img_err:
+                logger.warning(f"⚠️ Error procesando imagen {image_url}: {img_err}", exc_info=True)
+                results.append({"error": f"Error procesando imagen: {str(img_err)}"})
+
+        # --- PASO 3: Crear el nuevo DataFrame enriquecido ---
+        report_progress(90, "Guardando dataset enriquecido")
+        results_df = pd.DataFrame(results).add_prefix("img_")
+        original_df.reset_index(drop=True, inplace=True)
+        results_df.reset_index(drop=True, inplace=True)
+        enriched_df = pd.concat([original_df, results_df], axis=1)
+
+        # --- PASO 4: Generar bytes CSV y nombre del archivo ---
+        csv_bytes = enriched_df.to_csv(index=False).encode("utf-8")
+        new_dataset_id = str(uuid.uuid4())
+        original_name = dataset_info.get("dataset_name", "dataset")
+        file_name = f"enriched_{original_name.replace('.csv', '')}_{new_dataset_id[:8]}.csv"
+
+        # --- PASO 5: Guardar en Supabase ---
+        storage_path, _ = supabase_handler.save_file(
+            file_bytes=csv_bytes,
+            user_id=user_id,
+            project_id=dataset_info.get("project_id"),
+            folder="datasets",
+            filename=file_name
+        )
+        if not storage_path:
+            raise Exception("No se pudo guardar el archivo enriquecido en Supabase Storage.")
+
+        # --- PASO 6: Registrar el nuevo dataset ---
+        new_dataset = _service("dataset_service").create_dataset_record(
+            dataset_id=new_dataset_id,
+            user_id=user_id,
+            project_id=dataset_info.get("project_id"),
+            dataset_name=f"{original_name} (Enriquecido)",
+            dataset_type="tabular",
+            storage_path=storage_path,
+            file_size=len(csv_bytes)
+        )
+
+        return {
+            "success": True,
+            "message": "Dataset enriquecido creado exitosamente.",
+            "new_dataset": new_dataset
+        }, 201
+
+    except Exception as e:
+        logger.critical(f"❌ Error enriqueciendo dataset {dataset_id}: {e}", exc_info=True)
+        return {"success": False, "error": "Error interno del servidor."}, 500
+
+
+def analyze_pdf_bytes(pdf_bytes, filename, request_id):
+    """Análisis profundo de un PDF, página por página. Devuelve (cuerpo, código HTTP)."""
+    import fitz
+    from vision_processor import analisis_completo_de_imagen
+
+    try:
+        model_manager = _service("model_manager")
+        pdf_doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        pages_analysis = []
+
+        for page_num in range(len(pdf_doc)):
+            report_progress(100 * page_num / len(pdf_doc), f"Página {page_num + 1} de {len(pdf_doc)}")
+            page = pdf_doc.load_page(page_num)
+            pix = page.get_pixmap()
+            image_bytes = pix.tobytes("png")
+
+            analysis_result = analisis_completo_de_imagen(
+                imagen_bytes=image_bytes,
+                filename=f"{filename}_page_{page_num + 1}",
+                model_manager_instance=model_manager
+            )
+
+            pages_analysis.append({
+                "page_number": page_num + 1,
+                "analysis": analysis_result
+            })
+
+        pdf_doc.close()
+
+        logger.info(f"[{request_id}] ✅ Análisis del PDF '{filename}' completado con {len(pages_analysis)} páginas.")
+
+        return {
+            "success": True,
+            "pdf_analysis": {
+                "filename": filename,
+                "total_pages": len(pages_analysis),
+                "pages": pages_analysis
+            },
+            "request_id": request_id
+        }, 200
+
+    except Exception as e:
+        logger.exception(f"[{request_id}] ❌ Error inesperado analizando el PDF: {e}")
+        return {"success": False, "error": "Error interno al procesar el PDF.", "request_id": request_id}, 500
+
+
+def analyze_pdf_task(filename, pdf_storage_path, request_id):
+    """
+    Versión encolada de analyze_pdf_bytes: el endpoint deja el PDF en Storage (así el
+    archivo no viaja dentro de la cola) y la tarea lo borra al terminar.
+    """
+    storage = _service("storage_transport").from_(STORAGE_BUCKET)
+    try:
+        pdf_bytes = storage.download(pdf_storage_path)
+        return analyze_pdf_bytes(pdf_bytes, filename, request_id)
+    finally:
+        try:
+            storage.remove([pdf_storage_path])
+        except Exception as e:
+            logger.warning(f"[{request_id}] ⚠️ No se pudo borrar el PDF temporal {pdf_storage_path}: {e}")
+
+
+# --- ENTRENAMIENTO DE VISIÓN ---
+
+# Un entrenamiento de visión a la vez por proceso: los de la cola esperan su turno.
+_VISION_TRAINING_LOCK = threading.Lock()
+
+
 def train_vision_model_task(image_records, model_arch, epochs):
     """
     Esta es la función que RQ ejecutará en segundo plano.
     Es el "trabajador pesado".
     """
     logger.info(f"[RQ-WORKER] Tarea recibida. Entrenando {model_arch} con {len(image_records)} imágenes.")
-    
+
     try:
-        # Creamos una instancia fresca del servicio dentro del worker
-        vision_service = VisionPredictionService()
-        
-        # Llamamos al método que hace el trabajo computacional
-        result = vision_service.train_model(
-            image_records=image_records,
-            model_arch=model_arch,
-            epochs=epochs
-        )
-        
+        with _VISION_TRAINING_LOCK:
+            report_progress(10, f"Entrenando {model_arch} con {len(image_records)} imágenes")
+
+            # Creamos una instancia fresca del servicio dentro del worker
+            vision_service = VisionPredictionService()
+
+            # Llamamos al método que hace el trabajo computacional
+            result = vision_service.train_model(
+                image_records=image_records,
+                model_arch=model_arch,
+                epochs=epochs
+            )
+
         logger.info("[RQ-WORKER] Tarea completada con éxito.")
-        
+
         # El worker retorna el resultado completo, RQ lo guardará.
         return result
 
@@ -34,4 +437,3 @@ def train_vision_model_task(image_records, model_arch, epochs):
         logger.error(f"[RQ-WORKER] La tarea ha fallado: {e}", exc_info=True)
         # Cuando una tarea lanza una excepción, RQ la marca como 'failed'.
         raise
-
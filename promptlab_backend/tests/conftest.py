@@ -0,0 +1,6 @@
+# tests/conftest.py
+import os
+import sys
+
+# Los módulos del backend se importan como en la API (`services.…`, `utils.…`).
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
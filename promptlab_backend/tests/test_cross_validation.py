@@ -0,0 +1,60 @@
+# tests/test_cross_validation.py
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+pytest.importorskip("sklearn")
+backend_predictivo = pytest.importorskip("services.backend_predictivo")
+
+from sklearn.compose import TransformedTargetRegressor
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame({"a": rng.normal(size=80), "b": rng.normal(size=80)})
+    y = pd.Series(10 + 2 * X["a"] - X["b"] + rng.normal(scale=0.1, size=80))
+    return X, y
+
+
+def make_pipeline():
+    model = TransformedTargetRegressor(
+        regressor=RandomForestRegressor(n_estimators=10, n_jobs=-1, random_state=0),
+        func=np.log1p, inverse_func=np.expm1, check_inverse=False,
+    )
+    return Pipeline([("scaler", StandardScaler()), ("model", model)])
+
+
+def test_cv_caps_nested_n_jobs_and_refits_on_all_rows(monkeypatch, tmp_path, data):
+    X, y = data
+    monkeypatch.setattr(backend_predictivo, "CV_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(backend_predictivo, "CV_MAX_WORKERS", 2)
+    monkeypatch.setattr(backend_predictivo.os, "cpu_count", lambda: 4)
+
+    seen = {}
+    real_cross_validate = backend_predictivo.cross_validate
+
+    def spy(estimator, *args, **kwargs):
+        seen["n_jobs"] = estimator.get_params(deep=True)["model__regressor__n_jobs"]
+        seen["return_estimator"] = kwargs["return_estimator"]
+        return real_cross_validate(estimator, *args, **kwargs)
+
+    monkeypatch.setattr(backend_predictivo, "cross_validate", spy)
+
+    output = backend_predictivo.PredictionService()._cross_validate(make_pipeline(), X, y, "regresion", 0)
+
+    assert seen == {"n_jobs": 2, "return_estimator": False}
+    summary = output["summary"]
+    scores = [fold["r2"] for fold in summary["cv_folds"]]
+    assert len(scores) == backend_predictivo.CV_FOLDS
+    assert summary["cv_mean_score"] == pytest.approx(np.mean(scores))
+    assert summary["cv_std_dev"] == pytest.approx(np.std(scores))
+    assert "cv_selected_fold" not in summary
+
+    pipeline = output["pipeline"]
+    assert pipeline.get_params(deep=True)["model__regressor__n_jobs"] == -1
+    assert pipeline.memory is None
+    assert pipeline.named_steps["scaler"].n_samples_seen_ == len(X)
@@ -0,0 +1,101 @@
+# tests/test_dataframe_cache.py
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("pyarrow")
+
+from utils.dataframe_cache import DataFrameCache, apply_filters_in_memory, normalize_filters, read_parquet_subset
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({"pais": ["ar", "uy", "cl", "ar"], "edad": [20, 35, 50, 65]})
+
+
+# --- Filtros en memoria (misma semántica que la lectura Parquet) ---
+
+def test_in_memory_filters_match_parquet_subset(tmp_path, df):
+    path = str(tmp_path / "datos.parquet")
+    df.to_parquet(path, index=False)
+    filters = normalize_filters([[["pais", "=", "ar"], ["edad", ">", 30]], [["pais", "in", ["cl"]]]])
+
+    in_memory = apply_filters_in_memory(df, ["edad", "no-existe"], filters)
+    from_parquet = read_parquet_subset(path, ["edad", "no-existe"], filters)
+
+    assert in_memory["edad"].tolist() == from_parquet["edad"].tolist() == [50, 65]
+    assert list(in_memory.columns) == ["edad"]
+
+
+def test_in_memory_filter_on_unknown_column_is_a_value_error(df):
+    with pytest.raises(ValueError, match="no-existe"):
+        apply_filters_in_memory(df, None, normalize_filters([["no-existe", "=", 1]]))
+
+
+# --- Caché en disco: claves por versión, LRU e invalidación ---
+
+@pytest.fixture
+def cache(tmp_path):
+    return DataFrameCache(cache_dir=str(tmp_path / "cache"), max_bytes=10 * 1024 * 1024)
+
+
+def test_get_requires_the_same_version(cache, df):
+    assert cache.put("u1/datos.csv", "v1", df)
+
+    pd.testing.assert_frame_equal(cache.get("u1/datos.csv", "v1"), df)
+    assert cache.get("u1/datos.csv", "v2") is None
+    assert cache.get("u1/datos.csv", None) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_new_version_replaces_the_previous_one(cache, df):
+    cache.put("u1/datos.csv", "v1", df)
+    cache.put("u1/datos.csv", "v2", df.head(2))
+
+    assert cache.get("u1/datos.csv", "v1") is None
+    assert len(cache.get("u1/datos.csv", "v2")) == 2
+    assert cache.stats()["entries"] == 1
+
+
+def test_partial_read_from_cache(cache, df):
+    cache.put("u1/datos.csv", "v1", df)
+
+    subset = cache.get("u1/datos.csv", "v1", columns=["edad"], filters=normalize_filters([["pais", "=", "ar"]]))
+
+    assert subset.to_dict("list") == {"edad": [20, 65]}
+
+
+def test_invalidate_drops_every_version_of_the_path(cache, df):
+    cache.put("u1/datos.csv", "v1", df)
+    cache.put("u1/otro.csv", "v1", df)
+
+    assert cache.invalidate("u1/datos.csv") == 1
+    assert cache.invalidate("u1/datos.csv") == 0
+    assert cache.get("u1/datos.csv", "v1") is None
+    assert cache.get("u1/otro.csv", "v1") is not None
+
+
+def test_lru_eviction_keeps_the_recently_used_entry(tmp_path, df):
+    probe = DataFrameCache(cache_dir=str(tmp_path / "probe"))
+    probe.put("x", "v", df)
+    entry_size = probe.stats()["size_bytes"]
+
+    cache = DataFrameCache(cache_dir=str(tmp_path / "cache"), max_bytes=int(entry_size * 2.5))
+    cache.put("a", "v", df)
+    cache.put("b", "v", df)
+    assert cache.get("a", "v") is not None  # "b" pasa a ser el menos usado
+    cache.put("c", "v", df)
+
+    assert cache.get("b", "v") is None
+    assert cache.get("a", "v") is not None
+    assert cache.get("c", "v") is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["size_bytes"] <= cache.max_bytes
+
+
+def test_entries_survive_a_restart(tmp_path, df):
+    DataFrameCache(cache_dir=str(tmp_path / "cache")).put("u1/datos.csv", "v1", df)
+
+    reopened = DataFrameCache(cache_dir=str(tmp_path / "cache"))
+
+    pd.testing.assert_frame_equal(reopened.get("u1/datos.csv", "v1"), df)
@@ -0,0 +1,190 @@
+# tests/test_dataset_session.py
+import io
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("pyarrow")
+
+from services.dataset_session import DatasetSessionConflict, DatasetSessionManager
+from services.dataset_versioning import DatasetVersionStore
+
+PATH = "u1/datos.parquet"
+
+
+class FakeStorage:
+    """Storage en memoria con la interfaz de SupabaseHandler que usan sesiones e historial."""
+
+    def __init__(self, df):
+        self.objects = {PATH: df}
+        self.versions = {PATH: 1}
+        self.loads = 0
+        self.saves = []
+
+    def _write(self, path, value):
+        self.objects[path] = value
+        self.versions[path] = self.versions.get(path, 0) + 1
+
+    def get_object_version(self, path, bucket=None):
+        return f"v{self.versions[path]}" if path in self.objects else None
+
+    def load_file_as_dataframe(self, user_id, path, version=None, **kwargs):
+        self.loads += 1
+        value = self.objects.get(path)
+        if isinstance(value, bytes):
+            return pd.read_parquet(io.BytesIO(value))
+        return None if value is None else value.copy()
+
+    def load_row_hashes(self, path, version, n_rows=None):
+        return None
+
+    def save_dataframe_to_storage(self, user_id, path, df, row_hashes=None):
+        self.saves.append(df.copy())
+        self._write(path, df.copy())
+
+    def download_object(self, path):
+        return self.objects.get(path)
+
+    def upload_object(self, path, data, content_type=None):
+        self._write(path, data)
+
+    def copy_object(self, source, destination):
+        self._write(destination, self.objects[source])
+
+    def remove_objects(self, paths):
+        for path in paths:
+            self.objects.pop(path, None)
+
+
+@pytest.fixture
+def original():
+    return pd.DataFrame({"pais": ["ar", "uy", "cl", "ar"], "edad": [20, 35, 50, 65]})
+
+
+@pytest.fixture
+def storage(original):
+    return FakeStorage(original)
+
+
+def _open(manager):
+    return manager.open("u1", "ds1", PATH)
+
+
+# --- Sesión sin historial ---
+
+def test_actions_stay_in_memory_until_commit(storage):
+    manager = DatasetSessionManager(storage)
+    session = _open(manager)
+    assert _open(manager) is session
+    assert storage.loads == 1
+
+    session.update(session.df.assign(edad=session.df["edad"] + 1), action="sumar", base=session.df)
+    session.update(session.df[session.df["pais"] == "ar"], action="filtrar", base=session.df)
+    assert storage.saves == []
+    assert session.summary()["dirty"] is True
+
+    result = manager.commit("u1", "ds1")
+
+    assert result["data"]["flushed"] is True
+    assert len(storage.saves) == 1
+    assert storage.saves[0]["edad"].tolist() == [21, 66]
+    assert manager.commit("u1", "ds1")["data"]["flushed"] is False
+
+
+def test_sessions_are_private_and_stale_writes_conflict(storage):
+    manager = DatasetSessionManager(storage)
+    session = _open(manager)
+
+    assert manager.get("u2", "ds1") is None
+    with pytest.raises(PermissionError):
+        manager.open("u2", "ds1", PATH)
+
+    stale = session.df
+    session.update(stale.head(2), base=stale)
+    with pytest.raises(DatasetSessionConflict):
+        session.update(stale.head(1), base=stale)
+
+
+def test_close_without_commit_discards(storage, original):
+    manager = DatasetSessionManager(storage)
+    session = _open(manager)
+    session.update(session.df.head(1), action="recortar")
+
+    result = manager.close("u1", "ds1", commit=False)
+
+    assert result["data"] == {"dataset_id": "ds1", "flushed": False, "discarded": True}
+    assert storage.saves == []
+    assert manager.get("u1", "ds1") is None
+    pd.testing.assert_frame_equal(storage.objects[PATH], original)
+
+
+def test_flush_due_writes_behind_and_closes_idle_sessions(storage):
+    manager = DatasetSessionManager(storage, idle_timeout_sec=600, write_behind_sec=60)
+    session = _open(manager)
+    session.update(session.df.head(3), action="recortar")
+
+    manager.flush_due()
+    assert storage.saves == []
+
+    session.first_dirty_at -= 61
+    manager.flush_due()
+    assert len(storage.saves) == 1
+    assert manager.get("u1", "ds1") is session
+
+    session.last_access -= 601
+    manager.flush_due()
+    assert manager.get("u1", "ds1") is None
+    assert len(storage.saves) == 1  # No había nada pendiente que volver a guardar
+
+
+# --- Historial de versiones (deshacer / rehacer) ---
+
+@pytest.fixture
+def versioned(storage):
+    manager = DatasetSessionManager(storage, version_store=DatasetVersionStore(storage))
+    session = _open(manager)
+    session.update(session.df.assign(mayor=session.df["edad"] > 40), action="nueva columna")
+    session.update(session.df[session.df["pais"] != "uy"], action="filtrar")
+    manager.commit("u1", "ds1")
+    return manager, session
+
+
+def test_commit_stores_deltas_and_materializes_once(versioned, storage):
+    manager, session = versioned
+
+    assert len(storage.saves) == 1
+    assert session.manifest["head"] == session.manifest["materialized"] == 2
+    assert [v["action"] for v in session.manifest["versions"]] == ["original", "nueva columna", "filtrar"]
+    assert session.manifest["versions"][1]["changed"] == [["mayor", "c0"]]
+
+
+def test_undo_and_redo_move_between_versions(versioned, storage, original):
+    manager, session = versioned
+    after_filter = session.df.copy()
+
+    assert manager.undo("u1", "ds1")["data"]["version"] == 1
+    assert list(session.df.columns) == ["pais", "edad", "mayor"]
+    assert len(session.df) == 4
+
+    manager.undo("u1", "ds1")
+    pd.testing.assert_frame_equal(session.df.reset_index(drop=True), original)
+    assert manager.undo("u1", "ds1")["success"] is False
+
+    manager.redo("u1", "ds1")
+    redone = manager.redo("u1", "ds1")
+    assert redone["data"]["can_redo"] is False
+    pd.testing.assert_frame_equal(session.df.reset_index(drop=True), after_filter.reset_index(drop=True))
+    assert len(storage.saves) == 1  # Moverse en el historial no reescribe el archivo principal
+
+
+def test_discard_after_undo_materializes_the_head(versioned, storage):
+    manager, session = versioned
+    manager.undo("u1", "ds1")
+    session.update(session.df.head(1), action="descartable")
+
+    manager.close("u1", "ds1", commit=False)
+
+    saved = storage.objects[PATH]
+    assert len(saved) == 4
+    assert "mayor" in saved.columns
+    assert len(storage.saves) == 2
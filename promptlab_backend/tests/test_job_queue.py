@@ -0,0 +1,207 @@
+# tests/test_job_queue.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services.job_queue import JobQueue, JobCancelled, report_progress, check_cancelled, bind_current_job
+
+
+# --- Tareas de prueba (a nivel de módulo: RQ las importa por nombre) ---
+
+def add(a, b):
+    report_progress(50, "Sumando")
+    return a + b
+
+
+def explode():
+    raise ValueError("dataset roto")
+
+
+def wait_for(event, started=None):
+    if started is not None:
+        started.set()
+    event.wait(5)
+    return "listo"
+
+
+def loop_until_cancelled(started):
+    started.set()
+    deadline = time.monotonic() + 5
+    step = 0
+    while time.monotonic() < deadline:
+        step += 1
+        report_progress(step % 100, f"Paso {step}")
+        time.sleep(0.01)
+    return "no se canceló"
+
+
+def cancel_inside_pool(started):
+    """Como la búsqueda de hiperparámetros: las pruebas corren en un pool propio."""
+    started.set()
+
+    def trial(i):
+        time.sleep(0.05)
+        check_cancelled()
+        return i
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        return list(pool.map(bind_current_job(trial), range(200)))
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+# --- Backend inline ---
+
+@pytest.fixture
+def inline_queue():
+    return JobQueue(backend="inline")
+
+
+def test_inline_enqueue_status_and_result(inline_queue):
+    job_id = inline_queue.enqueue(add, args=(2, 3), kind="suma", owner="u1")
+
+    job = inline_queue.get(job_id, owner="u1")
+    assert job["status"] == "finished"
+    assert job["result"] == 5
+    assert job["kind"] == "suma"
+    assert job["progress"]["percent"] == 50
+    assert job["progress"]["message"] == "Sumando"
+    assert job["started_at"] and job["ended_at"]
+
+
+def test_inline_failure_keeps_error(inline_queue):
+    job_id = inline_queue.enqueue(explode, kind="falla", owner="u1")
+
+    job = inline_queue.get(job_id, owner="u1")
+    assert job["status"] == "failed"
+    assert job["result"] is None
+    assert "dataset roto" in job["error"]
+
+
+def test_jobs_are_private_to_their_owner(inline_queue):
+    job_id = inline_queue.enqueue(add, args=(1, 1), owner="u1")
+
+    assert inline_queue.get(job_id, owner="u2") is None
+    assert inline_queue.cancel(job_id, owner="u2") == (False, None)
+    assert inline_queue.get("no-existe", owner="u1") is None
+
+
+def test_cancel_finished_job_is_rejected(inline_queue):
+    job_id = inline_queue.enqueue(add, args=(1, 1), owner="u1")
+
+    canceled, job = inline_queue.cancel(job_id, owner="u1")
+    assert canceled is False
+    assert job["status"] == "finished"
+
+
+def test_report_progress_outside_a_job_is_a_noop():
+    report_progress(10, "sin trabajo")
+    check_cancelled()
+    assert bind_current_job(add)(1, 2) == 3
+
+
+# --- Backend de hilos ---
+
+@pytest.fixture
+def thread_queue():
+    return JobQueue(backend="thread")
+
+
+def test_thread_cancel_while_queued(thread_queue):
+    # JOBS_THREAD_WORKERS=2 por defecto: se ocupan ambos hilos para que el tercero espere.
+    release = threading.Event()
+    blockers = [thread_queue.enqueue(wait_for, args=(release,), owner="u1") for _ in range(2)]
+    assert wait_until(lambda: all(thread_queue.get(b)["status"] == "started" for b in blockers))
+
+    job_id = thread_queue.enqueue(add, args=(1, 2), owner="u1")
+    assert thread_queue.get(job_id)["status"] == "queued"
+
+    canceled, _ = thread_queue.cancel(job_id, owner="u1")
+    release.set()
+
+    assert canceled is True
+    assert wait_until(lambda: thread_queue.get(job_id)["status"] == "canceled")
+    assert thread_queue.get(job_id)["result"] is None
+    assert wait_until(lambda: all(thread_queue.get(b)["status"] == "finished" for b in blockers))
+
+
+def test_thread_cancel_while_running_stops_at_next_progress(thread_queue):
+    started = threading.Event()
+    job_id = thread_queue.enqueue(loop_until_cancelled, args=(started,), owner="u1")
+    assert started.wait(5)
+    assert wait_until(lambda: thread_queue.get(job_id)["progress"] is not None)
+
+    canceled, job = thread_queue.cancel(job_id, owner="u1")
+
+    assert canceled is True
+    assert wait_until(lambda: thread_queue.get(job_id)["status"] == "canceled", timeout=2)
+    assert thread_queue.get(job_id)["ended_at"] is not None
+
+
+def test_thread_cancel_reaches_pool_threads(thread_queue):
+    started = threading.Event()
+    job_id = thread_queue.enqueue(cancel_inside_pool, args=(started,), owner="u1")
+    assert started.wait(5)
+
+    thread_queue.cancel(job_id, owner="u1")
+
+    # 200 pruebas de 50 ms en 2 hilos tardarían ~5 s: la cancelación corta antes.
+    assert wait_until(lambda: thread_queue.get(job_id)["status"] == "canceled", timeout=2)
+
+
+def test_thread_result_retention(thread_queue):
+    job_id = thread_queue.enqueue(add, args=(1, 2), owner="u1", result_ttl_sec=0)
+    assert wait_until(lambda: (thread_queue.get(job_id) or {}).get("status") != "started")
+
+    time.sleep(0.01)
+    assert thread_queue.get(job_id) is None
+    assert thread_queue.stats()["backend"] == "thread"
+
+
+def test_job_cancelled_is_not_an_exception():
+    # Los `except Exception` de las tareas no deben tragarse la cancelación.
+    assert not issubclass(JobCancelled, Exception)
+
+
+# --- Backend RQ sobre fakeredis ---
+
+@pytest.fixture
+def rq_queue():
+    pytest.importorskip("rq")
+    pytest.importorskip("fakeredis")
+    queue = JobQueue(backend="rq", redis_url="fakeredis://")
+    assert queue.backend.name == "rq-fakeredis"
+    return queue
+
+
+def test_rq_enqueue_status_and_result(rq_queue):
+    job_id = rq_queue.enqueue(add, args=(20, 22), kind="suma", owner="u1")
+
+    job = rq_queue.get(job_id, owner="u1")
+    assert job["status"] == "finished"
+    assert job["result"] == 42
+    assert job["kind"] == "suma"
+    assert job["progress"]["percent"] == 50
+    assert rq_queue.get(job_id, owner="u2") is None
+
+
+def test_rq_failure_and_cancel(rq_queue):
+    failed_id = rq_queue.enqueue(explode, kind="falla", owner="u1")
+    failed = rq_queue.get(failed_id, owner="u1")
+    assert failed["status"] == "failed"
+    assert "dataset roto" in failed["error"]
+
+    done_id = rq_queue.enqueue(add, args=(1, 1), owner="u1")
+    canceled, job = rq_queue.cancel(done_id, owner="u1")
+    assert canceled is False
+    assert job["status"] == "finished"
+    assert rq_queue.stats()["jobs"]["finished"] >= 1
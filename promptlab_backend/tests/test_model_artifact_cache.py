@@ -0,0 +1,105 @@
+# tests/test_model_artifact_cache.py
+from io import BytesIO
+
+import joblib
+import pytest
+
+from services import model_artifact_cache as mac
+from services.model_artifact_cache import ModelArtifactCache
+
+
+def serialize(artifacts):
+    buffer = BytesIO()
+    joblib.dump(artifacts, buffer)
+    return buffer.getvalue()
+
+
+class Fetcher:
+    def __init__(self, artifacts):
+        self.data = serialize(artifacts)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.data
+
+
+def test_loads_once_per_version():
+    cache = ModelArtifactCache(max_bytes=10 * 1024 * 1024, ttl_sec=60)
+    fetch = Fetcher({"training_features": ["edad"]})
+
+    first = cache.get_or_load("m1", "v1", fetch)
+    again = cache.get_or_load("m1", "v1", fetch)
+
+    assert first is again
+    assert fetch.calls == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_new_version_reloads_and_drops_the_old_one():
+    cache = ModelArtifactCache(max_bytes=10 * 1024 * 1024, ttl_sec=60)
+    cache.get_or_load("m1", "v1", Fetcher({"v": 1}))
+
+    fresh = cache.get_or_load("m1", "v2", Fetcher({"v": 2}))
+
+    assert fresh == {"v": 2}
+    assert cache.get("m1", "v1") is None
+    assert cache.stats()["entries"] == 1
+
+
+def test_without_version_nothing_is_cached():
+    cache = ModelArtifactCache(max_bytes=10 * 1024 * 1024, ttl_sec=60)
+    fetch = Fetcher({"v": 1})
+
+    cache.get_or_load("m1", None, fetch)
+    cache.get_or_load("m1", None, fetch)
+
+    assert fetch.calls == 2
+    assert cache.stats()["entries"] == 0
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(mac.time, "monotonic", lambda: now[0])
+    cache = ModelArtifactCache(max_bytes=10 * 1024 * 1024, ttl_sec=60)
+    fetch = Fetcher({"v": 1})
+    cache.get_or_load("m1", "v1", fetch)
+
+    now[0] += 59
+    assert cache.get("m1", "v1") is not None
+    now[0] += 2
+    assert cache.get("m1", "v1") is None
+
+    cache.get_or_load("m1", "v1", fetch)
+    assert fetch.calls == 2
+
+
+def test_memory_budget_evicts_least_recently_used():
+    size = len(serialize({"v": 0}))
+    cache = ModelArtifactCache(max_bytes=size * 2, ttl_sec=60)
+    for model_id in ("a", "b"):
+        cache.get_or_load(model_id, "v1", Fetcher({"v": 0}))
+    cache.get("a", "v1")  # "b" pasa a ser el menos usado
+
+    cache.get_or_load("c", "v1", Fetcher({"v": 0}))
+
+    assert cache.get("b", "v1") is None
+    assert cache.get("a", "v1") is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["size_bytes"] <= cache.max_bytes
+
+
+def test_model_larger_than_budget_is_served_but_not_cached():
+    cache = ModelArtifactCache(max_bytes=10, ttl_sec=60)
+
+    assert cache.get_or_load("m1", "v1", Fetcher({"v": "grande"})) == {"v": "grande"}
+    assert cache.stats()["entries"] == 0
+
+
+def test_invalidate_and_missing_download():
+    cache = ModelArtifactCache(max_bytes=10 * 1024 * 1024, ttl_sec=60)
+    cache.get_or_load("m1", "v1", Fetcher({"v": 1}))
+
+    assert cache.invalidate("m1") == 1
+    assert cache.get("m1", "v1") is None
+    assert cache.get_or_load("m2", "v1", lambda: None) is None
@@ -0,0 +1,43 @@
+# tests/test_predict_rows.py
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+pytest.importorskip("sklearn")
+backend_predictivo = pytest.importorskip("services.backend_predictivo")
+
+
+@pytest.fixture(scope="module")
+def service():
+    return backend_predictivo.PredictionService()
+
+
+@pytest.fixture(scope="module")
+def artifacts(service):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "edad": rng.integers(18, 80, 120),
+        "pais": rng.choice(["ar", "uy", "cl"], 120),
+        "compra": rng.choice(["si", "no"], 120),
+    })
+    result = service.train_model(
+        df=df, target_col="compra", model_name="Random Forest", encoding_strategies={},
+        use_smote=False, use_cv=False, problem_type="clasificacion",
+    )
+    assert result["success"], result.get("error")
+    return result["data"]["artifacts"]
+
+
+def test_missing_features_lists_absent_training_columns(service, artifacts):
+    assert service.missing_features(artifacts, {"edad": 30, "pais": "ar"}) == []
+    assert service.missing_features(artifacts, {"edad": 30}) == ["pais"]
+
+
+def test_batch_matches_single_predictions(service, artifacts):
+    rows = [{"edad": 30, "pais": "ar"}, {"pais": "cl", "edad": 61}, {"edad": 45, "pais": "uy", "extra": 1}]
+
+    batch = service.predict_rows(artifacts, rows)
+    singles = [service.make_prediction(artifacts, row)["prediction_data"]["prediction"] for row in rows]
+
+    assert batch["success"]
+    assert batch["data"] == singles
@@ -0,0 +1,90 @@
+# tests/test_prediction_batcher.py
+import threading
+
+from services.prediction_batcher import PredictionBatcher
+
+
+class FakeModel:
+    def __init__(self, fail_batches=False):
+        self.fail_batches = fail_batches
+        self.batches = []
+        self.singles = 0
+        self._lock = threading.Lock()
+
+    def predict_many(self, model, rows):
+        with self._lock:
+            self.batches.append(len(rows))
+        if self.fail_batches:
+            return {"success": False, "error": "lote inválido"}
+        return {"success": True, "data": [row["x"] * model for row in rows]}
+
+    def predict_one(self, model, row):
+        with self._lock:
+            self.singles += 1
+        if row["x"] < 0:
+            return {"success": False, "error": "fila inválida"}
+        return {"success": True, "prediction_data": {"prediction": row["x"] * model}}
+
+
+def run_concurrently(batcher, requests):
+    """Lanza las peticiones (clave, modelo, fila) a la vez y devuelve los resultados en orden."""
+    results = [None] * len(requests)
+    barrier = threading.Barrier(len(requests))
+
+    def call(i, key, model, row):
+        barrier.wait()
+        results[i] = batcher.predict(key, model, row)
+
+    threads = [threading.Thread(target=call, args=(i, *req)) for i, req in enumerate(requests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_concurrent_rows_share_one_call():
+    fake = FakeModel()
+    batcher = PredictionBatcher(fake.predict_many, fake.predict_one, max_batch_size=4, window_ms=2000, enabled=True)
+
+    results = run_concurrently(batcher, [("m1", 10, {"x": i}) for i in range(4)])
+
+    assert fake.batches == [4]
+    assert [r["prediction_data"]["prediction"] for r in results] == [0, 10, 20, 30]
+    assert all(r["batching"]["batch_size"] == 4 for r in results)
+    assert batcher.stats()["avg_batch_size"] == 4
+
+
+def test_rows_for_different_keys_are_not_mixed():
+    fake = FakeModel()
+    batcher = PredictionBatcher(fake.predict_many, fake.predict_one, max_batch_size=2, window_ms=2000, enabled=True)
+
+    results = run_concurrently(batcher, [
+        ("m1", 1, {"x": 1}), ("m2", 100, {"x": 1}), ("m1", 1, {"x": 2}), ("m2", 100, {"x": 2}),
+    ])
+
+    assert sorted(fake.batches) == [2, 2]
+    assert [r["prediction_data"]["prediction"] for r in results] == [1, 100, 2, 200]
+
+
+def test_failed_batch_falls_back_to_single_rows():
+    fake = FakeModel(fail_batches=True)
+    batcher = PredictionBatcher(fake.predict_many, fake.predict_one, max_batch_size=2, window_ms=2000, enabled=True)
+
+    ok, bad = run_concurrently(batcher, [("m1", 1, {"x": 5}), ("m1", 1, {"x": -1})])
+
+    assert fake.singles == 2
+    assert ok["prediction_data"]["prediction"] == 5
+    assert bad["success"] is False and bad["error"] == "fila inválida"
+    assert bad["batching"]["batch_size"] == 2
+    assert batcher.stats()["fallbacks"] == 1
+
+
+def test_disabled_batcher_predicts_directly():
+    fake = FakeModel()
+    batcher = PredictionBatcher(fake.predict_many, fake.predict_one, enabled=False)
+
+    result = batcher.predict("m1", 3, {"x": 2})
+
+    assert result == {"success": True, "prediction_data": {"prediction": 6}}
+    assert fake.batches == []
@@ -0,0 +1,108 @@
+# tests/test_signed_url_cache.py
+import pytest
+
+pytest.importorskip("httpx")
+
+from utils import storage_transport as st
+from utils.storage_transport import SignedUrlCache, StorageTransport
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(st.time, "time", fake.time)
+    return fake
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    transport = StorageTransport(base_url="https://example.supabase.co", service_key="clave", local_root="")
+    transport.signed_urls_cache = SignedUrlCache(margin_sec=120)
+    transport.signed = []
+
+    def fake_create(bucket, paths, expires_in):
+        transport.signed.append((tuple(paths), expires_in))
+        return [{"path": p, "signedURL": f"https://firmada/{p}?v={len(transport.signed)}", "error": None} for p in paths]
+
+    monkeypatch.setattr(transport, "create_signed_urls", fake_create)
+    monkeypatch.setattr(st, "SIGNED_URL_MIN_LIFETIME_SEC", 300)
+    return transport
+
+
+def test_cache_reuses_until_shortly_before_expiry(clock):
+    cache = SignedUrlCache(margin_sec=120)
+    cache.put("b", "a.png", 3600, "url-1", clock.now + 3600)
+
+    clock.now += 3000
+    assert cache.get("b", "a.png", 3600) == "url-1"
+
+    clock.now += 500  # quedan 100 s < margen
+    assert cache.get("b", "a.png", 3600) is None
+
+
+def test_cache_is_keyed_by_requested_lifetime(clock):
+    cache = SignedUrlCache(margin_sec=120)
+    cache.put("b", "a.png", 600, "url-corta", clock.now + 600)
+
+    assert cache.get("b", "a.png", 3600) is None
+    assert cache.get("b", "a.png", 600) == "url-corta"
+
+
+def test_invalidate_drops_every_lifetime(clock):
+    cache = SignedUrlCache(margin_sec=120)
+    cache.put("b", "a.png", 600, "u1", clock.now + 600)
+    cache.put("b", "a.png", 3600, "u2", clock.now + 3600)
+    cache.put("b", "otra.png", 3600, "u3", clock.now + 3600)
+
+    cache.invalidate("b", ["a.png"])
+
+    assert cache.get("b", "a.png", 600) is None
+    assert cache.get("b", "a.png", 3600) is None
+    assert cache.get("b", "otra.png", 3600) == "u3"
+
+
+def test_lru_bound(clock):
+    cache = SignedUrlCache(max_entries=2, margin_sec=0)
+    for name in ("a", "b", "c"):
+        cache.put("b", name, 60, name, clock.now + 60)
+
+    assert cache.get("b", "a", 60) is None
+    assert cache.stats()["entries"] == 2
+
+
+def test_signed_urls_reuses_for_most_of_the_lifetime(transport, clock):
+    first = transport.signed_urls("bucket", ["a.png", "b.png"], 3600)
+    assert len(transport.signed) == 1
+
+    clock.now += 3000  # quedan 600 s: más que el mínimo de 300
+    again = transport.signed_urls("bucket", ["a.png", "b.png"], 3600)
+    assert again == first
+    assert len(transport.signed) == 1
+
+    clock.now += 400  # quedan 200 s: se vuelve a firmar
+    renewed = transport.signed_urls("bucket", ["a.png"], 3600)
+    assert renewed["a.png"] != first["a.png"]
+    assert transport.signed[-1] == (("a.png",), 3600)
+
+
+def test_signed_urls_signs_only_missing_paths(transport, clock):
+    transport.signed_urls("bucket", ["a.png"], 3600)
+    transport.signed_urls("bucket", ["a.png", "nueva.png", "nueva.png"], 3600)
+
+    assert transport.signed[-1] == (("nueva.png",), 3600)
+
+
+def test_short_lifetime_is_still_reused(transport, clock):
+    transport.signed_urls("bucket", ["a.png"], 400)
+    clock.now += 30  # quedan 370 s > max(margen 120, 400 // 2)
+    transport.signed_urls("bucket", ["a.png"], 400)
+
+    assert len(transport.signed) == 1
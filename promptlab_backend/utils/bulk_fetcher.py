@@ -0,0 +1,139 @@
+# utils/bulk_fetcher.py
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional, List, Iterable, Iterator, Callable, Any
+
+from utils.storage_transport import get_storage_transport
+
+
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# DESCARGA CONCURRENTE DE OBJETOS DE STORAGE
+# ==============================================================================
+# Descargar imágenes una por una deja al proceso esperando la red casi todo el
+# tiempo. BulkFetcher baja varias a la vez (hasta BULK_FETCH_CONCURRENCY) y las
+# entrega a medida que terminan, así quien consume (decodificar, inferir, guardar
+# en disco) trabaja mientras siguen llegando las demás. Nunca hay más de
+# 2 × concurrencia descargas pendientes: si el consumidor es lento, la red espera
+# en lugar de acumular bytes en memoria.
+
+BULK_FETCH_CONCURRENCY = int(os.getenv("BULK_FETCH_CONCURRENCY", 8))
+BULK_FETCH_TIMEOUT_SEC = float(os.getenv("BULK_FETCH_TIMEOUT_SEC", 30))
+
+_POLL_SEC = 0.25
+
+
+class FetchResult:
+    """Resultado de una descarga: `data` si salió bien, `error` (texto) si no."""
+
+    __slots__ = ("index", "path", "data", "error", "elapsed_ms")
+
+    def __init__(self, index: int, path: str, data: Optional[bytes] = None,
+                 error: Optional[str] = None, elapsed_ms: float = 0.0):
+        self.index = index
+        self.path = path
+        self.data = data
+        self.error = error
+        self.elapsed_ms = elapsed_ms
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def as_failure(self) -> dict:
+        return {"storage_path": self.path, "error": self.error}
+
+
+class BulkFetcher:
+    """
+    Descarga una lista de rutas con concurrencia acotada y timeout por ítem.
+
+    `fetch_fn(path, timeout)` devuelve los bytes; por defecto descarga del bucket
+    indicado con el transporte de Storage compartido. Un ítem que supera el timeout
+    se informa como fallido y no frena al resto.
+    """
+
+    def __init__(
+        self,
+        bucket: str = "visuales",
+        max_concurrency: Optional[int] = None,
+        timeout: Optional[float] = None,
+        fetch_fn: Optional[Callable[[str, float], Optional[bytes]]] = None,
+    ):
+        self.max_concurrency = max(1, max_concurrency or BULK_FETCH_CONCURRENCY)
+        self.timeout = timeout or BULK_FETCH_TIMEOUT_SEC
+        self._fetch_fn = fetch_fn or (
+            lambda path, timeout: get_storage_transport().from_(bucket).download(path, timeout=timeout)
+        )
+
+    def _fetch_one(self, index: int, path: str, started: dict) -> FetchResult:
+        started[index] = time.monotonic()
+        try:
+            data = self._fetch_fn(path, self.timeout)
+            if not data:
+                return FetchResult(index, path, error="Archivo vacío o inexistente.", elapsed_ms=self._elapsed(started[index]))
+            return FetchResult(index, path, data=data, elapsed_ms=self._elapsed(started[index]))
+        except Exception as e:
+            return FetchResult(index, path, error=str(e) or type(e).__name__, elapsed_ms=self._elapsed(started[index]))
+
+    @staticmethod
+    def _elapsed(start: float) -> float:
+        return round((time.monotonic() - start) * 1000, 1)
+
+    def iter_fetch(self, paths: Iterable[str]) -> Iterator[FetchResult]:
+        """
+        Genera un FetchResult por ruta en orden de llegada (no en el de `paths`);
+        `result.index` indica la posición original. Si quien consume corta la
+        iteración, las descargas pendientes se cancelan.
+        """
+        items = list(enumerate(paths))
+        if not items:
+            return
+        queue = iter(items)
+        started: dict = {}
+        pending: dict = {}
+        pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="bulk-fetch")
+
+        def submit_next() -> None:
+            for index, path in queue:
+                pending[pool.submit(self._fetch_one, index, path, started)] = (index, path)
+                return
+
+        try:
+            for _ in range(2 * self.max_concurrency):
+                submit_next()
+
+            while pending:
+                done, _ = wait(pending, timeout=_POLL_SEC, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.pop(future)
+                    submit_next()
+                    yield future.result()
+
+                # Timeout por ítem, contado desde que empezó su descarga (no desde que se encoló).
+                now = time.monotonic()
+                for future, (index, path) in list(pending.items()):
+                    start = started.get(index)
+                    if start is not None and now - start > self.timeout and not future.done():
+                        pending.pop(future)
+                        future.cancel()
+                        submit_next()
+                        yield FetchResult(index, path, error=f"Timeout de {self.timeout:g}s.", elapsed_ms=self._elapsed(start))
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def fetch_all(self, paths: Iterable[str]) -> List[FetchResult]:
+        """Todas las descargas, en el mismo orden que `paths`."""
+        results = sorted(self.iter_fetch(paths), key=lambda r: r.index)
+        failed = [r for r in results if not r.ok]
+        if failed:
+            logger.warning(f"⚠️ Descarga en lote: {len(failed)} de {len(results)} rutas fallaron.")
+        return results
+
+
+def fetch_visuals(paths: Iterable[str], **kwargs: Any) -> Iterator[FetchResult]:
+    """Atajo: descarga concurrente desde el bucket de imágenes ('visuales')."""
+    return BulkFetcher(bucket="visuales", **kwargs).iter_fetch(paths)
@@ -0,0 +1,296 @@
+# utils/dataframe_cache.py
+import os
+import glob
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List
+
+import pandas as pd
+import pyarrow.dataset as pa_ds
+import pyarrow.parquet as pq
+
+from services import arrow_backend as ab
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "promptlab_df_cache")
+DEFAULT_CACHE_MAX_MB = 2048
+
+# Filas por row group al escribir Parquet: grupos chicos permiten descartar más con las
+# estadísticas min/max, grupos grandes comprimen mejor. ~100k filas es un buen equilibrio.
+PARQUET_ROW_GROUP_SIZE = int(os.getenv("PARQUET_ROW_GROUP_SIZE", 100_000))
+
+FILTER_OPS = {"=", "==", "!=", "<", "<=", ">", ">=", "in", "not in"}
+
+
+# ==============================================================================
+# LECTURA PARCIAL (proyección de columnas + filtros sobre row groups)
+# ==============================================================================
+
+def normalize_filters(raw) -> Optional[List]:
+    """
+    Valida filtros en el formato DNF de pyarrow: una lista de condiciones
+    `[columna, operador, valor]` (AND) o una lista de listas de ellas (OR de ANDs).
+    Lanza ValueError si el formato u operador no es válido.
+    """
+    if not raw:
+        return None
+    if not isinstance(raw, (list, tuple)):
+        raise ValueError("Los filtros deben ser una lista de condiciones [columna, operador, valor].")
+
+    def _condition(item):
+        if not isinstance(item, (list, tuple)) or len(item) != 3:
+            raise ValueError(f"Condición de filtro inválida: {item!r}")
+        column, op, value = item
+        op = str(op).lower()
+        if op not in FILTER_OPS:
+            raise ValueError(f"Operador de filtro no soportado: '{op}'")
+        if op in ("in", "not in") and not isinstance(value, (list, tuple, set)):
+            raise ValueError(f"El operador '{op}' necesita una lista de valores.")
+        return (column, "==" if op == "=" else op, list(value) if op in ("in", "not in") else value)
+
+    if all(isinstance(item, (list, tuple)) and item and isinstance(item[0], (list, tuple)) for item in raw):
+        return [[_condition(c) for c in group] for group in raw]
+    return [_condition(c) for c in raw]
+
+
+def _existing_columns(columns: Optional[List[str]], names: List[str]) -> Optional[List[str]]:
+    # Las columnas que no existen se omiten: quien llama valida y responde su propio error.
+    if columns is None:
+        return None
+    return [c for c in dict.fromkeys(columns) if c in names]
+
+
+def read_parquet_subset(source, columns: Optional[List[str]] = None, filters: Optional[List] = None) -> pd.DataFrame:
+    """
+    Lee de un Parquet solo `columns` y solo los row groups que pueden cumplir `filters`.
+    `source` es una ruta local (se usa un pyarrow dataset) o un archivo abierto, por
+    ejemplo una lectura HTTP por rangos, donde solo viajan el footer y los bloques pedidos.
+    """
+    if isinstance(source, str):
+        dataset = pa_ds.dataset(source, format="parquet")
+        expression = pq.filters_to_expression(filters) if filters else None
+        table = dataset.to_table(columns=_existing_columns(columns, dataset.schema.names), filter=expression)
+    else:
+        names = pq.read_schema(source).names
+        source.seek(0)
+        table = pq.read_table(source, columns=_existing_columns(columns, names), filters=filters or None)
+    return ab.table_to_pandas(table)
+
+
+def apply_filters_in_memory(df: pd.DataFrame, columns: Optional[List[str]] = None, filters: Optional[List] = None) -> pd.DataFrame:
+    """
+    Misma semántica que read_parquet_subset para un DataFrame ya cargado (p. ej. CSV).
+    Lanza ValueError si un filtro usa una columna que no existe.
+    """
+    if filters:
+        groups = filters if isinstance(filters[0], list) else [filters]
+        unknown = [c for group in groups for c, _, _ in group if c not in df.columns]
+        if unknown:
+            raise ValueError(f"Columnas de filtro inexistentes: {list(dict.fromkeys(unknown))}")
+        mask = pd.Series(False, index=df.index)
+        for group in groups:
+            group_mask = pd.Series(True, index=df.index)
+            for column, op, value in group:
+                series = df[column]
+                if op == "==":
+                    cond = series == value
+                elif op == "!=":
+                    cond = series != value
+                elif op == "<":
+                    cond = series < value
+                elif op == "<=":
+                    cond = series <= value
+                elif op == ">":
+                    cond = series > value
+                elif op == ">=":
+                    cond = series >= value
+                elif op == "in":
+                    cond = series.isin(value)
+                else:
+                    cond = ~series.isin(value)
+                group_mask &= cond.fillna(False)
+            mask |= group_mask
+        df = df[mask]
+    if columns is not None:
+        df = df[_existing_columns(columns, list(df.columns))]
+    return df
+
+
+def _hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+class DataFrameCache:
+    """
+    Caché local en disco de DataFrames descargados desde Storage.
+
+    - Cada entrada se guarda como Parquet y se direcciona por contenido:
+      el nombre del archivo es `<hash(ruta)>_<hash(versión)>.parquet`, así que
+      una nueva versión del objeto en Storage nunca colisiona con la anterior.
+    - El tamaño total está acotado (`max_bytes`) y se desaloja por LRU.
+    - Es thread-safe: los endpoints de Flask comparten una única instancia.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.cache_dir = cache_dir or os.getenv("DF_CACHE_DIR", DEFAULT_CACHE_DIR)
+        if max_bytes is None:
+            max_bytes = int(os.getenv("DF_CACHE_MAX_MB", DEFAULT_CACHE_MAX_MB)) * 1024 * 1024
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # archivo -> bytes (orden LRU)
+        self._total_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_existing_entries()
+
+    # ------------------------------------------------------------------
+    # Helpers internos
+    # ------------------------------------------------------------------
+    def _load_existing_entries(self) -> None:
+        """Reconstruye el índice LRU a partir de los archivos que ya hay en disco."""
+        files = glob.glob(os.path.join(self.cache_dir, "*.parquet"))
+        files.sort(key=lambda f: os.path.getmtime(f))
+        for file_path in files:
+            size = os.path.getsize(file_path)
+            self._entries[file_path] = size
+            self._total_bytes += size
+        self._evict_if_needed()
+
+    def _file_for(self, path: str, version: str) -> str:
+        return os.path.join(self.cache_dir, f"{_hash_text(path)}_{_hash_text(version)}.parquet")
+
+    def _evict_if_needed(self) -> None:
+        # Se llama con el lock tomado (o durante __init__).
+        while self._total_bytes > self.max_bytes and self._entries:
+            file_path, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self._evictions += 1
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+            logger.info(f"🧹 Caché de DataFrames: desalojado {os.path.basename(file_path)} ({size} bytes)")
+
+    def _forget(self, file_path: str) -> None:
+        size = self._entries.pop(file_path, None)
+        if size is not None:
+            self._total_bytes -= size
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+    def get(
+        self,
+        path: str,
+        version: Optional[str],
+        columns: Optional[List[str]] = None,
+        filters: Optional[List] = None,
+    ) -> Optional[pd.DataFrame]:
+        """
+        Devuelve el DataFrame cacheado para (ruta, versión) o None si no está.
+        Sin versión no hay forma segura de validar la entrada, así que cuenta como fallo.
+        Con `columns` / `filters` solo se leen esas columnas y los row groups necesarios.
+        """
+        if not version:
+            with self._lock:
+                self._misses += 1
+            return None
+
+        file_path = self._file_for(path, version)
+        with self._lock:
+            if file_path not in self._entries:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(file_path)
+            self._hits += 1
+
+        try:
+            if columns is None and not filters:
+                df = ab.table_to_pandas(pq.read_table(file_path))
+            else:
+                df = read_parquet_subset(file_path, columns=columns, filters=filters)
+            os.utime(file_path, None)  # mantiene el orden LRU entre reinicios
+            return df
+        except Exception as e:
+            logger.warning(f"⚠️ Entrada de caché ilegible para '{path}', se descarta: {e}")
+            with self._lock:
+                self._forget(file_path)
+                self._hits -= 1
+                self._misses += 1
+            return None
+
+    def put(self, path: str, version: Optional[str], df: pd.DataFrame) -> bool:
+        """
+        Guarda el DataFrame en la caché. Devuelve False si no se pudo serializar
+        (por ejemplo columnas con tipos mixtos que Parquet no acepta).
+        """
+        if not version or df is None:
+            return False
+
+        file_path = self._file_for(path, version)
+        tmp_path = f"{file_path}.{threading.get_ident()}.tmp"
+        try:
+            df.to_parquet(tmp_path, index=False, engine="pyarrow", row_group_size=PARQUET_ROW_GROUP_SIZE)
+            os.replace(tmp_path, file_path)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo cachear '{path}' como Parquet: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+        size = os.path.getsize(file_path)
+        with self._lock:
+            # Las versiones anteriores de la misma ruta ya no sirven.
+            prefix = os.path.join(self.cache_dir, f"{_hash_text(path)}_")
+            for stale in [f for f in self._entries if f.startswith(prefix) and f != file_path]:
+                self._forget(stale)
+
+            previous = self._entries.pop(file_path, None)
+            if previous is not None:
+                self._total_bytes -= previous
+            self._entries[file_path] = size
+            self._total_bytes += size
+            self._evict_if_needed()
+        return True
+
+    def invalidate(self, path: str) -> int:
+        """Elimina todas las versiones cacheadas de una ruta. Devuelve cuántas se borraron."""
+        prefix = os.path.join(self.cache_dir, f"{_hash_text(path)}_")
+        with self._lock:
+            stale = [f for f in self._entries if f.startswith(prefix)]
+            for file_path in stale:
+                self._forget(file_path)
+        if stale:
+            logger.info(f"🗑️ Caché de DataFrames invalidada para '{path}' ({len(stale)} entradas)")
+        return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            for file_path in list(self._entries):
+                self._forget(file_path)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "entries": len(self._entries),
+                "size_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
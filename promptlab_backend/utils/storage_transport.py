@@ -0,0 +1,568 @@
+# utils/storage_transport.py
+import os
+import io
+import mmap
+import time
+import random
+import shutil
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Union, BinaryIO, Callable
+from urllib.parse import quote
+
+import httpx
+from dotenv import load_dotenv
+
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# TRANSPORTE HTTP COMPARTIDO PARA SUPABASE STORAGE
+# ==============================================================================
+# Un único cliente httpx con pool de conexiones keep-alive (y HTTP/2 si está `h2`)
+# para todas las lecturas y escrituras de Storage, con reintentos con backoff y
+# timeouts. Los cuerpos grandes se descargan en streaming a un archivo temporal
+# (en memoria hasta STORAGE_SPOOL_MAX_MB) o a un mmap, y se suben en bloques desde
+# el archivo abierto, sin armar nunca el contenido completo en un `bytes`.
+#
+# Con STORAGE_LOCAL_ROOT=/ruta los buckets son carpetas locales
+# (<raíz>/<bucket>/<ruta>): sirve para desarrollo y pruebas sin conexión.
+#
+# `from_(bucket)` expone la misma forma que `client.storage.from_(bucket)` de
+# supabase-py (download, upload, update, remove, list, copy, create_signed_url,
+# get_public_url), así que reemplazarlo no cambia a quien lo llama.
+
+STORAGE_HTTP2 = os.getenv("STORAGE_HTTP2", "true").lower() == "true"
+STORAGE_POOL_SIZE = int(os.getenv("STORAGE_POOL_SIZE", 20))
+STORAGE_MAX_RETRIES = int(os.getenv("STORAGE_MAX_RETRIES", 3))
+STORAGE_BACKOFF_SEC = float(os.getenv("STORAGE_BACKOFF_SEC", 0.5))
+STORAGE_CONNECT_TIMEOUT = float(os.getenv("STORAGE_CONNECT_TIMEOUT", 5))
+STORAGE_READ_TIMEOUT = float(os.getenv("STORAGE_READ_TIMEOUT", 60))
+STORAGE_SPOOL_MAX_MB = int(os.getenv("STORAGE_SPOOL_MAX_MB", 32))
+STORAGE_LOCAL_ROOT = os.getenv("STORAGE_LOCAL_ROOT") or None
+# Una URL firmada cacheada se reutiliza hasta que le quedan menos de estos segundos.
+SIGNED_URL_REFRESH_MARGIN_SEC = int(os.getenv("SIGNED_URL_REFRESH_MARGIN_SEC", 120))
+SIGNED_URL_CACHE_MAX = int(os.getenv("SIGNED_URL_CACHE_MAX", 20000))
+# Vigencia mínima que se garantiza al reutilizar una URL (acotada a la mitad de la pedida).
+SIGNED_URL_MIN_LIFETIME_SEC = int(os.getenv("SIGNED_URL_MIN_LIFETIME_SEC", 300))
+SIGN_BATCH_SIZE = 1000
+
+STREAM_CHUNK_BYTES = 1024 * 1024
+RETRY_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+class StorageError(Exception):
+    """Error de Storage con el código HTTP (404 si el objeto no existe)."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _iter_file(fh: BinaryIO) -> Any:
+    while True:
+        chunk = fh.read(STREAM_CHUNK_BYTES)
+        if not chunk:
+            break
+        yield chunk
+
+
+def _body_size(fh: BinaryIO) -> Optional[int]:
+    try:
+        start = fh.tell()
+        fh.seek(0, os.SEEK_END)
+        size = fh.tell() - start
+        fh.seek(start)
+        return size
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def _as_mmap(fh: BinaryIO) -> Union[mmap.mmap, io.BytesIO]:
+    # Un archivo vacío no se puede mapear.
+    if _body_size(fh) == 0:
+        fh.close()
+        return io.BytesIO(b"")
+    mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    fh.close()  # el mapeo conserva su propio descriptor
+    return mapped
+
+
+class SignedUrlCache:
+    """
+    URLs firmadas por (bucket, ruta, vigencia pedida) con su vencimiento. Una entrada
+    sirve mientras le queden más de `margin_sec` segundos (y, si se pide, más de
+    `min_remaining_sec`). Como la vigencia es parte de la clave, un pedido de 3600 s
+    nunca recibe una URL firmada por 600 s. El tamaño está acotado y se desaloja por LRU.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, margin_sec: Optional[int] = None):
+        self.max_entries = max_entries or SIGNED_URL_CACHE_MAX
+        self.margin_sec = SIGNED_URL_REFRESH_MARGIN_SEC if margin_sec is None else margin_sec
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()  # (bucket, ruta, vigencia) -> (url, vence)
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, bucket: str, path: str, expires_in: int, min_remaining_sec: float = 0) -> Optional[str]:
+        key = (bucket, path, int(expires_in))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] - time.time() <= max(self.margin_sec, min_remaining_sec):
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, bucket: str, path: str, expires_in: int, url: str, expires_at: float) -> None:
+        key = (bucket, path, int(expires_in))
+        with self._lock:
+            self._entries[key] = (url, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, bucket: str, paths: List[str]) -> None:
+        targets = set(paths)
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == bucket and k[1] in targets]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+class StorageTransport:
+    """Cliente de Storage con pool de conexiones, reintentos y descargas en streaming."""
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        service_key: Optional[str] = None,
+        local_root: Optional[str] = None,
+        http2: Optional[bool] = None,
+    ):
+        self.base_url = (base_url or os.getenv("SUPABASE_URL") or "").rstrip("/")
+        self.service_key = service_key or os.getenv("SUPABASE_SERVICE_KEY")
+        self.local_root = local_root if local_root is not None else STORAGE_LOCAL_ROOT
+        self.http2 = STORAGE_HTTP2 if http2 is None else http2
+        self._client: Optional[httpx.Client] = None
+        self._client_lock = threading.Lock()
+        self._retries = 0
+        self.signed_urls_cache = SignedUrlCache()
+        if self.is_local:
+            logger.info(f"🗂️ Storage local activo en '{self.local_root}' (sin red).")
+        elif not self.base_url or not self.service_key:
+            raise ValueError("Configuración de Supabase incompleta.")
+
+    @property
+    def is_local(self) -> bool:
+        return bool(self.local_root)
+
+    def from_(self, bucket: str) -> "BucketTransport":
+        return BucketTransport(self, bucket)
+
+    # ------------------------------------------------------------------
+    # Cliente HTTP y reintentos
+    # ------------------------------------------------------------------
+    def _http(self) -> httpx.Client:
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._build_client()
+        return self._client
+
+    def _build_client(self) -> httpx.Client:
+        kwargs = dict(
+            base_url=f"{self.base_url}/storage/v1",
+            headers={"Authorization": f"Bearer {self.service_key}", "apikey": self.service_key},
+            limits=httpx.Limits(max_connections=STORAGE_POOL_SIZE, max_keepalive_connections=STORAGE_POOL_SIZE),
+            timeout=httpx.Timeout(STORAGE_READ_TIMEOUT, connect=STORAGE_CONNECT_TIMEOUT),
+        )
+        try:
+            return httpx.Client(http2=self.http2, **kwargs)
+        except ImportError:
+            logger.warning("⚠️ Paquete 'h2' no disponible: Storage usará HTTP/1.1 con keep-alive.")
+            return httpx.Client(**kwargs)
+
+    def _sleep_before_retry(self, attempt: int) -> None:
+        self._retries += 1
+        time.sleep(STORAGE_BACKOFF_SEC * (2 ** attempt) * (0.5 + random.random() / 2))
+
+    def _request(
+        self,
+        method: str,
+        url: str,
+        body_factory: Optional[Callable[[], Any]] = None,
+        **kwargs,
+    ) -> httpx.Response:
+        """
+        Petición con reintentos ante errores de red y respuestas 408/429/5xx.
+        `body_factory` arma el cuerpo en cada intento (un archivo se rebobina y se
+        vuelve a leer en bloques).
+        """
+        attempts = STORAGE_MAX_RETRIES + 1
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            try:
+                if body_factory is not None:
+                    kwargs["content"] = body_factory()
+                response = self._http().request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                if last:
+                    raise StorageError(f"Storage no respondió ({method} {url}): {e}") from e
+                logger.warning(f"⚠️ Storage: error de red en {method} {url} ({e}); reintento {attempt + 1}.")
+                self._sleep_before_retry(attempt)
+                continue
+            if response.status_code in RETRY_STATUS and not last:
+                logger.warning(f"⚠️ Storage respondió {response.status_code} en {method} {url}; reintento {attempt + 1}.")
+                self._sleep_before_retry(attempt)
+                continue
+            if response.status_code >= 400:
+                raise StorageError(
+                    f"Storage respondió {response.status_code} en {method} {url}: {response.text[:300]}",
+                    status_code=response.status_code,
+                )
+            return response
+
+    def _stream_to(self, url: str, out: BinaryIO) -> None:
+        """GET en streaming hacia `out`; si se corta a mitad, se reintenta desde cero."""
+        for attempt in range(STORAGE_MAX_RETRIES + 1):
+            last = attempt == STORAGE_MAX_RETRIES
+            out.seek(0)
+            out.truncate()
+            try:
+                with self._http().stream("GET", url) as response:
+                    if response.status_code in RETRY_STATUS and not last:
+                        logger.warning(f"⚠️ Storage respondió {response.status_code} en GET {url}; reintento {attempt + 1}.")
+                        self._sleep_before_retry(attempt)
+                        continue
+                    if response.status_code >= 400:
+                        response.read()
+                        raise StorageError(
+                            f"Storage respondió {response.status_code} en GET {url}: {response.text[:300]}",
+                            status_code=response.status_code,
+                        )
+                    for chunk in response.iter_bytes(STREAM_CHUNK_BYTES):
+                        out.write(chunk)
+                out.seek(0)
+                return
+            except httpx.TransportError as e:
+                if last:
+                    raise StorageError(f"Storage no respondió (GET {url}): {e}") from e
+                logger.warning(f"⚠️ Storage: descarga interrumpida en {url} ({e}); reintento {attempt + 1}.")
+                self._sleep_before_retry(attempt)
+
+    @staticmethod
+    def _object_url(bucket: str, path: str) -> str:
+        return f"/object/{quote(bucket)}/{quote(path.lstrip('/'))}"
+
+    # ------------------------------------------------------------------
+    # Respaldo local
+    # ------------------------------------------------------------------
+    def _local_path(self, bucket: str, path: str) -> Path:
+        root = Path(self.local_root, bucket).resolve()
+        target = (root / path.lstrip("/")).resolve()
+        if root != target and root not in target.parents:
+            raise StorageError(f"Ruta fuera del bucket: '{path}'.", status_code=400)
+        return target
+
+    def _local_open(self, bucket: str, path: str) -> BinaryIO:
+        target = self._local_path(bucket, path)
+        if not target.is_file():
+            raise StorageError(f"Objeto no encontrado: {bucket}/{path}", status_code=404)
+        return open(target, "rb")
+
+    @staticmethod
+    def _local_entry(target: Path) -> Dict[str, Any]:
+        stat = target.stat()
+        updated = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(stat.st_mtime))
+        return {
+            "name": target.name,
+            "id": f"{stat.st_ino}",
+            "updated_at": updated,
+            "metadata": {"eTag": f"\"{stat.st_mtime_ns:x}-{stat.st_size:x}\"", "size": stat.st_size},
+        }
+
+    # ------------------------------------------------------------------
+    # Operaciones
+    # ------------------------------------------------------------------
+    def download(self, bucket: str, path: str, timeout: Optional[float] = None) -> bytes:
+        """
+        Contenido completo en memoria (objetos chicos: modelos, JSON, imágenes).
+        `timeout` reemplaza al de lectura por defecto para esta petición.
+        """
+        if self.is_local:
+            with self._local_open(bucket, path) as fh:
+                return fh.read()
+        kwargs = {"timeout": httpx.Timeout(timeout, connect=STORAGE_CONNECT_TIMEOUT)} if timeout else {}
+        return self._request("GET", self._object_url(bucket, path), **kwargs).content
+
+    def download_to_file(self, bucket: str, path: str, use_mmap: bool = False) -> Union[BinaryIO, mmap.mmap]:
+        """
+        Descarga en streaming y devuelve un archivo posicionado al inicio: un
+        SpooledTemporaryFile (en memoria hasta STORAGE_SPOOL_MAX_MB, después en disco)
+        o, con `use_mmap`, un mmap de solo lectura del archivo temporal. Quien llama
+        lo cierra al terminar.
+        """
+        if self.is_local:
+            fh = self._local_open(bucket, path)
+            return _as_mmap(fh) if use_mmap else fh
+
+        if use_mmap:
+            out = tempfile.TemporaryFile()
+            try:
+                self._stream_to(self._object_url(bucket, path), out)
+                return _as_mmap(out)
+            except Exception:
+                out.close()
+                raise
+
+        out = tempfile.SpooledTemporaryFile(max_size=STORAGE_SPOOL_MAX_MB * 1024 * 1024)
+        try:
+            self._stream_to(self._object_url(bucket, path), out)
+            return out
+        except Exception:
+            out.close()
+            raise
+
+    def upload(
+        self,
+        bucket: str,
+        path: str,
+        file: Union[bytes, BinaryIO],
+        content_type: str = "application/octet-stream",
+        cache_control: Optional[str] = None,
+        upsert: bool = False,
+    ) -> Dict[str, Any]:
+        """Sube bytes o un archivo abierto; el archivo viaja en bloques, con Content-Length."""
+        if isinstance(file, str):
+            file = file.encode("utf-8")
+        if self.is_local:
+            target = self._local_path(bucket, path)
+            if target.exists() and not upsert:
+                raise StorageError(f"El objeto ya existe: {bucket}/{path}", status_code=409)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp = target.with_name(f".{target.name}.{threading.get_ident()}.tmp")
+            with open(tmp, "wb") as out:
+                if isinstance(file, (bytes, bytearray, memoryview)):
+                    out.write(file)
+                else:
+                    shutil.copyfileobj(file, out, STREAM_CHUNK_BYTES)
+            os.replace(tmp, target)
+            return {"Key": f"{bucket}/{path}"}
+
+        headers = {"Content-Type": content_type, "x-upsert": "true" if upsert else "false"}
+        if cache_control:
+            headers["Cache-Control"] = f"max-age={cache_control}" if str(cache_control).isdigit() else cache_control
+
+        if isinstance(file, (bytes, bytearray, memoryview)):
+            body_factory = lambda: bytes(file)
+        else:
+            start = file.tell()
+            size = _body_size(file)
+            if size is not None:
+                headers["Content-Length"] = str(size)
+
+            def body_factory():
+                file.seek(start)
+                return _iter_file(file)
+
+        response = self._request("POST", self._object_url(bucket, path), body_factory=body_factory, headers=headers)
+        return response.json()
+
+    def remove(self, bucket: str, paths: List[str]) -> List[Dict[str, Any]]:
+        if self.is_local:
+            removed = []
+            for path in paths:
+                target = self._local_path(bucket, path)
+                if target.is_file():
+                    target.unlink()
+                    removed.append({"name": path})
+            return removed
+        self.signed_urls_cache.invalidate(bucket, paths)
+        return self._request("DELETE", f"/object/{quote(bucket)}", json={"prefixes": list(paths)}).json()
+
+    def copy(self, bucket: str, source: str, destination: str) -> Dict[str, Any]:
+        if self.is_local:
+            target = self._local_path(bucket, destination)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with self._local_open(bucket, source) as src, open(target, "wb") as out:
+                shutil.copyfileobj(src, out, STREAM_CHUNK_BYTES)
+            return {"Key": f"{bucket}/{destination}"}
+        body = {"bucketId": bucket, "sourceKey": source, "destinationKey": destination}
+        return self._request("POST", "/object/copy", json=body).json()
+
+    def list(self, bucket: str, folder: str = "", options: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Entradas de un nivel de `folder` con sus metadatos (eTag, fecha, tamaño)."""
+        options = options or {}
+        if self.is_local:
+            base = self._local_path(bucket, folder) if folder else Path(self.local_root, bucket).resolve()
+            if not base.is_dir():
+                return []
+            search = options.get("search") or ""
+            entries = [
+                self._local_entry(p) for p in sorted(base.iterdir())
+                if p.is_file() and not p.name.startswith(".") and search in p.name
+            ]
+            return entries[options.get("offset", 0):][:options.get("limit", 100)]
+        body = {
+            "prefix": folder,
+            "limit": options.get("limit", 100),
+            "offset": options.get("offset", 0),
+            "sortBy": options.get("sortBy", {"column": "name", "order": "asc"}),
+        }
+        if options.get("search"):
+            body["search"] = options["search"]
+        return self._request("POST", f"/object/list/{quote(bucket)}", json=body).json()
+
+    def create_signed_url(self, bucket: str, path: str, expires_in: int) -> Dict[str, Any]:
+        """URL firmada absoluta (en modo local, una URL file:// que fsspec y pandas abren)."""
+        url = self.signed_urls(bucket, [path], expires_in).get(path)
+        if not url:
+            raise StorageError(f"No se pudo firmar '{bucket}/{path}'.", status_code=404)
+        # Mismas claves que devuelven las distintas versiones de supabase-py.
+        return {"signedURL": url, "signedUrl": url, "signed_url": url}
+
+    def create_signed_urls(self, bucket: str, paths: List[str], expires_in: int) -> List[Dict[str, Any]]:
+        """
+        Firma varias rutas con una petición por cada SIGN_BATCH_SIZE (sin caché).
+        Devuelve [{"path", "signedURL", "error"}] como supabase-py.
+        """
+        if self.is_local:
+            return [{"path": p, "signedURL": self._local_path(bucket, p).as_uri(), "error": None} for p in paths]
+        results = []
+        for start in range(0, len(paths), SIGN_BATCH_SIZE):
+            batch = list(paths[start:start + SIGN_BATCH_SIZE])
+            response = self._request("POST", f"/object/sign/{quote(bucket)}",
+                                     json={"expiresIn": int(expires_in), "paths": batch})
+            for item in response.json():
+                signed = item.get("signedURL") or item.get("signedUrl")
+                results.append({
+                    "path": item.get("path"),
+                    "signedURL": f"{self.base_url}/storage/v1{signed}" if signed else None,
+                    "error": item.get("error"),
+                })
+        return results
+
+    def signed_urls(self, bucket: str, paths: List[str], expires_in: int) -> Dict[str, Optional[str]]:
+        """
+        {ruta: URL firmada} reutilizando las cacheadas con la misma vigencia hasta poco
+        antes de que venzan: se exige que les queden al menos SIGNED_URL_MIN_LIFETIME_SEC
+        (como mucho la mitad de `expires_in`). Las que faltan se firman todas juntas. Una
+        ruta que no se pudo firmar queda en None.
+        """
+        urls: Dict[str, Optional[str]] = {}
+        missing = []
+        min_remaining = min(SIGNED_URL_MIN_LIFETIME_SEC, int(expires_in) // 2)
+        for path in dict.fromkeys(p for p in paths if p):
+            cached = self.signed_urls_cache.get(bucket, path, expires_in, min_remaining_sec=min_remaining)
+            if cached:
+                urls[path] = cached
+            else:
+                missing.append(path)
+
+        if missing:
+            expires_at = time.time() + int(expires_in)
+            for item in self.create_signed_urls(bucket, missing, expires_in):
+                path, url = item.get("path"), item.get("signedURL")
+                if path is None:
+                    continue
+                urls[path] = url
+                if url and not self.is_local:
+                    self.signed_urls_cache.put(bucket, path, expires_in, url, expires_at)
+                elif item.get("error"):
+                    logger.warning(f"⚠️ No se pudo firmar '{bucket}/{path}': {item['error']}")
+        return {path: urls.get(path) for path in paths if path}
+
+    def get_public_url(self, bucket: str, path: str) -> str:
+        if self.is_local:
+            return self._local_path(bucket, path).as_uri()
+        return f"{self.base_url}/storage/v1/object/public/{quote(bucket)}/{quote(path.lstrip('/'))}"
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": "local" if self.is_local else ("http2" if self.http2 else "http1.1"),
+            "pool_size": STORAGE_POOL_SIZE,
+            "retries": self._retries,
+            "signed_urls": self.signed_urls_cache.stats(),
+        }
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+class BucketTransport:
+    """Vista de un bucket con la interfaz de `client.storage.from_(bucket)` de supabase-py."""
+
+    def __init__(self, transport: StorageTransport, bucket: str):
+        self._transport = transport
+        self.bucket = bucket
+
+    def download(self, path: str, timeout: Optional[float] = None) -> bytes:
+        return self._transport.download(self.bucket, path, timeout=timeout)
+
+    def download_to_file(self, path: str, use_mmap: bool = False):
+        return self._transport.download_to_file(self.bucket, path, use_mmap=use_mmap)
+
+    def upload(self, path: str, file, file_options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        options = file_options or {}
+        return self._transport.upload(
+            self.bucket, path, file,
+            content_type=options.get("content-type", "application/octet-stream"),
+            cache_control=options.get("cache-control"),
+            upsert=str(options.get("upsert", "false")).lower() == "true",
+        )
+
+    def update(self, path: str, file, file_options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        # Reemplazar un objeto es una subida con upsert.
+        return self.upload(path, file, {**(file_options or {}), "upsert": "true"})
+
+    def remove(self, paths: List[str]) -> List[Dict[str, Any]]:
+        return self._transport.remove(self.bucket, paths)
+
+    def copy(self, source: str, destination: str) -> Dict[str, Any]:
+        return self._transport.copy(self.bucket, source, destination)
+
+    def list(self, folder: str = "", options: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        return self._transport.list(self.bucket, folder, options)
+
+    def create_signed_url(self, path: str, expires_in: int) -> Dict[str, Any]:
+        return self._transport.create_signed_url(self.bucket, path, expires_in)
+
+    def create_signed_urls(self, paths: List[str], expires_in: int) -> List[Dict[str, Any]]:
+        return self._transport.create_signed_urls(self.bucket, paths, expires_in)
+
+    def signed_urls(self, paths: List[str], expires_in: int) -> Dict[str, Optional[str]]:
+        return self._transport.signed_urls(self.bucket, paths, expires_in)
+
+    def get_public_url(self, path: str) -> str:
+        return self._transport.get_public_url(self.bucket, path)
+
+
+_transport: Optional[StorageTransport] = None
+_transport_lock = threading.Lock()
+
+
+def get_storage_transport() -> StorageTransport:
+    """Instancia compartida por todo el proceso (un solo pool de conexiones)."""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = StorageTransport()
+    return _transport
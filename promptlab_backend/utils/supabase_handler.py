@@ -3,14 +3,28 @@ import uuid
 import os
 import io
 import logging
+import numpy as np
 import pandas as pd
 from supabase import create_client, Client
 from dotenv import load_dotenv
 from typing import Optional, Tuple, List, Callable, Dict, Any
 import time
 from typing import NoReturn
-import requests 
 import mimetypes
+import fsspec
+import pyarrow.parquet as pq
+
+from utils.dataframe_cache import (
+    DataFrameCache,
+    PARQUET_ROW_GROUP_SIZE,
+    read_parquet_subset,
+    apply_filters_in_memory,
+)
+from utils.storage_transport import StorageTransport, get_storage_transport
+from services import row_hash as rh
+from services import dtype_optimizer as dto
+from services import arrow_backend as ab
+from services.dataset_versioning import versions_folder
 
 
 
@@ -18,6 +32,9 @@ import mimetypes
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# Tamaño de cada petición por rangos al leer Parquet remoto (bytes).
+REMOTE_PARQUET_BLOCK_SIZE = int(os.getenv("REMOTE_PARQUET_BLOCK_SIZE", 4 * 1024 * 1024))
+
 def require_user_ownership(func):
     def wrapper(self, *args, **kwargs):
         user_id = kwargs.get("user_id")
@@ -35,11 +52,13 @@ class SupabaseHandler:
     _client: Client = None
     _bucket_name: str = "proyectos-usuarios"
     _visuals_bucket_name: str = "visuales" 
+    _df_cache: DataFrameCache = None
    
 
     def __new__(cls):
         if not cls._instance:
             cls._instance = super(SupabaseHandler, cls).__new__(cls)
+            cls._instance._df_cache = DataFrameCache()
         return cls._instance
 
     def _connect(self):
@@ -50,7 +69,12 @@ class SupabaseHandler:
                 raise ValueError("Configuración de Supabase incompleta.")
             self._client = create_client(url, key)
 
-    def save_dataframe_to_storage(self, user_id: str, path: str, df: pd.DataFrame) -> NoReturn:
+    @property
+    def _storage(self) -> StorageTransport:
+        """Transporte de Storage compartido: pool de conexiones, reintentos y streaming."""
+        return get_storage_transport()
+
+    def save_dataframe_to_storage(self, user_id: str, path: str, df: pd.DataFrame, row_hashes: Optional[np.ndarray] = None) -> NoReturn:
         """
         SOBRESCRIBE un DataFrame en una ruta existente en Supabase Storage.
         Detecta el formato del archivo por la extensión en la ruta.
@@ -60,14 +84,14 @@ class SupabaseHandler:
             user_id (str): ID del usuario solicitante.
             path (str): Ruta completa en el bucket (ej: "datasets/123/data.parquet").
             df (pd.DataFrame): DataFrame a guardar.
+            row_hashes (Optional[np.ndarray]): Hashes de fila del DataFrame; si se pasan,
+                se guardan como índice junto al archivo (ver save_row_hashes).
 
         Raises:
             PermissionError: Si el usuario no es propietario de la ruta.
             ValueError: Si la extensión no está soportada o si el DataFrame está vacío.
             Exception: Si ocurre un error en la conexión o subida.
         """
-        self._connect()
-
         # 🔐 Control de permisos
         if not self.is_owner_of_path(user_id, path):
             logger.warning(f"[PERMISO DENEGADO] user_id={user_id} intentó escribir en {path}")
@@ -84,7 +108,11 @@ class SupabaseHandler:
             buffer_out = io.BytesIO()
 
             if file_ext == "parquet":
-                df.to_parquet(buffer_out, index=False, engine="pyarrow", compression="snappy")
+                # Los tipos compactos quedan en el esquema del Parquet para las próximas cargas.
+                dto.compactar_dataframe(df).to_parquet(
+                    buffer_out, index=False, engine="pyarrow", compression="snappy",
+                    row_group_size=PARQUET_ROW_GROUP_SIZE,
+                )
                 content_type = "application/parquet"
             elif file_ext == "xlsx":
                 df.to_excel(buffer_out, index=False, engine="openpyxl")
@@ -99,14 +127,17 @@ class SupabaseHandler:
             buffer_out.seek(0)
 
             # 📤 Subida a Supabase Storage
-            self._client.storage.from_(self._bucket_name).update(
+            self._storage.from_(self._bucket_name).update(
                 path=path,
-                file=buffer_out.getvalue(),
+                file=buffer_out,
                 file_options={
                     "content-type": content_type,
                     "cache-control": "no-cache",
                 },
             )
+            self._df_cache.invalidate(path)
+            if row_hashes is not None and len(row_hashes) == len(df):
+                self.save_row_hashes(path, row_hashes)
 
             logger.info(f"[OK] DataFrame guardado exitosamente en '{path}' (user_id={user_id})")
 
@@ -114,38 +145,184 @@ class SupabaseHandler:
             logger.exception(f"[ERROR] Falló la escritura de DataFrame en {path}: {e}")
             raise
 
-    @require_user_ownership
-    def load_file_as_dataframe(self, user_id: str, path: str, **kwargs) -> Optional[pd.DataFrame]:
-        self._connect()
-        logger.info(f"Cargando archivo '{path}' como DataFrame con URL firmada...")
-        
+    def get_object_version(self, path: str, bucket: Optional[str] = None) -> Optional[str]:
+        """
+        Devuelve un identificador de versión del objeto en Storage (eTag + fecha de
+        actualización) consultando solo los metadatos, sin descargar el archivo.
+        Devuelve None si el objeto no existe o la consulta falla.
+        """
+        folder, _, filename = path.rpartition("/")
         try:
-            # PASO 1: Generar una URL firmada que es válida por un corto tiempo (ej. 60 segundos)
-            # Esto es más seguro que usar URLs públicas.
-            signed_url_response = self._client.storage.from_(self._bucket_name).create_signed_url(path, 60)
-            base_url = signed_url_response['signedURL']
+            entries = self._storage.from_(bucket or self._bucket_name).list(
+                folder, {"search": filename, "limit": 100}
+            )
+            for entry in entries or []:
+                if entry.get("name") == filename:
+                    metadata = entry.get("metadata") or {}
+                    etag = metadata.get("eTag") or entry.get("id") or ""
+                    return f"{etag}|{entry.get('updated_at', '')}"
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo obtener la versión de '{path}': {e}")
+        return None
 
-            # PASO 2: Añadir nuestro cache buster a la URL firmada.
-            cache_buster = f"&t={int(time.time())}" # Usamos '&' porque las URLs firmadas ya tienen un '?'
-            final_url = base_url + cache_buster
+    def save_row_hashes(self, path: str, row_hashes: np.ndarray) -> bool:
+        """
+        Guarda el índice de hashes de fila como `<path>.rowhash.npz`, junto con la versión
+        del archivo de datos que describe. Es una optimización: si falla solo se registra.
+        """
+        try:
+            payload = rh.to_sidecar_bytes(row_hashes, self.get_object_version(path))
+            self._storage.from_(self._bucket_name).upload(
+                path=rh.sidecar_path(path),
+                file=payload,
+                file_options={"content-type": "application/octet-stream", "cache-control": "0", "upsert": "true"},
+            )
+            logger.info(f"🔑 Índice de hashes de fila guardado para '{path}' ({len(row_hashes)} filas).")
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo guardar el índice de hashes de '{path}': {e}")
+            return False
 
-            # PASO 3: Descargar el contenido usando la URL única.
-            response = requests.get(final_url)
-            response.raise_for_status()  # Lanza un error si la descarga falla (ej. 404, 500)
-            file_bytes = response.content
+    def load_row_hashes(self, path: str, version: Optional[str], n_rows: Optional[int] = None) -> Optional[np.ndarray]:
+        """
+        Devuelve los hashes de fila persistidos si corresponden a `version` (y a `n_rows`,
+        si se indica). Un índice viejo o ausente devuelve None y el llamador los recalcula.
+        """
+        if not version:
+            return None
+        try:
+            data = self._storage.from_(self._bucket_name).download(rh.sidecar_path(path))
+        except Exception:
+            return None
+        row_hashes, stored_version = rh.from_sidecar_bytes(data)
+        if row_hashes is None or stored_version != version:
+            return None
+        if n_rows is not None and len(row_hashes) != n_rows:
+            return None
+        return row_hashes
+
+    # --- Objetos auxiliares (índices, fragmentos de versiones, manifiestos) ---
+    def upload_object(self, path: str, data: bytes, content_type: str = "application/octet-stream") -> None:
+        """Sube (o reemplaza) un objeto auxiliar tal cual. Lanza la excepción si falla."""
+        self._storage.from_(self._bucket_name).upload(
+            path=path,
+            file=data,
+            file_options={"content-type": content_type, "cache-control": "0", "upsert": "true"},
+        )
+
+    def download_object(self, path: str) -> Optional[bytes]:
+        """Descarga un objeto auxiliar; None si no existe (sin registrar error)."""
+        try:
+            return self._storage.from_(self._bucket_name).download(path)
+        except Exception:
+            return None
+
+    def copy_object(self, source: str, destination: str) -> None:
+        """Copia del lado del servidor: no descarga ni vuelve a subir el contenido."""
+        self._storage.from_(self._bucket_name).copy(source, destination)
+
+    def list_objects(self, folder: str) -> List[str]:
+        """Rutas completas de los objetos dentro de `folder` (un nivel)."""
+        try:
+            entries = self._storage.from_(self._bucket_name).list(folder, {"limit": 1000})
+            return [f"{folder}/{entry['name']}" for entry in entries or [] if entry.get("name")]
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo listar '{folder}': {e}")
+            return []
 
-            # PASO 4: El resto de la lógica es la misma que ya tenías.
+    def remove_objects(self, paths: List[str]) -> None:
+        """Elimina objetos auxiliares; los errores solo se registran."""
+        if not paths:
+            return
+        try:
+            self._storage.from_(self._bucket_name).remove(list(paths))
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudieron eliminar {len(paths)} objetos auxiliares: {e}")
+
+    def get_dataframe_cache_stats(self) -> Dict[str, Any]:
+        """Contadores de aciertos/fallos y ocupación de la caché local de DataFrames."""
+        return self._df_cache.stats()
+
+    def _read_parquet_ranges(self, url: str, columns: Optional[List[str]], filters: Optional[List]) -> Optional[pd.DataFrame]:
+        """
+        Lee un Parquet remoto con peticiones HTTP por rangos: primero el footer y luego
+        solo los column chunks de las columnas y row groups que hacen falta.
+        Devuelve None si el servidor no admite rangos o la lectura falla.
+        """
+        try:
+            with fsspec.open(url, mode="rb", block_size=REMOTE_PARQUET_BLOCK_SIZE) as f:
+                return read_parquet_subset(f, columns=columns, filters=filters)
+        except Exception as e:
+            logger.warning(f"⚠️ Lectura por rangos no disponible, se descarga el archivo completo: {e}")
+            return None
+
+    @require_user_ownership
+    def load_file_as_dataframe(
+        self,
+        user_id: str,
+        path: str,
+        version: Optional[str] = None,
+        columns: Optional[List[str]] = None,
+        filters: Optional[List] = None,
+        **kwargs,
+    ) -> Optional[pd.DataFrame]:
+        """
+        Carga un dataset como DataFrame. Con `columns` solo se leen esas columnas y con
+        `filters` (formato DNF de pyarrow, ver dataframe_cache.normalize_filters) solo las
+        filas que los cumplen; en Parquet ambos se empujan a la lectura de row groups.
+        """
+        partial = columns is not None or bool(filters)
+
+        # PASO 0: Consultar la caché local usando la versión actual del objeto.
+        # Pedir los metadatos es mucho más barato que descargar el archivo entero.
+        # Quien ya conoce la versión (p. ej. para la caché de perfiles) la pasa y ahorra la consulta.
+        version = version or self.get_object_version(path)
+        cached_df = self._df_cache.get(path, version, columns=columns, filters=filters)
+        if cached_df is not None:
+            logger.info(f"⚡ '{path}' servido desde la caché local (versión {version}).")
+            return cached_df
+
+        logger.info(f"Cargando archivo '{path}' como DataFrame...")
+        
+        try:
             ext = os.path.splitext(path)[-1].lower()
 
-            if ext == ".csv":
-                return pd.read_csv(io.BytesIO(file_bytes))
-            elif ext in [".xlsx", ".xls"]:
-                return pd.read_excel(io.BytesIO(file_bytes))
-            elif ext == ".parquet":
-                return pd.read_parquet(io.BytesIO(file_bytes))
-            else:
+            # PASO 1: Lectura parcial de Parquet sin bajar el archivo entero.
+            # fsspec necesita una URL: se firma una válida por poco tiempo, con cache buster.
+            # No se guarda en la caché: solo contiene una parte del dataset.
+            if partial and ext == ".parquet":
+                signed_url_response = self._storage.from_(self._bucket_name).create_signed_url(path, 60)
+                final_url = signed_url_response['signedURL']
+                if final_url.startswith("http"):
+                    final_url += f"&t={int(time.time())}"  # '&' porque las URLs firmadas ya tienen un '?'
+                df = self._read_parquet_ranges(final_url, columns, filters)
+                if df is not None:
+                    logger.info(f"📦 '{path}': lectura parcial por rangos ({len(df.columns)} columnas, {len(df)} filas).")
+                    return df
+
+            if ext not in (".csv", ".xlsx", ".xls", ".parquet"):
                 return None
 
+            # PASO 2: Descargar en streaming por el transporte compartido: el cuerpo va a
+            # un archivo temporal (en disco si es grande) en lugar de un `bytes` en memoria.
+            # Con DATAFRAME_BACKEND=pyarrow las columnas se cargan como ArrowDtype.
+            with self._storage.from_(self._bucket_name).download_to_file(path) as fh:
+                if ext == ".csv":
+                    df = pd.read_csv(fh, **ab.read_kwargs())
+                elif ext in [".xlsx", ".xls"]:
+                    df = pd.read_excel(fh, **ab.read_kwargs())
+                else:
+                    df = ab.table_to_pandas(pq.read_table(fh))
+
+            # PASO 3: Guardar en la caché para las próximas lecturas de esta versión.
+            # La copia local queda en Parquet, así que las lecturas parciales siguientes
+            # (también de CSV/Excel) ya aprovechan la proyección y los row groups.
+            self._df_cache.put(path, version, df)
+            if partial:
+                subset = self._df_cache.get(path, version, columns=columns, filters=filters)
+                return subset if subset is not None else apply_filters_in_memory(df, columns, filters)
+            return df
+
         except Exception as e:
             logger.error(f"Error al cargar archivo '{path}' como DataFrame: {e}", exc_info=True)
             return None
@@ -154,15 +331,8 @@ class SupabaseHandler:
     
     @require_user_ownership
     def load_file(self, user_id: str, path: str, **kwargs) -> Optional[bytes]:
-        self._connect()
         try:
-            signed_url_response = self._client.storage.from_(self._bucket_name).create_signed_url(path, 60)
-            base_url = signed_url_response['signedURL']
-            final_url = base_url + f"&t={int(time.time())}"
-
-            response = requests.get(final_url)
-            response.raise_for_status()
-            return response.content
+            return self._storage.from_(self._bucket_name).download(path)
         except Exception as e:
             logger.error(f"❌ Error al cargar archivo desde {path}: {e}", exc_info=True)
             return None
@@ -170,7 +340,6 @@ class SupabaseHandler:
     def load_file_as_csv(self, user_id: str, path: str) -> Optional[str]:
         # Esta función llama a load_file, que ya estará corregido si aplicas el cambio de arriba.
         # Pero para mayor claridad, podemos reescribirla también.
-        self._connect()
         if not self.is_owner_of_path(user_id, path):
             return None
         try:
@@ -224,7 +393,8 @@ class SupabaseHandler:
                 return {"success": False, "error": str(e)}
         return {"success": True, "results": results}
     
-    def save_dataframe(self, df: pd.DataFrame, user_id: str, project_id: str, original_filename: str) -> Tuple[Optional[str], str]:
+    def save_dataframe(self, df: pd.DataFrame, user_id: str, project_id: str, original_filename: str,
+                       row_hashes: Optional[np.ndarray] = None) -> Tuple[Optional[str], str]:
         """
         Guarda un DataFrame en formato .parquet en Supabase Storage, con una estructura de carpeta organizada por usuario y proyecto.
 
@@ -233,6 +403,7 @@ class SupabaseHandler:
             user_id (str): ID del usuario propietario.
             project_id (str): ID del proyecto asociado.
             original_filename (str): Nombre original del archivo, usado para derivar el nombre final.
+            row_hashes (Optional[np.ndarray]): Hashes de fila calculados en la ingesta (índice de duplicados).
 
         Returns:
             Tuple[Optional[str], str]: Ruta del archivo guardado y mensaje de estado.
@@ -242,24 +413,18 @@ class SupabaseHandler:
             return None, "El DataFrame está vacío."
 
         try:
-            self._connect()
-
             # --- LÓGICA PARA LA RUTA DEL ARCHIVO ---
-            base_name, _ = os.path.splitext(original_filename)
-            base_name = base_name.strip().replace(" ", "_")  # limpiar nombre
-            folder_name = base_name
-            new_filename = f"{base_name}.parquet"
-            path = f"{user_id}/{project_id}/{folder_name}/{new_filename}"
+            path = self.dataset_parquet_path(user_id, project_id, original_filename)
 
             # Convertir a parquet en memoria
             buffer = io.BytesIO()
-            df.to_parquet(buffer, index=False)
+            dto.compactar_dataframe(df).to_parquet(buffer, index=False, row_group_size=PARQUET_ROW_GROUP_SIZE)
             buffer.seek(0)  # Importante para asegurar el inicio del buffer
 
             # Subir archivo a Supabase Storage
-            self._client.storage.from_(self._bucket_name).upload(
+            self._storage.from_(self._bucket_name).upload(
                 path=path,
-                file=buffer.read(),
+                file=buffer,
                 file_options={
                   "content-type": "application/octet-stream",
                   "cache-control": "0",  # <--- AÑADIDO
@@ -268,6 +433,10 @@ class SupabaseHandler:
                   }
                 )
 
+            self._df_cache.invalidate(path)
+            if row_hashes is not None and len(row_hashes) == len(df):
+                self.save_row_hashes(path, row_hashes)
+
             logger.info(f"✅ DataFrame guardado exitosamente en: {path}")
             return path, "Guardado correctamente."
 
@@ -276,13 +445,45 @@ class SupabaseHandler:
             return None, f"Error al guardar el archivo: {str(e)}"
 
 
+    @staticmethod
+    def dataset_parquet_path(user_id: str, project_id: str, original_filename: str) -> str:
+        """Ruta del Parquet de un dataset: <usuario>/<proyecto>/<nombre>/<nombre>.parquet"""
+        base_name, _ = os.path.splitext(original_filename)
+        base_name = base_name.strip().replace(" ", "_")  # limpiar nombre
+        return f"{user_id}/{project_id}/{base_name}/{base_name}.parquet"
+
+    def save_parquet_file(self, local_path: str, user_id: str, project_id: str, original_filename: str,
+                          row_hashes: Optional[np.ndarray] = None) -> Tuple[Optional[str], str]:
+        """
+        Sube un Parquet ya escrito en disco (ingesta por lotes) con la misma ruta que
+        save_dataframe. El archivo se envía en streaming, sin leerlo entero en memoria.
+        """
+        path = self.dataset_parquet_path(user_id, project_id, original_filename)
+        try:
+            with open(local_path, "rb") as fh:
+                self._storage.from_(self._bucket_name).upload(
+                    path=path,
+                    file=fh,
+                    file_options={"content-type": "application/octet-stream", "cache-control": "0", "upsert": "true"},
+                )
+
+            self._df_cache.invalidate(path)
+            if row_hashes is not None:
+                self.save_row_hashes(path, row_hashes)
+
+            logger.info(f"✅ Parquet subido exitosamente en: {path}")
+            return path, "Guardado correctamente."
+
+        except Exception as e:
+            logger.exception(f"❌ Error al subir Parquet en {path}: {str(e)}")
+            return None, f"Error al guardar el archivo: {str(e)}"
+
    
     # --- Storage: Archivo Genérico ---
     def save_file(self, file_bytes: bytes, user_id: str, project_id: str, folder: str, filename: str) -> Tuple[Optional[str], str]:
-        self._connect()
         path = f"{user_id}/{project_id}/{folder}/{filename}"
         try:
-            self._client.storage.from_(self._bucket_name).upload(
+            self._storage.from_(self._bucket_name).upload(
                 path=path,
                 file=file_bytes,
                 file_options={
@@ -311,11 +512,14 @@ class SupabaseHandler:
         Elimina un archivo del storage, validando que pertenezca al usuario.
         `path` debe ser la ruta completa del archivo en el bucket.
         """
-        self._connect()
         logger.info(f"🗑️ Solicitud para eliminar archivo en: {path}")
         try:
             # La API de Supabase espera una lista de rutas
-            response = self._client.storage.from_(self._bucket_name).remove([path])
+            # El índice de hashes de fila (si existe) se va junto con el archivo.
+            response = self._storage.from_(self._bucket_name).remove([path, rh.sidecar_path(path)])
+            self._df_cache.invalidate(path)
+            # También el historial de versiones (manifiesto y fragmentos), si lo hay.
+            self.remove_objects(self.list_objects(versions_folder(path)))
             
             # La respuesta de remove es una lista de los archivos eliminados.
             # Si la lista no está vacía, la eliminación fue exitosa.
@@ -348,8 +552,6 @@ class SupabaseHandler:
         Returns:
             Optional[Tuple[str, str]]: (ruta en storage, URL pública).
         """
-        self._connect()
-
         # 1. Validar nombre y extensión
         if not filename or "." not in filename:
             logger.warning(f"❌ Archivo sin extensión recibido: {filename}")
@@ -370,14 +572,14 @@ class SupabaseHandler:
 
         try:
             # 4. Subir archivo a Supabase Storage
-            self._client.storage.from_(self._visuals_bucket_name).upload(
+            self._storage.from_(self._visuals_bucket_name).upload(
                 path=path,
                 file=file_bytes,
                 file_options={"content-type": content_type, "upsert": "true"}
             )
 
             # 5. Obtener URL pública
-            public_url = self._client.storage.from_(self._visuals_bucket_name).get_public_url(path)
+            public_url = self._storage.from_(self._visuals_bucket_name).get_public_url(path)
 
             logger.info(f"✅ Archivo visual guardado en: {path}")
             return path, public_url
@@ -512,13 +714,8 @@ class SupabaseHandler:
         Returns:
             bool: True si la operación fue exitosa, False en caso contrario.
         """
-        self._connect()
         try:
-            response = (
-                self.get_db_client()
-                .storage.from_(self._visuals_bucket_name)
-                .remove([path])
-            )
+            response = self._storage.from_(self._visuals_bucket_name).remove([path])
             if response and isinstance(response, dict) and response.get("error"):
                 logger.error(f"❌ Error de Supabase al eliminar archivo {path}: {response['error']}")
                 return False
@@ -602,12 +799,10 @@ class SupabaseHandler:
             logger.warning("⚠️ Se intentó descargar un archivo visual con una ruta inválida o vacía.")
             return None
 
-        self._connect()
-
         try:
             logger.debug(f"📥 Intentando descargar archivo visual desde: {path}")
             
-            file_bytes = self._client.storage.from_(self._visuals_bucket_name).download(path)
+            file_bytes = self._storage.from_(self._visuals_bucket_name).download(path)
             
             if not file_bytes:
                 logger.warning(f"⚠️ El archivo en {path} no fue encontrado o está vacío en el bucket '{self._visuals_bucket_name}'.")
@@ -680,26 +875,16 @@ class SupabaseHandler:
         if not image_records or not isinstance(image_records, list):
             return []
 
-        client = self.get_db_client()
-        if not client:
-            logger.error("❌ Supabase client no inicializado. No se pueden generar signed URLs.")
-            for record in image_records:
-                record['signed_url'] = None
-            return image_records
+        # Una sola petición para todas las rutas; las ya firmadas salen de la caché.
+        paths = [record.get("storage_path") for record in image_records if record.get("storage_path")]
+        try:
+            signed = self._storage.from_(self._visuals_bucket_name).signed_urls(paths, expiration_sec)
+        except Exception as e:
+            logger.error(f"❌ Error generando signed URLs para {len(paths)} imágenes: {e}", exc_info=True)
+            signed = {}
 
         for record in image_records:
-            path = record.get("storage_path")
-            if not path:
-                record['signed_url'] = None
-                continue
-
-            try:
-                signed_url_response = client.storage.from_(self._visuals_bucket_name).create_signed_url(path, expiration_sec)
-                signed_url = signed_url_response.get("signedURL") or signed_url_response.get("signed_url")  # por compatibilidad
-                record['signed_url'] = signed_url
-            except Exception as e:
-                logger.error(f"❌ Error generando signed URL para '{path}': {e}", exc_info=True)
-                record['signed_url'] = None
+            record['signed_url'] = signed.get(record.get("storage_path"))
 
         return image_records
 